@@ -0,0 +1,266 @@
+import random
+import shutil
+import asyncio
+import functools
+import contextvars
+from time import perf_counter as pc
+
+import tracing
+from client import Client, PHASE_DURATION
+from group_poly import Group
+from profile_format import load_profile
+
+
+def prepare_key_derivation() -> None:
+    # Deferred imports of key generation and decapsulation are done while waiting for network
+    import rsa
+    from Crypto.Cipher import PKCS1_OAEP
+
+
+class AsyncClient:
+    def __init__(self, client: Client, server_connection, executor=None):
+        """
+        AsyncClient class constructor, that returns asyncio front-end of Client overlapping network waits of login with local computation
+
+        Vault and session key are requested at once, session key is encrypted with Client's enroled public key
+        and so it travels while vault is unlocked, OPRF evaluated and key pair derived. Recovered key pair is kept
+        as key object and used for decapsulation directly, without export to PEM and import back.
+
+        Parameters:
+            - client (Client): Client holding biometric template and Evaluator
+            - server_connection (ServerConnection): Connection to ServerService
+            - executor (concurrent.futures.Executor): Executor running unlocking, OPRF round trip and key generation, default executor of event loop if not given
+
+        Returns:
+            - self (AsyncClient): AsyncClient class object
+        """
+        self.client = client
+        self.server_connection = server_connection
+        self.executor = executor
+
+    async def run_blocking(self, func, *args):
+        # Executor threads run function in copy of caller's context, so that its spans join login's trace
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(contextvars.copy_context().run, func, *args)
+        )
+
+    async def verify(
+        self,
+        public_values_json,
+        group: Group,
+        captures: list = None,
+        number_of_unlocking_rounds: int = 5000,
+        tally_capacity: int = None,
+    ):
+        """
+        Execute verification phase of BRAKE protocol without blocking event loop
+
+        Parameters:
+            - public_values_json (str | bytes | dict): Client's profile distributed to Server as JSON, binary profile or dict
+            - group (Group): Group in which the protocol is executed
+            - captures (list): Biometric verification templates taken during single login attempt, defaults to Client's biometric template
+            - number_of_unlocking_rounds (int): Number of secret polynomial recovery rounds to perform
+            - tally_capacity (int): Maximal number of secret polynomial candidates counted at once during unlocking, unbounded if not given
+
+        Returns:
+            - client_private_key (RSA.RsaKey): Recovered Client's private key object
+        """
+        if captures is None:
+            captures = [self.client.biometrics_template]
+        public_values_dict = load_profile(public_values_json)
+
+        with PHASE_DURATION.time(operation="async_verify", phase="unlock"):
+            recovered_secret_polynomial = await self.run_blocking(
+                self.client.unlock_vaults,
+                public_values_dict,
+                captures,
+                number_of_unlocking_rounds,
+                tally_capacity,
+            )
+
+        # Evaluator round trip waits in executor thread, so that event loop keeps serving other requests
+        with PHASE_DURATION.time(operation="async_verify", phase="oprf"):
+            unblinded_evaluator_result = await self.run_blocking(
+                self.client.evaluate, recovered_secret_polynomial, group
+            )
+
+        with PHASE_DURATION.time(operation="async_verify", phase="keygen"):
+            client_private_key = await self.run_blocking(
+                self.client.generate_key_pair, unblinded_evaluator_result
+            )
+
+        return client_private_key
+
+    async def login(
+        self,
+        group: Group,
+        captures: list = None,
+        number_of_unlocking_rounds: int = 5000,
+        tally_capacity: int = None,
+    ) -> bytes:
+        """
+        Execute verification and key exchange with Server, overlapping vault and session key requests with local work
+
+        Parameters:
+            - group (Group): Group in which the protocol is executed
+            - captures (list): Biometric verification templates taken during single login attempt, defaults to Client's biometric template
+            - number_of_unlocking_rounds (int): Number of secret polynomial recovery rounds to perform
+            - tally_capacity (int): Maximal number of secret polynomial candidates counted at once during unlocking, unbounded if not given
+
+        Returns:
+            - session_key (bytes): Session key established with Server, raises ValueError if it cannot be decapsulated
+        """
+        with tracing.span("async_client.login", client_id=self.client.id):
+            # Session key does not depend on verification, so it is requested along with vault
+            vault_task = asyncio.create_task(
+                self.server_connection.vault_request(self.client.id)
+            )
+            session_key_task = asyncio.create_task(
+                self.server_connection.send_session_key_to_client(self.client.id)
+            )
+            try:
+                await self.run_blocking(prepare_key_derivation)
+                public_values_json = await vault_task
+                client_private_key = await self.verify(
+                    public_values_json,
+                    group,
+                    captures=captures,
+                    number_of_unlocking_rounds=number_of_unlocking_rounds,
+                    tally_capacity=tally_capacity,
+                )
+                encrypted_session_key, session_key_hash = await session_key_task
+            except BaseException:
+                vault_task.cancel()
+                session_key_task.cancel()
+                raise
+
+            session_key = self.client.decrypt_session_key(
+                encrypted_session_key, client_private_key
+            )
+
+        if self.client.get_session_key_hash(session_key) != session_key_hash:
+            raise ValueError("Hash of decapsulated session key does not match Server's hash")
+        return session_key
+
+
+class DelayedConnection:
+    def __init__(self, server_connection, delay: float):
+        """
+        DelayedConnection class constructor, that returns ServerConnection with added round trip latency for experiments
+
+        Parameters:
+            - server_connection (ServerConnection): Connection to ServerService
+            - delay (float): Latency in seconds added to every request
+
+        Returns:
+            - self (DelayedConnection): DelayedConnection class object
+        """
+        self.server_connection = server_connection
+        self.delay = delay
+
+        # Number of requests in flight at once, so that overlap of requests is observed without timing them
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def request(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            return await request
+        finally:
+            self.in_flight -= 1
+
+    async def vault_request(self, client_id: int):
+        return await self.request(self.server_connection.vault_request(client_id))
+
+    async def send_session_key_to_client(self, client_id: int) -> tuple:
+        return await self.request(self.server_connection.send_session_key_to_client(client_id))
+
+
+def run_tests():
+    print("Running async_client.py tests...")
+
+    from server import Server
+    from server_service import ServerConnection, ServerService
+
+    db_path = "./async_client_test_db/"
+    shutil.rmtree(db_path, ignore_errors=True)
+
+    rng = random.Random(0)
+    G = Group(prime=2147483647)
+    biometrics_template = rng.sample(range(1, G.order), 44)
+    client = Client(1, biometrics_template)
+    capture = biometrics_template[:30] + rng.sample(range(1, G.order), 14)
+    delay = 1.0
+
+    async def test():
+        service = ServerService(Server(db_path), port=0)
+        await service.start()
+        connection = await ServerConnection.connect(port=service.port)
+        assert await connection.enrol_client(client.enrol(verify_threshold=8, group=G))
+        delayed_connection = DelayedConnection(connection, delay)
+
+        # Sequential login waits for every request in turn and round trips key through PEM
+        s = pc()
+        public_values_json = await delayed_connection.vault_request(1)
+        client_private_key_PEM = Client(1, capture).verify(public_values_json, G, 1000)
+        encrypted_session_key, session_key_hash = (
+            await delayed_connection.send_session_key_to_client(1)
+        )
+        session_key = client.recover_session_key(encrypted_session_key, client_private_key_PEM)
+        assert client.get_session_key_hash(session_key) == session_key_hash
+        sequential_time = pc() - s
+        assert delayed_connection.max_in_flight == 1
+        delayed_connection.max_in_flight = 0
+
+        # Pipelined login waits for session key while verifying
+        exporter = tracing.InMemoryExporter()
+        tracing.enable(exporter)
+        s = pc()
+        session_key = await AsyncClient(Client(1, capture), delayed_connection).login(
+            G, number_of_unlocking_rounds=1000
+        )
+        pipelined_time = pc() - s
+        tracing.disable()
+        assert len(session_key) == 32
+
+        spans = {span_dict["name"]: span_dict for span_dict in exporter.spans}
+        session_key_span = spans["server_connection.session_key"]
+        assert session_key_span["start"] < spans["fuzzy_vault.unlock"]["start"]
+        assert len({span_dict["trace_id"] for span_dict in exporter.spans}) == 1
+        # Vault and session key requests wait for network at once instead of in turn
+        assert delayed_connection.max_in_flight == 2
+        print(
+            f"Login with {delay * 1000:.0f} ms round trips: sequential {sequential_time:.2f} s, "
+            f"pipelined {pipelined_time:.2f} s"
+        )
+
+        # Verification with wrong capture cannot decapsulate session key
+        wrong_capture = rng.sample(range(1, G.order), 44)
+        try:
+            await AsyncClient(Client(1, wrong_capture), connection).login(
+                G, number_of_unlocking_rounds=100
+            )
+            assert False
+        except ValueError:
+            pass
+
+        # Service closes its side of connection before shutting down
+        await connection.close()
+        await asyncio.sleep(0.1)
+        await service.close()
+
+    asyncio.run(test())
+    shutil.rmtree(db_path)
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import os
+import random
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from time import perf_counter as pc
+
+from client import Client
+from evaluator import Evaluator
+from group_poly import Group, GroupPoly
+from profile_format import load_profile
+
+
+def lock_stage(
+    client_id: int, bio_template: list, verify_threshold: int, group: Group
+) -> tuple:
+    """
+    Worker stage generating secret polynomial and locking it into Fuzzy Vault
+
+    Parameters:
+        - client_id (int): Client's identificator
+        - bio_template (list): Client's enrolment biometric template
+        - verify_threshold (int): Defined closeness parameter value of acceptable biometric vector's distance
+        - group (Group): Group in which the protocol is executed
+
+    Returns:
+        - (tuple): Client's id, secret polynomial coefficients and vault polynomial coefficients
+    """
+    client = Client(client_id, bio_template)
+    secret_polynomial, fuzzy_vault = client.lock_template(
+        verify_threshold=verify_threshold, group=group
+    )
+    return (
+        client_id,
+        secret_polynomial.coef.tolist(),
+        fuzzy_vault.vault_polynomial.coef.tolist(),
+    )
+
+
+def keygen_stage(
+    client_id: int,
+    unblinded_evaluator_result: str,
+    vault_coefs: list,
+    group_order: int,
+    verify_threshold: int,
+    profile_format: str,
+):
+    """
+    Worker stage deriving Client's RSA key pair and creating enrolment record
+
+    Parameters:
+        - client_id (int): Client's identificator
+        - unblinded_evaluator_result (str): Unblinded OPRF evaluation result
+        - vault_coefs (list): Coefficients of vault polynomial
+        - group_order (int): Order of group the BRAKE protocol is executed in
+        - verify_threshold (int): Defined closeness parameter value of acceptable biometric vector's distance
+        - profile_format (str): Format of Client's profile, either 'json' or 'binary'
+
+    Returns:
+        - (str | bytes): Client's enrolment record
+    """
+    client = Client(client_id, [])
+    _, client_public_key_PEM = client.generate_key_pair_PEM(
+        unblinded_evaluator_result=unblinded_evaluator_result
+    )
+    return client.create_public_values(
+        vault_coefs,
+        client_public_key_PEM,
+        group_order,
+        verify_threshold,
+        profile_format=profile_format,
+    )
+
+
+class BatchEnrolmentPipeline:
+    def __init__(
+        self,
+        group: Group,
+        verify_threshold: int,
+        workers: int = None,
+        oprf_batch_size: int = 32,
+        max_in_flight: int = None,
+        profile_format: str = "json",
+        evaluator: Evaluator = None,
+    ):
+        """
+        BatchEnrolmentPipeline class constructor, that returns pipeline enroling many templates across process pool
+
+        Parameters:
+            - group (Group): Group in which the protocol is executed
+            - verify_threshold (int): Defined closeness parameter value of acceptable biometric vector's distance
+            - workers (int): Number of worker processes, defaults to number of CPU cores
+            - oprf_batch_size (int): Number of locked vaults evaluated in single OPRF round trip
+            - max_in_flight (int): Maximal number of enrolments held by pipeline at once, bounds memory and applies backpressure to input
+            - profile_format (str): Format of emitted enrolment records, either 'json' or 'binary'
+            - evaluator (Evaluator): Evaluator used for OPRF stage, shared default Evaluator if not given
+
+        Returns:
+            - self (BatchEnrolmentPipeline): BatchEnrolmentPipeline class object
+        """
+        self.group = group
+        self.verify_threshold = verify_threshold
+        self.workers = workers or os.cpu_count() or 1
+        self.oprf_batch_size = oprf_batch_size
+        self.max_in_flight = max_in_flight or 4 * self.workers + oprf_batch_size
+        self.profile_format = profile_format
+        self.evaluator = evaluator or Client.get_default_evaluator()
+
+        if self.max_in_flight < self.oprf_batch_size:
+            raise ValueError(
+                f"max_in_flight ({self.max_in_flight}) must not be lower than OPRF batch size ({self.oprf_batch_size})"
+            )
+
+    def evaluate_locked_batch(self, executor, locked_batch: list) -> set:
+        """
+        Run OPRF stage for batch of locked vaults and submit key generation stage for each of them
+
+        Parameters:
+            - executor (ProcessPoolExecutor): Process pool running key generation stage
+            - locked_batch (list): Results of lock stage
+
+        Returns:
+            - (set): Futures of key generation stage
+        """
+        secret_polynomials = [
+            GroupPoly(self.group.order, secret_coefs)
+            for _, secret_coefs, _ in locked_batch
+        ]
+        unblinded_evaluator_results = Client.evaluate_batch(
+            secret_polynomials, evaluator=self.evaluator
+        )
+
+        return {
+            executor.submit(
+                keygen_stage,
+                client_id,
+                unblinded_evaluator_result,
+                vault_coefs,
+                self.group.order,
+                self.verify_threshold,
+                self.profile_format,
+            )
+            for (client_id, _, vault_coefs), unblinded_evaluator_result in zip(
+                locked_batch, unblinded_evaluator_results
+            )
+        }
+
+    def enrol(self, templates):
+        """
+        Enrol stream of biometric templates, emitting enrolment records as soon as they are ready
+
+        Parameters:
+            - templates (iterable): Tuples (client_id, bio_template), consumed lazily
+
+        Returns:
+            - (generator): Yields enrolment records (str | bytes) in order of completion
+        """
+        templates = iter(templates)
+        input_exhausted = False
+        lock_futures = set()
+        keygen_futures = set()
+        locked_batch = []
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                # Admit new templates only while pipeline holds less than max_in_flight enrolments
+                while not input_exhausted and (
+                    len(lock_futures) + len(keygen_futures) + len(locked_batch)
+                    < self.max_in_flight
+                ):
+                    try:
+                        client_id, bio_template = next(templates)
+                    except StopIteration:
+                        input_exhausted = True
+                        break
+                    lock_futures.add(
+                        executor.submit(
+                            lock_stage,
+                            client_id,
+                            bio_template,
+                            self.verify_threshold,
+                            self.group,
+                        )
+                    )
+
+                # Feed OPRF stage with full batches, or with remainder once all vaults are locked
+                if len(locked_batch) >= self.oprf_batch_size or (
+                    locked_batch and input_exhausted and not lock_futures
+                ):
+                    keygen_futures |= self.evaluate_locked_batch(
+                        executor, locked_batch[: self.oprf_batch_size]
+                    )
+                    locked_batch = locked_batch[self.oprf_batch_size :]
+                    continue
+
+                if not lock_futures and not keygen_futures:
+                    if input_exhausted and not locked_batch:
+                        return
+                    continue
+
+                done, _ = wait(lock_futures | keygen_futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in lock_futures:
+                        lock_futures.remove(future)
+                        locked_batch.append(future.result())
+                    else:
+                        keygen_futures.remove(future)
+                        yield future.result()
+
+
+def run_tests():
+    print("Running batch_enrol.py tests...")
+
+    G = Group(prime=12401)
+    verify_threshold = 4
+    templates = {
+        client_id: [random.randint(1, G.order - 1) for _ in range(12)]
+        for client_id in range(5)
+    }
+
+    pipeline = BatchEnrolmentPipeline(
+        G, verify_threshold, workers=2, oprf_batch_size=2, max_in_flight=3
+    )
+    start = pc()
+    records = [load_profile(record) for record in pipeline.enrol(templates.items())]
+    elapsed = pc() - start
+
+    assert sorted(record["client_id"] for record in records) == list(templates)
+    for record in records:
+        assert record["verify_threshold"] == verify_threshold
+        assert len(record["vault_coefs"]) == len(templates[record["client_id"]]) + 1
+
+    print(f"Enrolments per second: {len(records) / elapsed:.2f}")
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import statistics
+from time import perf_counter as pc
+
+import numpy as np
+
+from client import Client
+from evaluator import Evaluator
+from fuzzy_vault import FuzzyVault
+from tally import candidate_digest, create_tally
+from group_poly import Group, GroupPoly
+from server import STORAGE_MODES, Server
+from profile_format import dump_profile, load_profile
+from server_service import create_test_profile, latency_percentiles
+from session_tickets import derive_resumption_secret
+
+# Default benchmark parameters, matching main.execute_BRAKE()
+PRIME = 2147483647
+BIO_TEMPLATE_LENGTH = 44
+VERIFY_THRESHOLDS = [4, 8]
+NUMBERS_OF_UNLOCKING_ROUNDS = [50, 500]
+
+# Relative slowdown of compared statistic reported as regression
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+
+def summarize(times: list) -> dict:
+    """
+    Compute statistics of measured run times
+
+    Parameters:
+        - times (list): Measured run times in seconds
+
+    Returns:
+        - (dict): Number of samples, mean, standard deviation, min, p50, p90, p99 and max in seconds
+    """
+    summary = latency_percentiles(times)
+    summary["min"] = min(times)
+    summary["stdev"] = statistics.stdev(times) if len(times) > 1 else 0.0
+    return summary
+
+
+class Benchmark:
+    def __init__(
+        self,
+        name: str,
+        run,
+        setup=None,
+        warmup: int = 3,
+        repetitions: int = 30,
+    ):
+        """
+        Benchmark class constructor, that returns single timed operation of the protocol
+
+        Parameters:
+            - name (str): Unique benchmark name
+            - run (callable): Timed operation, called with arguments returned by setup
+            - setup (callable): Untimed preparation called before every run, returns tuple of run's arguments
+            - warmup (int): Number of untimed runs before measurement
+            - repetitions (int): Number of timed runs
+
+        Returns:
+            - self (Benchmark): Benchmark class object
+        """
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.warmup = warmup
+        self.repetitions = repetitions
+
+    def measure(self, seed: int = 0, repetitions: int = None) -> dict:
+        """
+        Run benchmark with fixed seed of random inputs and summarize run times
+
+        Parameters:
+            - seed (int): Seed of 'random' and 'numpy.random' generators, secret values drawn with 'secrets' stay random
+            - repetitions (int): Number of timed runs overriding benchmark's default
+
+        Returns:
+            - (dict): Statistics of timed runs
+        """
+        random.seed(seed)
+        np.random.seed(seed)
+        repetitions = repetitions or self.repetitions
+
+        times = []
+        for i in range(self.warmup + repetitions):
+            arguments = self.setup() if self.setup is not None else ()
+            s = pc()
+            self.run(*arguments)
+            e = pc()
+            if i >= self.warmup:
+                times.append(e - s)
+
+        return dict(summarize(times), warmup=self.warmup)
+
+
+def create_protocol_benchmarks() -> list:
+    """
+    Create benchmarks of protocol phases running in memory
+
+    Parameters:
+        - None
+
+    Returns:
+        - benchmarks (list): Benchmark class objects
+    """
+    G = Group(prime=PRIME)
+
+    def random_template(length=BIO_TEMPLATE_LENGTH):
+        return [random.randint(1, PRIME - 1) for i in range(length)]
+
+    def random_polynomials():
+        return (
+            GroupPoly(PRIME, random_template(BIO_TEMPLATE_LENGTH + 1)),
+            GroupPoly(PRIME, random_template(BIO_TEMPLATE_LENGTH + 1)),
+        )
+
+    benchmarks = [
+        Benchmark(
+            "group_poly_multiply",
+            lambda a, b: a * b,
+            setup=random_polynomials,
+        ),
+        Benchmark(
+            "group_poly_add",
+            lambda a, b: a + b,
+            setup=random_polynomials,
+        ),
+        Benchmark(
+            "group_poly_eval",
+            lambda a, b: a.eval(PRIME - 2),
+            setup=random_polynomials,
+        ),
+    ]
+
+    for verify_threshold in VERIFY_THRESHOLDS:
+
+        def lock_setup(verify_threshold=verify_threshold):
+            fuzzy_vault = FuzzyVault(group_order=PRIME, bio_template=random_template())
+            secret_polynomial = FuzzyVault.generate_secret_polynomial(
+                group_order=PRIME, sec_poly_deg=verify_threshold
+            )
+            return (fuzzy_vault, secret_polynomial)
+
+        benchmarks.append(
+            Benchmark(
+                f"fuzzy_vault_lock[threshold={verify_threshold}]",
+                lambda fuzzy_vault, secret_polynomial: fuzzy_vault.lock(
+                    secret_polynomial=secret_polynomial
+                ),
+                setup=lock_setup,
+            )
+        )
+
+        for number_of_unlocking_rounds in NUMBERS_OF_UNLOCKING_ROUNDS:
+
+            def unlock_setup(verify_threshold=verify_threshold):
+                fuzzy_vault, secret_polynomial = lock_setup(verify_threshold)
+                fuzzy_vault.lock(secret_polynomial=secret_polynomial)
+                return (fuzzy_vault,)
+
+            def unlock(
+                fuzzy_vault,
+                verify_threshold=verify_threshold,
+                number_of_unlocking_rounds=number_of_unlocking_rounds,
+            ):
+                fuzzy_vault.unlock(
+                    verify_threshold=verify_threshold,
+                    number_of_unlocking_rounds=number_of_unlocking_rounds,
+                )
+
+            benchmarks.append(
+                Benchmark(
+                    f"fuzzy_vault_unlock[threshold={verify_threshold},rounds={number_of_unlocking_rounds}]",
+                    unlock,
+                    setup=unlock_setup,
+                    warmup=1,
+                    repetitions=5,
+                )
+            )
+
+    # Tallying noisy unlocking, where nearly every round recovers distinct candidate
+    def tally_setup():
+        return ([tuple(random_template(8)) for i in range(5000)],)
+
+    def tally_candidates(candidates, tally_capacity):
+        tally = create_tally(tally_capacity)
+        for round_number, coefs in enumerate(candidates, start=1):
+            tally.add(candidate_digest(coefs, PRIME), coefs, round_number)
+        return tally.winner()
+
+    for tally_capacity in (None, 256):
+        benchmarks.append(
+            Benchmark(
+                f"unlock_tally[capacity={tally_capacity},candidates=5000]",
+                lambda candidates, tally_capacity=tally_capacity: tally_candidates(
+                    candidates, tally_capacity
+                ),
+                setup=tally_setup,
+                repetitions=10,
+            )
+        )
+
+    client = Client(1, random_template(), evaluator=Evaluator())
+    benchmarks += [
+        Benchmark(
+            "oprf_evaluate",
+            lambda secret_polynomial: client.evaluate(secret_polynomial, G),
+            setup=lambda: (
+                FuzzyVault.generate_secret_polynomial(group_order=PRIME, sec_poly_deg=8),
+            ),
+        ),
+        Benchmark(
+            "key_derivation",
+            lambda unblinded_evaluator_result: client.generate_key_pair_PEM(
+                unblinded_evaluator_result=unblinded_evaluator_result
+            ),
+            setup=lambda: (f"{random.getrandbits(256):064x}",),
+            warmup=0,
+            repetitions=3,
+        ),
+        Benchmark(
+            "resumption_secret_kdf",
+            derive_resumption_secret,
+            setup=lambda: (random.randbytes(32),),
+        ),
+    ]
+
+    return benchmarks
+
+
+def create_storage_benchmarks(db_path: str) -> list:
+    """
+    Create benchmarks of Server's storage operations for every storage mode
+
+    Parameters:
+        - db_path (str): Directory for temporary Server databases, removed by caller
+
+    Returns:
+        - benchmarks (list): Benchmark class objects
+    """
+    profile_dict = load_profile(create_test_profile(0))
+    benchmarks = []
+
+    for storage_mode in STORAGE_MODES:
+        server = Server(f"{db_path}{storage_mode}/", storage_mode=storage_mode)
+        server.enrol_client(dump_profile(profile_dict, "json"))
+        client_ids = iter(range(1, 10**9))
+
+        def enrol_setup(server=server, client_ids=client_ids):
+            client_enrolment_json = dump_profile(
+                dict(profile_dict, client_id=next(client_ids)), "json"
+            )
+            return (server, client_enrolment_json)
+
+        def uncached_setup(server=server):
+            server.profile_cache.clear()
+            return (server,)
+
+        benchmarks += [
+            Benchmark(
+                f"server_enrol[{storage_mode}]",
+                lambda server, client_enrolment_json: server.enrol_client(
+                    client_enrolment_json
+                ),
+                setup=enrol_setup,
+            ),
+            Benchmark(
+                f"server_vault_request[{storage_mode},cached]",
+                lambda server: server.vault_request(0),
+                setup=lambda server=server: (server,),
+            ),
+            Benchmark(
+                f"server_vault_request[{storage_mode},uncached]",
+                lambda server: server.vault_request(0),
+                setup=uncached_setup,
+            ),
+        ]
+
+    benchmarks.append(
+        Benchmark(
+            "session_key_kdf",
+            lambda server: server.generate_session_key(),
+            setup=lambda server=server: (server,),
+        )
+    )
+
+    return benchmarks
+
+
+def run_suite(
+    name_filter: str = None, seed: int = 0, repetitions: int = None, verbose: bool = True
+) -> dict:
+    """
+    Run benchmark suite
+
+    Parameters:
+        - name_filter (str): Only run benchmarks whose name contains this string if given
+        - seed (int): Seed of random inputs of every benchmark
+        - repetitions (int): Number of timed runs of every benchmark overriding their defaults
+        - verbose (bool): Whether to print results as they are measured
+
+    Returns:
+        - (dict): Run metadata and statistics per benchmark name
+    """
+    db_path = "./benchmark_db/"
+    shutil.rmtree(db_path, ignore_errors=True)
+
+    results = {}
+    try:
+        benchmarks = create_protocol_benchmarks()
+        if name_filter is None or "server" in name_filter or "kdf" in name_filter:
+            benchmarks += create_storage_benchmarks(db_path)
+
+        for benchmark in benchmarks:
+            if name_filter is not None and name_filter not in benchmark.name:
+                continue
+            results[benchmark.name] = benchmark.measure(seed=seed, repetitions=repetitions)
+            if verbose:
+                print(
+                    f"{benchmark.name:<52} p50 {results[benchmark.name]['p50'] * 1000:10.3f} ms"
+                    f"   p99 {results[benchmark.name]['p99'] * 1000:10.3f} ms"
+                )
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+    return {
+        "metadata": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(
+    baseline: dict,
+    current: dict,
+    statistic: str = "p50",
+    threshold: float = DEFAULT_REGRESSION_THRESHOLD,
+) -> list:
+    """
+    Compare benchmark results against stored baseline
+
+    Parameters:
+        - baseline (dict): Baseline results returned by run_suite()
+        - current (dict): Current results returned by run_suite()
+        - statistic (str): Compared statistic
+        - threshold (float): Relative slowdown reported as regression
+
+    Returns:
+        - comparison (list): Dicts with 'name', 'baseline', 'current', 'change' and 'regression' for benchmarks present in both results
+    """
+    comparison = []
+    for name, current_statistics in current["results"].items():
+        baseline_statistics = baseline["results"].get(name)
+        if baseline_statistics is None:
+            continue
+        change = current_statistics[statistic] / baseline_statistics[statistic] - 1
+        comparison.append(
+            {
+                "name": name,
+                "baseline": baseline_statistics[statistic],
+                "current": current_statistics[statistic],
+                "change": change,
+                "regression": change > threshold,
+            }
+        )
+    return comparison
+
+
+def run_tests():
+    print("Running benchmark.py tests...")
+
+    times = [0.001 * i for i in range(1, 101)]
+    summary = summarize(times)
+    assert summary["count"] == 100 and summary["min"] == 0.001
+    assert summary["p50"] == 0.05 and summary["p99"] == 0.099
+
+    # Fixed seed gives identical inputs
+    benchmark_inputs = []
+    benchmark = Benchmark(
+        "seeded",
+        lambda value: benchmark_inputs.append(value),
+        setup=lambda: (random.random(),),
+        warmup=1,
+        repetitions=3,
+    )
+    benchmark.measure(seed=7)
+    benchmark.measure(seed=7)
+    assert benchmark_inputs[:4] == benchmark_inputs[4:]
+
+    current = run_suite(name_filter="group_poly", repetitions=5, verbose=False)
+    assert set(current["results"]) == {
+        "group_poly_multiply",
+        "group_poly_add",
+        "group_poly_eval",
+    }
+
+    # Slower current results are flagged as regressions
+    baseline = json.loads(json.dumps(current))
+    baseline["results"]["group_poly_multiply"]["p50"] /= 2
+    regressions = [
+        entry["name"] for entry in compare(baseline, current) if entry["regression"]
+    ]
+    assert regressions == ["group_poly_multiply"]
+
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    parser = argparse.ArgumentParser(description="Per-phase benchmark suite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run benchmarks")
+    run_parser.add_argument("--output", default=None, help="JSON file to store results in")
+    run_parser.add_argument("--filter", default=None, help="Run benchmarks containing this name")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--repetitions", type=int, default=None)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare results against baseline, exits with 1 on regression"
+    )
+    compare_parser.add_argument("baseline", help="Baseline JSON results")
+    compare_parser.add_argument("current", help="Current JSON results")
+    compare_parser.add_argument("--statistic", default="p50")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD
+    )
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite(
+            name_filter=args.filter, seed=args.seed, repetitions=args.repetitions
+        )
+        if args.output is not None:
+            with open(args.output, "wt") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    with open(args.baseline, "rt") as f:
+        baseline = json.load(f)
+    with open(args.current, "rt") as f:
+        current = json.load(f)
+
+    comparison = compare(baseline, current, args.statistic, args.threshold)
+    for entry in comparison:
+        flag = "REGRESSION" if entry["regression"] else ""
+        print(
+            f"{entry['name']:<52} {entry['baseline'] * 1000:10.3f} ms -> "
+            f"{entry['current'] * 1000:10.3f} ms {entry['change'] * 100:+7.1f} % {flag}"
+        )
+    if any(entry["regression"] for entry in comparison):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
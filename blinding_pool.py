@@ -0,0 +1,247 @@
+import os
+import secrets
+import threading
+from collections import deque
+from time import perf_counter as pc
+
+# Modulus for blinding procedure, the largest 256-bit prime shared with Evaluator's OPRF modulus
+BLINDING_MODULUS = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF43
+
+
+def batch_inverse(values: list, modulus: int) -> list:
+    """
+    Invert many values modulo prime with single modular inversion using Montgomery's simultaneous inversion trick
+
+    Parameters:
+        - values (list): Nonzero values to invert
+        - modulus (int): Prime modulus
+
+    Returns:
+        - inverses (list): Multiplicative inverses of values in the same order
+    """
+    if not values:
+        return []
+
+    # Prefix products: prefix[i] = values[0] * ... * values[i]
+    prefix = [0] * len(values)
+    accumulator = 1
+    for i, value in enumerate(values):
+        accumulator = (accumulator * value) % modulus
+        prefix[i] = accumulator
+
+    # Single inversion of product of all values
+    inverse_accumulator = pow(accumulator, -1, modulus)
+
+    # Walk back peeling one value at a time
+    inverses = [0] * len(values)
+    for i in range(len(values) - 1, 0, -1):
+        inverses[i] = (inverse_accumulator * prefix[i - 1]) % modulus
+        inverse_accumulator = (inverse_accumulator * values[i]) % modulus
+    inverses[0] = inverse_accumulator
+
+    return inverses
+
+
+class BlindingPool:
+    def __init__(
+        self,
+        r_mod: int = BLINDING_MODULUS,
+        batch_size: int = 256,
+        capacity: int = 1024,
+        low_watermark: int = 256,
+        background: bool = True,
+    ):
+        """
+        BlindingPool class constructor, that returns pool of pre-generated blinding pairs (r, r^-1) refilled in background
+
+        Parameters:
+            - r_mod (int): Prime modulus for blinding procedure
+            - batch_size (int): Number of pairs generated with single modular inversion
+            - capacity (int): Maximal number of pairs kept in pool
+            - low_watermark (int): Pool size below which background refill is triggered
+            - background (bool): Whether to refill pool in background thread
+
+        Returns:
+            - self (BlindingPool): BlindingPool class object
+        """
+        self.r_mod = r_mod
+        self.batch_size = batch_size
+        self.capacity = capacity
+        self.low_watermark = low_watermark
+        self.background = background
+
+        self.pairs = deque()
+        self.refill_needed = threading.Event()
+        self.closed = False
+        self.refill_thread = None
+        self.owner_pid = None
+
+        self.generated = 0
+        self.taken = 0
+        self.misses = 0
+        self.generation_time = 0.0
+
+    def generate_pairs(self, how_many: int) -> list:
+        """
+        Generate blinding pairs with CSPRNG and batch inversion
+
+        Parameters:
+            - how_many (int): Number of pairs to generate
+
+        Returns:
+            - (list): Tuples (r, r_inv) with r * r_inv = 1 mod r_mod
+        """
+        s = pc()
+        r_values = [secrets.randbelow(self.r_mod - 2) + 2 for _ in range(how_many)]
+        r_inverses = batch_inverse(r_values, self.r_mod)
+        self.generated += how_many
+        self.generation_time += pc() - s
+
+        return list(zip(r_values, r_inverses))
+
+    def refill(self) -> None:
+        """
+        Fill pool up to its capacity
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        while not self.closed and len(self.pairs) < self.capacity:
+            how_many = min(self.batch_size, self.capacity - len(self.pairs))
+            self.pairs.extend(self.generate_pairs(how_many))
+
+    def refill_loop(self) -> None:
+        while not self.closed:
+            self.refill_needed.wait()
+            self.refill_needed.clear()
+            self.refill()
+
+    def ensure_refill_thread(self) -> None:
+        """
+        Drop pairs inherited from parent process after fork, so that no blinding pair is used by two processes,
+        and start background refill thread in every process since threads do not survive fork
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        pid = os.getpid()
+        if self.owner_pid == pid:
+            return
+
+        self.owner_pid = pid
+        self.pairs = deque()
+        self.refill_needed = threading.Event()
+        if self.background and not self.closed:
+            self.refill_thread = threading.Thread(
+                target=self.refill_loop, name="blinding-pool", daemon=True
+            )
+            self.refill_thread.start()
+            self.refill_needed.set()
+
+    def take(self) -> tuple:
+        """
+        Take single blinding pair from pool
+
+        Parameters:
+            - None
+
+        Returns:
+            - (tuple): Blinding pair (r, r_inv)
+        """
+        return self.take_many(1)[0]
+
+    def take_many(self, how_many: int) -> list:
+        """
+        Take many blinding pairs from pool, generating missing pairs in place if pool is drained
+
+        Parameters:
+            - how_many (int): Number of pairs to take
+
+        Returns:
+            - (list): Blinding pairs (r, r_inv)
+        """
+        self.ensure_refill_thread()
+
+        taken_pairs = []
+        while len(taken_pairs) < how_many:
+            try:
+                taken_pairs.append(self.pairs.popleft())
+            except IndexError:
+                break
+
+        # Pool drained faster than refilled, generate rest on the critical path
+        if len(taken_pairs) < how_many:
+            self.misses += 1
+            taken_pairs.extend(self.generate_pairs(how_many - len(taken_pairs)))
+
+        self.taken += how_many
+        if len(self.pairs) < self.low_watermark:
+            if self.background:
+                self.refill_needed.set()
+            else:
+                self.refill()
+
+        return taken_pairs
+
+    def close(self) -> None:
+        self.closed = True
+        self.refill_needed.set()
+
+    def stats(self) -> dict:
+        return {
+            "available": len(self.pairs),
+            "generated": self.generated,
+            "taken": self.taken,
+            "misses": self.misses,
+            "generation_time": self.generation_time,
+        }
+
+
+def run_tests():
+    print("Running blinding_pool.py tests...")
+
+    modulus = 12401
+    values = [2, 3, 12400, 77, 1]
+    assert batch_inverse(values, modulus) == [pow(v, -1, modulus) for v in values]
+
+    for background in (False, True):
+        pool = BlindingPool(batch_size=16, capacity=64, low_watermark=16, background=background)
+        pairs = pool.take_many(100)
+        pairs.append(pool.take())
+        assert len(pairs) == 101
+        for r, r_inv in pairs:
+            assert 2 <= r < pool.r_mod
+            assert (r * r_inv) % pool.r_mod == 1
+
+        # Forked process never reuses pairs left in pool of parent process
+        pool.take()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            with os.fdopen(write_fd, "wt") as f:
+                f.write(" ".join(str(r) for r, _ in pool.take_many(16)))
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rt") as f:
+            child_r_values = {int(r) for r in f.read().split()}
+        os.waitpid(pid, 0)
+        assert len(child_r_values) == 16
+        assert not child_r_values & {r for r, _ in pool.take_many(16)}
+        pool.close()
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
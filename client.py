@@ -1,95 +1,262 @@
+import io
 import random
 import hashlib
 import json
+import logging
 
-from rsa import generate_key
 from evaluator import Evaluator
 from fuzzy_vault import FuzzyVault
 from group_poly import Group, GroupPoly
-from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP
+from interpolation import PreprocessedTemplate, preprocess_template
+from profile_format import encode_profile, load_profile, profile_vaults, public_key_DER
+from unlock_state import UnlockStateStore, unlock_state_key
+from blinding_pool import BlindingPool
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+PHASE_DURATION = metrics.histogram(
+    "brake_client_phase_duration_seconds",
+    "Duration of phases of Client's enrolment and verification",
+    ("operation", "phase"),
+)
+OPRF_DURATION = metrics.histogram(
+    "brake_oprf_duration_seconds",
+    "Duration of blinded OPRF evaluation including blinding and unblinding",
+    ("mode",),
+)
+
+
+def key_fingerprint(key_DER: bytes) -> str:
+    """
+    Compute short fingerprint of public key identifying it in logs
+
+    Parameters:
+        - key_DER (bytes): Public key in DER format
+
+    Returns:
+        - (str): First 16 hex digits of SHA256 of key, 'none' if key is not given
+    """
+    if key_DER is None:
+        return "none"
+    return hashlib.sha256(key_DER).hexdigest()[:16]
 
 
 class Client:
-    def __init__(self, client_id: int, biometrics_template: list):
+    # Long-lived Evaluator shared by Clients that are not given their own
+    default_evaluator = None
+    # Pool of blinding pairs refilled in background, off the login critical path
+    blinding_pool = None
+
+    def __init__(
+        self, client_id: int, biometrics_template: list, evaluator: Evaluator = None
+    ):
         """
         Client class constructor, that returns Client instantiation object
 
         Parameters:
             - client_id (int): Client's identificator
+            - biometrics_template (list): Client's biometric template
+            - evaluator (Evaluator): Evaluator or Evaluator service client used for OPRF evaluation, shared default Evaluator if not given
 
         Returns:
             - self (Client): Client class object
         """
         self.id = client_id
         self.biometrics_template = biometrics_template
+        self.evaluator = evaluator or Client.get_default_evaluator()
 
-    def enrol(self, verify_threshold: int, group: Group, DEBUG=False) -> str:
+    @classmethod
+    def get_default_evaluator(cls) -> Evaluator:
+        """
+        Get long-lived Evaluator shared by Clients, creating it on first use
+
+        Parameters:
+            - None
+
+        Returns:
+            - (Evaluator): Shared Evaluator object
+        """
+        if cls.default_evaluator is None:
+            cls.default_evaluator = Evaluator()
+        return cls.default_evaluator
+
+    @tracing.traced("client.enrol")
+    def enrol(
+        self,
+        verify_threshold: int,
+        group: Group,
+        DEBUG=False,
+        profile_format: str = "json",
+        bio_templates: list = None,
+    ):
         """
         Execute enrolment phase of BRAKE protocol
 
         Parameters:
             - verify_threshold (int): Defined closeness parameter value of acceptable biometric vector's distance
             - group (Group): Group in which the protocol is executed
-            - DEBUG (bool): Flag for verbose execution mode
+            - DEBUG (bool): Kept for compatibility, debug values are logged by "client" logger at DEBUG level
+            - profile_format (str): Format of Client's profile, either 'json' or 'binary'
+            - bio_templates (list): Templates of several fingers or modalities, each locked into its own vault with the same secret, so that any of them verifies Client;
+              defaults to Client's biometric template
 
         Returns:
-            - public_values_json (str): Client's profile distributed to Server as JSON
+            - public_values_json (str | bytes): Client's profile distributed to Server as JSON or binary profile
         """
-        # Generate secret polynomial for the Client with given ID
-        secret_polynomial = FuzzyVault.generate_secret_polynomial(
-            group_order=group.order, sec_poly_deg=verify_threshold
-        )
-
-        # Create FuzzyVault using secret polynomial and lock it
-        fuzzy_vault = FuzzyVault(
-            group_order=group.order, bio_template=self.biometrics_template
-        )
-        fuzzy_vault.lock(secret_polynomial=secret_polynomial)
+        if bio_templates is None:
+            bio_templates = [self.biometrics_template]
+
+        # Generate secret polynomial for the Client with given ID and lock it into FuzzyVault of every template
+        with PHASE_DURATION.time(operation="enrol", phase="lock"):
+            secret_polynomial, fuzzy_vault = self.lock_template(
+                verify_threshold=verify_threshold, group=group, bio_template=bio_templates[0]
+            )
+            additional_fuzzy_vaults = [
+                self.lock_template(
+                    verify_threshold=verify_threshold,
+                    group=group,
+                    bio_template=bio_template,
+                    secret_polynomial=secret_polynomial,
+                )[1]
+                for bio_template in bio_templates[1:]
+            ]
 
         # Evaluate OPRF with Evaluator
-        unblinded_evaluator_result = self.evaluate(
-            secret_polynomial=secret_polynomial, group=group, DEBUG=DEBUG
-        )
+        with PHASE_DURATION.time(operation="enrol", phase="oprf"):
+            unblinded_evaluator_result = self.evaluate(
+                secret_polynomial=secret_polynomial, group=group, DEBUG=DEBUG
+            )
 
         # Generate seeded client key pair: [0] - private, [1] - public
-        client_private_key_PEM, client_public_key_PEM = self.generate_key_pair_PEM(
-            unblinded_evaluator_result=unblinded_evaluator_result
-        )
+        with PHASE_DURATION.time(operation="enrol", phase="keygen"):
+            client_private_key_PEM, client_public_key_PEM = self.generate_key_pair_PEM(
+                unblinded_evaluator_result=unblinded_evaluator_result
+            )
 
         # Send (id, V(x), cpk_t) to the server
-        public_values_json = self.create_public_values_json(
-            fuzzy_vault.vault_polynomial.coef.tolist(),
-            client_public_key_PEM,
-            group.order,
-            verify_threshold,
-        )
-
-        # Print values for debugging purpose
-        if DEBUG:
-            print("### Enrolment Debug Log ###\n")
-            print(f"Secret poly f: {secret_polynomial}\n")
-            print(f"Unblinded poly [k]H(f): {unblinded_evaluator_result}\n")
-            print(f"Public values json: {public_values_json}\n")
-            print(f"Generated private key:\n{client_private_key_PEM}")
+        with PHASE_DURATION.time(operation="enrol", phase="encode"):
+            public_values_json = self.create_public_values(
+                fuzzy_vault.vault_polynomial.coef.tolist(),
+                client_public_key_PEM,
+                group.order,
+                verify_threshold,
+                profile_format=profile_format,
+                additional_vaults_coefs=[
+                    additional_fuzzy_vault.vault_polynomial.coef.tolist()
+                    for additional_fuzzy_vault in additional_fuzzy_vaults
+                ],
+            )
+
+        # Log public values for debugging purpose, key material never leaves the Client, not even to logs
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Enrolment of Client %s: profile of %d bytes, public key fingerprint %s",
+                self.id,
+                len(public_values_json),
+                key_fingerprint(public_key_DER({"client_public_key_PEM": client_public_key_PEM})),
+            )
 
         return public_values_json
 
+    @tracing.traced("client.lock_template")
+    def lock_template(
+        self,
+        verify_threshold: int,
+        group: Group,
+        bio_template: list = None,
+        secret_polynomial: GroupPoly = None,
+    ) -> tuple:
+        """
+        Generate secret polynomial and lock it into Fuzzy Vault using Client's biometric template
+
+        Parameters:
+            - verify_threshold (int): Defined closeness parameter value of acceptable biometric vector's distance
+            - group (Group): Group in which the protocol is executed
+            - bio_template (list): Biometric template locking the vault, defaults to Client's biometric template
+            - secret_polynomial (GroupPoly): Secret polynomial already locked into Client's other vault, new one is generated if not given
+
+        Returns:
+            - (tuple):
+                - secret_polynomial (GroupPoly): Generated secret polynomial
+                - fuzzy_vault (FuzzyVault): Fuzzy Vault locked with secret polynomial
+        """
+        # Generate secret polynomial for the Client with given ID
+        if secret_polynomial is None:
+            secret_polynomial = FuzzyVault.generate_secret_polynomial(
+                group_order=group.order, sec_poly_deg=verify_threshold
+            )
+
+        # Create FuzzyVault using secret polynomial and lock it
+        fuzzy_vault = FuzzyVault(
+            group_order=group.order,
+            bio_template=self.biometrics_template if bio_template is None else bio_template,
+        )
+        fuzzy_vault.lock(secret_polynomial=secret_polynomial)
+
+        return (secret_polynomial, fuzzy_vault)
+
+    @tracing.traced("client.verify")
     def verify(
         self,
-        public_values_json: str,
+        public_values_json,
         group: Group,
         number_of_unlocking_rounds: int = 5000,
         DEBUG=False,
+        tally_capacity: int = None,
+        unlock_state_store=None,
     ) -> str:
         """
         Execute verification phase of BRAKE protocol
 
         Parameters:
-            - public_values_json (str): Client's profile distributed to Server as JSON
+            - public_values_json (str | bytes | dict): Client's profile distributed to Server as JSON, binary profile or dict
             - group (Group): Group in which the protocol is executed
             - number_of_unlocking_rounds (int): Number of secret polynomial recovery rounds to perform
-            - DEBUG (bool): Flag for verbose execution mode
+            - DEBUG (bool): Kept for compatibility, debug values are logged by "client" logger at DEBUG level
+            - tally_capacity (int): Maximal number of secret polynomial candidates counted at once during unlocking, unbounded if not given
+            - unlock_state_store (UnlockStateStore): Store of unlocking progress, retry with the same capture continues previous unlocking
+
+        Returns:
+            - client_private_key_PEM (str): Value of recovered Client's private RSA key used for key exchange
+        """
+        return self.verify_multi(
+            public_values_json=public_values_json,
+            group=group,
+            captures=[self.biometrics_template],
+            number_of_unlocking_rounds=number_of_unlocking_rounds,
+            DEBUG=DEBUG,
+            tally_capacity=tally_capacity,
+            unlock_state_store=unlock_state_store,
+        )
+
+    @tracing.traced("client.verify_multi")
+    def verify_multi(
+        self,
+        public_values_json,
+        group: Group,
+        captures: list,
+        number_of_unlocking_rounds: int = 5000,
+        DEBUG=False,
+        tally_capacity: int = None,
+        unlock_state_store=None,
+    ) -> str:
+        """
+        Execute verification phase of BRAKE protocol with several captures of the same biometric modality
+
+        Vault is parsed once and evaluated once per distinct sample, unlocking rounds of all captures vote in single
+        candidate search, and OPRF and key derivation run once for the winning polynomial. Vaults of Client enroled
+        with several templates take turns in unlocking, see unlock_vaults().
+
+        Parameters:
+            - public_values_json (str | bytes | dict): Client's profile distributed to Server as JSON, binary profile or dict
+            - group (Group): Group in which the protocol is executed
+            - captures (list): Biometric verification templates taken during single login attempt
+            - number_of_unlocking_rounds (int): Number of secret polynomial recovery rounds to perform, split evenly between captures
+            - DEBUG (bool): Kept for compatibility, debug values are logged by "client" logger at DEBUG level
+            - tally_capacity (int): Maximal number of secret polynomial candidates counted at once during unlocking, unbounded if not given
+            - unlock_state_store (UnlockStateStore): Store of unlocking progress, retry with the same captures continues previous unlocking
 
         Returns:
             - client_private_key_PEM (str): Value of recovered Client's private RSA key used for key exchange
@@ -99,41 +266,154 @@ class Client:
             public_values_json=public_values_json
         )
 
-        group_order = public_values_dict["group_order"]
-        verify_threshold = public_values_dict["verify_threshold"]
+        # Unlock vault, or first of Client's vaults that is unlocked
+        with PHASE_DURATION.time(operation="verify", phase="unlock"):
+            recovered_secret_polynomial = self.unlock_vaults(
+                public_values_dict=public_values_dict,
+                captures=captures,
+                number_of_unlocking_rounds=number_of_unlocking_rounds,
+                tally_capacity=tally_capacity,
+                unlock_state_store=unlock_state_store,
+            )
 
-        # Create FuzzyVault instance for verification purpose
-        fuzzy_vault = FuzzyVault(
-            group_order=group_order, bio_template=self.biometrics_template
-        )
-        fuzzy_vault.set_vault_polynomial(
-            vault_polynomial_coefs=public_values_dict["vault_coefs"]
-        )
+        # Evaluate OPRF with Evaluator
+        with PHASE_DURATION.time(operation="verify", phase="oprf"):
+            unblinded_evaluator_result = self.evaluate(
+                secret_polynomial=recovered_secret_polynomial, group=group, DEBUG=DEBUG
+            )
+
+        with PHASE_DURATION.time(operation="verify", phase="keygen"):
+            client_private_key_PEM, client_public_key_PEM = self.generate_key_pair_PEM(
+                unblinded_evaluator_result=unblinded_evaluator_result
+            )
+
+        # Progress of successful unlocking must not be resumed by later logins with the same captures
+        recovered_key_DER = public_key_DER({"client_public_key_PEM": client_public_key_PEM})
+        if unlock_state_store is not None and recovered_key_DER == public_key_DER(public_values_dict):
+            self.discard_unlock_states(public_values_dict, captures, unlock_state_store)
+
+        # Log public keys only, recovered secret and private key never leave the Client, not even to logs
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Verification of Client %s: recovered public key fingerprint %s, enroled public key fingerprint %s",
+                self.id,
+                key_fingerprint(recovered_key_DER),
+                key_fingerprint(public_key_DER(public_values_dict)),
+            )
 
-        # Unlock vault using
-        recovered_secret_polynomial = fuzzy_vault.unlock(
-            verify_threshold=verify_threshold,
-            number_of_unlocking_rounds=number_of_unlocking_rounds,
-        )
+        return client_private_key_PEM
 
-        # Evaluate OPRF with Evaluator
-        unblinded_evaluator_result = self.evaluate(
-            secret_polynomial=recovered_secret_polynomial, group=group, DEBUG=DEBUG
-        )
+    @tracing.traced("client.unlock_vaults")
+    def unlock_vaults(
+        self,
+        public_values_dict: dict,
+        captures: list,
+        number_of_unlocking_rounds: int = 5000,
+        tally_capacity: int = None,
+        unlock_state_store=None,
+        min_votes: int = 2,
+        rounds_per_turn: int = 50,
+    ) -> GroupPoly:
+        """
+        Unlock Client's vaults with verification captures taking turns, returning secret of the first one unlocked
 
-        client_private_key_PEM, client_public_key_PEM = self.generate_key_pair_PEM(
-            unblinded_evaluator_result=unblinded_evaluator_result
-        )
+        All vaults lock the same secret, vault counts as unlocked once any of its candidates is guaranteed 'min_votes' votes
+        and unlocking of remaining vaults then stops; votes of bounded tally inherited from evicted candidates are not counted. Unlocking is CPU-bound Python code, so vaults unlocked in threads
+        would only take turns holding GIL. If no vault is unlocked, candidate with most votes is returned.
 
-        if DEBUG:
-            print("### Verification Debug Log ###\n")
-            print(f"Secret poly f': {recovered_secret_polynomial}\n")
-            print(f"Unblinded poly [k]H(f'): {unblinded_evaluator_result}\n")
-            print(f"Public values json: {public_values_json}\n")
-            print(f"Recovered private key:\n{client_private_key_PEM}")
+        Parameters:
+            - public_values_dict (dict): Client's profile with one or several vaults
+            - captures (list): Biometric verification templates taken during single login attempt
+            - number_of_unlocking_rounds (int): Number of secret polynomial recovery rounds to perform on every vault
+            - tally_capacity (int): Maximal number of secret polynomial candidates counted at once during unlocking, unbounded if not given
+            - unlock_state_store (UnlockStateStore): Store of unlocking progress, retry with the same captures continues previous unlocking
+            - min_votes (int): Number of votes of candidate that unlocks one of several vaults
+            - rounds_per_turn (int): Number of rounds performed on one vault before next vault takes its turn
 
-        return client_private_key_PEM
+        Returns:
+            - (GroupPoly): Recovered secret polynomial
+        """
+        # Create FuzzyVault instance of every vault for verification purpose
+        fuzzy_vaults = []
+        for vault_coefs in profile_vaults(public_values_dict):
+            fuzzy_vault = FuzzyVault(
+                group_order=public_values_dict["group_order"], bio_template=captures[0]
+            )
+            fuzzy_vault.set_vault_polynomial(vault_polynomial_coefs=vault_coefs)
+            fuzzy_vaults.append(fuzzy_vault)
+
+        # Captures are preprocessed once for all vaults, which share group order
+        templates = [
+            PreprocessedTemplate(capture, public_values_dict["group_order"]) for capture in captures
+        ]
+        unlock_arguments = dict(
+            verify_threshold=public_values_dict["verify_threshold"],
+            tally_capacity=tally_capacity,
+            captures=captures,
+            preprocessed_templates=templates,
+        )
+        if len(fuzzy_vaults) == 1:
+            return fuzzy_vaults[0].unlock(
+                **unlock_arguments,
+                number_of_unlocking_rounds=number_of_unlocking_rounds,
+                state_store=unlock_state_store,
+            )
+
+        # Vaults take turns in single thread, each turn continues untried combinations and votes of previous turns,
+        # so that vault matching captures is unlocked early while other vaults have tried few combinations only
+        state_store = unlock_state_store if unlock_state_store is not None else UnlockStateStore()
+        active_vaults = list(fuzzy_vaults)
+        results = []
+        errors = []
+        for turn_start in range(0, number_of_unlocking_rounds, rounds_per_turn):
+            turn_rounds = min(rounds_per_turn, number_of_unlocking_rounds - turn_start)
+            for fuzzy_vault in list(active_vaults):
+                try:
+                    secret_polynomial = fuzzy_vault.unlock(
+                        **unlock_arguments,
+                        number_of_unlocking_rounds=turn_rounds,
+                        state_store=state_store,
+                        stop_votes=min_votes,
+                    )
+                except ValueError as err:
+                    # Capture unusable with this vault, or all its combinations were tried
+                    errors.append(err)
+                    active_vaults.remove(fuzzy_vault)
+                    continue
+
+                votes = fuzzy_vault.unlock_stats["votes"]
+                if votes >= min_votes:
+                    return secret_polynomial
+                results.append((secret_polynomial, votes))
+
+        if not results:
+            raise errors[0]
+        return max(results, key=lambda result: result[1])[0]
+
+    def discard_unlock_states(
+        self, public_values_dict: dict, captures: list, unlock_state_store
+    ) -> None:
+        """
+        Discard unlocking progress of all Client's vaults with verification captures
 
+        Parameters:
+            - public_values_dict (dict): Client's profile with one or several vaults
+            - captures (list): Biometric verification templates taken during login attempt
+            - unlock_state_store (UnlockStateStore): Store of unlocking progress
+
+        Returns:
+            - None
+        """
+        group_order = public_values_dict["group_order"]
+        templates = [preprocess_template(capture, group_order) for capture in captures]
+        for vault_coefs in profile_vaults(public_values_dict):
+            unlock_state_store.discard(
+                unlock_state_key(
+                    vault_coefs, templates, group_order, public_values_dict["verify_threshold"]
+                )
+            )
+
+    @tracing.traced("client.recover_session_key")
     def recover_session_key(
         self, encrypted_session_key: bytes, client_private_key_PEM: str
     ) -> bytes:
@@ -147,13 +427,48 @@ class Client:
         Returns:
             - session_key (bytes): Decapsulated session key value
         """
+        from Crypto.PublicKey import RSA
+
         client_private_key = RSA.import_key(client_private_key_PEM)
+
+        return self.decrypt_session_key(encrypted_session_key, client_private_key)
+
+    def decrypt_session_key(self, encrypted_session_key: bytes, client_private_key) -> bytes:
+        """
+        Decapsulate session key with Client's private key object kept in memory, without PEM round trip
+
+        Parameters:
+            - encrypted_session_key (bytes): Value of encapsulated by Server session key
+            - client_private_key (RSA.RsaKey): Client's private key object returned by generate_key_pair()
+
+        Returns:
+            - session_key (bytes): Decapsulated session key value
+        """
+        from Crypto.Cipher import PKCS1_OAEP
+
         cipher = PKCS1_OAEP.new(client_private_key)
 
         session_key = cipher.decrypt(encrypted_session_key)
 
         return session_key
 
+    def resume_session_key(self, session_key: bytes, resumption_nonce: bytes) -> bytes:
+        """
+        Derive session key of resumed session from previous session key and Server's resumption nonce
+
+        Parameters:
+            - session_key (bytes): Session key of session the resumption ticket was issued for
+            - resumption_nonce (bytes): Nonce received from Server on session resumption
+
+        Returns:
+            - (bytes): Session key of resumed session
+        """
+        from session_tickets import derive_resumed_session_key, derive_resumption_secret
+
+        return derive_resumed_session_key(
+            derive_resumption_secret(session_key), resumption_nonce
+        )
+
     def get_session_key_hash(self, session_key: bytes) -> str:
         """
         Compute SHA256 checksum for given session key
@@ -166,6 +481,8 @@ class Client:
         """
         return hashlib.sha256(session_key).hexdigest()
 
+    @tracing.traced("client.oprf")
+    @metrics.timed(OPRF_DURATION, mode="single")
     def evaluate(self, secret_polynomial: GroupPoly, group: Group, DEBUG=False) -> str:
         """
         Symulate blinded value evaluation using Client-Evaluator communication model
@@ -186,8 +503,7 @@ class Client:
         blinded_polynomial = Client.blind(secret_polynomial, r, r_mod, DEBUG=DEBUG)
 
         # Evaluate blinded polynomial with Evaluator
-        evaluator = Evaluator()
-        evaluated_polynomial = evaluator.evaluate(blinded_polynomial)
+        evaluated_polynomial = self.evaluator.evaluate(blinded_polynomial)
 
         # Unblind result returned by the Evaluator
         # r_inv = group.order - 1 - r
@@ -197,6 +513,63 @@ class Client:
 
         return unblinded_evaluator_result
 
+    @classmethod
+    @tracing.traced("client.oprf_batch")
+    @metrics.timed(OPRF_DURATION, mode="batch")
+    def evaluate_batch(cls, secret_polynomials: list, evaluator: Evaluator = None) -> list:
+        """
+        Symulate blinded evaluation of many secret polynomials in single Client-Evaluator round trip
+
+        Parameters:
+            - secret_polynomials (list): Secret polynomials (GroupPoly) to perform evaluation process on
+            - evaluator (Evaluator): Evaluator to use, shared default Evaluator if not given
+
+        Returns:
+            - unblinded_evaluator_results (list): Unblinded evaluation results in order of secret polynomials
+        """
+        # Blind all secret polynomials with independent blinding exponents
+        blinding_pool = cls.get_blinding_pool()
+        blinding_exponents = [
+            (r, r_inv, blinding_pool.r_mod)
+            for r, r_inv in blinding_pool.take_many(len(secret_polynomials))
+        ]
+        blinded_polynomials = [
+            cls.blind(secret_polynomial, r, r_mod, DEBUG=False)
+            for secret_polynomial, (r, r_inv, r_mod) in zip(
+                secret_polynomials, blinding_exponents
+            )
+        ]
+
+        # Evaluate whole batch of blinded polynomials with Evaluator
+        if evaluator is None:
+            evaluator = cls.get_default_evaluator()
+        evaluated_polynomials = evaluator.evaluate_batch(blinded_polynomials)
+
+        # Unblind results returned by the Evaluator
+        return [
+            cls.unblind(evaluated_polynomial, r_inv, r_mod, DEBUG=False)
+            for evaluated_polynomial, (r, r_inv, r_mod) in zip(
+                evaluated_polynomials, blinding_exponents
+            )
+        ]
+
+    @tracing.traced("client.keygen")
+    def generate_key_pair(self, unblinded_evaluator_result: str):
+        """
+        Generate RSA key pair from result of evaluation process
+
+        Parameters:
+            - unblinded_evaluator_result (str): Unblinded evaluation result
+
+        Returns:
+            - client_private_key (RSA.RsaKey): Client's private key object, its public key is given by publickey()
+        """
+        # RSA key generation library pulls in pycryptodome, so it is imported on first key generation
+        from rsa import generate_key
+
+        # Generate RSA key pair based on unblinded evaluation process result value
+        return generate_key(unblinded_evaluator_result)
+
     def generate_key_pair_PEM(self, unblinded_evaluator_result: str) -> tuple:
         """
         Generate RSA key pair from result of evaluation process in PEM format
@@ -209,8 +582,7 @@ class Client:
                 - client_private_key_PEM (str): Value of private Client's key in PEM format
                 - client_public_key_PEM (str): Value of public Client's key in PEM format
         """
-        # Generate RSA key pair based on unblinded evaluation process result value
-        client_private_key = generate_key(unblinded_evaluator_result)
+        client_private_key = self.generate_key_pair(unblinded_evaluator_result)
         client_private_key_PEM = client_private_key.export_key("PEM").decode("utf-8")
         client_public_key_PEM = (
             client_private_key.publickey().exportKey("PEM").decode("utf-8")
@@ -288,22 +660,65 @@ class Client:
                 - r_inv (int): Inverse of blinding parameter 'r' for modulus 'r_mod'
                 - r_mod (int): Modulus for blinding procedure
         """
-        # Set boundries for 'r' parameter generation
-        r_mod = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF43
-        r_bottom_boundry = 2
-        r_top_boundry = r_mod-1
+        # Draw pre-generated blinding parameter 'r' and it's inverse for 'r_mod' from blinding pool
+        blinding_pool = cls.get_blinding_pool()
+        r, r_inv = blinding_pool.take()
+
+        return (r, r_inv, blinding_pool.r_mod)
+
+    @classmethod
+    def get_blinding_pool(cls) -> BlindingPool:
+        """
+        Get blinding pool shared by Clients, creating it on first use
+
+        Parameters:
+            - None
+
+        Returns:
+            - (BlindingPool): Shared pool of pre-generated blinding pairs
+        """
+        if cls.blinding_pool is None:
+            cls.blinding_pool = BlindingPool()
+        return cls.blinding_pool
 
-        # Generate blinding parameter 'r' and find it's inverse for 'r_mod'
-        found_r_inv = False
-        while not found_r_inv:
-            r = random.randint(r_bottom_boundry, r_top_boundry)
-            try:
-                r_inv = pow(r, -1, r_mod)
-                found_r_inv = True
-            except:
-                continue
+    def create_public_values(
+        self,
+        vault_coefs: list,
+        client_public_key_PEM: str,
+        group_order: int,
+        verify_threshold: int,
+        profile_format: str = "json",
+        additional_vaults_coefs: list = None,
+    ):
+        """
+        Create public values that are transferred to Server's database in requested profile format
 
-        return (r, r_inv, r_mod)
+        Parameters:
+            - vault_coefs (list): List of coefficients in Fuzzy Vault polynomial
+            - client_public_key_PEM (str): Value of public Client's key in PEM format
+            - group_order (int): Order of group the BRAKE protocol is executed in
+            - verify_threshold (int): Defined closeness parameter value of acceptable biometric vector's distance
+            - profile_format (str): Format of Client's profile, either 'json' or 'binary'
+            - additional_vaults_coefs (list): Coefficients of Client's other vaults locking the same secret
+
+        Returns:
+            - (str | bytes): Public values distributed to Server in JSON or binary profile format
+        """
+        if profile_format == "binary":
+            return self.create_public_values_binary(
+                vault_coefs,
+                client_public_key_PEM,
+                group_order,
+                verify_threshold,
+                additional_vaults_coefs,
+            )
+        return self.create_public_values_json(
+            vault_coefs,
+            client_public_key_PEM,
+            group_order,
+            verify_threshold,
+            additional_vaults_coefs,
+        )
 
     def create_public_values_json(
         self,
@@ -311,6 +726,7 @@ class Client:
         client_public_key_PEM: str,
         group_order: int,
         verify_threshold: int,
+        additional_vaults_coefs: list = None,
     ) -> str:
         """
         Create JSON for public values that are transferred to Server's database
@@ -320,6 +736,7 @@ class Client:
             - client_public_key_PEM (str): Value of public Client's key in PEM format
             - group_order (int): Order of group the BRAKE protocol is executed in
             - verify_threshold (int): Defined closeness parameter value of acceptable biometric vector's distance
+            - additional_vaults_coefs (list): Coefficients of Client's other vaults locking the same secret
 
         Returns:
             - (str): Public values distributed to Server in JSON format
@@ -335,20 +752,58 @@ class Client:
             "group_order": group_order,
             "verify_threshold": verify_threshold,
         }
+        if additional_vaults_coefs:
+            public_values_dict["additional_vault_coefs"] = [
+                [int(coef) for coef in additional_vault_coefs]
+                for additional_vault_coefs in additional_vaults_coefs
+            ]
 
         return json.dumps(public_values_dict)
 
-    def create_public_values_dict(self, public_values_json: str) -> dict:
+    def create_public_values_binary(
+        self,
+        vault_coefs: list,
+        client_public_key_PEM: str,
+        group_order: int,
+        verify_threshold: int,
+        additional_vaults_coefs: list = None,
+    ) -> bytes:
+        """
+        Create binary profile for public values that are transferred to Server's database
+
+        Parameters:
+            - vault_coefs (list): List of coefficients in Fuzzy Vault polynomial
+            - client_public_key_PEM (str): Value of public Client's key in PEM format
+            - group_order (int): Order of group the BRAKE protocol is executed in
+            - verify_threshold (int): Defined closeness parameter value of acceptable biometric vector's distance
+            - additional_vaults_coefs (list): Coefficients of Client's other vaults locking the same secret
+
+        Returns:
+            - (bytes): Public values distributed to Server in binary profile format
         """
-        Convert public values from JSON format to dictionary
+        public_values_dict = {
+            "client_id": self.id,
+            "vault_coefs": [int(coef) for coef in vault_coefs],
+            "client_public_key_PEM": client_public_key_PEM,
+            "group_order": group_order,
+            "verify_threshold": verify_threshold,
+        }
+        if additional_vaults_coefs:
+            public_values_dict["additional_vault_coefs"] = additional_vaults_coefs
+
+        return encode_profile(public_values_dict)
+
+    def create_public_values_dict(self, public_values_json) -> dict:
+        """
+        Convert public values from JSON or binary profile format to dictionary
 
         Parameters:
-            - public_values_json (str): Public values distributed to Server in JSON format
+            - public_values_json (str | bytes): Public values distributed to Server in JSON or binary profile format
 
         Returns:
             - (dict): Public values distributed to Server as dict
         """
-        return json.loads(public_values_json)
+        return load_profile(public_values_json)
 
 
 def run_tests():
@@ -366,6 +821,71 @@ def run_tests():
 
     public_values_json = client.enrol(verify_threshold=8, group=G, DEBUG=debug_flag)
 
+    # Debug log identifies keys by fingerprints, without key material
+    log_output = io.StringIO()
+    log_handler = logging.StreamHandler(log_output)
+    logger.addHandler(log_handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        client_private_key_PEM = client.verify(public_values_json, G, number_of_unlocking_rounds=50)
+    finally:
+        logger.removeHandler(log_handler)
+        logger.setLevel(logging.NOTSET)
+    assert "fingerprint" in log_output.getvalue()
+    assert client_private_key_PEM.splitlines()[1] not in log_output.getvalue()
+
+    # Poor capture does not prevent verification when good one is taken in the same attempt
+    rng = random.Random(0)
+    biometrics_template = rng.sample(range(1, 12401), 16)
+    client = Client(id, biometrics_template)
+    public_values_json = client.enrol(verify_threshold=4, group=G)
+    poor_capture = biometrics_template[:2] + rng.sample(range(1, 12401), 14)
+    good_capture = biometrics_template[6:] + rng.sample(range(1, 12401), 6)
+    assert client.verify_multi(
+        public_values_json, G, [poor_capture, good_capture], number_of_unlocking_rounds=400
+    ) == client.verify(public_values_json, G, number_of_unlocking_rounds=50)
+
+    # Client enroled with two fingers is verified with capture of either of them, sharing single key pair
+    second_template = rng.sample(range(1, 12401), 16)
+    public_values_binary = client.enrol(
+        verify_threshold=4,
+        group=G,
+        profile_format="binary",
+        bio_templates=[biometrics_template, second_template],
+    )
+    second_capture = second_template[6:] + rng.sample(range(1, 12401), 6)
+    assert client.verify_multi(
+        public_values_binary, G, [second_capture], number_of_unlocking_rounds=400
+    ) == client.verify(public_values_binary, G, number_of_unlocking_rounds=50)
+
+    # Unlocking progress is kept after failed verification and discarded after successful one
+    unlock_state_store = UnlockStateStore()
+    client.verify_multi(
+        public_values_binary, G, [poor_capture], 20, unlock_state_store=unlock_state_store
+    )
+    failed_state_keys = set(unlock_state_store.states)
+    assert len(failed_state_keys) == 2
+    client.verify(public_values_binary, G, 50, unlock_state_store=unlock_state_store)
+    client.verify_multi(
+        public_values_binary, G, [second_capture], 400, unlock_state_store=unlock_state_store
+    )
+    assert set(unlock_state_store.states) == failed_state_keys
+
+    # Bounded tally of vault not matching capture reports inherited votes, which must not unlock it before matching vault
+    first_template = rng.sample(range(1, 12401), 44)
+    second_template = rng.sample(range(1, 12401), 44)
+    client = Client(id, first_template)
+    public_values_json = client.enrol(
+        verify_threshold=8, group=G, bio_templates=[first_template, second_template]
+    )
+    public_values_dict = load_profile(public_values_json)
+    second_capture = second_template[:30] + rng.sample(range(1, 12401), 14)
+    secret_polynomial = client.unlock_vaults(public_values_dict, [first_template], 200)
+    for tally_capacity in (None, 16):
+        assert client.unlock_vaults(
+            public_values_dict, [second_capture], 2000, tally_capacity=tally_capacity
+        ).coef.tolist() == secret_polynomial.coef.tolist()
+
 
 def main():
     run_tests()
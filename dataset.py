@@ -0,0 +1,529 @@
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from time import perf_counter as pc
+
+import numpy as np
+
+from fuzzy_vault import FuzzyVault
+
+# Raw datasets store fixed-length little-endian uint32 feature vectors one after another
+RAW_DTYPE = np.dtype("<u4")
+
+# Datasets opened by worker process, by path, template length and number of samples per subject
+_OPEN_DATASETS = {}
+
+
+def open_templates(filepath: str, template_length: int = None) -> np.ndarray:
+    """
+    Memory-map template collection, rows are read from disk only when accessed
+
+    Parameters:
+        - filepath (str): Path of .npy file with 2-D unsigned integer array or raw binary of uint32 vectors
+        - template_length (int): Number of values of every template, required for raw binary
+
+    Returns:
+        - (np.ndarray): Read-only memory-mapped array of shape (templates, template length)
+    """
+    if filepath.endswith(".npy"):
+        templates = np.load(filepath, mmap_mode="r")
+        if templates.ndim != 2 or templates.dtype.kind != "u":
+            raise ValueError(
+                f"Dataset {filepath} must be 2-D array of unsigned integers, got {templates.ndim}-D {templates.dtype}"
+            )
+        if template_length is not None and templates.shape[1] != template_length:
+            raise ValueError(
+                f"Dataset {filepath} has templates of length {templates.shape[1]}, expected {template_length}"
+            )
+        return templates
+
+    if template_length is None:
+        raise ValueError(f"Template length must be given for raw dataset {filepath}")
+    row_size = RAW_DTYPE.itemsize * template_length
+    file_size = os.path.getsize(filepath)
+    if file_size == 0 or file_size % row_size:
+        raise ValueError(
+            f"Size of raw dataset {filepath} ({file_size} B) is not a positive multiple of template size ({row_size} B)"
+        )
+    return np.memmap(
+        filepath, dtype=RAW_DTYPE, mode="r", shape=(file_size // row_size, template_length)
+    )
+
+
+def write_raw_dataset(filepath: str, templates) -> None:
+    np.ascontiguousarray(templates, dtype=RAW_DTYPE).tofile(filepath)
+
+
+def to_field_elements(values: np.ndarray, group_order: int) -> list:
+    """
+    Map feature values to nonzero elements of group, equal features map to equal elements
+
+    Parameters:
+        - values (np.ndarray): Unsigned integer feature values of single template
+        - group_order (int): Order of group the BRAKE protocol is executed in
+
+    Returns:
+        - (list): Python integers in range [1, group_order - 1]
+    """
+    return [int(value) % (group_order - 1) + 1 for value in values.tolist()]
+
+
+class TemplateDataset:
+    def __init__(self, filepath: str, template_length: int = None, samples_per_subject: int = 2):
+        """
+        TemplateDataset class constructor, that returns memory-mapped collection of biometric templates grouped by subject
+
+        Samples of each subject are stored in consecutive rows, first sample of subject is used for enrolment
+        and the others as genuine probes.
+
+        Parameters:
+            - filepath (str): Path of .npy file or raw binary of uint32 vectors
+            - template_length (int): Number of values of every template, required for raw binary
+            - samples_per_subject (int): Number of consecutive templates of every subject
+
+        Returns:
+            - self (TemplateDataset): TemplateDataset class object
+        """
+        if samples_per_subject < 1:
+            raise ValueError(f"Number of samples per subject must be positive, got {samples_per_subject}")
+
+        self.filepath = filepath
+        self.templates = open_templates(filepath, template_length)
+        self.template_length = self.templates.shape[1]
+        self.samples_per_subject = samples_per_subject
+        if len(self.templates) % samples_per_subject:
+            raise ValueError(
+                f"Dataset {filepath} has {len(self.templates)} templates, not a multiple of {samples_per_subject} samples per subject"
+            )
+        self.subjects = len(self.templates) // samples_per_subject
+
+    def __len__(self):
+        return len(self.templates)
+
+    def sample(self, subject: int, sample: int) -> np.ndarray:
+        return self.templates[subject * self.samples_per_subject + sample]
+
+    def probes(self, subject: int, impostors_per_subject: int = 1):
+        """
+        Probes compared with enrolment template of subject
+
+        Parameters:
+            - subject (int): Enroled subject
+            - impostors_per_subject (int): Number of following subjects whose sample is used as impostor probe
+
+        Returns:
+            - (generator): Pairs of probe template and logic value of probe being genuine
+        """
+        for sample in range(1, self.samples_per_subject):
+            yield (self.sample(subject, sample), True)
+
+        # Impostor probes are samples that other subjects verify with, not their enrolment templates
+        impostor_sample = 1 if self.samples_per_subject > 1 else 0
+        for offset in range(1, min(impostors_per_subject, self.subjects - 1) + 1):
+            yield (self.sample((subject + offset) % self.subjects, impostor_sample), False)
+
+
+def get_dataset(filepath: str, template_length: int, samples_per_subject: int) -> TemplateDataset:
+    key = (filepath, template_length, samples_per_subject)
+    dataset = _OPEN_DATASETS.get(key)
+    if dataset is None:
+        dataset = _OPEN_DATASETS[key] = TemplateDataset(filepath, template_length, samples_per_subject)
+    return dataset
+
+
+class EvaluationReport:
+    def __init__(self):
+        """
+        EvaluationReport class constructor, that returns accuracy and throughput statistics of dataset evaluation
+
+        Genuine probe is accepted when it recovers the locked secret polynomial, impostor probe is falsely accepted
+        when it does. Unlocking that recovers no candidate rejects the probe.
+
+        Parameters:
+            - None
+
+        Returns:
+            - self (EvaluationReport): EvaluationReport class object
+        """
+        self.subjects = 0
+        self.genuine_attempts = 0
+        self.genuine_accepts = 0
+        self.impostor_attempts = 0
+        self.impostor_accepts = 0
+        self.unlock_errors = 0
+        self.lock_time = 0.0
+        self.unlock_time = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def FRR(self) -> float:
+        if not self.genuine_attempts:
+            return None
+        return 1 - self.genuine_accepts / self.genuine_attempts
+
+    @property
+    def FAR(self) -> float:
+        if not self.impostor_attempts:
+            return None
+        return self.impostor_accepts / self.impostor_attempts
+
+    @property
+    def comparisons(self) -> int:
+        return self.genuine_attempts + self.impostor_attempts
+
+    @property
+    def throughput(self) -> float:
+        return self.comparisons / self.elapsed if self.elapsed else 0.0
+
+    def merge(self, counts: dict) -> None:
+        for key, value in counts.items():
+            setattr(self, key, getattr(self, key) + value)
+
+    def to_dict(self) -> dict:
+        return {
+            "subjects": self.subjects,
+            "genuine_attempts": self.genuine_attempts,
+            "genuine_accepts": self.genuine_accepts,
+            "impostor_attempts": self.impostor_attempts,
+            "impostor_accepts": self.impostor_accepts,
+            "unlock_errors": self.unlock_errors,
+            "FRR": self.FRR,
+            "FAR": self.FAR,
+            "lock_time": self.lock_time,
+            "unlock_time": self.unlock_time,
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+        }
+
+
+def evaluate_subjects(
+    dataset_spec: tuple,
+    first_subject: int,
+    last_subject: int,
+    group_order: int,
+    verify_threshold: int,
+    number_of_unlocking_rounds: int,
+    impostors_per_subject: int,
+    seed: int,
+) -> dict:
+    """
+    Worker task locking enrolment template of every subject of chunk once and unlocking the vault with all its probes
+
+    Parameters:
+        - dataset_spec (tuple): Dataset path, template length and number of samples per subject, dataset is memory-mapped by the worker
+        - first_subject (int): First subject of chunk
+        - last_subject (int): Subject following the last subject of chunk
+        - group_order (int): Order of group the BRAKE protocol is executed in
+        - verify_threshold (int): Number of (argument, value) pairs of Fuzzy Vault used to recover secret polynomial
+        - number_of_unlocking_rounds (int): Number of secret polynomial recovery rounds to perform
+        - impostors_per_subject (int): Number of impostor probes of every subject
+        - seed (int): Base seed of evaluation, combinations drawn for subject depend only on seed and subject
+
+    Returns:
+        - (dict): Counts and timings to be merged into EvaluationReport
+    """
+    dataset = get_dataset(*dataset_spec)
+    counts = {
+        "subjects": 0,
+        "genuine_attempts": 0,
+        "genuine_accepts": 0,
+        "impostor_attempts": 0,
+        "impostor_accepts": 0,
+        "unlock_errors": 0,
+        "lock_time": 0.0,
+        "unlock_time": 0.0,
+    }
+
+    for subject in range(first_subject, last_subject):
+        # Unlocking draws index combinations from global generator
+        random.seed(f"{seed}:{subject}")
+        secret_polynomial = FuzzyVault.generate_secret_polynomial(
+            group_order=group_order, sec_poly_deg=verify_threshold
+        )
+
+        s = pc()
+        fuzzy_vault = FuzzyVault(
+            group_order=group_order,
+            bio_template=to_field_elements(dataset.sample(subject, 0), group_order),
+        )
+        fuzzy_vault.lock(secret_polynomial=secret_polynomial)
+        counts["lock_time"] += pc() - s
+        counts["subjects"] += 1
+
+        for probe, genuine in dataset.probes(subject, impostors_per_subject):
+            kind = "genuine" if genuine else "impostor"
+            fuzzy_vault.bio_template = to_field_elements(probe, group_order)
+            s = pc()
+            try:
+                accepted = (
+                    fuzzy_vault.unlock(
+                        verify_threshold=verify_threshold,
+                        number_of_unlocking_rounds=number_of_unlocking_rounds,
+                    )
+                    == secret_polynomial
+                )
+            except ValueError:
+                accepted = False
+                counts["unlock_errors"] += 1
+            counts["unlock_time"] += pc() - s
+            counts[f"{kind}_attempts"] += 1
+            counts[f"{kind}_accepts"] += accepted
+
+    return counts
+
+
+class DatasetEvaluation:
+    def __init__(
+        self,
+        dataset: TemplateDataset,
+        group_order: int = 2147483647,
+        verify_threshold: int = 8,
+        number_of_unlocking_rounds: int = 5000,
+        impostors_per_subject: int = 1,
+        subjects_per_chunk: int = 64,
+        workers: int = None,
+        seed: int = 0,
+        max_in_flight: int = None,
+    ):
+        """
+        DatasetEvaluation class constructor, that returns parallel evaluation of lock and unlock over all subjects of dataset
+
+        Workers memory-map the dataset themselves and receive only ranges of subjects, so that neither the submitting
+        process nor the workers hold more than a few chunks of templates in memory.
+
+        Parameters:
+            - dataset (TemplateDataset): Evaluated dataset
+            - group_order (int): Order of group the BRAKE protocol is executed in
+            - verify_threshold (int): Number of (argument, value) pairs of Fuzzy Vault used to recover secret polynomial
+            - number_of_unlocking_rounds (int): Number of secret polynomial recovery rounds to perform
+            - impostors_per_subject (int): Number of impostor probes of every subject
+            - subjects_per_chunk (int): Number of subjects evaluated by single worker task
+            - workers (int): Number of worker processes, defaults to number of CPU cores
+            - seed (int): Base seed of evaluation
+            - max_in_flight (int): Maximal number of submitted unfinished chunks
+
+        Returns:
+            - self (DatasetEvaluation): DatasetEvaluation class object
+        """
+        if subjects_per_chunk < 1:
+            raise ValueError(f"Number of subjects per chunk must be positive, got {subjects_per_chunk}")
+        if dataset.template_length < verify_threshold:
+            raise ValueError(
+                f"Templates of length {dataset.template_length} are shorter than verification threshold {verify_threshold}"
+            )
+
+        self.dataset = dataset
+        self.group_order = group_order
+        self.verify_threshold = verify_threshold
+        self.number_of_unlocking_rounds = number_of_unlocking_rounds
+        self.impostors_per_subject = impostors_per_subject
+        self.subjects_per_chunk = subjects_per_chunk
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.max_in_flight = max_in_flight or 2 * self.workers
+
+    def chunks(self):
+        for first_subject in range(0, self.dataset.subjects, self.subjects_per_chunk):
+            yield (first_subject, min(first_subject + self.subjects_per_chunk, self.dataset.subjects))
+
+    def run(self, progress: bool = False) -> EvaluationReport:
+        """
+        Evaluate all subjects, chunks are submitted as workers finish previous ones
+
+        Parameters:
+            - progress (bool): Whether to print progress
+
+        Returns:
+            - report (EvaluationReport): Accuracy and throughput statistics
+        """
+        dataset_spec = (
+            self.dataset.filepath,
+            self.dataset.template_length,
+            self.dataset.samples_per_subject,
+        )
+        report = EvaluationReport()
+        pending = self.chunks()
+
+        s = pc()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = set()
+            while True:
+                for first_subject, last_subject in itertools.islice(
+                    pending, self.max_in_flight - len(futures)
+                ):
+                    futures.add(
+                        executor.submit(
+                            evaluate_subjects,
+                            dataset_spec,
+                            first_subject,
+                            last_subject,
+                            self.group_order,
+                            self.verify_threshold,
+                            self.number_of_unlocking_rounds,
+                            self.impostors_per_subject,
+                            self.seed,
+                        )
+                    )
+                if not futures:
+                    break
+
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report.merge(future.result())
+                if progress:
+                    print(f"{report.subjects}/{self.dataset.subjects} subjects evaluated", end="\r")
+        report.elapsed = pc() - s
+
+        if progress:
+            print()
+        return report
+
+
+def create_synthetic_templates(
+    subjects: int, samples_per_subject: int, template_length: int, correct_samples: list, seed: int = 0
+) -> np.ndarray:
+    """
+    Create templates of subjects whose probes share given number of values with their enrolment template
+
+    Parameters:
+        - subjects (int): Number of subjects
+        - samples_per_subject (int): Number of templates of every subject
+        - template_length (int): Number of values of every template
+        - correct_samples (list): Number of shared values of probes, cycled over subjects
+        - seed (int): Seed of generated values
+
+    Returns:
+        - (np.ndarray): Templates of shape (subjects * samples_per_subject, template_length)
+    """
+    rng = np.random.default_rng(seed)
+    templates = rng.integers(
+        1, 2**32, size=(subjects, samples_per_subject, template_length), dtype=np.uint32
+    )
+    for subject in range(subjects):
+        shared = correct_samples[subject % len(correct_samples)]
+        for sample in range(1, samples_per_subject):
+            templates[subject, sample, :shared] = templates[subject, 0, :shared]
+            rng.shuffle(templates[subject, sample])
+    return templates.reshape(subjects * samples_per_subject, template_length)
+
+
+def run_tests():
+    print("Running dataset.py tests...")
+
+    test_directory = "./dataset_test/"
+    shutil.rmtree(test_directory, ignore_errors=True)
+    os.makedirs(test_directory)
+
+    # Even subjects have probes good enough to unlock their vault, odd ones do not
+    subjects = 24
+    template_length = 20
+    templates = create_synthetic_templates(
+        subjects, samples_per_subject=3, template_length=template_length, correct_samples=[14, 3]
+    )
+    raw_filepath = f"{test_directory}templates.bin"
+    npy_filepath = f"{test_directory}templates.npy"
+    write_raw_dataset(raw_filepath, templates)
+    np.save(npy_filepath, templates)
+
+    raw_dataset = TemplateDataset(raw_filepath, template_length, samples_per_subject=3)
+    npy_dataset = TemplateDataset(npy_filepath, samples_per_subject=3)
+    assert isinstance(raw_dataset.templates, np.memmap) and not raw_dataset.templates.flags.writeable
+    assert raw_dataset.subjects == npy_dataset.subjects == subjects
+    assert np.array_equal(raw_dataset.sample(5, 2), templates[17])
+    probes = list(raw_dataset.probes(23, impostors_per_subject=2))
+    assert [genuine for probe, genuine in probes] == [True, True, False, False]
+    assert np.array_equal(probes[2][0], templates[1]) and np.array_equal(probes[3][0], templates[4])
+    assert to_field_elements(np.array([0, 2**32 - 1], dtype=np.uint32), 12401) == [1, (2**32 - 1) % 12400 + 1]
+
+    reports = []
+    for dataset in (raw_dataset, npy_dataset):
+        evaluation = DatasetEvaluation(
+            dataset,
+            verify_threshold=4,
+            number_of_unlocking_rounds=200,
+            impostors_per_subject=2,
+            subjects_per_chunk=5,
+            workers=2,
+        )
+        assert list(evaluation.chunks())[-1] == (20, 24)
+        reports.append(evaluation.run())
+
+    report = reports[0]
+    assert report.subjects == subjects
+    assert report.genuine_attempts == 2 * subjects and report.impostor_attempts == 2 * subjects
+    assert report.FRR == 0.5 and report.FAR == 0.0
+    assert reports[1].to_dict()["genuine_accepts"] == report.genuine_accepts
+    print(
+        f"{report.comparisons} comparisons in {report.elapsed:.2f} s ({report.throughput:.1f}/s), "
+        f"FRR {report.FRR:.2f}, FAR {report.FAR:.2f}"
+    )
+
+    # Malformed datasets are rejected before evaluation
+    with open(f"{test_directory}truncated.bin", "wb") as f:
+        f.write(b"\x00" * (4 * template_length + 1))
+    for args in (
+        (f"{test_directory}truncated.bin", template_length),
+        (raw_filepath, None),
+        (raw_filepath, template_length, 5),
+        (npy_filepath, template_length + 1),
+    ):
+        try:
+            TemplateDataset(*args)
+            assert False
+        except ValueError:
+            pass
+
+    shutil.rmtree(test_directory)
+
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Evaluate lock and unlock accuracy and throughput over memory-mapped template dataset"
+    )
+    parser.add_argument("dataset", help=".npy file or raw binary of little-endian uint32 templates")
+    parser.add_argument("--template-length", type=int, default=None, help="Required for raw binary")
+    parser.add_argument("--samples-per-subject", type=int, default=2)
+    parser.add_argument("--prime", type=int, default=2147483647)
+    parser.add_argument("--threshold", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=5000)
+    parser.add_argument("--impostors", type=int, default=1, help="Impostor probes per subject")
+    parser.add_argument("--chunk", type=int, default=64, help="Subjects per worker task")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", default=None, help="Write report to JSON file")
+    args = parser.parse_args()
+
+    dataset = TemplateDataset(args.dataset, args.template_length, args.samples_per_subject)
+    report = DatasetEvaluation(
+        dataset,
+        group_order=args.prime,
+        verify_threshold=args.threshold,
+        number_of_unlocking_rounds=args.rounds,
+        impostors_per_subject=args.impostors,
+        subjects_per_chunk=args.chunk,
+        workers=args.workers,
+        seed=args.seed,
+    ).run(progress=True)
+
+    print(
+        f"Subjects: {report.subjects}, FRR: {report.FRR}, FAR: {report.FAR}, "
+        f"throughput: {report.throughput:.1f} comparisons/s, elapsed: {report.elapsed:.2f}s"
+    )
+    if args.report is not None:
+        with open(args.report, "wt") as f:
+            json.dump(report.to_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
 import hashlib
 
+import tracing
+
+# Evaluator's secret key is derived once per process and shared by all Evaluator instances
+_SECRET_KEY = int(
+    hashlib.sha256("evaluator_secret_key".encode("utf-8")).hexdigest(), 16
+)
+
 
 class Evaluator:
     def __init__(self):
@@ -14,12 +21,12 @@ class Evaluator:
         """
 
         # Set Evaluator's secret key
-        secret_key = "evaluator_secret_key".encode("utf-8")
-        self._secret_key = int(hashlib.sha256(secret_key).hexdigest(), 16)
+        self._secret_key = _SECRET_KEY
 
         # Set Evaluator's OPRF moduli as the lowest prime number lower than maximal possible value for secret key
         self.mod = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF43
 
+    @tracing.traced("evaluator.evaluate")
     def evaluate(self, input_value: str) -> str:
         """
         Evaluate blinded value using Evaluator's secret key.
@@ -39,6 +46,25 @@ class Evaluator:
 
         return evaluated_value_hex
 
+    @tracing.traced("evaluator.evaluate_batch")
+    def evaluate_batch(self, input_values: list) -> list:
+        """
+        Evaluate vector of blinded values using Evaluator's secret key in single pass.
+
+        Parameters:
+            - input_values (list): Values to be evaluated as hex strings
+
+        Returns:
+            - (list): Evaluated values of inputs as hex strings in order of inputs
+        """
+        secret_key = self._secret_key
+        mod = self.mod
+
+        return [
+            hex((int(input_value, 16) * secret_key) % mod)[2:]
+            for input_value in input_values
+        ]
+
 
 def run_tests():
     input_value = hashlib.sha256(b"blinded_data").hexdigest()
@@ -48,6 +74,8 @@ def run_tests():
     val = ev.evaluate(input_value=input_value)
     print(f"Evaluation [k][r]H(f): {val}")
 
+    assert ev.evaluate_batch([input_value, input_value]) == [val, val]
+
 
 def main():
     run_tests()
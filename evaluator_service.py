@@ -0,0 +1,444 @@
+import os
+import sys
+import json
+import queue
+import socket
+import asyncio
+import argparse
+import threading
+
+import tracing
+from evaluator import Evaluator
+
+# Maximal length of single request line
+MAX_LINE_LENGTH = 16 * 1024 * 1024
+
+
+class EvaluatorService:
+    def __init__(
+        self,
+        evaluator: Evaluator = None,
+        socket_path: str = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        coalesce_window: float = 0.001,
+        max_batch_size: int = 4096,
+    ):
+        """
+        EvaluatorService class constructor, that returns long-lived Evaluator serving batched OPRF evaluations over local socket
+
+        Parameters:
+            - evaluator (Evaluator): Evaluator holding the secret key, new Evaluator is created if not given
+            - socket_path (str): Path of Unix domain socket to listen on, TCP is used if not given
+            - host (str): Address to listen on when using TCP
+            - port (int): Port to listen on when using TCP, 0 chooses free port
+            - coalesce_window (float): Time in seconds for which concurrent requests are collected into single batch
+            - max_batch_size (int): Maximal number of values evaluated in single batch
+
+        Returns:
+            - self (EvaluatorService): EvaluatorService class object
+        """
+        self.evaluator = evaluator or Evaluator()
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.coalesce_window = coalesce_window
+        self.max_batch_size = max_batch_size
+
+        self.requests = 0
+        self.batches = 0
+        self.evaluated_values = 0
+
+        self.loop = None
+        self.pending = None
+        self.batcher_task = None
+        self.socket_server = None
+
+    async def start(self) -> None:
+        """
+        Start listening for connections and batching requests
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        self.loop = asyncio.get_running_loop()
+        self.pending = asyncio.Queue()
+        self.batcher_task = asyncio.create_task(self.batcher())
+
+        if self.socket_path is not None:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.socket_server = await asyncio.start_unix_server(
+                self.handle_connection, self.socket_path, limit=MAX_LINE_LENGTH
+            )
+        else:
+            self.socket_server = await asyncio.start_server(
+                self.handle_connection,
+                self.host,
+                self.port,
+                limit=MAX_LINE_LENGTH,
+                backlog=4096,
+            )
+            self.port = self.socket_server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        if self.socket_server is None:
+            await self.start()
+        async with self.socket_server:
+            await self.socket_server.serve_forever()
+
+    async def close(self) -> None:
+        if self.socket_server is not None:
+            self.socket_server.close()
+            await self.socket_server.wait_closed()
+        if self.batcher_task is not None:
+            self.batcher_task.cancel()
+        if self.socket_path is not None and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def evaluate_batch(self, input_values: list) -> list:
+        """
+        Queue vector of blinded values for evaluation in next coalesced batch
+
+        Parameters:
+            - input_values (list): Values to be evaluated as hex strings
+
+        Returns:
+            - (list): Evaluated values as hex strings in order of inputs, raises TypeError if values are not strings
+        """
+        # Malformed request is rejected before it can fail batch shared with other requests
+        if not isinstance(input_values, list) or not all(
+            isinstance(input_value, str) for input_value in input_values
+        ):
+            raise TypeError("Values to be evaluated must be list of hex strings")
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.put_nowait((input_values, future, tracing.inject()))
+        return await future
+
+    async def batcher(self) -> None:
+        """
+        Collect requests arriving within coalescing window and evaluate them in single modular-multiply pass
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        while True:
+            batch = [await self.pending.get()]
+            batch_size = len(batch[0][0])
+
+            # Let concurrent requests join the batch
+            if self.coalesce_window > 0:
+                await asyncio.sleep(self.coalesce_window)
+            while batch_size < self.max_batch_size and not self.pending.empty():
+                request = self.pending.get_nowait()
+                batch.append(request)
+                batch_size += len(request[0])
+
+            all_values = [value for input_values, _, _ in batch for value in input_values]
+            try:
+                # Coalesced batch is recorded in trace of its first request
+                with tracing.continue_trace(batch[0][2]), tracing.span(
+                    "evaluator_service.batch", requests=len(batch), values=len(all_values)
+                ):
+                    evaluated_values = self.evaluator.evaluate_batch(all_values)
+            except Exception:
+                # Fall back to evaluating requests separately to isolate malformed one, batcher keeps running
+                for input_values, future, _ in batch:
+                    if future.done():
+                        continue
+                    try:
+                        future.set_result(self.evaluator.evaluate_batch(input_values))
+                    except Exception as request_err:
+                        future.set_exception(request_err)
+                continue
+
+            self.requests += len(batch)
+            self.batches += 1
+            self.evaluated_values += len(all_values)
+
+            offset = 0
+            for input_values, future, _ in batch:
+                if not future.done():
+                    future.set_result(
+                        evaluated_values[offset : offset + len(input_values)]
+                    )
+                offset += len(input_values)
+
+    async def handle_connection(self, reader, writer) -> None:
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(request):
+            response = {"id": request.get("id")}
+            try:
+                with tracing.continue_trace(request.get("trace")), tracing.span(
+                    "evaluator_service.evaluate_batch"
+                ):
+                    response["values"] = await self.evaluate_batch(request["values"])
+            except (KeyError, TypeError, ValueError) as err:
+                response["error"] = str(err)
+            async with write_lock:
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = {}
+                task = asyncio.create_task(respond(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "evaluated_values": self.evaluated_values,
+            "mean_requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+        }
+
+
+def run_in_background(service: EvaluatorService) -> threading.Thread:
+    """
+    Run EvaluatorService on its own event loop in daemon thread
+
+    Parameters:
+        - service (EvaluatorService): Service to run
+
+    Returns:
+        - (threading.Thread): Thread running the service, returned once service listens
+    """
+    started = threading.Event()
+
+    def run():
+        async def serve():
+            await service.start()
+            started.set()
+            await service.serve_forever()
+
+        asyncio.run(serve())
+
+    thread = threading.Thread(target=run, name="evaluator-service", daemon=True)
+    thread.start()
+    started.wait()
+    return thread
+
+
+class EvaluatorClient:
+    def __init__(
+        self,
+        socket_path: str = None,
+        host: str = "127.0.0.1",
+        port: int = None,
+        pool_size: int = 8,
+        timeout: float = 10.0,
+    ):
+        """
+        EvaluatorClient class constructor, that returns Evaluator drop-in using pooled connections to EvaluatorService
+
+        Parameters:
+            - socket_path (str): Path of service's Unix domain socket, TCP is used if not given
+            - host (str): Address of service when using TCP
+            - port (int): Port of service when using TCP
+            - pool_size (int): Maximal number of idle connections kept for reuse
+            - timeout (float): Socket timeout in seconds
+
+        Returns:
+            - self (EvaluatorClient): EvaluatorClient class object
+        """
+        if socket_path is None and port is None:
+            raise ValueError("Either socket_path or port of EvaluatorService must be given")
+
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle_connections = queue.LifoQueue(maxsize=pool_size)
+        self.next_request_id = 0
+        self.request_id_lock = threading.Lock()
+
+    def open_connection(self) -> tuple:
+        if self.socket_path is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        else:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return (sock, sock.makefile("rwb"))
+
+    def acquire_connection(self) -> tuple:
+        try:
+            return self.idle_connections.get_nowait()
+        except queue.Empty:
+            return self.open_connection()
+
+    def release_connection(self, connection: tuple) -> None:
+        try:
+            self.idle_connections.put_nowait(connection)
+        except queue.Full:
+            self.close_connection(connection)
+
+    def close_connection(self, connection: tuple) -> None:
+        sock, stream = connection
+        try:
+            stream.close()
+        finally:
+            sock.close()
+
+    def evaluate_batch(self, input_values: list) -> list:
+        """
+        Evaluate vector of blinded values with EvaluatorService in single round trip
+
+        Parameters:
+            - input_values (list): Values to be evaluated as hex strings
+
+        Returns:
+            - (list): Evaluated values as hex strings in order of inputs
+        """
+        with self.request_id_lock:
+            request_id = self.next_request_id
+            self.next_request_id += 1
+
+        request = {"id": request_id, "values": list(input_values)}
+        trace_context = tracing.inject()
+        if trace_context is not None:
+            request["trace"] = trace_context
+
+        connection = self.acquire_connection()
+        try:
+            sock, stream = connection
+            stream.write(json.dumps(request).encode("utf-8") + b"\n")
+            stream.flush()
+            line = stream.readline()
+            if not line:
+                raise ConnectionError("EvaluatorService closed connection")
+            response = json.loads(line)
+        except BaseException:
+            self.close_connection(connection)
+            raise
+
+        self.release_connection(connection)
+
+        if "error" in response:
+            raise ValueError(f"EvaluatorService error: {response['error']}")
+        return response["values"]
+
+    def evaluate(self, input_value: str) -> str:
+        """
+        Evaluate blinded value with EvaluatorService, drop-in replacement of Evaluator.evaluate()
+
+        Parameters:
+            - input_value (str): Value to be evaluated as hex string
+
+        Returns:
+            - (str): Evaluated value of input as hex string
+        """
+        return self.evaluate_batch([input_value])[0]
+
+    def close(self) -> None:
+        while True:
+            try:
+                self.close_connection(self.idle_connections.get_nowait())
+            except queue.Empty:
+                return
+
+
+def run_tests():
+    print("Running evaluator_service.py tests...")
+
+    import hashlib
+    from concurrent.futures import ThreadPoolExecutor
+
+    service = EvaluatorService(coalesce_window=0.002)
+    run_in_background(service)
+    evaluator_client = EvaluatorClient(port=service.port, pool_size=4)
+
+    input_values = [
+        hashlib.sha256(f"blinded_data_{i}".encode("utf-8")).hexdigest() for i in range(64)
+    ]
+    expected_values = Evaluator().evaluate_batch(input_values)
+
+    # Single and vector requests match local Evaluator
+    assert evaluator_client.evaluate(input_values[0]) == expected_values[0]
+    assert evaluator_client.evaluate_batch(input_values) == expected_values
+
+    # Concurrent requests are coalesced into shared batches
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(evaluator_client.evaluate, input_values))
+    assert results == expected_values
+    assert service.stats()["batches"] < service.stats()["requests"]
+
+    # Malformed values are reported and do not stop batching of later requests
+    for malformed_values in (["not hex"], [1], [None, input_values[0]]):
+        try:
+            evaluator_client.evaluate_batch(malformed_values)
+            assert False
+        except ValueError:
+            pass
+    assert evaluator_client.evaluate_batch(input_values[:2]) == expected_values[:2]
+
+    async def evaluate_failing_batch():
+        # Batch failing with other exception than ValueError is isolated per request
+        evaluate_batch = service.evaluator.evaluate_batch
+        service.evaluator.evaluate_batch = lambda values: 1 / 0
+        try:
+            await service.evaluate_batch(input_values[:1])
+            assert False
+        except ZeroDivisionError:
+            pass
+        finally:
+            service.evaluator.evaluate_batch = evaluate_batch
+
+    asyncio.run_coroutine_threadsafe(evaluate_failing_batch(), service.loop).result(timeout=5)
+    assert not service.batcher_task.done()
+    assert evaluator_client.evaluate(input_values[0]) == expected_values[0]
+
+    evaluator_client.close()
+
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    parser = argparse.ArgumentParser(description="Long-lived batched Evaluator service")
+    parser.add_argument("--socket", default=None, help="Unix domain socket path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--coalesce-window", type=float, default=0.001)
+    args = parser.parse_args()
+
+    service = EvaluatorService(
+        socket_path=args.socket,
+        host=args.host,
+        port=args.port,
+        coalesce_window=args.coalesce_window,
+    )
+    print(f"Serving Evaluator on {args.socket or f'{args.host}:{args.port}'}")
+    asyncio.run(service.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,46 @@
 import secrets
 import random
-import galois
+from math import comb
 import numpy as np
+import metrics
+import tracing
+from tally import candidate_digest, create_tally
+from interpolation import PreprocessedTemplate
+from unlock_state import UnlockState, UnlockStateStore, unlock_state_key
 from group_poly import Group, GroupPoly
+from profile_format import (
+    check_end,
+    check_magic,
+    pack_integer,
+    pack_integers,
+    unpack_integer,
+    unpack_integers,
+)
+
+# Magic of FuzzyVault buffers: magic | flags | group order | template | [vault coefficients]
+FUZZY_VAULT_MAGIC = b"BRFV"
+FLAG_HAS_VAULT = 0x01
+
+UNLOCK_DURATION = metrics.histogram(
+    "brake_unlock_duration_seconds", "Duration of Fuzzy Vault unlocking"
+)
+UNLOCK_ROUNDS = metrics.counter(
+    "brake_unlock_rounds_total", "Secret polynomial recovery rounds executed"
+)
+UNLOCK_TEMPLATE_DUPLICATES = metrics.counter(
+    "brake_unlock_template_duplicates_total",
+    "Duplicate verification template values dropped before unlocking",
+)
+UNLOCK_DISTINCT_CANDIDATES = metrics.histogram(
+    "brake_unlock_distinct_candidates",
+    "Number of distinct secret polynomial candidates recovered during unlocking",
+    buckets=(1, 2, 5, 10, 50, 100, 500, 1000, 5000, 10000),
+)
+UNLOCK_WINNING_VOTE_SHARE = metrics.histogram(
+    "brake_unlock_winning_vote_share",
+    "Share of recovery rounds voting for chosen secret polynomial",
+    buckets=metrics.RATIO_BUCKETS,
+)
 
 
 class FuzzyVault:
@@ -54,6 +92,7 @@ class FuzzyVault:
 
         return GroupPoly(group_order, secret_coefs)
 
+    @tracing.traced("fuzzy_vault.lock")
     def lock(self, secret_polynomial: GroupPoly = None) -> None:
         """
         Lock secret polynomial into Fuzzy Vault using biometric enrolment template provided by Client
@@ -75,20 +114,32 @@ class FuzzyVault:
         self.vault_polynomial = vault_polynomial
 
     def get_random_argument_combinations(
-        self, how_many_indices: int, how_many_combinations: int
+        self,
+        how_many_indices: int,
+        how_many_combinations: int,
+        number_of_indices: int = None,
     ) -> list:
         """
         Generate list of unique index combinations of length equal to the number of unlocking rounds. Unique combination contains indices of biometric template to use in specific unlocking round
 
         Parameters:
             - how_many_indices (int): How many indices to put into single combination, equivalent of verification threshold
-            - how_many_combinations (int): How many unique combinations to generate, equivalent of number of unlocking rounds
+            - how_many_combinations (int): How many unique combinations to generate, equivalent of number of unlocking rounds, capped at number of all combinations
+            - number_of_indices (int): Number of indices to choose from, defaults to biometric template length
 
         Returns:
             - unique_combinations_of_indices (list): List of all generated unique combinations of indices
         """
-        # Define set of all indices in biometric template
-        set_of_indices = set(range(self.bio_template_length))
+        if number_of_indices is None:
+            number_of_indices = self.bio_template_length
+
+        # Define list of all indices in biometric template, random.sample() no longer accepts sets
+        set_of_indices = list(range(number_of_indices))
+
+        # There are no more unique combinations than binomial coefficient
+        how_many_combinations = min(
+            how_many_combinations, comb(number_of_indices, how_many_indices)
+        )
 
         # Generate desired amount of unique combinations of indices of biometric template
         unique_combinations_of_indices = set()
@@ -103,8 +154,18 @@ class FuzzyVault:
 
         return list(unique_combinations_of_indices)
 
+    @tracing.traced("fuzzy_vault.unlock")
+    @metrics.timed(UNLOCK_DURATION)
     def unlock(
-        self, verify_threshold: int, number_of_unlocking_rounds: int = 5000
+        self,
+        verify_threshold: int,
+        number_of_unlocking_rounds: int = 5000,
+        tally_capacity: int = None,
+        state_store: UnlockStateStore = None,
+        captures: list = None,
+        stop_votes: int = None,
+        cancel_event=None,
+        preprocessed_templates: list = None,
     ) -> GroupPoly:
         """
         Unlock secret polynomial from Fuzzy Vault using biometric verification template provided by Client
@@ -112,57 +173,202 @@ class FuzzyVault:
         Parameters:
             - verify_threshold (int): Number of (argument, value) pairs of Fuzzy Vault used to recover secret polynomial
             - number_of_unlocking_rounds (int): Number of secret polynomial recovery rounds to perform
+            - tally_capacity (int): Maximal number of candidates counted at once, bounding memory of noisy unlocking; all candidates are counted if not given
+            - state_store (UnlockStateStore): Store of unlocking progress, retries with the same vault and template continue with untried combinations and previous votes
+            - captures (list): Verification templates of several captures unlocked together, rounds alternate between them and vote in single tally; defaults to biometric template of Fuzzy Vault
+            - stop_votes (int): Stop unlocking as soon as any candidate is guaranteed this many votes and return it, all rounds are performed if not given
+            - cancel_event (threading.Event): Unlocking stops before next round once event is set, candidate with most votes so far is returned
+            - preprocessed_templates (list): PreprocessedTemplate of every capture, e.g. read from shared memory arena; computed from captures if not given
         Returns:
             - secret_polynomial (GroupPoly): Recovered secret polynomial object
         """
-        # Define Finite Field of order delivered to Client from Server
-        GF = galois.GF(self.group_order)
-
-        # Dictionary structure for counting occurence of certain secret polynomials during unlocking process
-        poly_counting_dict = {}
-
-        # Generate unique index combination list
-        unique_index_combinations = self.get_random_argument_combinations(
-            verify_threshold, number_of_unlocking_rounds
-        )
+        if captures is None:
+            captures = [self.bio_template]
+
+        # Reduce and deduplicate templates once, so that no subset of them is singular, and precompute inverses of their differences
+        if preprocessed_templates is None:
+            templates = [PreprocessedTemplate(capture, self.group_order) for capture in captures]
+        else:
+            templates = preprocessed_templates
+        UNLOCK_TEMPLATE_DUPLICATES.inc(sum(template.duplicates for template in templates))
+        longest_template_length = max(len(template) for template in templates)
+        if longest_template_length < verify_threshold:
+            raise ValueError(
+                f"Verification template has {longest_template_length} distinct values, at least {verify_threshold} are required"
+            )
 
-        for combination in unique_index_combinations:
-            arguments = GF([self.bio_template[ind] for ind in combination])
-            values = [self.vault_polynomial.eval(int(arg)) for arg in arguments]
-            values = GF(values)
+        # Values of vault at template arguments are shared by all rounds, and by captures with the same samples
+        vault_values_cache = {}
+        for template in templates:
+            for value in template.values:
+                if value not in vault_values_cache:
+                    vault_values_cache[value] = self.vault_polynomial.eval(value)
+        vault_values = [
+            [vault_values_cache[value] for value in template.values] for template in templates
+        ]
 
-            # Recover secret polynomial from chosen arguments 'x' and Fuzzy Vault values V(x) using Lagrange interpolation for finite field polynomials
-            try:
-                interpolated_polynomial = galois.lagrange_poly(arguments, values)
-            except:
-                continue
+        if state_store is None:
+            # Tally of votes for secret polynomial candidates keyed by compact digest of their coefficients
+            tally = create_tally(tally_capacity)
+
+            # Generate unique index combination lists, rounds are split evenly between captures
+            rounds_per_capture = -(-number_of_unlocking_rounds // len(templates))
+            combinations = [
+                self.get_random_argument_combinations(
+                    verify_threshold, rounds_per_capture, len(template)
+                )
+                for template in templates
+            ]
+            interleaved_rounds = [
+                (capture_index, capture_combinations[i])
+                for i in range(max(len(capture_combinations) for capture_combinations in combinations))
+                for capture_index, capture_combinations in enumerate(combinations)
+                if i < len(capture_combinations)
+            ]
+            unlocking_rounds = [
+                (round_number, capture_index, combination)
+                for round_number, (capture_index, combination) in enumerate(
+                    interleaved_rounds[:number_of_unlocking_rounds], start=1
+                )
+            ]
+        else:
+            # Resume sampling position and tally of previous attempts with the same vault and templates
+            state_key = unlock_state_key(
+                self.vault_polynomial.coef,
+                [template.values for template in templates],
+                self.group_order,
+                verify_threshold,
+            )
+            state = state_store.get(state_key)
+            if state is None:
+                state = UnlockState(
+                    state_key,
+                    [len(template) for template in templates],
+                    verify_threshold,
+                    tally_capacity,
+                )
+            tally = state.tally
+            unlocking_rounds = state.next_combinations(number_of_unlocking_rounds)
+
+            # Retry would return the same candidate as previous attempt without trying anything new
+            if not unlocking_rounds:
+                state_store.discard(state_key)
+                raise ValueError(
+                    "All combinations of verification template were already tried, take new capture"
+                )
+
+        rounds_done = 0
+        stop_digest = None
+        for round_number, capture_index, combination in unlocking_rounds:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+
+            # Recover secret polynomial from chosen arguments 'x' and Fuzzy Vault values V(x) using Lagrange interpolation
+            capture_vault_values = vault_values[capture_index]
+            secret_polynomial_coeffs = tuple(
+                templates[capture_index].interpolate(
+                    combination, [capture_vault_values[index] for index in combination]
+                )
+            )
 
             # Count secret polynomial occurence
-            secret_polynomial_coeffs = list(
-                [
-                    int(coefficient)
-                    for coefficient in interpolated_polynomial.coefficients()[::-1]
-                ]
+            digest = candidate_digest(secret_polynomial_coeffs, self.group_order)
+            votes = tally.add(digest, secret_polynomial_coeffs, round_number)
+            rounds_done += 1
+            # Votes reported by bounded tally may be inherited from evicted candidate, so early stop needs guaranteed ones
+            if stop_votes is not None and votes >= stop_votes and tally.guaranteed_votes(digest) >= stop_votes:
+                stop_digest = digest
+                break
+
+        UNLOCK_ROUNDS.inc(rounds_done)
+        total_rounds = rounds_done
+        if state_store is not None:
+            # Combinations drawn but not tried are left for next attempt
+            if rounds_done < len(unlocking_rounds):
+                state.cursor = unlocking_rounds[rounds_done][0] - 1
+            state.attempts += 1
+            state_store.put(state)
+            total_rounds = state.tried_combinations
+
+        if tally.winner() is None:
+            raise ValueError(
+                "No candidate was recovered, unlocking was cancelled or all combinations of verification template were already tried"
             )
-            if str(secret_polynomial_coeffs) not in poly_counting_dict.keys():
-                poly_counting_dict[str(secret_polynomial_coeffs)] = 1
-            else:
-                poly_counting_dict[str(secret_polynomial_coeffs)] += 1
-
-        # Choose most common ocurring polynomial as true recovered secret polynomial
-        most_common_coefs_str = str(max(poly_counting_dict, key=poly_counting_dict.get))
-        secret_polynomial_coeffs = [
-            int(val)
-            for val in most_common_coefs_str.replace("[", "")
-            .replace("]", "")
-            .split(", ")
-        ]
+
+        # Choose most common ocurring polynomial as true recovered secret polynomial, or the one that stopped unlocking,
+        # whose votes may be exceeded by overestimated votes of bounded tally
+        if stop_digest is None:
+            most_common_coefs, _, first_round = tally.winner()
+        else:
+            _, first_round, most_common_coefs = tally.entries[stop_digest][:3]
+        votes = tally.guaranteed_votes(stop_digest)
+
+        # Coefficients of candidates are not stored with unlocking progress, winner is interpolated again from its first round
+        if most_common_coefs is None:
+            capture_index, combination = state.round_combination(first_round)
+            most_common_coefs = templates[capture_index].interpolate(
+                combination, [vault_values[capture_index][index] for index in combination]
+            )
+
+        # Keep statistics of unlocking for experiments
+        self.unlock_stats = {
+            "rounds": rounds_done,
+            "total_rounds": total_rounds,
+            "first_round": first_round,
+            "votes": votes,
+        }
+        UNLOCK_DISTINCT_CANDIDATES.observe(tally.distinct_candidates)
+        UNLOCK_WINNING_VOTE_SHARE.observe(votes / total_rounds)
         secret_polynomial = GroupPoly(
-            group_order=self.group_order, coef=secret_polynomial_coeffs
+            group_order=self.group_order, coef=list(most_common_coefs)
         )
 
         return secret_polynomial
 
+    def to_buffer(self) -> bytes:
+        """
+        Serialize Fuzzy Vault into compact buffer, that is cheaper to pass to worker processes than pickled object
+
+        Parameters:
+            - None
+
+        Returns:
+            - (bytes): Group order, biometric template and vault coefficients if vault is locked
+        """
+        has_vault = hasattr(self, "vault_polynomial")
+        encoded = [
+            FUZZY_VAULT_MAGIC,
+            bytes([FLAG_HAS_VAULT if has_vault else 0]),
+            pack_integer(self.group_order),
+            pack_integers(self.bio_template),
+        ]
+        if has_vault:
+            encoded.append(pack_integers(self.vault_polynomial.coef.tolist()))
+        return b"".join(encoded)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """
+        Deserialize Fuzzy Vault from buffer created with to_buffer()
+
+        Parameters:
+            - buffer (bytes | memoryview): Buffer, e.g. view of shared memory arena
+
+        Returns:
+            - (FuzzyVault): Deserialized Fuzzy Vault
+        """
+        offset = check_magic(buffer, FUZZY_VAULT_MAGIC)
+        flags = buffer[offset]
+        group_order, offset = unpack_integer(buffer, offset + 1)
+        bio_template, offset = unpack_integers(buffer, offset)
+
+        fuzzy_vault = cls(group_order=group_order, bio_template=bio_template)
+        if flags & FLAG_HAS_VAULT:
+            vault_coefs, offset = unpack_integers(buffer, offset)
+            fuzzy_vault.set_vault_polynomial(vault_coefs)
+        check_end(buffer, offset)
+        return fuzzy_vault
+
     def set_vault_polynomial(self, vault_polynomial_coefs: list) -> None:
         """
         Set vault polynomial as Fuzzy Vault object property
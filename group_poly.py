@@ -1,6 +1,17 @@
-import sympy
 import numpy as np
 
+from profile_format import (
+    check_end,
+    check_magic,
+    pack_integer,
+    pack_integers,
+    unpack_integer,
+    unpack_integers,
+)
+
+# Magic of GroupPoly buffers: magic | group order | coefficients
+GROUP_POLY_MAGIC = b"BRGP"
+
 
 class Group:
     def __init__(self, prime: int):
@@ -14,6 +25,9 @@ class Group:
             - self (Group): Group class object
         """
 
+        # sympy is slow to import and only needed for primality test
+        import sympy
+
         # Test if given group order is prime number
         if not sympy.isprime(prime):
             raise ValueError(f"Given group order is not prime: p = {prime}")
@@ -231,6 +245,37 @@ class GroupPoly:
                 return False
         return True
 
+    def to_buffer(self) -> bytes:
+        """
+        Serialize polynomial into compact buffer, that is cheaper to pass to worker processes than pickled object array
+
+        Parameters:
+            - None
+
+        Returns:
+            - (bytes): Group order and fixed-width coefficients
+        """
+        return b"".join(
+            (GROUP_POLY_MAGIC, pack_integer(self.group_order), pack_integers(self.coef.tolist()))
+        )
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """
+        Deserialize polynomial from buffer created with to_buffer()
+
+        Parameters:
+            - buffer (bytes | memoryview): Buffer, e.g. view of shared memory arena
+
+        Returns:
+            - (GroupPoly): Deserialized polynomial
+        """
+        offset = check_magic(buffer, GROUP_POLY_MAGIC)
+        group_order, offset = unpack_integer(buffer, offset)
+        coefs, offset = unpack_integers(buffer, offset)
+        check_end(buffer, offset)
+        return cls(group_order, coefs)
+
     @classmethod
     def zero(cls, group_order: int):
         return cls(group_order, [0])
@@ -274,6 +319,10 @@ def run_tests():
     # One polynomial test
     assert GroupPoly.one(group_order) == GroupPoly(group_order, [1])
 
+    # Buffer round trip test
+    assert GroupPoly.from_buffer(poly1.to_buffer()) == poly1
+    assert GroupPoly.from_buffer(memoryview(poly1.to_buffer())).coef.tolist() == [3, 2, 6]
+
     print("Tests completed!")
 
 
@@ -0,0 +1,602 @@
+import os
+import sys
+import random
+import argparse
+from math import comb
+from time import perf_counter as pc
+
+import numpy as np
+
+from blinding_pool import batch_inverse
+from fuzzy_vault import FuzzyVault
+from interpolation import preprocess_template
+from group_poly import GroupPoly
+from profile_format import PROFILE_EXTENSIONS, load_profile
+
+# Float64 represents integers exactly up to 2^53
+FLOAT_MANTISSA_BITS = 53
+
+
+def limb_bits(group_order: int, inner_length: int) -> int:
+    """
+    Choose width of limbs right operand of modular matrix product is split into, so that float64 product of limbs is exact
+
+    Parameters:
+        - group_order (int): Order of group the BRAKE protocol is executed in
+        - inner_length (int): Inner dimension of matrix product
+
+    Returns:
+        - (int): Limb width in bits, None if group order is too large for float64 arithmetic
+    """
+    bits = (
+        FLOAT_MANTISSA_BITS
+        - group_order.bit_length()
+        - (inner_length - 1).bit_length()
+    )
+    return bits if bits >= 1 else None
+
+
+def split_limbs(matrix, group_order: int) -> tuple:
+    """
+    Prepare right operand of modular matrix product
+
+    Parameters:
+        - matrix (np.ndarray): 2D array of group elements
+        - group_order (int): Order of group the BRAKE protocol is executed in
+
+    Returns:
+        - (tuple): Limb width in bits and float64 limbs, most significant first, or (None, [object matrix]) for large group orders
+    """
+    bits = limb_bits(group_order, matrix.shape[0])
+    if bits is None:
+        return (None, [np.asarray(matrix, dtype=object)])
+
+    matrix = np.asarray(matrix).astype(np.int64)
+    number_of_limbs = -(-group_order.bit_length() // bits)
+    mask = (1 << bits) - 1
+    limbs = [
+        ((matrix >> (bits * i)) & mask).astype(np.float64)
+        for i in range(number_of_limbs - 1, -1, -1)
+    ]
+    return (bits, limbs)
+
+
+def modular_matmul(left: np.ndarray, right: tuple, group_order: int) -> np.ndarray:
+    """
+    Multiply matrices of group elements exactly using float64 BLAS matrix product of limbs
+
+    Parameters:
+        - left (np.ndarray): 2D array of group elements, float64 unless group order is too large
+        - right (tuple): Right operand prepared by split_limbs()
+        - group_order (int): Order of group the BRAKE protocol is executed in
+
+    Returns:
+        - (np.ndarray): Product modulo group order, int64 unless group order is too large
+    """
+    bits, limbs = right
+    if bits is None:
+        return (np.asarray(left, dtype=object) @ limbs[0]) % group_order
+
+    product = None
+    for limb in limbs:
+        limb_product = (left @ limb).astype(np.int64)
+        if product is None:
+            product = limb_product % group_order
+        else:
+            product <<= bits
+            product += limb_product
+            product %= group_order
+    return product
+
+
+def operand_dtype(group_order: int, inner_length: int):
+    return np.float64 if limb_bits(group_order, inner_length) is not None else object
+
+
+def evaluate_vaults(coefs, arguments: list, group_order: int) -> np.ndarray:
+    """
+    Evaluate many vault polynomials at many arguments as single matrix product with Vandermonde matrix
+
+    Parameters:
+        - coefs (np.ndarray): 2D array of vault coefficients with one vault per row, lowest powers first
+        - arguments (list): Arguments to evaluate vaults at
+        - group_order (int): Order of group the BRAKE protocol is executed in
+
+    Returns:
+        - values (np.ndarray): 2D array with values of vault polynomial of each row at each argument
+    """
+    number_of_coefs = np.shape(coefs)[1]
+    vandermonde = np.array(
+        [
+            [pow(int(argument), power, group_order) for argument in arguments]
+            for power in range(number_of_coefs)
+        ],
+        dtype=object,
+    )
+    left = np.asarray(coefs).astype(operand_dtype(group_order, number_of_coefs))
+    return modular_matmul(left, split_limbs(vandermonde, group_order), group_order)
+
+
+def lagrange_weights(nodes: list, points: list, group_order: int) -> list:
+    """
+    Compute Lagrange basis polynomials through nodes evaluated at points, shared by all vaults interpolated through the same nodes
+
+    Parameters:
+        - nodes (list): Distinct interpolation arguments
+        - points (list): Arguments the interpolated polynomial is evaluated at
+        - group_order (int): Order of group the BRAKE protocol is executed in
+
+    Returns:
+        - weights (list): Rows of weights such that P(points[j]) = sum_i P(nodes[i]) * weights[i][j]
+    """
+    denominators = []
+    for i, node in enumerate(nodes):
+        denominator = 1
+        for m, other_node in enumerate(nodes):
+            if m != i:
+                denominator = denominator * (node - other_node) % group_order
+        denominators.append(denominator)
+    inverses = batch_inverse(denominators, group_order)
+
+    weights = []
+    for i in range(len(nodes)):
+        row = []
+        for point in points:
+            numerator = inverses[i]
+            for m, other_node in enumerate(nodes):
+                if m != i:
+                    numerator = numerator * (point - other_node) % group_order
+            row.append(numerator)
+        weights.append(row)
+
+    return weights
+
+
+def agreement_forms(
+    template: list, rounds: list, verify_threshold: int, group_order: int
+) -> np.ndarray:
+    """
+    Build linear forms vanishing on values of vault at template arguments iff round's check argument agrees with polynomial interpolated through round's nodes
+
+    Parameters:
+        - template (list): Distinct template values in group
+        - rounds (list): Tuples of template indices, first verify_threshold are interpolation nodes and rest are check arguments
+        - verify_threshold (int): Verification threshold of vaults
+        - group_order (int): Order of group the BRAKE protocol is executed in
+
+    Returns:
+        - forms (np.ndarray): 2D array with one form per column, (len(template) x rounds * check arguments)
+    """
+    number_of_checks = len(rounds[0]) - verify_threshold
+    forms = np.zeros((len(template), len(rounds) * number_of_checks), dtype=object)
+    for r, round_indices in enumerate(rounds):
+        nodes = round_indices[:verify_threshold]
+        checks = round_indices[verify_threshold:]
+        weights = lagrange_weights(
+            [template[i] for i in nodes], [template[j] for j in checks], group_order
+        )
+        for c, check in enumerate(checks):
+            column = r * number_of_checks + c
+            for i, node in enumerate(nodes):
+                forms[node, column] = weights[i][c]
+            forms[check, column] = group_order - 1
+
+    return forms
+
+
+class IdentificationEngine:
+    def __init__(self, vault_chunk_size: int = 2048, round_batch_size: int = 64):
+        """
+        IdentificationEngine class constructor, that returns engine finding which enrolled vaults a verification template unlocks (1:N identification)
+
+        Parameters:
+            - vault_chunk_size (int): Number of vaults tested at once, sized so that intermediate results stay in cache
+            - round_batch_size (int): Number of interpolation rounds tested at once
+
+        Returns:
+            - self (IdentificationEngine): IdentificationEngine class object
+        """
+        self.vault_chunk_size = vault_chunk_size
+        self.round_batch_size = round_batch_size
+        self.vault_batches = []
+
+    def __len__(self):
+        return sum(len(batch["client_ids"]) for batch in self.vault_batches)
+
+    def add_vaults(
+        self, group_order: int, verify_threshold: int, client_ids, coefs
+    ) -> None:
+        """
+        Add vaults of the same group order, verification threshold and degree to engine
+
+        Parameters:
+            - group_order (int): Order of group the vaults are defined in
+            - verify_threshold (int): Verification threshold of vaults
+            - client_ids (list): Client's identificators in order of rows
+            - coefs (np.ndarray): 2D array of vault coefficients with one vault per row, may be memory-mapped
+
+        Returns:
+            - None
+        """
+        if len(client_ids) == 0:
+            return
+        self.vault_batches.append(
+            {
+                "group_order": int(group_order),
+                "verify_threshold": int(verify_threshold),
+                "client_ids": np.asarray(client_ids, dtype=object),
+                "coefs": coefs,
+            }
+        )
+
+    @classmethod
+    def from_vault_store(cls, vault_store, **kwargs):
+        """
+        Create engine over all live vaults of columnar vault store, without copying vault coefficients
+
+        Parameters:
+            - vault_store (ColumnarVaultStore): Vault store to identify against
+            - kwargs (dict): IdentificationEngine constructor arguments
+
+        Returns:
+            - engine (IdentificationEngine): IdentificationEngine class object
+        """
+        engine = cls(**kwargs)
+        for group_order, client_ids, coefs, thresholds in vault_store.scan(
+            with_thresholds=True
+        ):
+            for verify_threshold in np.unique(thresholds):
+                mask = thresholds == verify_threshold
+                if mask.all():
+                    engine.add_vaults(group_order, verify_threshold, client_ids, coefs)
+                else:
+                    engine.add_vaults(
+                        group_order, verify_threshold, client_ids[mask], coefs[mask]
+                    )
+        return engine
+
+    @classmethod
+    def from_server(cls, server, **kwargs):
+        """
+        Create engine over all Clients enroled in Server's database
+
+        Parameters:
+            - server (Server): Server whose database is identified against
+            - kwargs (dict): IdentificationEngine constructor arguments
+
+        Returns:
+            - engine (IdentificationEngine): IdentificationEngine class object
+        """
+        if server.vault_store is not None:
+            return cls.from_vault_store(server.vault_store, **kwargs)
+
+        # Group profile files by vaults sharing group order, threshold and degree
+        groups = {}
+        for filename in os.listdir(server.db_path):
+            if not filename.endswith(server.profile_extension):
+                continue
+            with open(f"{server.db_path}{filename}", "rb") as f:
+                profile_dict = load_profile(f.read())
+            group_key = (
+                profile_dict["group_order"],
+                profile_dict["verify_threshold"],
+                len(profile_dict["vault_coefs"]),
+            )
+            client_ids, coefs = groups.setdefault(group_key, ([], []))
+            client_ids.append(profile_dict["client_id"])
+            coefs.append([int(coef) for coef in profile_dict["vault_coefs"]])
+
+        engine = cls(**kwargs)
+        for (group_order, verify_threshold, _), (client_ids, coefs) in sorted(
+            groups.items()
+        ):
+            engine.add_vaults(
+                group_order,
+                verify_threshold,
+                client_ids,
+                np.array(coefs, dtype=object),
+            )
+        return engine
+
+    def agreement_mask(
+        self, values: list, template: list, nodes: list, group_order: int
+    ) -> np.ndarray:
+        """
+        Find template arguments at which vault agrees with polynomial interpolated through nodes
+
+        Parameters:
+            - values (list): Values of vault at template arguments
+            - template (list): Distinct template values in group
+            - nodes (list): Template indices of interpolation nodes
+            - group_order (int): Order of group the vault is defined in
+
+        Returns:
+            - (np.ndarray): Boolean mask of agreeing template arguments
+        """
+        weights = lagrange_weights([template[i] for i in nodes], template, group_order)
+        return np.array(
+            [
+                sum(values[node] * weights[i][j] for i, node in enumerate(nodes))
+                % group_order
+                == values[j]
+                for j in range(len(template))
+            ]
+        )
+
+    def unlock_candidate(
+        self,
+        vault_coefs: list,
+        template: list,
+        agreement_mask: np.ndarray,
+        verify_threshold: int,
+        group_order: int,
+        min_agreement: int,
+        number_of_unlocking_rounds: int,
+    ) -> tuple:
+        """
+        Run full unlock of shortlisted vault and confirm recovered secret polynomial
+
+        Parameters:
+            - vault_coefs (list): Coefficients of vault polynomial
+            - template (list): Distinct template values in group
+            - agreement_mask (np.ndarray): Template arguments agreeing with interpolated polynomial during scoring
+            - verify_threshold (int): Verification threshold of vault
+            - group_order (int): Order of group the vault is defined in
+            - min_agreement (int): Minimal number of template arguments agreeing with recovered polynomial
+            - number_of_unlocking_rounds (int): Maximal number of secret polynomial recovery rounds to perform
+
+        Returns:
+            - (tuple): Recovered secret polynomial and its agreement count, or (None, 0) if vault is not unlocked
+        """
+        agreeing_template = [
+            value for value, agrees in zip(template, agreement_mask) if agrees
+        ]
+
+        fuzzy_vault = FuzzyVault(group_order=group_order, bio_template=agreeing_template)
+        fuzzy_vault.set_vault_polynomial(vault_polynomial_coefs=vault_coefs)
+        secret_polynomial = fuzzy_vault.unlock(
+            verify_threshold=verify_threshold,
+            number_of_unlocking_rounds=min(
+                number_of_unlocking_rounds,
+                comb(len(agreeing_template), verify_threshold),
+            ),
+        )
+
+        # Template arguments are roots of enrolled product polynomial V - f
+        product_polynomial = fuzzy_vault.vault_polynomial - secret_polynomial
+        agreement = sum(1 for value in template if product_polynomial.eval(value) == 0)
+        if agreement < min_agreement:
+            return (None, 0)
+
+        return (secret_polynomial, agreement)
+
+    def identify(
+        self,
+        bio_template: list,
+        number_of_rounds: int = 5000,
+        check_points: int = 1,
+        min_extra_agreement: int = 2,
+        max_matches: int = 1,
+        number_of_unlocking_rounds: int = 16,
+    ) -> list:
+        """
+        Identify enrolled vaults unlocked by biometric verification template
+
+        Parameters:
+            - bio_template (list): Biometric verification template
+            - number_of_rounds (int): Number of random template subsets tried against every vault
+            - check_points (int): Number of template arguments checked against each interpolation
+            - min_extra_agreement (int): Number of template arguments beyond verify_threshold that must agree with secret polynomial
+            - max_matches (int): Stop scan once this many vaults were unlocked
+            - number_of_unlocking_rounds (int): Maximal number of rounds of full unlock of shortlisted vault
+
+        Returns:
+            - matches (list): Dicts with 'client_id', 'group_order', 'verify_threshold', 'agreement' and 'secret_polynomial', best agreement first
+        """
+        matches = []
+
+        for batch in self.vault_batches:
+            group_order = batch["group_order"]
+            k = batch["verify_threshold"]
+            min_agreement = k + min_extra_agreement
+            client_ids = batch["client_ids"]
+
+            template = preprocess_template(bio_template, group_order)
+            if len(template) < max(min_agreement, k + check_points):
+                raise ValueError(
+                    f"Identification requires at least {max(min_agreement, k + check_points)} distinct template values, got {len(template)}"
+                )
+
+            # Evaluate all vaults at template arguments once, memory-mapped coefficients are converted chunk by chunk
+            values = np.concatenate(
+                [
+                    evaluate_vaults(
+                        batch["coefs"][start : start + self.vault_chunk_size],
+                        template,
+                        group_order,
+                    )
+                    for start in range(0, len(client_ids), self.vault_chunk_size)
+                ]
+            ).astype(operand_dtype(group_order, len(template)))
+
+            # Rounds are the outer loop, so that genuine vault is found after as few rounds as possible
+            unlocked_rows = set()
+            for round_start in range(0, number_of_rounds, self.round_batch_size):
+                rounds = [
+                    random.sample(range(len(template)), k + check_points)
+                    for _ in range(
+                        min(self.round_batch_size, number_of_rounds - round_start)
+                    )
+                ]
+                forms = split_limbs(
+                    agreement_forms(template, rounds, k, group_order), group_order
+                )
+
+                for start in range(0, len(client_ids), self.vault_chunk_size):
+                    tested = modular_matmul(
+                        values[start : start + self.vault_chunk_size], forms, group_order
+                    )
+
+                    # Hits are rare for other Clients' vaults, count agreement over whole template only for them
+                    for row, column in zip(*np.nonzero(tested == 0)):
+                        vault_row = start + int(row)
+                        if vault_row in unlocked_rows:
+                            continue
+                        vault_values = [int(value) for value in values[vault_row]]
+                        agreement_mask = self.agreement_mask(
+                            vault_values,
+                            template,
+                            rounds[column // check_points][:k],
+                            group_order,
+                        )
+                        if agreement_mask.sum() < min_agreement:
+                            continue
+
+                        # Full unlock of shortlisted vault
+                        unlocked_rows.add(vault_row)
+                        secret_polynomial, agreement = self.unlock_candidate(
+                            [int(coef) for coef in batch["coefs"][vault_row]],
+                            template,
+                            agreement_mask,
+                            k,
+                            group_order,
+                            min_agreement,
+                            number_of_unlocking_rounds,
+                        )
+                        if secret_polynomial is None:
+                            continue
+                        matches.append(
+                            {
+                                "client_id": client_ids[vault_row],
+                                "group_order": group_order,
+                                "verify_threshold": k,
+                                "agreement": agreement,
+                                "secret_polynomial": secret_polynomial,
+                            }
+                        )
+                        if len(matches) >= max_matches:
+                            return sorted(matches, key=lambda match: -match["agreement"])
+
+        return sorted(matches, key=lambda match: -match["agreement"])
+
+
+def create_random_vaults(group_order: int, degree: int, count: int) -> np.ndarray:
+    """
+    Create random vault polynomials, indistinguishable from vaults of other Clients
+
+    Parameters:
+        - group_order (int): Order of group the vaults are defined in
+        - degree (int): Degree of vault polynomials
+        - count (int): Number of vaults
+
+    Returns:
+        - coefs (np.ndarray): 2D array of vault coefficients with one monic vault per row
+    """
+    coefs = np.random.randint(0, group_order, size=(count, degree + 1), dtype=np.int64)
+    coefs[:, -1] = 1
+    return coefs
+
+
+def create_genuine_vault(
+    group_order: int, enrol_template: list, verify_threshold: int
+) -> tuple:
+    secret_polynomial = FuzzyVault.generate_secret_polynomial(
+        group_order=group_order, sec_poly_deg=verify_threshold
+    )
+    fuzzy_vault = FuzzyVault(group_order=group_order, bio_template=enrol_template)
+    fuzzy_vault.lock(secret_polynomial=secret_polynomial)
+    return (secret_polynomial, [int(coef) for coef in fuzzy_vault.vault_polynomial.coef])
+
+
+def run_tests():
+    print("Running identification.py tests...")
+
+    # Matrix evaluation and Lagrange weights agree with GroupPoly arithmetic, for float64 and large group orders
+    for group_order in (12401, 2147483647, 2**61 - 1):
+        coefs = [[3, 0, 5, 1], [7, 1, 0, group_order - 1]]
+        arguments = [0, 1, 2, group_order - 1]
+        values = evaluate_vaults(np.array(coefs, dtype=object), arguments, group_order)
+        for row, vault_coefs in enumerate(coefs):
+            polynomial = GroupPoly(group_order, vault_coefs)
+            assert [int(value) for value in values[row]] == [
+                polynomial.eval(argument) for argument in arguments
+            ]
+
+        polynomial = GroupPoly(group_order, [4, 9, 1])
+        nodes = [1, 2, group_order - 3]
+        points = [4, 2, 13]
+        weights = lagrange_weights(nodes, points, group_order)
+        for j, point in enumerate(points):
+            interpolated = sum(
+                polynomial.eval(node) * weights[i][j] for i, node in enumerate(nodes)
+            )
+            assert interpolated % group_order == polynomial.eval(point)
+
+    # Genuine vault is found among random vaults
+    group_order = 2147483647
+    verify_threshold = 4
+    enrol_template = [random.randint(1, group_order - 1) for _ in range(16)]
+    secret_polynomial, genuine_coefs = create_genuine_vault(
+        group_order, enrol_template, verify_threshold
+    )
+    coefs = create_random_vaults(group_order, len(enrol_template), 5000)
+    genuine_row = 3210
+    coefs[genuine_row] = genuine_coefs
+
+    engine = IdentificationEngine()
+    engine.add_vaults(group_order, verify_threshold, list(range(len(coefs))), coefs)
+
+    verification_template = enrol_template[:10] + [
+        random.randint(1, group_order - 1) for _ in range(6)
+    ]
+    random.shuffle(verification_template)
+    start = pc()
+    matches = engine.identify(verification_template, number_of_rounds=400)
+    elapsed = pc() - start
+    assert [match["client_id"] for match in matches] == [genuine_row]
+    assert matches[0]["secret_polynomial"] == secret_polynomial
+    assert matches[0]["agreement"] == 10
+
+    # Impostor template unlocks nothing
+    impostor_template = [random.randint(1, group_order - 1) for _ in range(16)]
+    assert engine.identify(impostor_template, number_of_rounds=400) == []
+
+    print(f"Identification among {len(engine)} vaults took {elapsed:.3f} s")
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    from server import Server
+
+    parser = argparse.ArgumentParser(description="1:N identification against Server's database")
+    parser.add_argument("db_path", help="Server's database directory")
+    parser.add_argument("template", help="Comma separated biometric verification template")
+    parser.add_argument("--storage-mode", default="files", choices=("files", "columnar"))
+    parser.add_argument(
+        "--profile-format", default="json", choices=tuple(PROFILE_EXTENSIONS)
+    )
+    parser.add_argument("--rounds", type=int, default=5000)
+    parser.add_argument("--max-matches", type=int, default=1)
+    args = parser.parse_args()
+
+    server = Server(
+        args.db_path, profile_format=args.profile_format, storage_mode=args.storage_mode
+    )
+    engine = IdentificationEngine.from_server(server)
+    bio_template = [int(value) for value in args.template.split(",")]
+
+    start = pc()
+    matches = engine.identify(
+        bio_template, number_of_rounds=args.rounds, max_matches=args.max_matches
+    )
+    print(f"Scanned {len(engine)} vaults in {pc() - start:.3f} s")
+    for match in matches:
+        print(f"Client {match['client_id']}: {match['agreement']} agreeing template values")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+from time import perf_counter as pc
+
+from Crypto.PublicKey import RSA
+
+from server import Server
+from profile_format import public_key_DER
+
+REQUIRED_INTEGER_FIELDS = ("client_id", "group_order", "verify_threshold")
+
+
+def validate_enrolment_record(record) -> str:
+    """
+    Validate single enrolment record read from JSONL enrolment stream
+
+    Parameters:
+        - record (dict): Parsed enrolment record
+
+    Returns:
+        - (str): Reason of record being invalid or None if record is valid
+    """
+    if not isinstance(record, dict):
+        return "record is not a JSON object"
+
+    for field in REQUIRED_INTEGER_FIELDS:
+        if not isinstance(record.get(field), int) or isinstance(record.get(field), bool):
+            return f"missing or non-integer field '{field}'"
+
+    group_order = record["group_order"]
+    if group_order < 2:
+        return f"invalid group order {group_order}"
+
+    vault_coefs = record.get("vault_coefs")
+    if not isinstance(vault_coefs, list) or len(vault_coefs) < 2:
+        return "missing or too short 'vault_coefs'"
+    for coef in vault_coefs:
+        if not isinstance(coef, int) or not 0 <= coef < group_order:
+            return f"vault coefficient {coef!r} is not reduced modulo group order"
+
+    verify_threshold = record["verify_threshold"]
+    if not 0 < verify_threshold < len(vault_coefs):
+        return f"verification threshold {verify_threshold} does not match vault degree"
+
+    key_PEM = record.get("client_public_key_PEM")
+    if not isinstance(key_PEM, str) or "-----BEGIN PUBLIC KEY-----" not in key_PEM:
+        return "missing or malformed 'client_public_key_PEM'"
+    try:
+        RSA.import_key(key_PEM)
+    except (ValueError, IndexError, TypeError):
+        return "malformed 'client_public_key_PEM'"
+
+    return None
+
+
+class IngestReport:
+    def __init__(self):
+        """
+        IngestReport class constructor, that returns summary of bulk enrolment import
+
+        Parameters:
+            - None
+
+        Returns:
+            - self (IngestReport): IngestReport class object
+        """
+        self.enroled = 0
+        self.batches = 0
+        self.lines_read = 0
+        self.offset = 0
+        self.elapsed = 0.0
+        self.duplicates = []
+        self.invalid = []
+
+    def to_dict(self, include_records: bool = True) -> dict:
+        report_dict = {
+            "enroled": self.enroled,
+            "batches": self.batches,
+            "lines_read": self.lines_read,
+            "offset": self.offset,
+            "elapsed": self.elapsed,
+        }
+        if include_records:
+            report_dict["duplicates"] = self.duplicates
+            report_dict["invalid"] = self.invalid
+        else:
+            report_dict["duplicate_count"] = len(self.duplicates)
+            report_dict["invalid_count"] = len(self.invalid)
+        return report_dict
+
+    @classmethod
+    def from_dict(cls, report_dict: dict):
+        report = cls()
+        for key in ("enroled", "batches", "lines_read", "offset", "elapsed", "duplicates", "invalid"):
+            if key in report_dict:
+                setattr(report, key, report_dict[key])
+        return report
+
+
+class BulkIngest:
+    def __init__(
+        self,
+        server: Server,
+        batch_size: int = 1000,
+        checkpoint_filepath: str = None,
+    ):
+        """
+        BulkIngest class constructor, that returns streaming importer of JSONL enrolment records into Server's database
+
+        Parameters:
+            - server (Server): Server whose database the records are imported into
+            - batch_size (int): Number of records committed to Server's database at once
+            - checkpoint_filepath (str): Path of checkpoint file allowing interrupted import to be resumed, None disables checkpoints;
+              duplicate and invalid records are appended to report log next to it
+
+        Returns:
+            - self (BulkIngest): BulkIngest class object
+        """
+        if batch_size < 1:
+            raise ValueError(f"Batch size must be positive: {batch_size}")
+
+        self.server = server
+        self.batch_size = batch_size
+        self.checkpoint_filepath = checkpoint_filepath
+        self.report_log_filepath = None
+        if checkpoint_filepath is not None:
+            self.report_log_filepath = f"{os.path.splitext(checkpoint_filepath)[0]}.report.jsonl"
+
+        # Checkpoint of last committed batch, and end offset of batch whose commit was interrupted,
+        # so that its records saved before interruption are not reported as duplicates when import is resumed
+        self.committed_checkpoint = None
+        self.interrupted_offset = None
+        self.logged_duplicates = 0
+        self.logged_invalid = 0
+
+    def load_checkpoint(self, input_filepath: str) -> IngestReport:
+        """
+        Load report of previous interrupted import of the same input file, with its records read from report log
+
+        Parameters:
+            - input_filepath (str): Path of JSONL enrolment records file
+
+        Returns:
+            - (IngestReport): Report to continue from, empty if there is no matching checkpoint
+        """
+        report = IngestReport()
+        self.committed_checkpoint = self.create_checkpoint(input_filepath, report, 0)
+        self.interrupted_offset = None
+        self.logged_duplicates = 0
+        self.logged_invalid = 0
+        if self.checkpoint_filepath is None:
+            return report
+        if os.path.exists(self.checkpoint_filepath):
+            with open(self.checkpoint_filepath, "rt") as f:
+                checkpoint = json.load(f)
+        else:
+            checkpoint = None
+
+        # Report log of other input, or past last checkpoint after interruption, is truncated
+        if checkpoint is None or checkpoint["input"] != os.path.abspath(input_filepath):
+            open(self.report_log_filepath, "wb").close()
+            return report
+        with open(self.report_log_filepath, "ab") as f:
+            f.truncate(checkpoint["report_log_offset"])
+        with open(self.report_log_filepath, "rt") as f:
+            for line in f:
+                record = json.loads(line)
+                if "duplicate" in record:
+                    report.duplicates.append(record["duplicate"])
+                else:
+                    report.invalid.append(record["invalid"])
+
+        report = IngestReport.from_dict(
+            dict(checkpoint["report"], duplicates=report.duplicates, invalid=report.invalid)
+        )
+        self.logged_duplicates = len(report.duplicates)
+        self.logged_invalid = len(report.invalid)
+        self.interrupted_offset = checkpoint.get("committing_offset")
+        self.committed_checkpoint = dict(checkpoint)
+        self.committed_checkpoint.pop("committing_offset", None)
+        return report
+
+    def create_checkpoint(self, input_filepath: str, report: IngestReport, report_log_offset: int) -> dict:
+        """
+        Create checkpoint holding counts of report and offsets of input file and report log only
+
+        Parameters:
+            - input_filepath (str): Path of JSONL enrolment records file
+            - report (IngestReport): Report of import up to last committed batch
+            - report_log_offset (int): Size of report log with records of import up to last committed batch
+
+        Returns:
+            - (dict): Checkpoint of constant size regardless of progress of import
+        """
+        return {
+            "input": os.path.abspath(input_filepath),
+            "report": report.to_dict(include_records=False),
+            "report_log_offset": report_log_offset,
+        }
+
+    def save_checkpoint(self, checkpoint: dict) -> None:
+        """
+        Atomically save progress of import
+
+        Parameters:
+            - checkpoint (dict): Checkpoint created by create_checkpoint(), possibly marking batch being committed
+
+        Returns:
+            - None
+        """
+        if self.checkpoint_filepath is None:
+            return
+
+        tmp_filepath = f"{self.checkpoint_filepath}.tmp"
+        with open(tmp_filepath, "wt") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filepath, self.checkpoint_filepath)
+
+    def append_report_log(self, report: IngestReport) -> int:
+        """
+        Append duplicate and invalid records found since last call to report log and flush it
+
+        Parameters:
+            - report (IngestReport): Report of import
+
+        Returns:
+            - (int): Size of report log
+        """
+        if self.report_log_filepath is None:
+            return 0
+
+        lines = [
+            json.dumps({"duplicate": duplicate}) + "\n"
+            for duplicate in report.duplicates[self.logged_duplicates :]
+        ] + [
+            json.dumps({"invalid": invalid}) + "\n" for invalid in report.invalid[self.logged_invalid :]
+        ]
+        self.logged_duplicates = len(report.duplicates)
+        self.logged_invalid = len(report.invalid)
+        with open(self.report_log_filepath, "at") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def find_interrupted_enrolments(
+        self, batch: list, duplicate_ids: list, input_filepath: str, batch_offset: int
+    ) -> set:
+        """
+        Find Clients of batch that were saved by interrupted commit of the same batch, only checked once when import is resumed
+
+        Client reported as duplicate was saved by this import if their stored profile equals their record
+        and they do not occur on any earlier line of the import.
+
+        Parameters:
+            - batch (list): Tuples (line number, enrolment record)
+            - duplicate_ids (list): IDs of Clients of batch reported as duplicates by Server
+            - input_filepath (str): Path of JSONL enrolment records file
+            - batch_offset (int): Byte offset in input file of first line of batch
+
+        Returns:
+            - (set): IDs of Clients enroled by this import
+        """
+        records = {record["client_id"]: record for _, record in reversed(batch)}
+        interrupted_ids = set()
+        for client_id in set(duplicate_ids):
+            stored_dict = self.server.get_client_data_dict(client_id)
+            record = records[client_id]
+            if public_key_DER(stored_dict) == public_key_DER(record) and [
+                int(coef) for coef in stored_dict["vault_coefs"]
+            ] == record["vault_coefs"]:
+                interrupted_ids.add(client_id)
+
+        # Clients already imported from earlier lines are duplicates
+        if interrupted_ids:
+            with open(input_filepath, "rb") as f:
+                for line in f:
+                    if f.tell() > batch_offset:
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if (
+                        isinstance(record, dict)
+                        and record.get("client_id") in interrupted_ids
+                        and validate_enrolment_record(record) is None
+                    ):
+                        interrupted_ids.remove(record["client_id"])
+
+        return interrupted_ids
+
+    def commit_batch(
+        self, batch: list, input_filepath: str, report: IngestReport, offset: int
+    ) -> None:
+        """
+        Write batch of valid records to Server's database and record progress
+
+        Parameters:
+            - batch (list): Tuples (line number, enrolment record)
+            - input_filepath (str): Path of JSONL enrolment records file
+            - report (IngestReport): Report to update
+            - offset (int): Byte offset in input file right after last record of batch
+
+        Returns:
+            - None
+        """
+        if batch:
+            line_numbers = {}
+            for line_number, record in batch:
+                line_numbers.setdefault(record["client_id"], []).append(line_number)
+
+            # Batch being committed is recorded, in case import is interrupted before batch is checkpointed
+            self.save_checkpoint(
+                dict(
+                    self.committed_checkpoint,
+                    committing_offset=max(offset, self.interrupted_offset or 0),
+                )
+            )
+
+            duplicate_ids = self.server.enrol_clients([record for _, record in batch])
+
+            # Clients saved by interrupted commit of the same batch were enroled by this import
+            if self.interrupted_offset is not None:
+                for client_id in self.find_interrupted_enrolments(
+                    batch, duplicate_ids, input_filepath, report.offset
+                ):
+                    duplicate_ids.remove(client_id)
+                if offset >= self.interrupted_offset:
+                    self.interrupted_offset = None
+
+            # Repeated ids within batch are saved once, so only their later lines are duplicates
+            duplicate_lines = []
+            for client_id in duplicate_ids:
+                duplicate_lines.append((line_numbers[client_id].pop(), client_id))
+            report.duplicates.extend(
+                {"line": line_number, "client_id": client_id}
+                for line_number, client_id in sorted(duplicate_lines)
+            )
+            report.enroled += len(batch) - len(duplicate_ids)
+            report.batches += 1
+
+        report.offset = offset
+        checkpoint = self.create_checkpoint(input_filepath, report, self.append_report_log(report))
+        self.save_checkpoint(checkpoint)
+        self.committed_checkpoint = checkpoint
+
+    def ingest(self, input_filepath: str) -> IngestReport:
+        """
+        Stream JSONL enrolment records into Server's database, resuming from checkpoint if present
+
+        Parameters:
+            - input_filepath (str): Path of JSONL file with one Client's enrolment JSON per line
+
+        Returns:
+            - report (IngestReport): Counts of enroled records, duplicate and invalid records with reasons
+        """
+        report = self.load_checkpoint(input_filepath)
+        start = pc() - report.elapsed
+
+        batch = []
+        with open(input_filepath, "rb") as f:
+            f.seek(report.offset)
+            offset = report.offset
+            for line in f:
+                offset += len(line)
+                report.lines_read += 1
+                line_number = report.lines_read
+
+                if not line.strip():
+                    continue
+
+                try:
+                    record = json.loads(line)
+                except ValueError as err:
+                    report.invalid.append(
+                        {"line": line_number, "reason": f"malformed JSON: {err}"}
+                    )
+                    continue
+
+                reason = validate_enrolment_record(record)
+                if reason is not None:
+                    report.invalid.append({"line": line_number, "reason": reason})
+                    continue
+
+                batch.append((line_number, record))
+                if len(batch) >= self.batch_size:
+                    report.elapsed = pc() - start
+                    self.commit_batch(batch, input_filepath, report, offset)
+                    batch = []
+
+            report.elapsed = pc() - start
+            self.commit_batch(batch, input_filepath, report, offset)
+
+        return report
+
+
+def run_tests():
+    print("Running ingest.py tests...")
+
+    test_directory = "./ingest_test/"
+    shutil.rmtree(test_directory, ignore_errors=True)
+    os.makedirs(test_directory)
+
+    key_PEM = RSA.generate(1024).publickey().export_key("PEM").decode("utf-8")
+    records = [
+        {
+            "client_id": client_id,
+            "vault_coefs": [client_id, 2, 3, 1],
+            "client_public_key_PEM": key_PEM,
+            "group_order": 12401,
+            "verify_threshold": 3,
+        }
+        for client_id in range(10)
+    ]
+    lines = [json.dumps(record) for record in records]
+    lines.insert(3, json.dumps(records[1]))
+    lines.insert(5, "{not json")
+    lines.insert(7, json.dumps(dict(records[2], vault_coefs=[12401, 1])))
+    malformed_key_PEM = key_PEM.replace(key_PEM.splitlines()[1], "A" * 64)
+    lines.append(json.dumps(dict(records[3], client_id=10, client_public_key_PEM=malformed_key_PEM)))
+
+    input_filepath = f"{test_directory}records.jsonl"
+    for storage_mode in ("files", "columnar"):
+        db_path = f"{test_directory}db_{storage_mode}/"
+        checkpoint_filepath = f"{test_directory}checkpoint_{storage_mode}.json"
+        server = Server(db_path, storage_mode=storage_mode)
+
+        # Import first part of the stream
+        with open(input_filepath, "wt") as f:
+            f.write("\n".join(lines[:6]) + "\n")
+        BulkIngest(server, batch_size=2, checkpoint_filepath=checkpoint_filepath).ingest(
+            input_filepath
+        )
+
+        # Resume after more records were appended
+        with open(input_filepath, "wt") as f:
+            f.write("\n".join(lines) + "\n")
+        report = BulkIngest(
+            server, batch_size=2, checkpoint_filepath=checkpoint_filepath
+        ).ingest(input_filepath)
+
+        assert report.enroled == 10
+        assert report.duplicates == [{"line": 4, "client_id": 1}]
+        assert [invalid["line"] for invalid in report.invalid] == [6, 8, 14]
+        assert all(server.client_exists(client_id) for client_id in range(10))
+
+        # Checkpoint holds counts only, records are kept in report log
+        with open(checkpoint_filepath, "rt") as f:
+            checkpoint = json.load(f)
+        assert checkpoint["report"]["duplicate_count"] == 1 and "duplicates" not in checkpoint["report"]
+        with open(f"{test_directory}checkpoint_{storage_mode}.report.jsonl", "rt") as f:
+            assert len(f.readlines()) == 4
+        assert public_key_DER(server.get_client_data_dict(9)) == public_key_DER(
+            records[9]
+        )
+
+        # Import interrupted after batch is committed but before it is checkpointed does not report batch as duplicates
+        class InterruptedIngest(BulkIngest):
+            def save_checkpoint(self, checkpoint):
+                if checkpoint["report"]["batches"] == 2:
+                    raise RuntimeError("Import interrupted")
+                super().save_checkpoint(checkpoint)
+
+        server = Server(f"{test_directory}interrupted_db_{storage_mode}/", storage_mode=storage_mode)
+        checkpoint_filepath = f"{test_directory}interrupted_checkpoint_{storage_mode}.json"
+        try:
+            InterruptedIngest(server, batch_size=2, checkpoint_filepath=checkpoint_filepath).ingest(
+                input_filepath
+            )
+            assert False
+        except RuntimeError:
+            pass
+        report = BulkIngest(
+            server, batch_size=2, checkpoint_filepath=checkpoint_filepath
+        ).ingest(input_filepath)
+        assert report.enroled == 10
+        assert report.duplicates == [{"line": 4, "client_id": 1}]
+        assert [invalid["line"] for invalid in report.invalid] == [6, 8, 14]
+
+    shutil.rmtree(test_directory)
+
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Stream JSONL enrolment records into Server's database"
+    )
+    parser.add_argument("db_path", help="Path to Server's database directory")
+    parser.add_argument("input", help="JSONL file with one enrolment record per line")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file for resumable import")
+    parser.add_argument("--storage-mode", default="files", choices=("files", "columnar"))
+    parser.add_argument("--profile-format", default="json", choices=("json", "binary"))
+    parser.add_argument("--report", default=None, help="Write full import report to JSON file")
+    args = parser.parse_args()
+
+    db_path = args.db_path if args.db_path.endswith("/") else f"{args.db_path}/"
+    server = Server(
+        db_path, profile_format=args.profile_format, storage_mode=args.storage_mode
+    )
+    report = BulkIngest(
+        server, batch_size=args.batch_size, checkpoint_filepath=args.checkpoint
+    ).ingest(args.input)
+
+    print(
+        f"Enroled: {report.enroled}, duplicates: {len(report.duplicates)}, "
+        f"invalid: {len(report.invalid)}, elapsed: {report.elapsed:.2f}s"
+    )
+    if args.report is not None:
+        with open(args.report, "wt") as f:
+            json.dump(report.to_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import random
+from time import perf_counter as pc
+
+from blinding_pool import batch_inverse
+from profile_format import (
+    check_end,
+    check_magic,
+    pack_integer,
+    pack_integers,
+    unpack_integer,
+    unpack_integers,
+)
+
+# Magic of PreprocessedTemplate buffers: magic | group order | duplicates | values | inverse differences row by row
+PREPROCESSED_TEMPLATE_MAGIC = b"BRPT"
+
+
+def preprocess_template(bio_template: list, group_order: int) -> list:
+    """
+    Reduce biometric template values into group and drop duplicates, keeping order of first occurrence
+
+    Parameters:
+        - bio_template (list): Biometric verification template
+        - group_order (int): Order of group the BRAKE protocol is executed in
+
+    Returns:
+        - (list): Distinct template values in group
+    """
+    return list(dict.fromkeys(int(value) % group_order for value in bio_template))
+
+
+class PreprocessedTemplate:
+    def __init__(self, bio_template: list, group_order: int):
+        """
+        PreprocessedTemplate class constructor, that returns distinct template values with inverses of all their pairwise differences
+
+        Inverses are computed once per verification template with single batch inversion, so that every
+        interpolation round needs multiplications only and no subset of template values is singular.
+
+        Parameters:
+            - bio_template (list): Biometric verification template
+            - group_order (int): Order of group the BRAKE protocol is executed in
+
+        Returns:
+            - self (PreprocessedTemplate): PreprocessedTemplate class object
+        """
+        self.group_order = group_order
+        self.values = preprocess_template(bio_template, group_order)
+        self.duplicates = len(bio_template) - len(self.values)
+
+        # inverse_differences[i][j] = 1 / (values[i] - values[j]) for i != j
+        n = len(self.values)
+        differences = [
+            (self.values[i] - self.values[j]) % group_order
+            for i in range(n)
+            for j in range(i + 1, n)
+        ]
+        inverses = iter(batch_inverse(differences, group_order))
+        self.inverse_differences = [[0] * n for i in range(n)]
+        for i in range(n):
+            for j in range(i + 1, n):
+                inverse = next(inverses)
+                self.inverse_differences[i][j] = inverse
+                self.inverse_differences[j][i] = group_order - inverse
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_buffer(self) -> bytes:
+        """
+        Serialize template with its table of inverse differences, so that worker processes need not recompute it
+
+        Parameters:
+            - None
+
+        Returns:
+            - (bytes): Group order, number of duplicates, distinct values and inverse differences
+        """
+        return b"".join(
+            (
+                PREPROCESSED_TEMPLATE_MAGIC,
+                pack_integer(self.group_order),
+                pack_integer(self.duplicates),
+                pack_integers(self.values),
+                pack_integers([inverse for row in self.inverse_differences for inverse in row]),
+            )
+        )
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """
+        Deserialize template from buffer created with to_buffer(), without recomputing inverses
+
+        Parameters:
+            - buffer (bytes | memoryview): Buffer, e.g. view of shared memory arena
+
+        Returns:
+            - (PreprocessedTemplate): Deserialized template
+        """
+        offset = check_magic(buffer, PREPROCESSED_TEMPLATE_MAGIC)
+        group_order, offset = unpack_integer(buffer, offset)
+        duplicates, offset = unpack_integer(buffer, offset)
+        values, offset = unpack_integers(buffer, offset)
+        inverses, offset = unpack_integers(buffer, offset)
+        check_end(buffer, offset)
+
+        n = len(values)
+        if len(inverses) != n * n:
+            raise ValueError(f"Expected {n * n} inverse differences, got {len(inverses)}")
+        template = cls.__new__(cls)
+        template.group_order = group_order
+        template.values = values
+        template.duplicates = duplicates
+        template.inverse_differences = [inverses[i * n : (i + 1) * n] for i in range(n)]
+        return template
+
+    def lagrange_denominators(self, indices: list) -> list:
+        """
+        Inverted denominators of Lagrange basis polynomials through template values at indices
+
+        Parameters:
+            - indices (list): Distinct indices of template values used as interpolation nodes
+
+        Returns:
+            - denominators (list): 1 / prod_{m != i} (x_i - x_m) for every node x_i
+        """
+        p = self.group_order
+        denominators = []
+        for i in indices:
+            row = self.inverse_differences[i]
+            denominator = 1
+            for m in indices:
+                if m != i:
+                    denominator = denominator * row[m] % p
+            denominators.append(denominator)
+        return denominators
+
+    def interpolate(self, indices: list, node_values: list) -> list:
+        """
+        Interpolate polynomial through template values at indices and given values, with O(k^2) multiplications and no inversion
+
+        Parameters:
+            - indices (list): Distinct indices of template values used as interpolation nodes
+            - node_values (list): Values of polynomial at nodes
+
+        Returns:
+            - coefs (list): Coefficients of interpolated polynomial of degree lower than number of nodes, lowest powers first
+        """
+        p = self.group_order
+        nodes = [self.values[i] for i in indices]
+        k = len(nodes)
+
+        # Master polynomial prod (x - x_i), lowest powers first
+        master = [1]
+        for node in nodes:
+            shifted = [0] + master
+            for d in range(len(master)):
+                shifted[d] = (shifted[d] - node * master[d]) % p
+            master = shifted
+
+        coefs = [0] * k
+        for node, node_value, denominator in zip(
+            nodes, node_values, self.lagrange_denominators(indices)
+        ):
+            weight = node_value * denominator % p
+            if weight == 0:
+                continue
+
+            # Synthetic division of master polynomial by (x - x_i), from highest power down
+            quotient_coef = master[k]
+            for d in range(k - 1, -1, -1):
+                coefs[d] += weight * quotient_coef
+                quotient_coef = (master[d] + node * quotient_coef) % p
+
+        return [coef % p for coef in coefs]
+
+
+def run_tests():
+    print("Running interpolation.py tests...")
+
+    p = 2147483647
+    rng = random.Random(0)
+
+    template = PreprocessedTemplate([5, p + 5, 7, 12, 7, 3 * p + 1], p)
+    assert template.values == [5, 7, 12, 1] and template.duplicates == 2
+    for i in range(len(template)):
+        for j in range(len(template)):
+            if i != j:
+                assert (template.values[i] - template.values[j]) * template.inverse_differences[i][j] % p == 1
+
+    # Interpolated polynomial agrees with original one
+    k = 8
+    coefs = [rng.randrange(p) for i in range(k)]
+
+    def evaluate(x):
+        return sum(coef * pow(x, d, p) for d, coef in enumerate(coefs)) % p
+
+    template = PreprocessedTemplate([rng.randrange(p) for i in range(44)], p)
+    indices = rng.sample(range(len(template)), k)
+    node_values = [evaluate(template.values[i]) for i in indices]
+    assert template.interpolate(indices, node_values) == coefs
+
+    rounds = 5000
+    s = pc()
+    for i in range(rounds):
+        template.interpolate(indices, node_values)
+    print(f"Interpolation of degree {k - 1} polynomial: {(pc() - s) / rounds * 1e6:.1f} us")
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
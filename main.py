@@ -1,11 +1,19 @@
+import sys
 import random
+import logging
+import argparse
 
-from client import Client
-from server import Server
-from group_poly import Group
+import tracing
+
+logger = logging.getLogger(__name__)
 
 
 def execute_BRAKE(correct_samples=None, number_of_unlocking_rounds=None):
+    # Protocol modules are imported on first run, so that submitting job to warm worker stays fast
+    from client import Client
+    from server import Server
+    from group_poly import Group
+
     # If debug_flag == True - enter verbose mode with additional messages during program execution
     debug_flag = True
     # If verify_only == True - the program will skip the enrolment phase
@@ -35,6 +43,12 @@ def execute_BRAKE(correct_samples=None, number_of_unlocking_rounds=None):
     if number_of_unlocking_rounds is None:
         number_of_unlocking_rounds = 5000
 
+    # Log debug values of protocol's modules, formatted only when debug level is enabled
+    if debug_flag:
+        logging.basicConfig(format="%(message)s")
+        for logger_name in (__name__, "client", "server"):
+            logging.getLogger(logger_name).setLevel(logging.DEBUG)
+
     # Create authentication Server instance
     server = Server(SERVER_DB_PATH)
 
@@ -52,10 +66,11 @@ def execute_BRAKE(correct_samples=None, number_of_unlocking_rounds=None):
         client_enrolment = Client(client_id, client_enrolment_biometrics_template)
 
         # Enrol Client to Server
-        enrolment_json = client_enrolment.enrol(
-            verify_threshold=verify_threshold, group=G, DEBUG=debug_flag
-        )
-        server.enrol_client(enrolment_json)
+        with tracing.span("enrolment", client_id=client_id):
+            enrolment_json = client_enrolment.enrol(
+                verify_threshold=verify_threshold, group=G, DEBUG=debug_flag
+            )
+            server.enrol_client(enrolment_json)
 
         print("\n###### END ENROLMENT ######\n")
 
@@ -72,42 +87,42 @@ def execute_BRAKE(correct_samples=None, number_of_unlocking_rounds=None):
     random.shuffle(client_verification_biometrics_template)
     client_verification = Client(client_id, client_verification_biometrics_template)
 
-    # Send client request for public data
-    verify_json = server.vault_request(client_id=client_verification.id)
-
-    # Verify Client with Server, recover Client's private key
-    client_private_key_PEM = client_verification.verify(
-        public_values_json=verify_json,
-        group=G,
-        number_of_unlocking_rounds=number_of_unlocking_rounds,
-        DEBUG=debug_flag,
-    )
+    # Login spans verification and key exchange, its trace can be opened as flame chart
+    with tracing.span("login", client_id=client_id):
+        # Send client request for public data
+        verify_json = server.vault_request(client_id=client_verification.id)
+
+        # Verify Client with Server, recover Client's private key
+        client_private_key_PEM = client_verification.verify(
+            public_values_json=verify_json,
+            group=G,
+            number_of_unlocking_rounds=number_of_unlocking_rounds,
+            DEBUG=debug_flag,
+        )
 
-    print("\n###### END VERIFICATION ######\n")
+        print("\n###### END VERIFICATION ######\n")
 
-    print("\n###### START KEY EXCHANGE ######\n")
+        print("\n###### START KEY EXCHANGE ######\n")
 
-    # Establish session key
-    encrypted_session_key, session_key_hash = server.send_session_key_to_client(
-        client_id=client_verification.id, DEBUG=debug_flag
-    )
-    recovered_session_key = client_verification.recover_session_key(
-        encrypted_session_key=encrypted_session_key,
-        client_private_key_PEM=client_private_key_PEM,
-    )
-    recovered_session_key_hash = client_verification.get_session_key_hash(
-        recovered_session_key
-    )
+        # Establish session key
+        encrypted_session_key, session_key_hash = server.send_session_key_to_client(
+            client_id=client_verification.id, DEBUG=debug_flag
+        )
+        recovered_session_key = client_verification.recover_session_key(
+            encrypted_session_key=encrypted_session_key,
+            client_private_key_PEM=client_private_key_PEM,
+        )
+        recovered_session_key_hash = client_verification.get_session_key_hash(
+            recovered_session_key
+        )
 
     # Assert if session key hashes are the same
-    if debug_flag:
-        print("\nRunning session key hashes comparison assertion...")
+    logger.debug("Running session key hashes comparison assertion...")
     assert recovered_session_key_hash == session_key_hash
 
     print("\n###### SESSION KEY EXCHANGE SUCCESSFUL ######\n")
 
-    if debug_flag:
-        print(f"Exchanged session key value: {recovered_session_key}")
+    logger.debug("Exchanged session key value: %s", recovered_session_key)
     
     print("\n###### END KEY EXCHANGE ######\n")
 
@@ -118,7 +133,41 @@ def execute_BRAKE(correct_samples=None, number_of_unlocking_rounds=None):
 
 
 def main():
-    execute_BRAKE()
+    if len(sys.argv) == 1:
+        execute_BRAKE()
+        return
+
+    parser = argparse.ArgumentParser(description="Run BRAKE enrolment, verification and key exchange")
+    parser.add_argument("--correct-samples", type=int, default=None)
+    parser.add_argument("--rounds", type=int, default=None)
+    parser.add_argument(
+        "--worker",
+        nargs="?",
+        const="",
+        default=None,
+        help="Hand the run to warm worker listening on given socket or on its default socket, run locally if none is running",
+    )
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        import warm_worker
+
+        try:
+            response = warm_worker.submit_job(
+                "brake",
+                args.worker or None,
+                correct_samples=args.correct_samples,
+                number_of_unlocking_rounds=args.rounds,
+            )
+        except OSError:
+            print(f"No warm worker on {args.worker or 'default socket'}, running locally")
+        else:
+            print(response["output"], end="")
+            if not response["ok"]:
+                sys.exit(f"Warm worker job failed: {response['error']}")
+            return
+
+    execute_BRAKE(correct_samples=args.correct_samples, number_of_unlocking_rounds=args.rounds)
 
 
 if __name__ == "__main__":
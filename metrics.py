@@ -0,0 +1,417 @@
+import os
+import math
+import threading
+from functools import wraps
+from time import perf_counter as pc
+
+# Default histogram buckets for durations in seconds
+DURATION_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+)
+# Histogram buckets for ratios in [0, 1]
+RATIO_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = pc()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(pc() - self.start, **self.labels)
+        return False
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{escape_label_value(value)}"'
+        for name, value in zip(labelnames, labelvalues)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    metric_type = None
+
+    def __init__(self, registry, name: str, documentation: str, labelnames: tuple = ()):
+        """
+        Metric class constructor, that returns metric with values per combination of label values
+
+        Parameters:
+            - registry (MetricsRegistry): Registry the metric is exported by
+            - name (str): Metric name
+            - documentation (str): Help text of metric
+            - labelnames (tuple): Names of labels distinguishing metric's values
+
+        Returns:
+            - self (Metric): Metric class object
+        """
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def label_key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(labels[name] for name in self.labelnames)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.values = {}
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        with self.lock:
+            for labelvalues, value in sorted(self.values.items()):
+                lines += self.render_value(labelvalues, value)
+        return lines
+
+    def render_value(self, labelvalues: tuple, value) -> list:
+        return [
+            f"{self.name}{format_labels(self.labelnames, labelvalues)} {format_value(value)}"
+        ]
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.label_key(labels), 0)
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.label_key(labels), 0)
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        registry,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DURATION_BUCKETS,
+    ):
+        """
+        Histogram class constructor, that returns histogram of observed values with cumulative buckets
+
+        Parameters:
+            - registry (MetricsRegistry): Registry the metric is exported by
+            - name (str): Metric name
+            - documentation (str): Help text of metric
+            - labelnames (tuple): Names of labels distinguishing metric's values
+            - buckets (tuple): Upper bounds of buckets in increasing order
+
+        Returns:
+            - self (Histogram): Histogram class object
+        """
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = self.label_key(labels)
+        with self.lock:
+            bucket_counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    bucket_counts[i] += 1
+                    break
+            self.values[key] = (bucket_counts, total + value)
+
+    def time(self, **labels):
+        """
+        Context manager observing duration of its block, does nothing while metrics are disabled
+
+        Parameters:
+            - labels (dict): Label values of observation
+
+        Returns:
+            - Context manager
+        """
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def get_count(self, **labels) -> int:
+        bucket_counts, _ = self.values.get(self.label_key(labels), ([0], 0.0))
+        return sum(bucket_counts)
+
+    def get_sum(self, **labels) -> float:
+        return self.values.get(self.label_key(labels), ([0], 0.0))[1]
+
+    def render_value(self, labelvalues: tuple, value) -> list:
+        bucket_counts, total = value
+        lines = []
+        cumulative_count = 0
+        for upper_bound, count in zip(self.buckets, bucket_counts):
+            cumulative_count += count
+            bucket_labels = format_labels(
+                self.labelnames, labelvalues, f'le="{format_value(upper_bound)}"'
+            )
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative_count}")
+        labels = format_labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative_count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = False):
+        """
+        MetricsRegistry class constructor, that returns registry of metrics exported together
+
+        Parameters:
+            - enabled (bool): Whether metrics record observations, disabled metrics return immediately
+
+        Returns:
+            - self (MetricsRegistry): MetricsRegistry class object
+        """
+        self.enabled = enabled
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric_class, name: str, documentation: str, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = metric_class(self, name, documentation, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as {metric.metric_type}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter, name, documentation, labelnames=labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self.register(Gauge, name, documentation, labelnames=labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DURATION_BUCKETS,
+    ) -> Histogram:
+        return self.register(
+            Histogram, name, documentation, labelnames=labelnames, buckets=buckets
+        )
+
+    def reset(self) -> None:
+        for metric in list(self.metrics.values()):
+            metric.reset()
+
+    def render_prometheus(self) -> str:
+        """
+        Export all metrics in Prometheus text exposition format
+
+        Parameters:
+            - None
+
+        Returns:
+            - (str): Metrics in Prometheus text format
+        """
+        lines = []
+        for name in sorted(self.metrics):
+            lines += self.metrics[name].render()
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by all instrumented modules, enabled with BRAKE_METRICS=1 environment variable or enable()
+REGISTRY = MetricsRegistry(enabled=os.environ.get("BRAKE_METRICS") == "1")
+
+
+def enable() -> None:
+    REGISTRY.enabled = True
+
+
+def disable() -> None:
+    REGISTRY.enabled = False
+
+
+def is_enabled() -> bool:
+    return REGISTRY.enabled
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return REGISTRY.counter(name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return REGISTRY.gauge(name, documentation, labelnames)
+
+
+def histogram(
+    name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DURATION_BUCKETS
+) -> Histogram:
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render_prometheus()
+
+
+def timed(duration_histogram: Histogram, error_counter: Counter = None, **labels):
+    """
+    Decorator observing duration and failures of function, calling it directly while metrics are disabled
+
+    Parameters:
+        - duration_histogram (Histogram): Histogram of call durations
+        - error_counter (Counter): Counter of calls that raised exception
+        - labels (dict): Label values of observations
+
+    Returns:
+        - Decorator
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not duration_histogram.registry.enabled:
+                return func(*args, **kwargs)
+            start = pc()
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                if error_counter is not None:
+                    error_counter.inc(**labels)
+                raise
+            finally:
+                duration_histogram.observe(pc() - start, **labels)
+
+        return wrapper
+
+    return decorator
+
+
+def run_tests():
+    print("Running metrics.py tests...")
+
+    registry = MetricsRegistry(enabled=False)
+    requests = registry.counter("requests_total", "Requests", ("op",))
+    latency = registry.histogram("latency_seconds", "Latency", ("op",), buckets=(0.1, 1.0))
+
+    # Disabled metrics record nothing
+    requests.inc(op="vault")
+    with latency.time(op="vault"):
+        pass
+    assert requests.get(op="vault") == 0 and latency.get_count(op="vault") == 0
+
+    registry.enabled = True
+    requests.inc(op="vault")
+    requests.inc(2, op="vault")
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, op="vault")
+    assert requests.get(op="vault") == 3
+    assert latency.get_count(op="vault") == 3 and latency.get_sum(op="vault") == 5.55
+
+    text = registry.render_prometheus()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{op="vault"} 3' in text
+    assert 'latency_seconds_bucket{op="vault",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{op="vault",le="1"} 2' in text
+    assert 'latency_seconds_bucket{op="vault",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{op="vault"} 3' in text
+
+    try:
+        requests.inc(operation="vault")
+        assert False
+    except ValueError:
+        pass
+
+    # Overhead of disabled instrumentation
+    registry.enabled = False
+    iterations = 100000
+    s = pc()
+    for i in range(iterations):
+        with latency.time(op="vault"):
+            pass
+    print(f"Disabled timer overhead: {(pc() - s) / iterations * 1e9:.0f} ns")
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
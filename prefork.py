@@ -0,0 +1,439 @@
+import os
+import sys
+import json
+import random
+import shutil
+import signal
+import socket
+import asyncio
+import argparse
+import traceback
+
+from server import Server
+from server_service import ServerConnection, ServerService, ServiceError, create_test_profile
+
+
+def run_worker(sock: socket.socket, db_path: str, server_kwargs: dict, cpu_workers: int = None) -> None:
+    """
+    Serve connections accepted on shared socket until SIGTERM or SIGINT is received, runs in forked worker process
+
+    Parameters:
+        - sock (socket.socket): Listening socket inherited from parent process
+        - db_path (str): Path to Server's database shared by all workers
+        - server_kwargs (dict): Server constructor arguments
+        - cpu_workers (int): Number of threads of worker running CPU-bound work
+
+    Returns:
+        - None
+    """
+
+    async def serve():
+        # Each worker has own profile cache, changes of other workers are read from invalidation log
+        server = Server(db_path, shared_store=True, **server_kwargs)
+        service = ServerService(server, sock=sock, cpu_workers=cpu_workers)
+        await service.start()
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signal_number, stop_event.set)
+        await stop_event.wait()
+        await service.close()
+
+    asyncio.run(serve())
+
+
+class PreforkServer:
+    def __init__(
+        self,
+        db_path: str,
+        workers: int = None,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        profile_format: str = "json",
+        profile_cache_size: int = 10000,
+        cpu_workers: int = None,
+    ):
+        """
+        PreforkServer class constructor, that returns supervisor of worker processes serving one Server's database
+
+        Listening socket is opened once and inherited by forked workers, kernel distributes accepted connections
+        among them. Workers share database files, enrolment creates profiles exclusively and profile changes
+        are announced through invalidation log, so that profiles cached by other workers are not served stale.
+        Session ticket keys are created before forking and redeemed tickets are recorded in the database,
+        so that ticket issued by one worker is redeemed by any worker exactly once.
+
+        Parameters:
+            - db_path (str): Path to Server's database shared by all workers
+            - workers (int): Number of worker processes, number of CPUs if not given
+            - host (str): Address to listen on
+            - port (int): Port to listen on, 0 chooses free port
+            - profile_format (str): Format of stored profiles and vault responses, either 'json' or 'binary'
+            - profile_cache_size (int): Maximal number of Client's profiles kept in memory of each worker
+            - cpu_workers (int): Number of threads of each worker running CPU-bound work
+
+        Returns:
+            - self (PreforkServer): PreforkServer class object
+        """
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.host = host
+        self.port = port
+        self.server_kwargs = {
+            "profile_format": profile_format,
+            "profile_cache_size": profile_cache_size,
+        }
+        self.cpu_workers = cpu_workers
+        self.sock = None
+        self.worker_pids = set()
+        self.stopping = False
+
+    def start(self) -> None:
+        """
+        Create database and Server's keys, open listening socket and fork workers
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        # Database, key pair and session ticket keys are created before forking, so that workers only load them
+        Server(self.db_path, shared_store=True, **self.server_kwargs)
+
+        self.sock = socket.create_server((self.host, self.port), backlog=4096)
+        self.port = self.sock.getsockname()[1]
+        for _ in range(self.workers):
+            self.spawn_worker()
+
+    def spawn_worker(self) -> int:
+        # Buffered output would be duplicated by child process
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid != 0:
+            self.worker_pids.add(pid)
+            return pid
+
+        exit_code = 0
+        try:
+            run_worker(self.sock, self.db_path, self.server_kwargs, self.cpu_workers)
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def reap_workers(self, block: bool = False) -> int:
+        """
+        Collect exited workers and replace them unless PreforkServer is stopping
+
+        Parameters:
+            - block (bool): Wait until at least one worker exits
+
+        Returns:
+            - (int): Number of exited workers
+        """
+        exited_workers = 0
+        options = 0 if block else os.WNOHANG
+        while self.worker_pids:
+            pid, status = os.waitpid(-1, options)
+            if pid == 0:
+                break
+            options = os.WNOHANG
+            if pid not in self.worker_pids:
+                continue
+
+            self.worker_pids.remove(pid)
+            exited_workers += 1
+            if not self.stopping:
+                print(f"Worker {pid} exited with status {status}, starting new worker")
+                self.spawn_worker()
+        return exited_workers
+
+    def serve_forever(self) -> None:
+        if self.sock is None:
+            self.start()
+
+        # SIGTERM stops supervisor the same way as SIGINT
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            while True:
+                self.reap_workers(block=True)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """
+        Stop workers, waiting for them to finish requests in progress, and close listening socket
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        self.stopping = True
+        for pid in self.worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.worker_pids):
+            os.waitpid(pid, 0)
+            self.worker_pids.remove(pid)
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def run_tests():
+    print("Running prefork.py tests...")
+
+    db_path = "./prefork_test_db/"
+    shutil.rmtree(db_path, ignore_errors=True)
+
+    rng = random.Random(0)
+    client_ids = list(range(1, 7))
+    profiles = {client_id: create_test_profile(client_id) for client_id in client_ids}
+
+    prefork_server = PreforkServer(db_path, workers=4, port=0)
+    prefork_server.start()
+    assert len(prefork_server.worker_pids) == 4
+
+    async def connect_all(count):
+        return await asyncio.gather(
+            *[ServerConnection.connect(port=prefork_server.port) for _ in range(count)]
+        )
+
+    async def close_all(connections):
+        for connection in connections:
+            await connection.close()
+
+    async def test_concurrent_enrolment():
+        # Every connection enrols every Client at once, exactly one enrolment of each Client succeeds
+        connections = await connect_all(12)
+        requests = [
+            (client_id, connection.enrol_client(profiles[client_id]))
+            for connection in connections
+            for client_id in rng.sample(client_ids, len(client_ids))
+        ]
+        results = await asyncio.gather(*[request for _, request in requests])
+        for client_id in client_ids:
+            successes = [
+                result
+                for (request_client_id, _), result in zip(requests, results)
+                if request_client_id == client_id and result
+            ]
+            assert len(successes) == 1, (client_id, successes)
+        await close_all(connections)
+
+    async def test_concurrent_reads(client_ids):
+        # Readers never see partially written profiles or keys, only session keys beyond capacity are shed
+        connections = await connect_all(24)
+        requests = []
+        for connection in connections:
+            for client_id in client_ids:
+                requests.append(connection.vault_request(client_id))
+                requests.append(connection.send_session_key_to_client(client_id))
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        errors = [
+            result
+            for result in results
+            if isinstance(result, BaseException)
+            and not (isinstance(result, ServiceError) and result.error == "overloaded")
+        ]
+        assert not errors, errors[:3]
+        assert not any(isinstance(result, BaseException) for result in results[::2])
+        assert any(isinstance(result, tuple) for result in results[1::2])
+        await close_all(connections)
+
+    async def test_invalidation():
+        # Profiles cached by all workers are dropped when another worker deletes or re-enrols Client
+        connections = await connect_all(24)
+        await asyncio.gather(
+            *[
+                connection.vault_request(client_id)
+                for connection in connections
+                for client_id in client_ids
+            ]
+        )
+
+        assert await connections[0].delete_client(1)
+        assert not await connections[0].delete_client(1)
+        for connection in connections:
+            try:
+                await connection.vault_request(1)
+                assert False
+            except ServiceError as err:
+                assert err.error == "not_found"
+
+        assert await connections[0].delete_client(2)
+        profile_dict = json.loads(profiles[2])
+        profile_dict["vault_coefs"] = [7, 7, 7, 1]
+        assert await connections[0].enrol_client(json.dumps(profile_dict))
+        for connection in connections:
+            vault_response = json.loads(await connection.vault_request(2))
+            assert vault_response["vault_coefs"] == [7, 7, 7, 1]
+        await close_all(connections)
+
+    async def test_ticket_resumption():
+        # Ticket issued by one worker is redeemed by exactly one of concurrent resumptions served by all workers
+        connections = await connect_all(24)
+        for client_id in client_ids[1:]:
+            _, session_key_hash, session_ticket = await connections[0].send_session_key_with_ticket(client_id)
+            results = await asyncio.gather(
+                *[connection.resume_session(client_id, session_ticket) for connection in connections],
+                return_exceptions=True,
+            )
+            resumed = [result for result in results if isinstance(result, tuple)]
+            assert len(resumed) == 1, results
+            assert all(
+                isinstance(result, ServiceError) and result.error == "invalid_ticket"
+                for result in results
+                if not isinstance(result, tuple)
+            )
+            _, _, session_ticket = resumed[0]
+            for connection in connections[::-1][:4]:
+                _, _, session_ticket = await connection.resume_session(client_id, session_ticket)
+        await close_all(connections)
+
+    async def test_concurrent_churn():
+        # Clients are enroled, verified and deleted at once through all workers, all workers agree on final state
+        connections = await connect_all(16)
+        exists = {}
+        for client_id in client_ids:
+            try:
+                await connections[0].vault_request(client_id)
+                exists[client_id] = True
+            except ServiceError:
+                exists[client_id] = False
+
+        operations = ("enrol", "vault", "session_key", "delete")
+        requests = []
+        for connection in connections:
+            for _ in range(24):
+                client_id = rng.choice(client_ids)
+                operation = rng.choice(operations)
+                if operation == "enrol":
+                    request = connection.enrol_client(profiles[client_id])
+                elif operation == "vault":
+                    request = connection.vault_request(client_id)
+                elif operation == "session_key":
+                    request = connection.send_session_key_to_client(client_id)
+                else:
+                    request = connection.delete_client(client_id)
+                requests.append((client_id, operation, request))
+        results = await asyncio.gather(*[request for _, _, request in requests], return_exceptions=True)
+
+        errors = [
+            result
+            for result in results
+            if isinstance(result, BaseException)
+            and not (isinstance(result, ServiceError) and result.error in ("not_found", "overloaded"))
+        ]
+        assert not errors, errors[:3]
+        for client_id in client_ids:
+            enrolments = sum(
+                result is True
+                for (request_client_id, operation, _), result in zip(requests, results)
+                if request_client_id == client_id and operation == "enrol"
+            )
+            deletions = sum(
+                result is True
+                for (request_client_id, operation, _), result in zip(requests, results)
+                if request_client_id == client_id and operation == "delete"
+            )
+            final_exists = exists[client_id] + enrolments - deletions
+            assert final_exists in (0, 1), (client_id, enrolments, deletions)
+
+            vault_responses = await asyncio.gather(
+                *[connection.vault_request(client_id) for connection in connections],
+                return_exceptions=True,
+            )
+            if final_exists:
+                assert all(response == vault_responses[0] for response in vault_responses)
+                assert not isinstance(vault_responses[0], BaseException)
+            else:
+                assert all(
+                    isinstance(response, ServiceError) and response.error == "not_found"
+                    for response in vault_responses
+                )
+        await close_all(connections)
+
+    # Workers must be stopped even if test fails, they would keep running and serving the port
+    try:
+        asyncio.run(test_concurrent_enrolment())
+        assert not [filename for filename in os.listdir(db_path) if filename.endswith(".tmp")]
+        asyncio.run(test_concurrent_reads(client_ids))
+        asyncio.run(test_invalidation())
+        asyncio.run(test_ticket_resumption())
+        asyncio.run(test_concurrent_churn())
+
+        # Crashed worker is replaced
+        crashed_pid = next(iter(prefork_server.worker_pids))
+        os.kill(crashed_pid, signal.SIGKILL)
+        assert prefork_server.reap_workers(block=True) == 1
+        assert crashed_pid not in prefork_server.worker_pids
+        assert len(prefork_server.worker_pids) == 4
+        asyncio.run(test_concurrent_churn())
+    finally:
+        prefork_server.stop()
+    assert not prefork_server.worker_pids
+
+    # Full invalidation log is emptied, Server reading replaced log drops all cached profiles
+    writer = Server(db_path, shared_store=True)
+    reader = Server(db_path, shared_store=True)
+    writer.invalidation_log_max_size = 4 * 8
+    for client_id in client_ids:
+        writer.delete_existing_user_by_id(client_id)
+        writer.enrol_client(profiles[client_id])
+        reader.vault_request(client_id)
+    for client_id in client_ids:
+        writer.delete_existing_user_by_id(client_id)
+        assert os.path.getsize(writer.invalidation_log_filepath) <= writer.invalidation_log_max_size
+    for client_id in client_ids:
+        try:
+            reader.vault_request(client_id)
+            assert False
+        except FileNotFoundError:
+            pass
+    shutil.rmtree(db_path)
+
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    parser = argparse.ArgumentParser(description="Pre-forked worker processes serving one Server's database")
+    parser.add_argument("--db", default="./server_db/")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cpu-workers", type=int, default=None)
+    parser.add_argument("--profile-format", default="json", choices=("json", "binary"))
+    args = parser.parse_args()
+
+    prefork_server = PreforkServer(
+        args.db,
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
+        profile_format=args.profile_format,
+        cpu_workers=args.cpu_workers,
+    )
+    prefork_server.start()
+    print(f"Serving {args.db} on {args.host}:{prefork_server.port} with {prefork_server.workers} workers")
+    prefork_server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import sys
+from collections import OrderedDict
+
+from Crypto.PublicKey import RSA
+
+
+class ProfileCacheEntry:
+    def __init__(self, profile_dict: dict, vault_response):
+        """
+        ProfileCacheEntry class constructor, that returns ProfileCacheEntry instantiation object
+
+        Parameters:
+            - profile_dict (dict): Parsed Client's profile stored in Server's database
+            - vault_response (str | bytes): Pre-serialized public verification data sent to Client on vault request
+
+        Returns:
+            - self (ProfileCacheEntry): ProfileCacheEntry class object
+        """
+        self.profile_dict = profile_dict
+        self.vault_response = vault_response
+        self._client_public_key = None
+
+    @property
+    def client_public_key(self) -> RSA.RsaKey:
+        """
+        Client's public RSA key imported on first use and kept for subsequent key exchanges
+
+        Parameters:
+            - None
+
+        Returns:
+            - (RSA.RsaKey): Imported Client's public key object
+        """
+        if self._client_public_key is None:
+            self._client_public_key = RSA.import_key(
+                self.profile_dict.get("client_public_key_PEM")
+                or self.profile_dict["client_public_key_DER"]
+            )
+        return self._client_public_key
+
+    def size_in_bytes(self) -> int:
+        """
+        Approximate memory used by the cached entry
+
+        Parameters:
+            - None
+
+        Returns:
+            - size (int): Estimated number of bytes held by the entry
+        """
+        size = sys.getsizeof(self.vault_response)
+        size += sys.getsizeof(self.profile_dict)
+        for key, value in self.profile_dict.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+            if isinstance(value, list):
+                size += sum(sys.getsizeof(element) for element in value)
+        if self._client_public_key is not None:
+            size += 2 * self._client_public_key.size_in_bytes()
+        return size
+
+
+class ProfileCache:
+    def __init__(self, capacity: int = 1024):
+        """
+        ProfileCache class constructor, that returns bounded LRU cache of Client's profiles
+
+        Parameters:
+            - capacity (int): Maximal number of profiles kept in memory, 0 disables caching
+
+        Returns:
+            - self (ProfileCache): ProfileCache class object
+        """
+        if capacity < 0:
+            raise ValueError(f"Cache capacity must be non-negative: {capacity}")
+
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, client_id):
+        return client_id in self._entries
+
+    def get(self, client_id: int) -> ProfileCacheEntry:
+        """
+        Return cached profile of Client and mark it as most recently used
+
+        Parameters:
+            - client_id (int): Client's identificator
+
+        Returns:
+            - (ProfileCacheEntry): Cached entry or None if Client's profile is not cached
+        """
+        entry = self._entries.get(client_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(client_id)
+        self.hits += 1
+        return entry
+
+    def put(self, client_id: int, entry: ProfileCacheEntry) -> None:
+        """
+        Insert Client's profile into cache, evicting least recently used profiles if full
+
+        Parameters:
+            - client_id (int): Client's identificator
+            - entry (ProfileCacheEntry): Entry to be cached
+
+        Returns:
+            - None
+        """
+        if self.capacity == 0:
+            return
+
+        self._entries[client_id] = entry
+        self._entries.move_to_end(client_id)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, client_id: int) -> None:
+        """
+        Remove Client's profile from cache after it was changed in Server's database
+
+        Parameters:
+            - client_id (int): Client's identificator
+
+        Returns:
+            - None
+        """
+        if self._entries.pop(client_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        """
+        Remove all profiles from cache
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def hit_rate(self) -> float:
+        """
+        Compute fraction of lookups served from cache
+
+        Parameters:
+            - None
+
+        Returns:
+            - (float): Cache hit rate in range [0, 1]
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def memory_usage(self) -> int:
+        """
+        Approximate memory used by all cached profiles
+
+        Parameters:
+            - None
+
+        Returns:
+            - (int): Estimated number of bytes held by cache entries
+        """
+        return sum(entry.size_in_bytes() for entry in self._entries.values())
+
+    def stats(self) -> dict:
+        """
+        Collect cache statistics
+
+        Parameters:
+            - None
+
+        Returns:
+            - (dict): Cache size, capacity, hit/miss counters, hit rate and memory usage
+        """
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hit_rate(),
+            "memory_bytes": self.memory_usage(),
+        }
+
+
+def run_tests():
+    print("Running profile_cache.py tests...")
+
+    cache = ProfileCache(capacity=2)
+    for client_id in range(3):
+        profile_dict = {"client_id": client_id, "vault_coefs": [1, 2, 3]}
+        cache.put(client_id, ProfileCacheEntry(profile_dict, f"{client_id}"))
+
+    # Least recently used profile is evicted
+    assert 0 not in cache and len(cache) == 2
+    assert cache.evictions == 1
+
+    # Lookups are counted
+    assert cache.get(1).vault_response == "1"
+    assert cache.get(0) is None
+    assert cache.hit_rate() == 0.5
+
+    # Invalidation removes entry
+    cache.invalidate(1)
+    assert 1 not in cache
+    assert cache.stats()["invalidations"] == 1
+    assert cache.memory_usage() > 0
+
+    # Disabled cache does not hold entries
+    disabled_cache = ProfileCache(capacity=0)
+    disabled_cache.put(1, ProfileCacheEntry({}, ""))
+    assert len(disabled_cache) == 0
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
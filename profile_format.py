@@ -0,0 +1,495 @@
+import sys
+import json
+import struct
+
+import numpy as np
+
+# Binary profile layout (all integers little-endian):
+#   magic (4s) | version (B) | flags (B) | group order length (H) | group order bytes
+#   verify threshold (I) | client id (q) | coefficient width (B) | coefficient count (I)
+#   coefficients (count * width bytes)
+#   [additional vault count (I) | (coefficient count (I) | coefficients) per additional vault]
+#   [public key length (I) | public key DER bytes]
+PROFILE_MAGIC = b"BRKP"
+PROFILE_VERSION = 1
+FLAG_HAS_PUBLIC_KEY = 0x01
+FLAG_HAS_ADDITIONAL_VAULTS = 0x02
+
+PROFILE_FORMATS = ("json", "binary")
+PROFILE_EXTENSIONS = {"json": ".json", "binary": ".brake"}
+
+_PREFIX_STRUCT = struct.Struct("<4sBBH")
+_PARAMS_STRUCT = struct.Struct("<IqBI")
+_LENGTH_STRUCT = struct.Struct("<I")
+
+
+def coefficient_width(group_order: int) -> int:
+    """
+    Compute number of bytes needed to store single coefficient of polynomial in group of given order
+
+    Parameters:
+        - group_order (int): Order of group the BRAKE protocol is executed in
+
+    Returns:
+        - (int): Fixed width of packed coefficient in bytes
+    """
+    return max(1, ((group_order - 1).bit_length() + 7) // 8)
+
+
+def pack_coefficients(coefs: list, width: int) -> bytes:
+    """
+    Pack polynomial coefficients as fixed-width little-endian unsigned integers
+
+    Parameters:
+        - coefs (list): Coefficients of polynomial reduced modulo group order
+        - width (int): Width of single packed coefficient in bytes
+
+    Returns:
+        - (bytes): Packed coefficients
+    """
+    if width in (1, 2, 4, 8):
+        return np.asarray([int(c) for c in coefs], dtype=f"<u{width}").tobytes()
+    return b"".join(int(c).to_bytes(width, "little") for c in coefs)
+
+
+def unpack_coefficients(data: bytes, width: int, count: int) -> list:
+    """
+    Unpack fixed-width little-endian polynomial coefficients
+
+    Parameters:
+        - data (bytes): Packed coefficients
+        - width (int): Width of single packed coefficient in bytes
+        - count (int): Number of packed coefficients
+
+    Returns:
+        - (list): Coefficients of polynomial as Python integers
+    """
+    if len(data) != width * count:
+        raise ValueError(
+            f"Expected {width * count} bytes of coefficients, got {len(data)}"
+        )
+    if width in (1, 2, 4, 8):
+        return np.frombuffer(data, dtype=f"<u{width}", count=count).tolist()
+    return [
+        int.from_bytes(data[i : i + width], "little")
+        for i in range(0, width * count, width)
+    ]
+
+
+# Layouts of buffers passed to worker processes (all integers little-endian):
+#   integer: byte length (H) | bytes
+#   integer array: width (B) | count (I) | values (count * width bytes)
+_INTEGER_STRUCT = struct.Struct("<H")
+_ARRAY_STRUCT = struct.Struct("<BI")
+
+
+def pack_integer(value: int) -> bytes:
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"Only non-negative integers can be packed, got {value}")
+    data = value.to_bytes(max(1, (value.bit_length() + 7) // 8), "little")
+    return _INTEGER_STRUCT.pack(len(data)) + data
+
+
+def unpack_integer(buffer, offset: int) -> tuple:
+    (length,) = _INTEGER_STRUCT.unpack_from(buffer, offset)
+    offset += _INTEGER_STRUCT.size
+    return (int.from_bytes(buffer[offset : offset + length], "little"), offset + length)
+
+
+def pack_integers(values: list) -> bytes:
+    """
+    Pack non-negative integers as fixed-width array, width is chosen by largest value
+
+    Parameters:
+        - values (list): Non-negative integers
+
+    Returns:
+        - (bytes): Width, count and packed values
+    """
+    values = [int(value) for value in values]
+    if values and min(values) < 0:
+        raise ValueError("Only non-negative integers can be packed")
+    width = coefficient_width(max(values, default=0) + 1)
+    return _ARRAY_STRUCT.pack(width, len(values)) + pack_coefficients(values, width)
+
+
+def unpack_integers(buffer, offset: int) -> tuple:
+    """
+    Unpack fixed-width array packed with pack_integers()
+
+    Parameters:
+        - buffer (bytes | memoryview): Buffer containing array
+        - offset (int): Offset of array in buffer
+
+    Returns:
+        - (tuple): Unpacked values as list of Python integers and offset following the array
+    """
+    width, count = _ARRAY_STRUCT.unpack_from(buffer, offset)
+    offset += _ARRAY_STRUCT.size
+    end = offset + width * count
+    if end > len(buffer):
+        raise ValueError(f"Buffer is truncated, array needs {end} bytes, buffer has {len(buffer)}")
+    return (unpack_coefficients(buffer[offset:end], width, count), end)
+
+
+def check_magic(buffer, magic: bytes) -> int:
+    if bytes(buffer[: len(magic)]) != magic:
+        raise ValueError(f"Buffer does not start with {magic!r}")
+    return len(magic)
+
+
+def check_end(buffer, offset: int) -> None:
+    if offset != len(buffer):
+        raise ValueError(f"Buffer has {len(buffer) - offset} trailing bytes")
+
+
+def public_key_DER(profile_dict: dict) -> bytes:
+    """
+    Get Client's public key in DER format from profile in either JSON or binary representation
+
+    Parameters:
+        - profile_dict (dict): Client's profile as dict
+
+    Returns:
+        - (bytes): Client's public key in DER format or None if profile does not contain public key
+    """
+    if "client_public_key_DER" in profile_dict:
+        return profile_dict["client_public_key_DER"]
+    if "client_public_key_PEM" in profile_dict:
+        from Crypto.PublicKey import RSA
+
+        return RSA.import_key(profile_dict["client_public_key_PEM"]).export_key("DER")
+    return None
+
+
+def profile_vaults(profile_dict: dict) -> list:
+    """
+    Get coefficients of all vaults of Client enroled with several biometric templates
+
+    Parameters:
+        - profile_dict (dict): Client's profile as dict
+
+    Returns:
+        - (list): Coefficients of primary vault followed by coefficients of additional vaults
+    """
+    return [profile_dict["vault_coefs"]] + list(profile_dict.get("additional_vault_coefs", []))
+
+
+def encode_profile(profile_dict: dict, include_public_key: bool = True) -> bytes:
+    """
+    Encode Client's profile into versioned binary profile format
+
+    Parameters:
+        - profile_dict (dict): Client's profile as dict
+        - include_public_key (bool): Whether to store Client's public key in encoded profile
+
+    Returns:
+        - (bytes): Client's profile in binary format
+    """
+    group_order = int(profile_dict["group_order"])
+    vaults = [[int(c) for c in vault_coefs] for vault_coefs in profile_vaults(profile_dict)]
+    vault_coefs = vaults[0]
+    width = coefficient_width(group_order)
+
+    for coef in (coef for vault in vaults for coef in vault):
+        if not 0 <= coef < group_order:
+            raise ValueError(
+                f"Vault coefficient {coef} is not reduced modulo group order {group_order}"
+            )
+
+    key_DER = public_key_DER(profile_dict) if include_public_key else None
+    flags = FLAG_HAS_PUBLIC_KEY if key_DER is not None else 0
+    if len(vaults) > 1:
+        flags |= FLAG_HAS_ADDITIONAL_VAULTS
+
+    group_order_bytes = group_order.to_bytes(coefficient_width(group_order + 1), "little")
+    encoded = [
+        _PREFIX_STRUCT.pack(
+            PROFILE_MAGIC, PROFILE_VERSION, flags, len(group_order_bytes)
+        ),
+        group_order_bytes,
+        _PARAMS_STRUCT.pack(
+            int(profile_dict["verify_threshold"]),
+            int(profile_dict["client_id"]),
+            width,
+            len(vault_coefs),
+        ),
+        pack_coefficients(vault_coefs, width),
+    ]
+    if flags & FLAG_HAS_ADDITIONAL_VAULTS:
+        encoded.append(_LENGTH_STRUCT.pack(len(vaults) - 1))
+        for additional_vault_coefs in vaults[1:]:
+            encoded.append(_LENGTH_STRUCT.pack(len(additional_vault_coefs)))
+            encoded.append(pack_coefficients(additional_vault_coefs, width))
+    if key_DER is not None:
+        encoded.append(_LENGTH_STRUCT.pack(len(key_DER)))
+        encoded.append(key_DER)
+
+    return b"".join(encoded)
+
+
+def unpack_profile_field(field_struct: struct.Struct, data, offset: int, field: str) -> tuple:
+    """
+    Unpack fixed-size field of binary profile, checking that buffer holds all of it
+
+    Parameters:
+        - field_struct (struct.Struct): Layout of field
+        - data (memoryview): Binary profile
+        - offset (int): Offset of field in binary profile
+        - field (str): Name of field reported when profile is truncated
+
+    Returns:
+        - (tuple): Unpacked values of field
+    """
+    check_profile_length(data, offset + field_struct.size, field)
+    return field_struct.unpack_from(data, offset)
+
+
+def check_profile_length(data, end: int, field: str) -> None:
+    if end > len(data):
+        raise ValueError(
+            f"Binary profile is truncated: {field} needs {end} bytes, profile has {len(data)}"
+        )
+
+
+def decode_profile(data: bytes) -> dict:
+    """
+    Decode Client's profile from versioned binary profile format
+
+    Parameters:
+        - data (bytes): Client's profile in binary format
+
+    Returns:
+        - (dict): Client's profile as dict, public key is stored under 'client_public_key_DER' if present;
+          raises ValueError if profile is truncated or corrupted
+    """
+    data = memoryview(data)
+    magic, version, flags, group_order_length = unpack_profile_field(
+        _PREFIX_STRUCT, data, 0, "header"
+    )
+    if magic != PROFILE_MAGIC:
+        raise ValueError(f"Not a binary BRAKE profile: magic = {magic!r}")
+    if version != PROFILE_VERSION:
+        raise ValueError(f"Unsupported binary profile version: {version}")
+
+    offset = _PREFIX_STRUCT.size
+    check_profile_length(data, offset + group_order_length, "group order")
+    group_order = int.from_bytes(data[offset : offset + group_order_length], "little")
+    offset += group_order_length
+    if group_order < 2:
+        raise ValueError(f"Binary profile has invalid group order {group_order}")
+
+    verify_threshold, client_id, width, count = unpack_profile_field(
+        _PARAMS_STRUCT, data, offset, "vault parameters"
+    )
+    offset += _PARAMS_STRUCT.size
+    if width != coefficient_width(group_order):
+        raise ValueError(
+            f"Binary profile has coefficient width {width}, group order {group_order} needs {coefficient_width(group_order)}"
+        )
+    check_profile_length(data, offset + width * count, "vault coefficients")
+
+    vault_coefs = unpack_coefficients(
+        bytes(data[offset : offset + width * count]), width, count
+    )
+    offset += width * count
+
+    profile_dict = {
+        "client_id": client_id,
+        "vault_coefs": vault_coefs,
+        "group_order": group_order,
+        "verify_threshold": verify_threshold,
+    }
+
+    if flags & FLAG_HAS_ADDITIONAL_VAULTS:
+        (additional_vault_count,) = unpack_profile_field(
+            _LENGTH_STRUCT, data, offset, "number of additional vaults"
+        )
+        offset += _LENGTH_STRUCT.size
+        profile_dict["additional_vault_coefs"] = []
+        for i in range(additional_vault_count):
+            (count,) = unpack_profile_field(_LENGTH_STRUCT, data, offset, "additional vault length")
+            offset += _LENGTH_STRUCT.size
+            check_profile_length(data, offset + width * count, "additional vault coefficients")
+            profile_dict["additional_vault_coefs"].append(
+                unpack_coefficients(bytes(data[offset : offset + width * count]), width, count)
+            )
+            offset += width * count
+
+    if flags & FLAG_HAS_PUBLIC_KEY:
+        (key_length,) = unpack_profile_field(_LENGTH_STRUCT, data, offset, "public key length")
+        offset += _LENGTH_STRUCT.size
+        check_profile_length(data, offset + key_length, "public key")
+        profile_dict["client_public_key_DER"] = bytes(data[offset : offset + key_length])
+        offset += key_length
+
+    if offset != len(data):
+        raise ValueError(f"Binary profile has {len(data) - offset} trailing bytes")
+
+    return profile_dict
+
+
+def is_binary_profile(data) -> bool:
+    """
+    Check whether given profile data is in binary profile format
+
+    Parameters:
+        - data (str | bytes): Client's profile data
+
+    Returns:
+        - (bool): Logic value of data being binary profile
+    """
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(
+        data[: len(PROFILE_MAGIC)]
+    ) == PROFILE_MAGIC
+
+
+def load_profile(data) -> dict:
+    """
+    Parse Client's profile given either as JSON or in binary profile format
+
+    Parameters:
+        - data (str | bytes | dict): Client's profile data, dicts are returned unchanged
+
+    Returns:
+        - (dict): Client's profile as dict
+    """
+    if isinstance(data, dict):
+        return data
+    if is_binary_profile(data):
+        return decode_profile(data)
+    return json.loads(data)
+
+
+def dump_profile(profile_dict: dict, profile_format: str, include_public_key: bool = True):
+    """
+    Serialize Client's profile into requested profile format
+
+    Parameters:
+        - profile_dict (dict): Client's profile as dict
+        - profile_format (str): Either 'json' or 'binary'
+        - include_public_key (bool): Whether to store Client's public key in serialized profile
+
+    Returns:
+        - (str | bytes): Client's profile as JSON string or binary profile
+    """
+    if profile_format == "binary":
+        return encode_profile(profile_dict, include_public_key=include_public_key)
+
+    if profile_format != "json":
+        raise ValueError(f"Unknown profile format: {profile_format}")
+
+    json_dict = {
+        key: value
+        for key, value in profile_dict.items()
+        if key not in ("client_public_key_PEM", "client_public_key_DER")
+    }
+    if include_public_key:
+        key_DER = public_key_DER(profile_dict)
+        if key_DER is not None:
+            from Crypto.PublicKey import RSA
+
+            json_dict["client_public_key_PEM"] = profile_dict.get(
+                "client_public_key_PEM"
+            ) or RSA.import_key(key_DER).export_key("PEM").decode("utf-8")
+    json_dict["vault_coefs"] = [int(c) for c in json_dict["vault_coefs"]]
+    if "additional_vault_coefs" in json_dict:
+        json_dict["additional_vault_coefs"] = [
+            [int(c) for c in vault_coefs] for vault_coefs in json_dict["additional_vault_coefs"]
+        ]
+
+    return json.dumps(json_dict)
+
+
+def profile_to_json(data: bytes) -> str:
+    """
+    Convert binary profile into JSON representation for debugging purpose
+
+    Parameters:
+        - data (bytes): Client's profile in binary format
+
+    Returns:
+        - (str): Client's profile in JSON format
+    """
+    return dump_profile(decode_profile(data), "json")
+
+
+def run_tests():
+    print("Running profile_format.py tests...")
+
+    from Crypto.PublicKey import RSA
+
+    key = RSA.generate(1024)
+    profile_dict = {
+        "client_id": 7,
+        "vault_coefs": [0, 1, 2147483646, 12345, 1],
+        "client_public_key_PEM": key.publickey().export_key("PEM").decode("utf-8"),
+        "group_order": 2147483647,
+        "verify_threshold": 8,
+    }
+
+    # Round trip with public key
+    encoded = encode_profile(profile_dict)
+    assert is_binary_profile(encoded)
+    decoded = decode_profile(encoded)
+    assert decoded["vault_coefs"] == profile_dict["vault_coefs"]
+    assert decoded["group_order"] == profile_dict["group_order"]
+    assert decoded["verify_threshold"] == profile_dict["verify_threshold"]
+    assert decoded["client_id"] == profile_dict["client_id"]
+    assert RSA.import_key(decoded["client_public_key_DER"]) == key.publickey()
+
+    # Binary profile is more compact than JSON
+    assert len(encoded) < len(json.dumps(profile_dict))
+
+    # JSON conversion for debugging
+    assert json.loads(profile_to_json(encoded)) == profile_dict
+
+    # Round trip without public key and with non power of two coefficient width
+    large_order_dict = dict(profile_dict, group_order=2**61 - 1 + 2**64)
+    encoded = encode_profile(large_order_dict, include_public_key=False)
+    decoded = decode_profile(encoded)
+    assert "client_public_key_DER" not in decoded
+    assert decoded["vault_coefs"] == profile_dict["vault_coefs"]
+    assert load_profile(dump_profile(decoded, "json")) == decoded
+
+    # Round trip of Client enroled with several biometric templates
+    multi_vault_dict = dict(profile_dict, additional_vault_coefs=[[3, 2, 1], [5, 4, 3, 2, 1, 1]])
+    decoded = decode_profile(encode_profile(multi_vault_dict))
+    assert profile_vaults(decoded) == [[0, 1, 2147483646, 12345, 1], [3, 2, 1], [5, 4, 3, 2, 1, 1]]
+    assert RSA.import_key(decoded["client_public_key_DER"]) == key.publickey()
+    assert json.loads(dump_profile(decoded, "json")) == multi_vault_dict
+    assert profile_vaults(profile_dict) == [profile_dict["vault_coefs"]]
+
+    # Truncated or corrupted binary profile is rejected with ValueError at every length
+    encoded = encode_profile(multi_vault_dict)
+    for length in range(len(PROFILE_MAGIC), len(encoded)):
+        try:
+            load_profile(encoded[:length])
+            assert False
+        except ValueError as err:
+            assert "truncated" in str(err) or "width" in str(err)
+    corrupted = bytearray(encoded)
+    corrupted[_PREFIX_STRUCT.size + 4 + 4 + 8] = 1
+    try:
+        load_profile(bytes(corrupted))
+        assert False
+    except ValueError as err:
+        assert "width" in str(err)
+
+    print("Tests completed!")
+
+
+def main():
+    # Print binary profiles given as arguments in JSON format
+    if len(sys.argv) > 1:
+        for filepath in sys.argv[1:]:
+            with open(filepath, "rb") as f:
+                print(profile_to_json(f.read()))
+        return
+
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from time import perf_counter as pc
+
+import metrics
+
+SCHEDULER_QUEUE_DEPTH = metrics.gauge(
+    "brake_scheduler_queue_depth",
+    "Requests waiting for execution slot",
+    ("operation",),
+)
+SCHEDULER_IN_FLIGHT = metrics.gauge(
+    "brake_scheduler_in_flight",
+    "Requests holding execution slot",
+    ("operation",),
+)
+SCHEDULER_WAIT_DURATION = metrics.histogram(
+    "brake_scheduler_wait_duration_seconds",
+    "Time requests waited for execution slot",
+    ("operation",),
+)
+SCHEDULER_SHED = metrics.counter(
+    "brake_scheduler_shed_total",
+    "Requests rejected by admission control",
+    ("operation", "reason"),
+)
+
+# Weight of latest execution in moving average of operation's execution time
+SERVICE_TIME_SMOOTHING = 0.1
+
+
+class OverloadError(Exception):
+    def __init__(self, operation: str, reason: str, message: str):
+        """
+        OverloadError class constructor, that returns exception describing request shed by admission control
+
+        Parameters:
+            - operation (str): Name of shed operation
+            - reason (str): Either 'queue_full', 'deadline_unreachable' or 'deadline_exceeded'
+            - message (str): Human readable description
+
+        Returns:
+            - self (OverloadError): OverloadError class object
+        """
+        super().__init__(message)
+        self.operation = operation
+        self.reason = reason
+
+
+class OperationPolicy:
+    def __init__(
+        self,
+        priority: int,
+        concurrency: int = None,
+        max_queue: int = 1024,
+        deadline: float = 1.0,
+    ):
+        """
+        OperationPolicy class constructor, that returns scheduling parameters of single operation
+
+        Parameters:
+            - priority (int): Priority of operation, waiting requests with lower number are started first
+            - concurrency (int): Maximal number of requests of operation executed at once, limited only by Scheduler if not given
+            - max_queue (int): Maximal number of waiting requests of operation, further requests are shed
+            - deadline (float): Default time in seconds request may wait for execution slot
+
+        Returns:
+            - self (OperationPolicy): OperationPolicy class object
+        """
+        self.priority = priority
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+
+
+def default_operation_policies(cpu_workers: int) -> dict:
+    """
+    Policies of ServerService operations, cheap reads take precedence over key encapsulation and enrolment writes
+
+    Parameters:
+        - cpu_workers (int): Number of threads running CPU-bound work
+
+    Returns:
+        - (dict): OperationPolicy per operation name
+    """
+    return {
+        "vault": OperationPolicy(priority=0, max_queue=4096, deadline=1.0),
+        "resume": OperationPolicy(priority=1, max_queue=1024, deadline=1.0),
+        "session_key": OperationPolicy(
+            priority=2, concurrency=cpu_workers, max_queue=256, deadline=2.0
+        ),
+        "enrol": OperationPolicy(priority=3, concurrency=1, max_queue=256, deadline=5.0),
+        "delete": OperationPolicy(priority=3, concurrency=1, max_queue=256, deadline=5.0),
+    }
+
+
+class Scheduler:
+    def __init__(self, policies: dict, max_concurrency: int):
+        """
+        Scheduler class constructor, that returns admission control of asyncio requests with bounded per-operation queues
+
+        Requests acquire one of 'max_concurrency' execution slots. Free slot is given to waiting request of operation
+        with highest priority that is under its concurrency limit, requests of the same operation are started in order
+        of arrival. Requests are shed when queue of their operation is full, when expected wait exceeds their deadline
+        or when deadline passes while waiting. Scheduler is used from single event loop and needs no locking.
+
+        Parameters:
+            - policies (dict): OperationPolicy per operation name, operations without policy are not scheduled
+            - max_concurrency (int): Maximal number of requests executed at once
+
+        Returns:
+            - self (Scheduler): Scheduler class object
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"Scheduler concurrency must be positive, got {max_concurrency}")
+        self.policies = policies
+        self.max_concurrency = max_concurrency
+        self.operations_by_priority = sorted(policies, key=lambda operation: policies[operation].priority)
+
+        self.running = 0
+        self.running_by_operation = {operation: 0 for operation in policies}
+        # Waiting requests of operation: [future, enqueue time, deadline timer], expired entries are skipped
+        self.queues = {operation: deque() for operation in policies}
+        self.queued_by_operation = {operation: 0 for operation in policies}
+        self.service_times = {operation: 0.0 for operation in policies}
+        self.shed_by_reason = {}
+
+    def schedules(self, operation: str) -> bool:
+        return operation in self.policies
+
+    def can_start(self, operation: str) -> bool:
+        concurrency = self.policies[operation].concurrency
+        return self.running < self.max_concurrency and (
+            concurrency is None or self.running_by_operation[operation] < concurrency
+        )
+
+    def expected_wait(self, operation: str) -> float:
+        # Requests of operation ahead in queue are started in parallel up to operation's concurrency
+        concurrency = self.policies[operation].concurrency or self.max_concurrency
+        return (self.queued_by_operation[operation] + 1) * self.service_times[operation] / concurrency
+
+    def shed(self, operation: str, reason: str, message: str) -> OverloadError:
+        SCHEDULER_SHED.inc(operation=operation, reason=reason)
+        self.shed_by_reason[reason] = self.shed_by_reason.get(reason, 0) + 1
+        return OverloadError(operation, reason, f"Server is overloaded, {operation} request shed: {message}")
+
+    def start(self, operation: str, enqueue_time: float) -> None:
+        self.running += 1
+        self.running_by_operation[operation] += 1
+        SCHEDULER_IN_FLIGHT.set(self.running_by_operation[operation], operation=operation)
+        SCHEDULER_WAIT_DURATION.observe(pc() - enqueue_time, operation=operation)
+
+    def dequeue(self, operation: str) -> None:
+        self.queued_by_operation[operation] -= 1
+        SCHEDULER_QUEUE_DEPTH.set(self.queued_by_operation[operation], operation=operation)
+
+    def expire(self, operation: str, entry: list) -> None:
+        future = entry[0]
+        if future.done():
+            return
+        self.dequeue(operation)
+        future.set_exception(
+            self.shed(operation, "deadline_exceeded", "deadline passed while waiting for execution slot")
+        )
+
+    def start_waiting(self) -> None:
+        # Slots are handed over synchronously, so that no waiting request can start when new request arrives
+        for operation in self.operations_by_priority:
+            queue = self.queues[operation]
+            while queue and self.can_start(operation):
+                future, enqueue_time, timer = queue.popleft()
+                if future.done():
+                    continue
+                timer.cancel()
+                self.dequeue(operation)
+                self.start(operation, enqueue_time)
+                future.set_result(None)
+            if self.running >= self.max_concurrency:
+                return
+
+    async def acquire(self, operation: str, deadline: float = None) -> None:
+        """
+        Wait for execution slot of operation
+
+        Parameters:
+            - operation (str): Name of scheduled operation
+            - deadline (float): Time in seconds request may wait, operation's default deadline if not given
+
+        Returns:
+            - None, raises OverloadError if request is shed
+        """
+        policy = self.policies[operation]
+        enqueue_time = pc()
+        if deadline is None:
+            deadline = policy.deadline
+
+        if self.can_start(operation):
+            self.start(operation, enqueue_time)
+            return
+        if deadline <= 0:
+            raise self.shed(operation, "deadline_exceeded", "deadline passed before arrival")
+        if self.queued_by_operation[operation] >= policy.max_queue:
+            raise self.shed(operation, "queue_full", f"{policy.max_queue} requests already waiting")
+        if self.expected_wait(operation) > deadline:
+            raise self.shed(
+                operation,
+                "deadline_unreachable",
+                f"expected wait {self.expected_wait(operation):.3f} s exceeds deadline {deadline:.3f} s",
+            )
+
+        loop = asyncio.get_running_loop()
+        entry = [loop.create_future(), enqueue_time, None]
+        entry[2] = loop.call_later(deadline, self.expire, operation, entry)
+        self.queues[operation].append(entry)
+        self.queued_by_operation[operation] += 1
+        SCHEDULER_QUEUE_DEPTH.set(self.queued_by_operation[operation], operation=operation)
+
+        future = entry[0]
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Slot handed over to request cancelled meanwhile is passed on
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(operation)
+            elif not future.done() or future.cancelled():
+                entry[2].cancel()
+                self.dequeue(operation)
+            raise
+
+    def release(self, operation: str, service_time: float = None) -> None:
+        """
+        Return execution slot and start waiting requests
+
+        Parameters:
+            - operation (str): Name of finished operation
+            - service_time (float): Execution time of finished request, updates estimate of operation's execution time
+
+        Returns:
+            - None
+        """
+        self.running -= 1
+        self.running_by_operation[operation] -= 1
+        SCHEDULER_IN_FLIGHT.set(self.running_by_operation[operation], operation=operation)
+        if service_time is not None:
+            self.service_times[operation] += SERVICE_TIME_SMOOTHING * (
+                service_time - self.service_times[operation]
+            )
+        self.start_waiting()
+
+    @asynccontextmanager
+    async def slot(self, operation: str, deadline: float = None):
+        """
+        Hold execution slot of operation for duration of context, operations without policy run immediately
+
+        Parameters:
+            - operation (str): Name of operation
+            - deadline (float): Time in seconds request may wait, operation's default deadline if not given
+
+        Returns:
+            - Context manager holding the slot
+        """
+        if not self.schedules(operation):
+            yield
+            return
+
+        await self.acquire(operation, deadline)
+        start = pc()
+        try:
+            yield
+        finally:
+            self.release(operation, pc() - start)
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": dict(self.queued_by_operation),
+            "shed": dict(self.shed_by_reason),
+            "service_times": dict(self.service_times),
+        }
+
+
+def run_tests():
+    print("Running scheduler.py tests...")
+
+    async def test_scheduling():
+        policies = {
+            "cheap": OperationPolicy(priority=0, max_queue=2, deadline=1.0),
+            "expensive": OperationPolicy(priority=1, concurrency=1, deadline=1.0),
+        }
+        scheduler = Scheduler(policies, max_concurrency=2)
+        started = []
+
+        async def request(operation, hold, deadline=None):
+            async with scheduler.slot(operation, deadline):
+                started.append(operation)
+                await hold.wait()
+
+        # Expensive operation never takes last slot from cheap one beyond its concurrency
+        hold = asyncio.Event()
+        tasks = [asyncio.create_task(request("expensive", hold)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert started == ["expensive"] and scheduler.queued_by_operation["expensive"] == 2
+        tasks.append(asyncio.create_task(request("cheap", hold)))
+        await asyncio.sleep(0)
+        assert started == ["expensive", "cheap"] and scheduler.running == 2
+
+        # Cheap requests waiting for full Scheduler start before expensive ones queued earlier
+        tasks += [asyncio.create_task(request("cheap", hold)) for _ in range(2)]
+        await asyncio.sleep(0)
+        try:
+            await request("cheap", hold)
+            assert False
+        except OverloadError as err:
+            assert err.reason == "queue_full"
+        hold.set()
+        await asyncio.gather(*tasks)
+        assert started == ["expensive", "cheap", "cheap", "cheap", "expensive", "expensive"]
+        assert scheduler.running == 0 and scheduler.queued_by_operation == {"cheap": 0, "expensive": 0}
+
+        # Deadline passes while waiting, cancelled waiters leave queue
+        hold = asyncio.Event()
+        blocking_task = asyncio.create_task(request("expensive", hold))
+        await asyncio.sleep(0)
+        try:
+            await request("expensive", hold, deadline=0.05)
+            assert False
+        except OverloadError as err:
+            assert err.reason == "deadline_exceeded"
+        cancelled_task = asyncio.create_task(request("expensive", hold))
+        await asyncio.sleep(0)
+        cancelled_task.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queued_by_operation["expensive"] == 0
+        hold.set()
+        await blocking_task
+
+        # Requests that cannot start in time are rejected at once
+        scheduler.service_times["expensive"] = 10.0
+        hold = asyncio.Event()
+        blocking_task = asyncio.create_task(request("expensive", hold))
+        await asyncio.sleep(0)
+        s = pc()
+        try:
+            await request("expensive", hold)
+            assert False
+        except OverloadError as err:
+            assert err.reason == "deadline_unreachable" and pc() - s < 0.1
+        hold.set()
+        await blocking_task
+        assert scheduler.running == 0
+
+    metrics.enable()
+    asyncio.run(test_scheduling())
+    assert SCHEDULER_SHED.get(operation="cheap", reason="queue_full") == 1
+    assert SCHEDULER_WAIT_DURATION.get_count(operation="expensive") == 5
+    assert SCHEDULER_QUEUE_DEPTH.get(operation="expensive") == 0
+    metrics.disable()
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import os
-import json
+import fcntl
+import shutil
+import struct
 import secrets
 import hashlib
+import logging
+from contextlib import contextmanager
 
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_OAEP
@@ -9,14 +13,106 @@ from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+from profile_cache import ProfileCache, ProfileCacheEntry
+from profile_format import (
+    PROFILE_EXTENSIONS,
+    PROFILE_FORMATS,
+    dump_profile,
+    is_binary_profile,
+    load_profile,
+    profile_vaults,
+    public_key_DER,
+)
+from vault_store import ColumnarVaultStore, fsync_directory
+from session_tickets import SessionTicketIssuer, SharedSessionTicketIssuer, derive_resumed_session_key
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODES = ("files", "columnar")
+
+OPERATION_DURATION = metrics.histogram(
+    "brake_server_operation_duration_seconds",
+    "Duration of Server operations",
+    ("operation",),
+)
+OPERATION_ERRORS = metrics.counter(
+    "brake_server_operation_errors_total",
+    "Server operations that raised exception",
+    ("operation",),
+)
+PROFILE_CACHE_LOOKUPS = metrics.counter(
+    "brake_server_profile_cache_lookups_total",
+    "Lookups of Client profiles in profile cache",
+    ("result",),
+)
+
+# Record of invalidation log shared by Server processes: ID of Client whose profile changed
+_INVALIDATION_STRUCT = struct.Struct("<q")
+
+# Size in bytes of invalidation log, after which it is emptied
+_INVALIDATION_LOG_MAX_SIZE = 1 << 20
+
+
+def write_file_atomically(
+    filepath: str, data: bytes, exclusive: bool = False, sync: bool = True
+) -> bool:
+    """
+    Write file through temporary file renamed or linked into place, so that readers never see partially written file
+
+    Parameters:
+        - filepath (str): Path of written file
+        - data (bytes): Content of file
+        - exclusive (bool): Create file only if it does not exist, atomically with respect to other processes
+        - sync (bool): Flush file to disk before it is put in place, needless for files whose content may be lost
+
+    Returns:
+        - (bool): Logic value of file being written, False if exclusive file already existed
+    """
+    temporary_filepath = f"{filepath}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+    with open(temporary_filepath, "wb") as f:
+        f.write(data)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+    try:
+        if not exclusive:
+            os.replace(temporary_filepath, filepath)
+            return True
+
+        # Hard link fails if target exists, unlike rename, which would silently replace it
+        try:
+            os.link(temporary_filepath, filepath)
+        except FileExistsError:
+            return False
+        return True
+    finally:
+        if os.path.exists(temporary_filepath):
+            os.unlink(temporary_filepath)
+
 
 class Server:
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        profile_cache_size: int = 1024,
+        profile_format: str = "json",
+        storage_mode: str = "files",
+        session_ticket_lifetime: float = 3600.0,
+        shared_store: bool = False,
+    ):
         """
         Server class constructor, that returns Server instantiation object
 
         Parameters:
             - db_path (str): Path to directory that stores parameters of enroled clients.
+            - profile_cache_size (int): Maximal number of Client's profiles kept in memory, 0 disables caching
+            - profile_format (str): Format of stored profiles and vault responses, either 'json' or 'binary'
+            - storage_mode (str): Either 'files' for one profile file per Client or 'columnar' for memory-mapped vault store
+            - session_ticket_lifetime (float): Time in seconds for which session resumption ticket can be redeemed
+            - shared_store (bool): Whether several Server processes serve the same database, profile changes are then announced to them through invalidation log
 
         Returns:
             - self (Server): Server class object
@@ -28,16 +124,144 @@ class Server:
         self.private_key_filepath = f"{self.db_path}server_private_key.pem"
         self.public_key_filename = "server_public_key.pem"
         self.public_key_filepath = f"{self.db_path}server_public_key.pem"
+        self.lock_filepath = f"{self.db_path}server.lock"
+        self.invalidation_log_filepath = f"{self.db_path}invalidation.log"
+        self.invalidation_log_max_size = _INVALIDATION_LOG_MAX_SIZE
+        self.ticket_keys_filepath = f"{self.db_path}ticket_keys"
+        self.redeemed_tickets_filepath = f"{self.db_path}redeemed_tickets"
+        self.profile_cache = ProfileCache(capacity=profile_cache_size)
+
+        if profile_format not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format: {profile_format}")
+        self.profile_format = profile_format
+        self.profile_extension = PROFILE_EXTENSIONS[profile_format]
+
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode: {storage_mode}")
+        self.storage_mode = storage_mode
+
+        # Columnar vault store keeps its index in memory of single process
+        if shared_store and storage_mode != "files":
+            raise ValueError("Database shared by several Server processes requires 'files' storage mode")
+        self.shared_store = shared_store
 
         # Create Server's database if nonexistent
         if not os.path.exists(self.db_path):
             print(f"Server: creating database directory {self.db_path}")
-            os.makedirs(self.db_path)
+            os.makedirs(self.db_path, exist_ok=True)
+
+        # Open columnar vault store kept inside Server's database
+        self.vault_store = None
+        if self.storage_mode == "columnar":
+            self.vault_store = ColumnarVaultStore(f"{self.db_path}vault_store/")
+
+        # Generate Server's RSA key pair if nonexistent, processes starting at once generate single key pair
+        with self.database_lock():
+            if not self.RSA_key_pair_exists():
+                self.delete_existing_RSA_keys()
+                self.generate_RSA_key_pair()
+
+        # Tickets issued by any of Server processes sharing database are redeemed by all of them exactly once
+        if self.shared_store:
+            self.ticket_issuer = SharedSessionTicketIssuer(
+                self.ticket_keys_filepath,
+                self.redeemed_tickets_filepath,
+                self.database_lock,
+                ticket_lifetime=session_ticket_lifetime,
+            )
+        else:
+            self.ticket_issuer = SessionTicketIssuer(ticket_lifetime=session_ticket_lifetime)
+
+        # Invalidations announced before start do not concern empty profile cache
+        self.invalidation_log_id = None
+        self.invalidation_log_offset = 0
+        if self.shared_store:
+            with self.database_lock():
+                with open(self.invalidation_log_filepath, "ab") as f:
+                    stat = os.fstat(f.fileno())
+            self.invalidation_log_id = (stat.st_dev, stat.st_ino)
+            self.invalidation_log_offset = stat.st_size
+
+    @contextmanager
+    def database_lock(self):
+        """
+        Hold exclusive advisory lock of Server's database, shared by all Server processes
+
+        Parameters:
+            - None
+
+        Returns:
+            - Context manager holding the lock
+        """
+        with open(self.lock_filepath, "ab") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def publish_invalidation(self, client_id: int) -> None:
+        """
+        Invalidate Client's cached profile in this and, with shared store, in all other Server processes
+
+        Parameters:
+            - client_id (int): Client's identificator
 
-        # Generate Server's RSA key pair if nonexistent
-        if not self.RSA_key_pair_exists():
-            self.delete_existing_RSA_keys()
-            self.generate_RSA_key_pair()
+        Returns:
+            - None
+        """
+        self.profile_cache.invalidate(client_id)
+        if not self.shared_store:
+            return
+
+        with self.database_lock():
+            # Full log is replaced by empty one, processes noticing replaced log drop their whole profile cache
+            if os.stat(self.invalidation_log_filepath).st_size >= self.invalidation_log_max_size:
+                self.apply_invalidations()
+                write_file_atomically(self.invalidation_log_filepath, b"", sync=False)
+                stat = os.stat(self.invalidation_log_filepath)
+                self.invalidation_log_id = (stat.st_dev, stat.st_ino)
+                self.invalidation_log_offset = 0
+
+            # Appends of single record are atomic, so that concurrent writers never interleave records
+            fd = os.open(self.invalidation_log_filepath, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+            try:
+                os.write(fd, _INVALIDATION_STRUCT.pack(client_id))
+            finally:
+                os.close(fd)
+
+    def apply_invalidations(self) -> None:
+        """
+        Drop cached profiles changed by other Server processes since last check, costs single stat when nothing changed
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        if not self.shared_store:
+            return
+        stat = os.stat(self.invalidation_log_filepath)
+        if (
+            (stat.st_dev, stat.st_ino) == self.invalidation_log_id
+            and stat.st_size <= self.invalidation_log_offset
+        ):
+            return
+
+        with open(self.invalidation_log_filepath, "rb") as f:
+            # Records of replaced log may have been missed, none of cached profiles can be trusted
+            stat = os.fstat(f.fileno())
+            if (stat.st_dev, stat.st_ino) != self.invalidation_log_id:
+                self.profile_cache.clear()
+                self.invalidation_log_id = (stat.st_dev, stat.st_ino)
+                self.invalidation_log_offset = 0
+            f.seek(self.invalidation_log_offset)
+            data = f.read()
+        complete_length = len(data) - len(data) % _INVALIDATION_STRUCT.size
+        for (client_id,) in _INVALIDATION_STRUCT.iter_unpack(data[:complete_length]):
+            self.profile_cache.invalidate(client_id)
+        self.invalidation_log_offset += complete_length
 
     def delete_existing_RSA_keys(self) -> None:
         """
@@ -64,7 +288,9 @@ class Server:
         except:
             print(f"Could not delete {file_to_delete}: File does not exist")
 
-    def delete_existing_user_by_id(self, id: int) -> None:
+    @tracing.traced("server.delete_existing_user_by_id")
+    @metrics.timed(OPERATION_DURATION, OPERATION_ERRORS, operation="delete_existing_user_by_id")
+    def delete_existing_user_by_id(self, id: int) -> bool:
         """
         Search Server's database for Client's profile identified by 'id'  and delete it if found
 
@@ -72,15 +298,26 @@ class Server:
             - client_id (int): Client's identificator
 
         Returns:
-            - None
+            - (bool): Logic value of Client's profile being found and deleted
         """
 
         # Find and delete Client's profile
-        file_to_delete = f"{self.db_path}{id}.json"
+        if self.vault_store is not None:
+            self.profile_cache.invalidate(id)
+            if not self.vault_store.delete(id):
+                print(f"Could not delete Client ID {id}: Client does not exist")
+                return False
+            return True
+
+        file_to_delete = self.get_profile_filepath(id)
         try:
             os.unlink(file_to_delete)
-        except:
+        except FileNotFoundError:
             print(f"Could not delete {file_to_delete}: File does not exist")
+            return False
+        finally:
+            self.publish_invalidation(id)
+        return True
 
     def generate_RSA_key_pair(self) -> None:
         """
@@ -99,11 +336,8 @@ class Server:
         server_public_key_pem = key.publickey().export_key("PEM").decode("utf-8")
 
         # Save generated keys to Server's database
-        with open(self.private_key_filepath, "wt") as f:
-            f.write(server_private_key_pem)
-
-        with open(self.public_key_filepath, "wt") as f:
-            f.write(server_public_key_pem)
+        write_file_atomically(self.private_key_filepath, server_private_key_pem.encode("utf-8"))
+        write_file_atomically(self.public_key_filepath, server_public_key_pem.encode("utf-8"))
 
     def client_exists(self, client_id) -> bool:
         """
@@ -115,8 +349,22 @@ class Server:
         Returns:
             - (bool): Logic value of Client existence in Server's database
         """
-        db_file_list = os.listdir(self.db_path)
-        return f"{client_id}.json" in db_file_list
+        if self.vault_store is not None:
+            return self.vault_store.contains(client_id)
+
+        return os.path.exists(self.get_profile_filepath(client_id))
+
+    def get_profile_filepath(self, client_id: int) -> str:
+        """
+        Get path of file storing Client's profile in Server's database
+
+        Parameters:
+            - client_id (int): Client's identificator
+
+        Returns:
+            - (str): Path to Client's profile file
+        """
+        return f"{self.db_path}{client_id}{self.profile_extension}"
 
     def RSA_key_pair_exists(self) -> bool:
         """
@@ -159,7 +407,7 @@ class Server:
 
     def get_client_data_dict(self, client_id: int) -> dict:
         """
-        Generate session key using PBKDF2HMAC cryptographic method
+        Get Client's profile stored in Server's database
 
         Parameters:
             - client_id (int): Client's identificator
@@ -167,98 +415,394 @@ class Server:
         Returns:
             - (dict): Dictionary of Client's profile stored in Server's database
         """
-        with open(f"{self.db_path}{client_id}.json") as f:
-            client_data_json = f.read()
+        return self.load_client_profile(client_id).profile_dict
+
+    def load_client_profile(self, client_id: int) -> ProfileCacheEntry:
+        """
+        Get Client's profile from profile cache, reading it from Server's database on cache miss
+
+        Parameters:
+            - client_id (int): Client's identificator
+
+        Returns:
+            - (ProfileCacheEntry): Parsed profile with pre-serialized vault response
+        """
+        self.apply_invalidations()
+        entry = self.profile_cache.get(client_id)
+        if entry is not None:
+            PROFILE_CACHE_LOOKUPS.inc(result="hit")
+            return entry
+        PROFILE_CACHE_LOOKUPS.inc(result="miss")
 
-        return json.loads(client_data_json)
+        if not self.client_exists(client_id=client_id):
+            raise FileNotFoundError(
+                f"Submitted Client ID {client_id} is not in Server's database! Please enrol Client..."
+            )
 
+        if self.vault_store is not None:
+            # Vault coefficients are zero-copy view of memory-mapped vault store, serialized once for cached vault response
+            vault_dict = self.vault_store.get_vault(client_id)
+            profile_dict = dict(
+                vault_dict,
+                client_public_key_DER=self.vault_store.get_public_key_DER(client_id),
+            )
+            vault_response = dump_profile(vault_dict, self.profile_format, include_public_key=False)
+        else:
+            # Read Client's profile data
+            with open(self.get_profile_filepath(client_id), "rb") as f:
+                profile_dict = load_profile(f.read())
+
+            # Create Clients public data in Server's profile format
+            vault_response = dump_profile(
+                profile_dict, self.profile_format, include_public_key=False
+            )
+
+        entry = ProfileCacheEntry(profile_dict, vault_response)
+        self.profile_cache.put(client_id, entry)
+
+        return entry
+
+    def get_profile_cache_stats(self) -> dict:
+        """
+        Get statistics of Server's profile cache
+
+        Parameters:
+            - None
+
+        Returns:
+            - (dict): Cache size, capacity, hit/miss counters, hit rate and memory usage
+        """
+        return self.profile_cache.stats()
+
+    @tracing.traced("server.send_session_key_to_client")
+    @metrics.timed(OPERATION_DURATION, OPERATION_ERRORS, operation="send_session_key_to_client")
     def send_session_key_to_client(self, client_id: int, DEBUG: bool = False) -> tuple:
         """
         Simulate sending encapsulated session key and it's checksum value to Client
 
         Parameters:
             - client_id (int): Client's identificator
-            - DEBUG (bool): Flag for verbose execution mode
+            - DEBUG (bool): Kept for compatibility, length and checksum of session key are logged by "server" logger at DEBUG level
 
         Returns:
             - (tuple):
                 - encrypted_session_key (srt): Value of encapsulated session key
                 - session_key_hash (str): Value of SHA256 checksum of session key
         """
-        # Generate session key
+        # Get Client's public key obtained during enrolment phase
+        client_public_key = self.load_client_profile(client_id).client_public_key
+
+        return self.encapsulate_session_key(client_public_key, DEBUG=DEBUG)
+
+    @tracing.traced("server.send_session_key_with_ticket")
+    @metrics.timed(OPERATION_DURATION, OPERATION_ERRORS, operation="send_session_key_with_ticket")
+    def send_session_key_with_ticket(self, client_id: int, DEBUG: bool = False) -> tuple:
+        """
+        Simulate sending encapsulated session key together with session resumption ticket to Client
+
+        Parameters:
+            - client_id (int): Client's identificator
+            - DEBUG (bool): Kept for compatibility, length and checksum of session key are logged by "server" logger at DEBUG level
+
+        Returns:
+            - (tuple):
+                - encrypted_session_key (srt): Value of encapsulated session key
+                - session_key_hash (str): Value of SHA256 checksum of session key
+                - session_ticket (bytes): Ticket allowing Client to resume session without verification
+        """
+        client_public_key = self.load_client_profile(client_id).client_public_key
+
         session_key = self.generate_session_key()
-        if DEBUG:
-            print(f"Session key generated by Server: {session_key}")
+        encrypted_session_key, session_key_hash = self.encapsulate_session_key(
+            client_public_key, DEBUG=DEBUG, session_key=session_key
+        )
+        session_ticket = self.ticket_issuer.issue(client_id, session_key)
 
-        # Compute SHA256 checksum of session key
+        return (encrypted_session_key, session_key_hash, session_ticket)
+
+    @tracing.traced("server.resume_session")
+    @metrics.timed(OPERATION_DURATION, OPERATION_ERRORS, operation="resume_session")
+    def resume_session(self, client_id: int, session_ticket: bytes) -> tuple:
+        """
+        Establish new session key with Client presenting resumption ticket, without vault unlocking and key encapsulation
+
+        Parameters:
+            - client_id (int): Client's identificator
+            - session_ticket (bytes): Ticket issued with previous session key
+
+        Returns:
+            - (tuple):
+                - resumption_nonce (bytes): Fresh nonce Client derives new session key with
+                - session_key_hash (str): Value of SHA256 checksum of new session key
+                - session_ticket (bytes): New ticket replacing the redeemed one
+        """
+        # Deleted Clients must not resume sessions, cached profile means Client exists
+        self.apply_invalidations()
+        if client_id not in self.profile_cache and not self.client_exists(client_id):
+            raise FileNotFoundError(
+                f"Submitted Client ID {client_id} is not in Server's database! Please enrol Client..."
+            )
+
+        resumption_secret = self.ticket_issuer.redeem(client_id, session_ticket)
+        resumption_nonce = secrets.token_bytes(16)
+        session_key = derive_resumed_session_key(resumption_secret, resumption_nonce)
         session_key_hash = hashlib.sha256(session_key).hexdigest()
 
-        # Encapsulate session key using Client's public key obtained during enrolment phase
-        client_public_key = RSA.import_key(
-            self.get_client_data_dict(client_id)["client_public_key_PEM"]
+        return (
+            resumption_nonce,
+            session_key_hash,
+            self.ticket_issuer.issue(client_id, session_key),
         )
+
+    @tracing.traced("server.encapsulate_session_key")
+    @metrics.timed(OPERATION_DURATION, OPERATION_ERRORS, operation="encapsulate_session_key")
+    def encapsulate_session_key(
+        self,
+        client_public_key: RSA.RsaKey,
+        DEBUG: bool = False,
+        session_key: bytes = None,
+    ) -> tuple:
+        """
+        Encapsulate session key using Client's public key
+
+        Parameters:
+            - client_public_key (RSA.RsaKey): Client's public key obtained during enrolment phase
+            - DEBUG (bool): Kept for compatibility, length and checksum of session key are logged by "server" logger at DEBUG level
+            - session_key (bytes): Session key to encapsulate, new session key is generated if not given
+
+        Returns:
+            - (tuple):
+                - encrypted_session_key (srt): Value of encapsulated session key
+                - session_key_hash (str): Value of SHA256 checksum of session key
+        """
+        # Generate session key
+        if session_key is None:
+            session_key = self.generate_session_key()
+        # Compute SHA256 checksum of session key
+        session_key_hash = hashlib.sha256(session_key).hexdigest()
+        logger.debug("Session key of %d bytes generated, SHA256 %s", len(session_key), session_key_hash)
+
+        # Encapsulate session key using Client's public key
         cipher = PKCS1_OAEP.new(client_public_key)
         encrypted_session_key = cipher.encrypt(session_key)
 
         return (encrypted_session_key, session_key_hash)
 
-    def enrol_client(self, client_enrolment_json: str) -> None:
+    def check_single_vault(self, client_enrolment_dict: dict) -> None:
         """
-        Saving enroled client data to server database as .json file.
+        Check that Client's profile fits columnar vault store, which holds single vault per Client
 
         Parameters:
-            client_enrolment_json (str): Enrolment data received from client to be stored at the Server
+            - client_enrolment_dict (dict): Parsed enrolment data of Client
 
         Returns:
             - None
         """
+        if len(profile_vaults(client_enrolment_dict)) > 1:
+            raise ValueError(
+                f"Client {client_enrolment_dict['client_id']} is enroled with several vaults, columnar storage holds single vault per Client, use file storage instead"
+            )
+
+    @tracing.traced("server.enrol_client")
+    @metrics.timed(OPERATION_DURATION, OPERATION_ERRORS, operation="enrol_client")
+    def enrol_client(self, client_enrolment_json) -> None:
+        """
+        Saving enroled client data to server database as .json or binary profile file.
+
+        Parameters:
+            client_enrolment_json (str | bytes): Enrolment data received from client to be stored at the Server, either as JSON or binary profile,
+              possibly with several vaults of Client enroled with several biometric templates
+
+        Returns:
+            - (bool): Logic value of Client being enroled, False if Client ID already exists
+        """
         # Process Client's profile data
-        client_enrolment_dict = json.loads(client_enrolment_json)
+        client_enrolment_dict = load_profile(client_enrolment_json)
         client_id = client_enrolment_dict["client_id"]
 
         if self.client_exists(client_id=client_id):
-            print(f"Submitted Client ID {client_id} already exists! Returning None...")
-            return None
+            print(f"Submitted Client ID {client_id} already exists! Returning False...")
+            return False
 
         # Save Client's profile into Server's database
-        with open(f"{self.db_path}/{client_id}.json", "w") as f:
-            f.write(client_enrolment_json)
+        self.profile_cache.invalidate(client_id)
+        if self.vault_store is not None:
+            self.check_single_vault(client_enrolment_dict)
+            self.vault_store.append(
+                client_id=client_id,
+                vault_coefs=client_enrolment_dict["vault_coefs"],
+                group_order=client_enrolment_dict["group_order"],
+                verify_threshold=client_enrolment_dict["verify_threshold"],
+                key_DER=public_key_DER(client_enrolment_dict),
+            )
+            return True
 
-    def vault_request(self, client_id: int) -> str:
+        if is_binary_profile(client_enrolment_json) != (self.profile_format == "binary"):
+            client_enrolment_json = dump_profile(
+                client_enrolment_dict, self.profile_format
+            )
+        if isinstance(client_enrolment_json, str):
+            client_enrolment_json = client_enrolment_json.encode("utf-8")
+
+        # Profile is created exclusively, so that of concurrent enrolments of same Client only one succeeds
+        if not write_file_atomically(
+            self.get_profile_filepath(client_id), client_enrolment_json, exclusive=True
+        ):
+            print(f"Submitted Client ID {client_id} already exists! Returning False...")
+            return False
+        self.publish_invalidation(client_id)
+        return True
+
+    @tracing.traced("server.enrol_clients")
+    @metrics.timed(OPERATION_DURATION, OPERATION_ERRORS, operation="enrol_clients")
+    def enrol_clients(self, client_enrolment_dicts: list) -> list:
         """
-        Simulate Client's request for data stored in their profile in Server's database
+        Save batch of enroled clients to Server's database committing whole batch at once
 
         Parameters:
-            - client_id (int): Client's identificator
+            - client_enrolment_dicts (list): Parsed and validated enrolment data of many Clients
 
         Returns:
-            - public_verification_data_json (str): Content of public parameters stored in Server's database that are sent to Client in form of JSON
+            - duplicate_ids (list): IDs of Clients that were already enroled or repeated in batch and were not saved
         """
-        if not self.client_exists(client_id=client_id):
-            raise FileNotFoundError(
-                f"Submitted Client ID {client_id} is not in Server's database! Please enrol Client..."
+        duplicate_ids = []
+        new_profiles = {}
+
+        # Profile files are checked for existence by their exclusive creation, no database listing is needed
+        for client_enrolment_dict in client_enrolment_dicts:
+            client_id = client_enrolment_dict["client_id"]
+            if self.vault_store is not None and self.vault_store.contains(client_id):
+                duplicate_ids.append(client_id)
+                continue
+            if client_id in new_profiles:
+                duplicate_ids.append(client_id)
+                continue
+            new_profiles[client_id] = client_enrolment_dict
+
+        if self.vault_store is not None:
+            for client_id in new_profiles:
+                self.profile_cache.invalidate(client_id)
+            for profile_dict in new_profiles.values():
+                self.check_single_vault(profile_dict)
+            self.vault_store.append_batch(
+                [
+                    {
+                        "client_id": client_id,
+                        "vault_coefs": profile_dict["vault_coefs"],
+                        "group_order": profile_dict["group_order"],
+                        "verify_threshold": profile_dict["verify_threshold"],
+                        "key_DER": public_key_DER(profile_dict),
+                    }
+                    for client_id, profile_dict in new_profiles.items()
+                ]
             )
+            return duplicate_ids
 
-        # Read Client's profile data
-        with open(f"{self.db_path}/{client_id}.json", "rt") as f:
-            server_public_client_data_json = f.read()
+        # Group commit: write whole batch to temporary files and flush them with single sync instead of one fsync per Client,
+        # so that no profile is linked into place before its content is on disk
+        temporary_filepaths = {}
+        try:
+            for client_id, profile_dict in new_profiles.items():
+                profile_data = dump_profile(profile_dict, self.profile_format)
+                if isinstance(profile_data, str):
+                    profile_data = profile_data.encode("utf-8")
+                temporary_filepaths[client_id] = (
+                    f"{self.get_profile_filepath(client_id)}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+                )
+                with open(temporary_filepaths[client_id], "wb") as f:
+                    f.write(profile_data)
+            if temporary_filepaths:
+                os.sync()
+
+            # Exclusive links detect Clients enroled before or meanwhile by other Server processes
+            for client_id, temporary_filepath in temporary_filepaths.items():
+                try:
+                    os.link(temporary_filepath, self.get_profile_filepath(client_id))
+                except FileExistsError:
+                    duplicate_ids.append(client_id)
+                    continue
+                self.publish_invalidation(client_id)
+        finally:
+            for temporary_filepath in temporary_filepaths.values():
+                if os.path.exists(temporary_filepath):
+                    os.unlink(temporary_filepath)
+
+        # Commit linked profiles with single synchronization of database directory
+        fsync_directory(self.db_path)
+
+        return duplicate_ids
+
+    @tracing.traced("server.vault_request")
+    @metrics.timed(OPERATION_DURATION, OPERATION_ERRORS, operation="vault_request")
+    def vault_request(self, client_id: int):
+        """
+        Simulate Client's request for data stored in their profile in Server's database
 
-        # Create Clients public data as JSON
-        public_verication_dict = json.loads(server_public_client_data_json)
-        public_verification_data_dict = {
-            key: public_verication_dict[key]
-            for key in public_verication_dict.keys()
-            if key not in ("client_public_key_PEM")
-        }
-        public_verification_data_json = json.dumps(public_verification_data_dict)
+        Parameters:
+            - client_id (int): Client's identificator
+
+        Returns:
+            - public_verification_data_json (str | bytes): Content of public parameters stored in Server's database that are sent to Client in form of JSON or binary profile
+              according to Server's profile format, in both storage modes; all vaults of Client are sent in single response
+        """
+        # Read Client's pre-serialized public data from profile cache
+        public_verification_data_json = self.load_client_profile(
+            client_id
+        ).vault_response
 
         return public_verification_data_json
 
+    @tracing.traced("server.compact_vault_store")
+    @metrics.timed(OPERATION_DURATION, OPERATION_ERRORS, operation="compact_vault_store")
+    def compact_vault_store(self) -> dict:
+        """
+        Reclaim rows of deleted Clients in columnar vault store, should be run while Server is not serving requests
+
+        Parameters:
+            - None
+
+        Returns:
+            - (dict): Number of reclaimed rows per vault store shard
+        """
+        if self.vault_store is None:
+            return {}
+
+        # Cached vault views point to rows that are moved by compaction
+        self.profile_cache.clear()
+        return self.vault_store.compact()
+
 
 def run_tests():
     SERVER_DB_PATH = "./server_db/"
     s = Server(SERVER_DB_PATH)
 
+    print("Running server.py tests...")
+
+    # Vault response has representation of Server's profile format in every storage mode
+    profile_dict = {
+        "client_id": 1,
+        "vault_coefs": [5, 2, 12400, 1],
+        "group_order": 12401,
+        "verify_threshold": 3,
+        "client_public_key_PEM": RSA.generate(1024).publickey().export_key("PEM").decode("utf-8"),
+    }
+    for storage_mode in STORAGE_MODES:
+        for profile_format in PROFILE_FORMATS:
+            db_path = f"./server_test_db_{storage_mode}_{profile_format}/"
+            shutil.rmtree(db_path, ignore_errors=True)
+            server = Server(db_path, profile_format=profile_format, storage_mode=storage_mode)
+            server.enrol_client(dump_profile(profile_dict, "json"))
+            for _ in range(2):
+                vault_response = server.vault_request(1)
+                assert isinstance(vault_response, bytes if profile_format == "binary" else str)
+                assert is_binary_profile(vault_response) == (profile_format == "binary")
+                vault_dict = load_profile(vault_response)
+                assert vault_dict["vault_coefs"] == profile_dict["vault_coefs"]
+                assert public_key_DER(vault_dict) is None
+            shutil.rmtree(db_path)
+
+    print("Tests completed!")
+
 
 def main():
     run_tests()
@@ -0,0 +1,813 @@
+import os
+import sys
+import json
+import random
+import base64
+import shutil
+import asyncio
+import argparse
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter as pc
+
+import metrics
+import tracing
+from server import Server
+from scheduler import OverloadError, Scheduler, default_operation_policies
+from session_tickets import InvalidTicketError
+from profile_format import dump_profile, load_profile
+
+# Maximal length of single request line, enrolment profiles are a few kilobytes
+MAX_LINE_LENGTH = 1024 * 1024
+
+
+class ServiceError(Exception):
+    def __init__(self, error: str, message: str):
+        """
+        ServiceError class constructor, that returns exception describing failed service request
+
+        Parameters:
+            - error (str): Error code returned by the service
+            - message (str): Human readable error description
+
+        Returns:
+            - self (ServiceError): ServiceError class object
+        """
+        super().__init__(f"{error}: {message}")
+        self.error = error
+        self.message = message
+
+
+def encode_payload(data) -> dict:
+    """
+    Encode profile data or vault response to JSON-friendly payload
+
+    Parameters:
+        - data (str | bytes): JSON profile or binary profile
+
+    Returns:
+        - (dict): Payload with 'encoding' and 'data' keys
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return {"encoding": "base64", "data": base64.b64encode(data).decode("ascii")}
+    return {"encoding": "json", "data": data}
+
+
+def decode_payload(payload: dict):
+    """
+    Decode payload created with encode_payload
+
+    Parameters:
+        - payload (dict): Payload with 'encoding' and 'data' keys
+
+    Returns:
+        - (str | bytes): JSON or binary profile data
+    """
+    if payload["encoding"] == "base64":
+        return base64.b64decode(payload["data"])
+    return payload["data"]
+
+
+def latency_percentiles(latencies: list) -> dict:
+    """
+    Compute latency percentiles with nearest-rank method
+
+    Parameters:
+        - latencies (list): Measured latencies in seconds
+
+    Returns:
+        - (dict): Number of samples, mean, p50, p90, p99 and max latency in seconds
+    """
+    if not latencies:
+        return {"count": 0}
+
+    ordered = sorted(latencies)
+
+    def nearest_rank(q):
+        return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": nearest_rank(0.50),
+        "p90": nearest_rank(0.90),
+        "p99": nearest_rank(0.99),
+        "max": ordered[-1],
+    }
+
+
+class ServerService:
+    def __init__(
+        self,
+        server: Server,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        cpu_workers: int = None,
+        max_pending_cpu: int = 256,
+        sock=None,
+        scheduler: Scheduler = None,
+    ):
+        """
+        ServerService class constructor, that returns asyncio TCP front-end serving Server to concurrent Clients
+
+        Parameters:
+            - server (Server): Server handling enrolment, vault requests and key exchange
+            - host (str): Address to listen on
+            - port (int): Port to listen on, 0 chooses free port
+            - cpu_workers (int): Number of threads running CPU-bound work (KDF, RSA encryption)
+            - max_pending_cpu (int): Maximal number of CPU-bound tasks submitted to executor at once
+            - sock (socket.socket): Already listening socket to accept connections on instead of host and port, e.g. shared by pre-forked processes
+            - scheduler (Scheduler): Admission control of requests, by default vault requests take precedence over session keys and enrolments
+
+        Returns:
+            - self (ServerService): ServerService class object
+        """
+        self.server = server
+        self.host = host
+        self.port = port
+        self.sock = sock
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1
+
+        # Storage is accessed from single thread, so that Server's cache and files need no locking
+        self.storage_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="storage"
+        )
+        self.cpu_executor = ThreadPoolExecutor(
+            max_workers=self.cpu_workers, thread_name_prefix="cpu"
+        )
+        self.max_pending_cpu = max_pending_cpu
+        self.cpu_semaphore = None
+
+        # One slot more than CPU threads keeps cheap requests flowing while key encapsulation saturates CPU
+        if scheduler is None:
+            scheduler = Scheduler(
+                default_operation_policies(self.cpu_workers),
+                max_concurrency=self.cpu_workers + 1,
+            )
+        self.scheduler = scheduler
+        self.tcp_server = None
+
+    async def start(self) -> None:
+        """
+        Start listening for connections
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        self.cpu_semaphore = asyncio.Semaphore(self.max_pending_cpu)
+        if self.sock is not None:
+            self.tcp_server = await asyncio.start_server(
+                self.handle_connection, sock=self.sock, limit=MAX_LINE_LENGTH
+            )
+        else:
+            self.tcp_server = await asyncio.start_server(
+                self.handle_connection,
+                self.host,
+                self.port,
+                limit=MAX_LINE_LENGTH,
+                backlog=4096,
+            )
+        self.port = self.tcp_server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        if self.tcp_server is None:
+            await self.start()
+        async with self.tcp_server:
+            await self.tcp_server.serve_forever()
+
+    async def close(self) -> None:
+        """
+        Stop accepting connections and shut down executors
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        if self.tcp_server is not None:
+            self.tcp_server.close()
+            await self.tcp_server.wait_closed()
+        self.storage_executor.shutdown(wait=True)
+        self.cpu_executor.shutdown(wait=True)
+
+    async def run_storage(self, func, *args):
+        # Executor threads run function in copy of request's context, so that its spans join request's trace
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.storage_executor,
+            functools.partial(contextvars.copy_context().run, func, *args),
+        )
+
+    async def run_cpu(self, func, *args):
+        async with self.cpu_semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.cpu_executor,
+                functools.partial(contextvars.copy_context().run, func, *args),
+            )
+
+    async def handle_connection(self, reader, writer) -> None:
+        """
+        Serve requests of single connection, responses are sent as soon as they are ready and may be reordered
+
+        Parameters:
+            - reader (asyncio.StreamReader): Connection's reader
+            - writer (asyncio.StreamWriter): Connection's writer
+
+        Returns:
+            - None
+        """
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(request):
+            response = await self.handle_request(request)
+            async with write_lock:
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = {"op": None}
+                task = asyncio.create_task(respond(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def handle_request(self, request: dict) -> dict:
+        """
+        Dispatch single request to Server
+
+        Parameters:
+            - request (dict): Request with 'op' field, operation arguments and optional 'deadline' in seconds the request may wait for execution
+
+        Returns:
+            - (dict): Response with 'ok' field and either 'result' or 'error' fields, shed requests have 'overloaded' error and 'reason' field
+        """
+        response = {"id": request.get("id")}
+        try:
+            with tracing.continue_trace(request.get("trace")), tracing.span(
+                f"server_service.{request.get('op')}", client_id=request.get("client_id")
+            ):
+                async with self.scheduler.slot(request.get("op"), request.get("deadline")):
+                    response["result"] = await self.dispatch(request)
+            response["ok"] = True
+        except OverloadError as err:
+            response.update(ok=False, error="overloaded", reason=err.reason, message=str(err))
+        except FileNotFoundError as err:
+            response.update(ok=False, error="not_found", message=str(err))
+        except InvalidTicketError as err:
+            response.update(ok=False, error="invalid_ticket", message=str(err))
+        except (KeyError, TypeError, ValueError) as err:
+            response.update(ok=False, error="bad_request", message=str(err))
+        except Exception as err:
+            response.update(ok=False, error="internal", message=repr(err))
+        return response
+
+    async def dispatch(self, request: dict):
+        op = request.get("op")
+
+        if op == "vault":
+            vault_response = await self.run_storage(
+                self.server.vault_request, request["client_id"]
+            )
+            return encode_payload(vault_response)
+
+        if op == "session_key":
+            profile = await self.run_storage(
+                self.server.load_client_profile, request["client_id"]
+            )
+            client_public_key = await self.run_storage(
+                getattr, profile, "client_public_key"
+            )
+            # Key derivation runs in CPU executor, so that it does not stall event loop serving cheap requests
+            session_key = await self.run_cpu(self.server.generate_session_key)
+            encrypted_session_key, session_key_hash = await self.run_cpu(
+                self.server.encapsulate_session_key,
+                client_public_key,
+                False,
+                session_key,
+            )
+            result = {
+                "encrypted_session_key": base64.b64encode(encrypted_session_key).decode(
+                    "ascii"
+                ),
+                "session_key_hash": session_key_hash,
+            }
+            if request.get("ticket"):
+                # Issuer is used by storage executor only, the same as on resumption
+                session_ticket = await self.run_storage(
+                    self.server.ticket_issuer.issue, request["client_id"], session_key
+                )
+                result["ticket"] = base64.b64encode(session_ticket).decode("ascii")
+            return result
+
+        if op == "resume":
+            resumption_nonce, session_key_hash, session_ticket = await self.run_storage(
+                self.server.resume_session,
+                request["client_id"],
+                base64.b64decode(request["ticket"]),
+            )
+            return {
+                "nonce": base64.b64encode(resumption_nonce).decode("ascii"),
+                "session_key_hash": session_key_hash,
+                "ticket": base64.b64encode(session_ticket).decode("ascii"),
+            }
+
+        if op == "enrol":
+            # Single profile is created exclusively, without listing or synchronizing whole database directory
+            enroled = await self.run_storage(
+                self.server.enrol_client, decode_payload(request["profile"])
+            )
+            return {"enroled": enroled}
+
+        if op == "delete":
+            deleted = await self.run_storage(
+                self.server.delete_existing_user_by_id, request["client_id"]
+            )
+            return {"deleted": deleted}
+
+        if op == "stats":
+            return await self.run_storage(self.server.get_profile_cache_stats)
+
+        if op == "metrics":
+            return {"text": metrics.render_prometheus()}
+
+        raise ValueError(f"Unknown operation: {op}")
+
+
+class ServerConnection:
+    def __init__(self, reader, writer):
+        """
+        ServerConnection class constructor, that returns Client's connection to ServerService
+
+        Parameters:
+            - reader (asyncio.StreamReader): Connection's reader
+            - writer (asyncio.StreamWriter): Connection's writer
+
+        Returns:
+            - self (ServerConnection): ServerConnection class object
+        """
+        self.reader = reader
+        self.writer = writer
+        self.next_request_id = 0
+        self.pending = {}
+        self.reader_task = asyncio.create_task(self.read_responses())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 8765):
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE_LENGTH)
+        return cls(reader, writer)
+
+    async def read_responses(self) -> None:
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to service closed"))
+            self.pending.clear()
+
+    async def request(self, op: str, **fields):
+        """
+        Send request to ServerService and wait for its response
+
+        Parameters:
+            - op (str): Operation name
+            - fields (dict): Operation arguments
+
+        Returns:
+            - Result of operation, raises ServiceError if service reports failure
+        """
+        request_id = self.next_request_id
+        self.next_request_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+
+        with tracing.span(f"server_connection.{op}"):
+            trace_context = tracing.inject()
+            if trace_context is not None:
+                fields["trace"] = trace_context
+            self.writer.write(
+                json.dumps(dict(fields, id=request_id, op=op)).encode("utf-8") + b"\n"
+            )
+            await self.writer.drain()
+
+            response = await future
+        if not response["ok"]:
+            raise ServiceError(response["error"], response.get("message", ""))
+        return response["result"]
+
+    async def enrol_client(self, client_enrolment_json) -> bool:
+        result = await self.request("enrol", profile=encode_payload(client_enrolment_json))
+        return result["enroled"]
+
+    async def delete_client(self, client_id: int) -> bool:
+        result = await self.request("delete", client_id=client_id)
+        return result["deleted"]
+
+    async def vault_request(self, client_id: int):
+        return decode_payload(await self.request("vault", client_id=client_id))
+
+    async def send_session_key_to_client(self, client_id: int) -> tuple:
+        result = await self.request("session_key", client_id=client_id)
+        return (
+            base64.b64decode(result["encrypted_session_key"]),
+            result["session_key_hash"],
+        )
+
+    async def send_session_key_with_ticket(self, client_id: int) -> tuple:
+        result = await self.request("session_key", client_id=client_id, ticket=True)
+        return (
+            base64.b64decode(result["encrypted_session_key"]),
+            result["session_key_hash"],
+            base64.b64decode(result["ticket"]),
+        )
+
+    async def resume_session(self, client_id: int, session_ticket: bytes) -> tuple:
+        result = await self.request(
+            "resume",
+            client_id=client_id,
+            ticket=base64.b64encode(session_ticket).decode("ascii"),
+        )
+        return (
+            base64.b64decode(result["nonce"]),
+            result["session_key_hash"],
+            base64.b64decode(result["ticket"]),
+        )
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self.reader_task
+
+
+async def run_load_test(
+    host: str,
+    port: int,
+    client_ids: list,
+    connections: int = 1000,
+    requests_per_connection: int = 10,
+    session_key_ratio: float = 0.1,
+) -> dict:
+    """
+    Open many concurrent connections to ServerService and measure request latencies
+
+    Parameters:
+        - host (str): Address of ServerService
+        - port (int): Port of ServerService
+        - client_ids (list): IDs of enroled Clients to request
+        - connections (int): Number of concurrent connections
+        - requests_per_connection (int): Number of sequential requests sent over each connection
+        - session_key_ratio (float): Fraction of requests asking for session key instead of vault
+
+    Returns:
+        - (dict): Latency percentiles per operation, error count, count of requests shed by overloaded service and throughput
+    """
+    latencies = {"vault": [], "session_key": []}
+    errors = []
+    overloaded = []
+
+    async def run_connection(connection_number):
+        connection = await ServerConnection.connect(host, port)
+        try:
+            for request_number in range(requests_per_connection):
+                client_id = client_ids[(connection_number + request_number) % len(client_ids)]
+                request_index = connection_number * requests_per_connection + request_number
+                is_session_key = session_key_ratio > 0 and (
+                    request_index % max(1, round(1 / session_key_ratio)) == 0
+                )
+                s = pc()
+                try:
+                    if is_session_key:
+                        await connection.send_session_key_to_client(client_id)
+                    else:
+                        await connection.vault_request(client_id)
+                except ServiceError as err:
+                    (overloaded if err.error == "overloaded" else errors).append(str(err))
+                    continue
+                latencies["session_key" if is_session_key else "vault"].append(pc() - s)
+        finally:
+            await connection.close()
+
+    s = pc()
+    results = await asyncio.gather(
+        *(run_connection(i) for i in range(connections)), return_exceptions=True
+    )
+    elapsed = pc() - s
+    errors.extend(repr(result) for result in results if isinstance(result, Exception))
+
+    completed = sum(len(values) for values in latencies.values())
+    return {
+        "connections": connections,
+        "completed": completed,
+        "errors": len(errors),
+        "overloaded": len(overloaded),
+        "elapsed": elapsed,
+        "throughput": completed / elapsed if elapsed else 0.0,
+        "vault": latency_percentiles(latencies["vault"]),
+        "session_key": latency_percentiles(latencies["session_key"]),
+    }
+
+
+def create_test_profile(client_id: int) -> str:
+    from Crypto.PublicKey import RSA
+
+    key = RSA.generate(1024)
+    return json.dumps(
+        {
+            "client_id": client_id,
+            "vault_coefs": [client_id, 2, 3, 1],
+            "client_public_key_PEM": key.publickey().export_key("PEM").decode("utf-8"),
+            "group_order": 12401,
+            "verify_threshold": 3,
+        }
+    )
+
+
+async def run_overload_test(
+    scheduler: Scheduler,
+    client_ids: list,
+    storm_connections: int,
+    storm_requests: int,
+    storm_interval: float = 0.01,
+) -> dict:
+    """
+    Flood ServerService in test database with session key requests while measuring latency of concurrent vault requests
+
+    Parameters:
+        - scheduler (Scheduler): Scheduler of tested ServerService
+        - client_ids (list): IDs of enroled Clients to request
+        - storm_connections (int): Number of connections sending session key requests
+        - storm_requests (int): Number of session key requests sent over each connection
+        - storm_interval (float): Time in seconds between session key requests of connection, requests do not wait for previous ones
+
+    Returns:
+        - (dict): Latency percentiles of vault and served session key requests, numbers of served and shed requests
+    """
+    db_path = "./overload_test_db/"
+    shutil.rmtree(db_path, ignore_errors=True)
+    service = ServerService(Server(db_path), port=0, cpu_workers=2, scheduler=scheduler)
+    await service.start()
+
+    connection = await ServerConnection.connect(port=service.port)
+    for client_id in client_ids:
+        assert await connection.enrol_client(create_test_profile(client_id))
+
+    latencies = {"vault": [], "session_key": []}
+    overloaded = []
+
+    async def timed_request(operation, request):
+        s = pc()
+        try:
+            await request
+        except ServiceError as err:
+            if err.error != "overloaded":
+                raise
+            overloaded.append(operation)
+            return
+        latencies[operation].append(pc() - s)
+
+    async def storm(storm_connection):
+        tasks = []
+        for _ in range(storm_requests):
+            tasks.append(
+                asyncio.create_task(
+                    timed_request(
+                        "session_key",
+                        storm_connection.send_session_key_to_client(random.choice(client_ids)),
+                    )
+                )
+            )
+            await asyncio.sleep(storm_interval)
+        await asyncio.gather(*tasks)
+
+    async def probe():
+        # Vault requests arrive steadily while storm is queued
+        for _ in range(100):
+            await timed_request("vault", connection.vault_request(random.choice(client_ids)))
+            await asyncio.sleep(0.01)
+
+    storm_connection_list = [
+        await ServerConnection.connect(port=service.port) for _ in range(storm_connections)
+    ]
+    await asyncio.gather(probe(), *[storm(storm_connection) for storm_connection in storm_connection_list])
+
+    for open_connection in [connection] + storm_connection_list:
+        await open_connection.close()
+    await asyncio.sleep(0.1)
+    await service.close()
+    shutil.rmtree(db_path)
+
+    return {
+        "vault": latency_percentiles(latencies["vault"]),
+        "session_key": latency_percentiles(latencies["session_key"]),
+        "overloaded": {
+            operation: overloaded.count(operation) for operation in ("vault", "session_key")
+        },
+    }
+
+
+def run_tests():
+    print("Running server_service.py tests...")
+
+    db_path = "./server_service_test_db/"
+    shutil.rmtree(db_path, ignore_errors=True)
+
+    async def test():
+        service = ServerService(Server(db_path), port=0)
+        await service.start()
+
+        connection = await ServerConnection.connect(port=service.port)
+        profile = create_test_profile(1)
+        assert await connection.enrol_client(profile)
+        assert not await connection.enrol_client(profile)
+
+        vault_response = load_profile(await connection.vault_request(1))
+        assert vault_response["vault_coefs"] == [1, 2, 3, 1]
+        encrypted_session_key, session_key_hash = (
+            await connection.send_session_key_to_client(1)
+        )
+        assert len(session_key_hash) == 64
+
+        # Resumed session replaces ticket, redeemed ticket cannot be replayed
+        _, _, session_ticket = await connection.send_session_key_with_ticket(1)
+        _, _, new_session_ticket = await connection.resume_session(1, session_ticket)
+        assert new_session_ticket != session_ticket
+        try:
+            await connection.resume_session(1, session_ticket)
+            assert False
+        except ServiceError as err:
+            assert err.error == "invalid_ticket"
+
+        try:
+            await connection.vault_request(2)
+            assert False
+        except ServiceError as err:
+            assert err.error == "not_found"
+
+        # Truncated binary profile is rejected as bad request
+        try:
+            truncated_profile = dump_profile(load_profile(create_test_profile(2)), "binary")[:20]
+            await connection.enrol_client(truncated_profile)
+            assert False
+        except ServiceError as err:
+            assert err.error == "bad_request" and "truncated" in err.message
+
+        # Trace id is propagated to spans of service and Server running in executor threads
+        exporter = tracing.InMemoryExporter()
+        tracing.enable(exporter)
+        with tracing.span("login") as login_span:
+            await connection.vault_request(1)
+        tracing.disable()
+        assert {span_dict["name"] for span_dict in exporter.spans} == {
+            "login",
+            "server_connection.vault",
+            "server_service.vault",
+            "server.vault_request",
+        }
+        assert all(span_dict["trace_id"] == login_span.trace_id for span_dict in exporter.spans)
+        await connection.close()
+
+        report = await run_load_test(
+            "127.0.0.1", service.port, [1], connections=200, requests_per_connection=5
+        )
+        assert report["errors"] == 0 and report["completed"] + report["overloaded"] == 1000
+        assert report["vault"]["count"] == 900
+        print(
+            f"Throughput: {report['throughput']:.0f} req/s, "
+            f"vault p99: {report['vault']['p99'] * 1000:.1f} ms, "
+            f"session key p99: {report['session_key']['p99'] * 1000:.1f} ms, "
+            f"{report['overloaded']} requests shed"
+        )
+
+        # Deleted Client is not found, also through cached profile
+        connection = await ServerConnection.connect(port=service.port)
+        assert await connection.delete_client(1)
+        assert not await connection.delete_client(1)
+        try:
+            await connection.vault_request(1)
+            assert False
+        except ServiceError as err:
+            assert err.error == "not_found"
+        await connection.close()
+        await asyncio.sleep(0.1)
+
+        await service.close()
+
+    asyncio.run(test())
+    shutil.rmtree(db_path)
+
+    # Sustained storm of session key requests beyond capacity: without admission control latency grows with backlog,
+    # with it excess requests are shed and latency of served requests stays bounded by deadline
+    random.seed(0)
+    client_ids = [1, 2]
+    unscheduled_report = asyncio.run(
+        run_overload_test(Scheduler({}, max_concurrency=1), client_ids, 4, 50)
+    )
+    scheduled_policies = default_operation_policies(cpu_workers=2)
+    scheduled_policies["session_key"].deadline = 0.5
+    scheduled_report = asyncio.run(
+        run_overload_test(Scheduler(scheduled_policies, max_concurrency=3), client_ids, 4, 50)
+    )
+    for name, report in (("unscheduled", unscheduled_report), ("scheduled", scheduled_report)):
+        print(
+            f"{name}: vault p99 {report['vault']['p99'] * 1000:.1f} ms, "
+            f"session key p99 {report['session_key'].get('p99', 0) * 1000:.1f} ms, "
+            f"{report['session_key']['count']} session keys served, "
+            f"{report['overloaded']['session_key']} shed"
+        )
+    assert unscheduled_report["overloaded"] == {"vault": 0, "session_key": 0}
+    assert scheduled_report["overloaded"]["vault"] == 0
+    assert scheduled_report["overloaded"]["session_key"] > 0
+    assert scheduled_report["vault"]["p99"] < unscheduled_report["vault"]["p99"] / 2
+    assert scheduled_report["session_key"]["max"] < 0.5 + 1.0
+    assert scheduled_report["session_key"]["p99"] < unscheduled_report["session_key"]["p99"] / 4
+
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    parser = argparse.ArgumentParser(description="Asyncio network front-end for Server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve Server's database over TCP")
+    serve_parser.add_argument("--db", default="./server_db/")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--cpu-workers", type=int, default=None)
+    serve_parser.add_argument("--storage-mode", default="files", choices=("files", "columnar"))
+    serve_parser.add_argument("--profile-format", default="json", choices=("json", "binary"))
+
+    load_parser = subparsers.add_parser("loadtest", help="Measure latency percentiles of running service")
+    load_parser.add_argument("--host", default="127.0.0.1")
+    load_parser.add_argument("--port", type=int, default=8765)
+    load_parser.add_argument("--client-id", type=int, action="append", required=True)
+    load_parser.add_argument("--connections", type=int, default=1000)
+    load_parser.add_argument("--requests", type=int, default=10)
+    load_parser.add_argument("--session-key-ratio", type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = Server(
+            args.db, profile_format=args.profile_format, storage_mode=args.storage_mode
+        )
+        service = ServerService(
+            server, host=args.host, port=args.port, cpu_workers=args.cpu_workers
+        )
+        print(f"Serving {args.db} on {args.host}:{args.port}")
+        asyncio.run(service.serve_forever())
+    else:
+        report = asyncio.run(
+            run_load_test(
+                args.host,
+                args.port,
+                args.client_id,
+                connections=args.connections,
+                requests_per_connection=args.requests,
+                session_key_ratio=args.session_key_ratio,
+            )
+        )
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,582 @@
+import os
+import time
+import shutil
+import struct
+import secrets
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+# Ticket layout: key id (4 bytes) | AES-GCM nonce (12 bytes) | encrypted ticket state with tag
+# Ticket state: client id (q) | issued at (d) | expires at (d) | ticket id (16s) | resumption secret (32s)
+_TICKET_STATE_STRUCT = struct.Struct("<qdd16s32s")
+_KEY_ID_LENGTH = 4
+_KEY_LENGTH = 32
+_NONCE_LENGTH = 12
+
+# Ticket keys file: time of last rotation (d) | number of keys (I), followed by key id (4s) | key (32s) records, the newest first
+_TICKET_KEYS_HEADER_STRUCT = struct.Struct("<dI")
+_TICKET_KEY_STRUCT = struct.Struct(f"<{_KEY_ID_LENGTH}s{_KEY_LENGTH}s")
+
+# Redeemed tickets file: issued at watermark (d), followed by ticket id (16s) | issued at (d) | expires at (d) records
+_REPLAY_HEADER_STRUCT = struct.Struct("<d")
+_REPLAY_RECORD_STRUCT = struct.Struct("<16sdd")
+
+
+class InvalidTicketError(Exception):
+    pass
+
+
+def derive_resumption_secret(session_key: bytes) -> bytes:
+    """
+    Derive resumption secret bound to session key, known to both Server and Client after key exchange
+
+    Parameters:
+        - session_key (bytes): Exchanged session key
+
+    Returns:
+        - (bytes): 32 byte resumption secret
+    """
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"BRAKE session resumption secret",
+    ).derive(session_key)
+
+
+def derive_resumed_session_key(resumption_secret: bytes, resumption_nonce: bytes) -> bytes:
+    """
+    Derive fresh session key of resumed session
+
+    Parameters:
+        - resumption_secret (bytes): Resumption secret of previous session
+        - resumption_nonce (bytes): Fresh nonce chosen by Server for resumed session
+
+    Returns:
+        - (bytes): 32 byte session key of resumed session
+    """
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=resumption_nonce,
+        info=b"BRAKE resumed session key",
+    ).derive(resumption_secret)
+
+
+def replace_file(filepath: str, data: bytes) -> None:
+    """
+    Replace content of file guarded by lock, readers opening file after the replacement never see partially written data
+
+    Parameters:
+        - filepath (str): Path of replaced file
+        - data (bytes): New content of file
+
+    Returns:
+        - None
+    """
+    temporary_filepath = f"{filepath}.tmp"
+    with open(temporary_filepath, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_filepath, filepath)
+
+
+class ReplayCache:
+    def __init__(self, capacity: int = 100000):
+        """
+        ReplayCache class constructor, that returns bounded cache of redeemed ticket ids
+
+        Parameters:
+            - capacity (int): Maximal number of remembered ticket ids
+
+        Returns:
+            - self (ReplayCache): ReplayCache class object
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+        # Tickets issued not later than the newest evicted unexpired ticket are rejected, so that eviction never enables replay
+        self.issued_watermark = float("-inf")
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def evict_expired(self, now: float) -> None:
+        expired_ids = [
+            ticket_id
+            for ticket_id, (issued_at, expires_at) in self.entries.items()
+            if expires_at <= now
+        ]
+        for ticket_id in expired_ids:
+            del self.entries[ticket_id]
+
+    def check_and_add(
+        self, ticket_id: bytes, issued_at: float, expires_at: float, now: float
+    ) -> bool:
+        """
+        Record ticket as redeemed
+
+        Parameters:
+            - ticket_id (bytes): Unique ticket id
+            - issued_at (float): Time of issuing the ticket
+            - expires_at (float): Time of ticket expiry
+            - now (float): Current time
+
+        Returns:
+            - (bool): False if ticket was already redeemed or cannot be told apart from redeemed ticket
+        """
+        if ticket_id in self.entries or issued_at <= self.issued_watermark:
+            return False
+
+        self.add(ticket_id, issued_at, expires_at, now)
+        return True
+
+    def add(self, ticket_id: bytes, issued_at: float, expires_at: float, now: float) -> None:
+        if len(self.entries) >= self.capacity:
+            self.evict_expired(now)
+        while len(self.entries) >= self.capacity:
+            _, (evicted_issued_at, _) = self.entries.popitem(last=False)
+            self.issued_watermark = max(self.issued_watermark, evicted_issued_at)
+            self.evictions += 1
+
+        self.entries[ticket_id] = (issued_at, expires_at)
+
+
+class SharedReplayCache(ReplayCache):
+    def __init__(self, filepath: str, file_lock, capacity: int = 100000):
+        """
+        SharedReplayCache class constructor, that returns replay cache shared by processes through file of redeemed tickets
+
+        Every process keeps redeemed tickets in memory and reads tickets redeemed by other processes from the file
+        before each check. File is compacted to unexpired tickets once it holds twice as many records as the cache.
+
+        Parameters:
+            - filepath (str): Path of redeemed tickets file
+            - file_lock (callable): Returns context manager holding lock shared by all processes, guards the file
+            - capacity (int): Maximal number of remembered ticket ids
+
+        Returns:
+            - self (SharedReplayCache): SharedReplayCache class object
+        """
+        super().__init__(capacity=capacity)
+        self.filepath = filepath
+        self.file_lock = file_lock
+        self.file_id = None
+        self.offset = 0
+
+    def read_records(self, now: float) -> None:
+        """
+        Add tickets redeemed by other processes since last read, must be called with file lock held
+
+        Parameters:
+            - now (float): Current time
+
+        Returns:
+            - None
+        """
+        try:
+            f = open(self.filepath, "rb")
+        except FileNotFoundError:
+            self.write_records()
+            return
+
+        with f:
+            stat = os.fstat(f.fileno())
+            # File replaced by compaction is read from the beginning
+            if (stat.st_dev, stat.st_ino) != self.file_id:
+                self.entries.clear()
+                (self.issued_watermark,) = _REPLAY_HEADER_STRUCT.unpack(
+                    f.read(_REPLAY_HEADER_STRUCT.size)
+                )
+                self.file_id = (stat.st_dev, stat.st_ino)
+                self.offset = _REPLAY_HEADER_STRUCT.size
+            f.seek(self.offset)
+            data = f.read()
+
+        # Records were accepted by the process appending them, so they are added without checking
+        for ticket_id, issued_at, expires_at in _REPLAY_RECORD_STRUCT.iter_unpack(data):
+            self.add(ticket_id, issued_at, expires_at, now)
+        self.offset += len(data)
+
+    def write_records(self) -> None:
+        data = _REPLAY_HEADER_STRUCT.pack(self.issued_watermark) + b"".join(
+            _REPLAY_RECORD_STRUCT.pack(ticket_id, issued_at, expires_at)
+            for ticket_id, (issued_at, expires_at) in self.entries.items()
+        )
+        replace_file(self.filepath, data)
+        stat = os.stat(self.filepath)
+        self.file_id = (stat.st_dev, stat.st_ino)
+        self.offset = len(data)
+
+    def check_and_add(
+        self, ticket_id: bytes, issued_at: float, expires_at: float, now: float
+    ) -> bool:
+        with self.file_lock():
+            self.read_records(now)
+            if not super().check_and_add(ticket_id, issued_at, expires_at, now):
+                return False
+
+            if self.offset >= _REPLAY_HEADER_STRUCT.size + 2 * self.capacity * _REPLAY_RECORD_STRUCT.size:
+                self.evict_expired(now)
+                self.write_records()
+                return True
+
+            with open(self.filepath, "ab") as f:
+                f.write(_REPLAY_RECORD_STRUCT.pack(ticket_id, issued_at, expires_at))
+            self.offset += _REPLAY_RECORD_STRUCT.size
+        return True
+
+
+class SessionTicketIssuer:
+    def __init__(
+        self,
+        ticket_lifetime: float = 3600.0,
+        key_rotation_interval: float = 3600.0,
+        max_ticket_keys: int = 3,
+        replay_cache_size: int = 100000,
+    ):
+        """
+        SessionTicketIssuer class constructor, that returns issuer of encrypted and authenticated session resumption tickets
+
+        Parameters:
+            - ticket_lifetime (float): Time in seconds for which ticket can be redeemed
+            - key_rotation_interval (float): Time in seconds after which new ticket encryption key is generated
+            - max_ticket_keys (int): Number of ticket keys kept, tickets encrypted with older keys are rejected
+            - replay_cache_size (int): Maximal number of remembered redeemed tickets
+
+        Returns:
+            - self (SessionTicketIssuer): SessionTicketIssuer class object
+        """
+        self.ticket_lifetime = ticket_lifetime
+        self.key_rotation_interval = key_rotation_interval
+        self.ticket_keys = deque(maxlen=max_ticket_keys)
+        self.replay_cache = ReplayCache(capacity=replay_cache_size)
+
+        # Tickets are issued and redeemed from event loop and executor threads, rotation and replay check must not interleave
+        self.lock = threading.Lock()
+
+        # First ticket key is generated when first ticket is issued
+        self.last_rotation = None
+
+    def rotate_keys(self, now: float = None) -> None:
+        """
+        Generate new ticket encryption key, dropping the oldest one if too many keys are kept
+
+        Parameters:
+            - now (float): Current time, taken from clock if not given
+
+        Returns:
+            - None
+        """
+        key_id = secrets.token_bytes(_KEY_ID_LENGTH)
+        key = AESGCM.generate_key(bit_length=_KEY_LENGTH * 8)
+        self.ticket_keys.appendleft((key_id, key, AESGCM(key)))
+        self.last_rotation = time.time() if now is None else now
+
+    def get_ticket_key(self, key_id: bytes) -> AESGCM:
+        for ticket_key_id, _, ticket_key in self.ticket_keys:
+            if ticket_key_id == key_id:
+                return ticket_key
+        return None
+
+    def issue(self, client_id: int, session_key: bytes, now: float = None) -> bytes:
+        """
+        Issue resumption ticket for session established with Client
+
+        Parameters:
+            - client_id (int): Client's identificator
+            - session_key (bytes): Session key exchanged with Client
+            - now (float): Current time, taken from clock if not given
+
+        Returns:
+            - (bytes): Encrypted and authenticated ticket
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            if (
+                self.last_rotation is None
+                or now - self.last_rotation >= self.key_rotation_interval
+            ):
+                self.rotate_keys(now)
+            key_id, _, ticket_key = self.ticket_keys[0]
+
+        ticket_state = _TICKET_STATE_STRUCT.pack(
+            client_id,
+            now,
+            now + self.ticket_lifetime,
+            secrets.token_bytes(16),
+            derive_resumption_secret(session_key),
+        )
+        nonce = secrets.token_bytes(_NONCE_LENGTH)
+        associated_data = key_id + struct.pack("<q", client_id)
+
+        return key_id + nonce + ticket_key.encrypt(nonce, ticket_state, associated_data)
+
+    def redeem(self, client_id: int, ticket: bytes, now: float = None) -> bytes:
+        """
+        Verify ticket presented by Client and mark it as used
+
+        Parameters:
+            - client_id (int): Client's identificator the ticket must be bound to
+            - ticket (bytes): Ticket issued to Client
+            - now (float): Current time, taken from clock if not given
+
+        Returns:
+            - (bytes): Resumption secret of session the ticket was issued for
+        """
+        now = time.time() if now is None else now
+
+        key_id = ticket[:_KEY_ID_LENGTH]
+        nonce = ticket[_KEY_ID_LENGTH : _KEY_ID_LENGTH + _NONCE_LENGTH]
+        with self.lock:
+            ticket_key = self.get_ticket_key(key_id)
+        if ticket_key is None:
+            raise InvalidTicketError("Ticket key is unknown or was rotated out")
+
+        try:
+            ticket_state = ticket_key.decrypt(
+                nonce,
+                ticket[_KEY_ID_LENGTH + _NONCE_LENGTH :],
+                key_id + struct.pack("<q", client_id),
+            )
+        except InvalidTag:
+            raise InvalidTicketError("Ticket is not authentic or bound to another Client")
+
+        (
+            ticket_client_id,
+            issued_at,
+            expires_at,
+            ticket_id,
+            resumption_secret,
+        ) = _TICKET_STATE_STRUCT.unpack(ticket_state)
+
+        if ticket_client_id != client_id:
+            raise InvalidTicketError("Ticket is bound to another Client")
+        if expires_at <= now:
+            raise InvalidTicketError("Ticket has expired")
+        with self.lock:
+            redeemed = self.replay_cache.check_and_add(ticket_id, issued_at, expires_at, now)
+        if not redeemed:
+            raise InvalidTicketError("Ticket was already redeemed")
+
+        return resumption_secret
+
+
+class SharedSessionTicketIssuer(SessionTicketIssuer):
+    def __init__(
+        self,
+        keys_filepath: str,
+        redeemed_filepath: str,
+        file_lock,
+        ticket_lifetime: float = 3600.0,
+        key_rotation_interval: float = 3600.0,
+        max_ticket_keys: int = 3,
+        replay_cache_size: int = 100000,
+    ):
+        """
+        SharedSessionTicketIssuer class constructor, that returns issuer whose tickets can be redeemed by any of processes sharing its files
+
+        Ticket keys are stored in file, process creating the file generates the first key, so that processes forked
+        from it start with the same keys. Keys rotated or tickets redeemed by one process are read by others under file lock.
+
+        Parameters:
+            - keys_filepath (str): Path of ticket keys file
+            - redeemed_filepath (str): Path of redeemed tickets file
+            - file_lock (callable): Returns context manager holding lock shared by all processes, guards both files
+            - ticket_lifetime (float): Time in seconds for which ticket can be redeemed
+            - key_rotation_interval (float): Time in seconds after which new ticket encryption key is generated
+            - max_ticket_keys (int): Number of ticket keys kept, tickets encrypted with older keys are rejected
+            - replay_cache_size (int): Maximal number of remembered redeemed tickets
+
+        Returns:
+            - self (SharedSessionTicketIssuer): SharedSessionTicketIssuer class object
+        """
+        super().__init__(
+            ticket_lifetime=ticket_lifetime,
+            key_rotation_interval=key_rotation_interval,
+            max_ticket_keys=max_ticket_keys,
+            replay_cache_size=replay_cache_size,
+        )
+        self.keys_filepath = keys_filepath
+        self.file_lock = file_lock
+        self.replay_cache = SharedReplayCache(redeemed_filepath, file_lock, capacity=replay_cache_size)
+
+        with self.file_lock():
+            self.load_keys()
+            if not self.ticket_keys:
+                super().rotate_keys()
+                self.save_keys()
+
+    def load_keys(self) -> None:
+        try:
+            with open(self.keys_filepath, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        last_rotation, key_count = _TICKET_KEYS_HEADER_STRUCT.unpack_from(data)
+        ticket_keys = [
+            (key_id, key, AESGCM(key))
+            for key_id, key in _TICKET_KEY_STRUCT.iter_unpack(
+                data[_TICKET_KEYS_HEADER_STRUCT.size :][: key_count * _TICKET_KEY_STRUCT.size]
+            )
+        ]
+        max_ticket_keys = self.ticket_keys.maxlen
+        self.ticket_keys = deque(ticket_keys[:max_ticket_keys], maxlen=max_ticket_keys)
+        self.last_rotation = last_rotation
+
+    def save_keys(self) -> None:
+        data = _TICKET_KEYS_HEADER_STRUCT.pack(self.last_rotation, len(self.ticket_keys)) + b"".join(
+            _TICKET_KEY_STRUCT.pack(key_id, key) for key_id, key, _ in self.ticket_keys
+        )
+        replace_file(self.keys_filepath, data)
+
+    def rotate_keys(self, now: float = None) -> None:
+        now = time.time() if now is None else now
+        # Keys may already be rotated by another process
+        with self.file_lock():
+            self.load_keys()
+            if now - self.last_rotation >= self.key_rotation_interval:
+                super().rotate_keys(now)
+                self.save_keys()
+
+    def get_ticket_key(self, key_id: bytes) -> AESGCM:
+        ticket_key = super().get_ticket_key(key_id)
+        if ticket_key is None:
+            # Ticket may be encrypted with key generated by another process since keys were loaded
+            with self.file_lock():
+                self.load_keys()
+            ticket_key = super().get_ticket_key(key_id)
+        return ticket_key
+
+
+def run_tests():
+    print("Running session_tickets.py tests...")
+
+    session_key = secrets.token_bytes(32)
+    issuer = SessionTicketIssuer(ticket_lifetime=10, key_rotation_interval=5, max_ticket_keys=2)
+
+    # Ticket redeemed once gives resumption secret known to Client
+    ticket = issuer.issue(1, session_key, now=100)
+    resumption_secret = issuer.redeem(1, ticket, now=101)
+    assert resumption_secret == derive_resumption_secret(session_key)
+    nonce = secrets.token_bytes(16)
+    assert derive_resumed_session_key(resumption_secret, nonce) == derive_resumed_session_key(
+        derive_resumption_secret(session_key), nonce
+    )
+
+    def assert_rejected(client_id, ticket, now):
+        try:
+            issuer.redeem(client_id, ticket, now=now)
+            assert False
+        except InvalidTicketError:
+            pass
+
+    # Replay, binding and expiry
+    assert_rejected(1, ticket, now=102)
+    ticket = issuer.issue(1, session_key, now=102)
+    assert_rejected(2, ticket, now=103)
+    assert_rejected(1, ticket, now=113)
+    tampered_ticket = ticket[:-1] + bytes([ticket[-1] ^ 1])
+    assert_rejected(1, tampered_ticket, now=103)
+
+    # Rotated out ticket keys invalidate tickets
+    ticket = issuer.issue(1, session_key, now=104)
+    issuer.issue(1, session_key, now=110)
+    issuer.issue(1, session_key, now=116)
+    assert_rejected(1, ticket, now=105)
+
+    # Bounded replay cache never accepts replays of evicted tickets
+    replay_cache = ReplayCache(capacity=2)
+    assert replay_cache.check_and_add(b"a", 1, 100, now=2)
+    assert replay_cache.check_and_add(b"b", 2, 100, now=3)
+    assert replay_cache.check_and_add(b"c", 3, 100, now=4)
+    assert len(replay_cache) == 2
+    assert not replay_cache.check_and_add(b"a", 1, 100, now=5)
+
+    # Ticket redeemed by many threads at once is accepted exactly once, while other threads issue and rotate keys
+    issuer = SessionTicketIssuer(key_rotation_interval=0, max_ticket_keys=1000)
+    tickets = [issuer.issue(1, session_key) for _ in range(50)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+
+        def try_redeem(ticket):
+            try:
+                issuer.redeem(1, ticket)
+                return True
+            except InvalidTicketError:
+                return False
+
+        issued = [executor.submit(issuer.issue, 1, session_key) for _ in range(200)]
+        redeemed = list(executor.map(try_redeem, tickets * 8))
+        issued = [future.result() for future in issued]
+    assert sum(redeemed) == len(tickets)
+    assert all(try_redeem(ticket) for ticket in issued)
+
+    # Issuers of processes sharing files accept each other's tickets once
+    db_path = "./session_tickets_test_db/"
+    shutil.rmtree(db_path, ignore_errors=True)
+    os.makedirs(db_path)
+    file_lock = threading.Lock()
+
+    def create_shared_issuer():
+        return SharedSessionTicketIssuer(
+            f"{db_path}ticket_keys",
+            f"{db_path}redeemed_tickets",
+            lambda: file_lock,
+            ticket_lifetime=10,
+            key_rotation_interval=5,
+            max_ticket_keys=2,
+            replay_cache_size=2,
+        )
+
+    issuer, other_issuer = create_shared_issuer(), create_shared_issuer()
+    assert [key_id for key_id, _, _ in issuer.ticket_keys] == [
+        key_id for key_id, _, _ in other_issuer.ticket_keys
+    ]
+    now = issuer.last_rotation
+    ticket = issuer.issue(1, session_key, now=now)
+    assert other_issuer.redeem(1, ticket, now=now + 1) == derive_resumption_secret(session_key)
+    try:
+        issuer.redeem(1, ticket, now=now + 1)
+        assert False
+    except InvalidTicketError:
+        pass
+
+    # Key rotated by one process is used by other processes
+    ticket = issuer.issue(1, session_key, now=now + 6)
+    assert len(issuer.ticket_keys) == 2
+    other_issuer.redeem(1, ticket, now=now + 7)
+    other_issuer.issue(1, session_key, now=now + 8)
+    assert len(other_issuer.ticket_keys) == 2
+
+    # Redeemed tickets file is compacted, tickets redeemed before compaction stay rejected
+    tickets = [issuer.issue(1, session_key, now=now + 8 + ticket_number / 10) for ticket_number in range(6)]
+    for ticket_number, ticket in enumerate(tickets):
+        (issuer, other_issuer)[ticket_number % 2].redeem(1, ticket, now=now + 9)
+    assert os.path.getsize(f"{db_path}redeemed_tickets") <= _REPLAY_HEADER_STRUCT.size + 4 * _REPLAY_RECORD_STRUCT.size
+    for ticket in tickets:
+        for shared_issuer in (issuer, other_issuer, create_shared_issuer()):
+            try:
+                shared_issuer.redeem(1, ticket, now=now + 9)
+                assert False
+            except InvalidTicketError:
+                pass
+    shutil.rmtree(db_path)
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
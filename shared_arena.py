@@ -0,0 +1,281 @@
+import time
+import pickle
+import random
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+# Offsets of buffers in arena are aligned, so that fixed-width arrays can be viewed by NumPy directly
+ALIGNMENT = 8
+
+# Arenas attached by worker process, by name
+_ATTACHED_ARENAS = {}
+
+# Maximal number of objects decoded from arena buffers kept by worker process
+DECODED_CACHE_SIZE = 256
+
+# Objects decoded by worker process, by descriptor of their buffer, least recently used first
+_DECODED_OBJECTS = OrderedDict()
+
+
+class SharedArena:
+    def __init__(self, size: int = None, name: str = None):
+        """
+        SharedArena class constructor, that returns shared memory block buffers are appended to and read from by worker processes
+
+        Buffers are written once by creating process and read without copy by workers, that receive only
+        small descriptors (arena name, offset, length) instead of pickled objects.
+
+        Parameters:
+            - size (int): Size in bytes of created arena
+            - name (str): Name of existing arena to attach to instead of creating new one
+
+        Returns:
+            - self (SharedArena): SharedArena class object
+        """
+        if name is None:
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            # Worker processes share resource tracker of process that started them, so arena is unlinked only by its owner
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+        self.name = self.shared_memory.name
+        self.size = self.shared_memory.size
+        self.used = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if self.owner:
+            self.unlink()
+        return False
+
+    def put(self, data) -> tuple:
+        """
+        Copy buffer into arena
+
+        Parameters:
+            - data (bytes | memoryview): Buffer, e.g. returned by to_buffer() of GroupPoly, FuzzyVault or PreprocessedTemplate
+
+        Returns:
+            - (tuple): Descriptor of buffer, arena name, offset and length
+        """
+        if not self.owner:
+            raise ValueError("Buffers can be put only into arena created by this process")
+
+        offset = -(-self.used // ALIGNMENT) * ALIGNMENT
+        if offset + len(data) > self.size:
+            raise ValueError(
+                f"Shared arena of {self.size} bytes cannot fit {len(data)} more bytes after {offset} used"
+            )
+        self.shared_memory.buf[offset : offset + len(data)] = data
+        self.used = offset + len(data)
+        return (self.name, offset, len(data))
+
+    def view(self, descriptor: tuple) -> memoryview:
+        name, offset, length = descriptor
+        if name != self.name:
+            raise ValueError(f"Descriptor of arena {name} used with arena {self.name}")
+        return self.shared_memory.buf[offset : offset + length]
+
+    def close(self) -> None:
+        self.shared_memory.close()
+
+    def unlink(self) -> None:
+        self.shared_memory.unlink()
+
+
+def get_buffer(descriptor: tuple) -> memoryview:
+    """
+    View of buffer in shared arena, arena is attached on first use and kept for following tasks of the process
+
+    Parameters:
+        - descriptor (tuple): Descriptor returned by SharedArena.put()
+
+    Returns:
+        - (memoryview): Zero-copy view of buffer
+    """
+    name = descriptor[0]
+    arena = _ATTACHED_ARENAS.get(name)
+    if arena is None:
+        arena = _ATTACHED_ARENAS[name] = SharedArena(name=name)
+    return arena.view(descriptor)
+
+
+def get_decoded(descriptor: tuple, from_buffer):
+    """
+    Object decoded from buffer in shared arena, decoded once and kept for following tasks of the process
+
+    Buffers are never changed once put into arena, so that decoded object stays valid as long as arena exists.
+
+    Parameters:
+        - descriptor (tuple): Descriptor returned by SharedArena.put()
+        - from_buffer (callable): Decoder of buffer, e.g. FuzzyVault.from_buffer
+
+    Returns:
+        - Decoded object shared by all tasks of the process, must not be modified
+    """
+    key = (descriptor, from_buffer)
+    decoded = _DECODED_OBJECTS.get(key)
+    if decoded is None:
+        decoded = _DECODED_OBJECTS[key] = from_buffer(get_buffer(descriptor))
+        while len(_DECODED_OBJECTS) > DECODED_CACHE_SIZE:
+            _DECODED_OBJECTS.popitem(last=False)
+    else:
+        _DECODED_OBJECTS.move_to_end(key)
+    return decoded
+
+
+def unlock_task(
+    vault_descriptor: tuple,
+    template_descriptor: tuple,
+    verify_threshold: int,
+    number_of_unlocking_rounds: int,
+    seed: int,
+) -> tuple:
+    """
+    Worker task unlocking vault read from shared arena with verification template preprocessed by submitting process
+
+    Parameters:
+        - vault_descriptor (tuple): Descriptor of FuzzyVault buffer
+        - template_descriptor (tuple): Descriptor of PreprocessedTemplate buffer
+        - verify_threshold (int): Verification threshold of vault
+        - number_of_unlocking_rounds (int): Number of secret polynomial recovery rounds to perform
+        - seed (int): Seed of combinations drawn by the task
+
+    Returns:
+        - (tuple): Coefficients of recovered secret polynomial and its votes
+    """
+    from fuzzy_vault import FuzzyVault
+    from interpolation import PreprocessedTemplate
+
+    # Tasks of the same vault and template decode them once per worker process
+    fuzzy_vault = get_decoded(vault_descriptor, FuzzyVault.from_buffer)
+    template = get_decoded(template_descriptor, PreprocessedTemplate.from_buffer)
+
+    random.seed(seed)
+    secret_polynomial = fuzzy_vault.unlock(
+        verify_threshold,
+        number_of_unlocking_rounds,
+        preprocessed_templates=[template],
+    )
+    return (secret_polynomial.coef.tolist(), fuzzy_vault.unlock_stats["votes"])
+
+
+def unlock_task_pickled(
+    fuzzy_vault, bio_template: list, verify_threshold: int, number_of_unlocking_rounds: int, seed: int
+) -> tuple:
+    random.seed(seed)
+    fuzzy_vault.bio_template = bio_template
+    secret_polynomial = fuzzy_vault.unlock(verify_threshold, number_of_unlocking_rounds)
+    return (secret_polynomial.coef.tolist(), fuzzy_vault.unlock_stats["votes"])
+
+
+def run_tests():
+    print("Running shared_arena.py tests...")
+
+    from fuzzy_vault import FuzzyVault
+    from group_poly import GroupPoly
+    from interpolation import PreprocessedTemplate
+    from profile_format import pack_integer, pack_integers, unpack_integer, unpack_integers
+
+    prime = 2147483647
+    rng = random.Random(0)
+
+    packed = pack_integers([0, 1, 2**70 + 5]) + pack_integer(prime)
+    values, offset = unpack_integers(packed, 0)
+    assert values == [0, 1, 2**70 + 5]
+    assert unpack_integer(memoryview(packed), offset) == (prime, len(packed))
+
+    # Buffers round trip and are much smaller than pickled objects
+    enrol_template = rng.sample(range(1, prime), 44)
+    secret_polynomial = FuzzyVault.generate_secret_polynomial(prime, 8)
+    fuzzy_vault = FuzzyVault(group_order=prime, bio_template=enrol_template)
+    fuzzy_vault.lock(secret_polynomial)
+    assert GroupPoly.from_buffer(secret_polynomial.to_buffer()) == secret_polynomial
+    restored_vault = FuzzyVault.from_buffer(fuzzy_vault.to_buffer())
+    assert restored_vault.vault_polynomial == fuzzy_vault.vault_polynomial
+    assert restored_vault.bio_template == enrol_template
+    assert not hasattr(FuzzyVault.from_buffer(FuzzyVault(prime, [3, 1]).to_buffer()), "vault_polynomial")
+    assert len(fuzzy_vault.to_buffer()) < len(pickle.dumps(fuzzy_vault)) / 2
+
+    capture = enrol_template[:30] + rng.sample(range(1, prime), 14)
+    template = PreprocessedTemplate(capture + capture[:3], prime)
+    restored_template = PreprocessedTemplate.from_buffer(template.to_buffer())
+    assert restored_template.values == template.values
+    assert restored_template.duplicates == 3
+    assert restored_template.inverse_differences == template.inverse_differences
+
+    try:
+        GroupPoly.from_buffer(fuzzy_vault.to_buffer())
+        assert False
+    except ValueError:
+        pass
+
+    # Workers read vault and precomputed table from arena, only descriptors are pickled
+    tasks = 32
+    rounds = 200
+    with SharedArena(size=1 << 20) as arena:
+        vault_descriptor = arena.put(fuzzy_vault.to_buffer())
+        template_descriptor = arena.put(template.to_buffer())
+        assert bytes(arena.view(vault_descriptor)) == fuzzy_vault.to_buffer()
+        assert template_descriptor[1] % ALIGNMENT == 0
+        task_arguments = (vault_descriptor, template_descriptor, 8, rounds, 0)
+        print(
+            f"Task arguments: {len(pickle.dumps(task_arguments))} B with shared arena, "
+            f"{len(pickle.dumps((fuzzy_vault, capture, 8, rounds, 0)))} B pickled"
+        )
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            # Workers are started before timing, so that neither variant pays for process startup
+            list(executor.map(unlock_task_pickled, [fuzzy_vault] * 2, [capture] * 2, [8] * 2, [1] * 2, range(2)))
+
+            s = time.perf_counter()
+            results = list(
+                executor.map(
+                    unlock_task,
+                    [vault_descriptor] * tasks,
+                    [template_descriptor] * tasks,
+                    [8] * tasks,
+                    [rounds] * tasks,
+                    range(tasks),
+                )
+            )
+            shared_time = time.perf_counter() - s
+
+            s = time.perf_counter()
+            pickled_results = list(
+                executor.map(
+                    unlock_task_pickled,
+                    [fuzzy_vault] * tasks,
+                    [capture] * tasks,
+                    [8] * tasks,
+                    [rounds] * tasks,
+                    range(tasks),
+                )
+            )
+            pickled_time = time.perf_counter() - s
+
+        assert all(coefs == secret_polynomial.coef.tolist() for coefs, votes in results)
+        assert results == pickled_results
+        print(f"{tasks} unlock tasks: {shared_time:.2f} s with shared arena, {pickled_time:.2f} s pickled")
+
+        try:
+            arena.put(bytes(arena.size))
+            assert False
+        except ValueError:
+            pass
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import os
+import sys
+import json
+import random
+import argparse
+import itertools
+from math import comb
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from time import perf_counter as pc
+
+from fuzzy_vault import FuzzyVault
+
+# Names of swept parameters in order of grid expansion
+GRID_PARAMETERS = (
+    "prime",
+    "bio_template_length",
+    "verify_threshold",
+    "number_of_unlocking_rounds",
+    "correct_samples",
+)
+
+
+def expand_grid(grid: dict) -> list:
+    """
+    Expand parameter grid into list of sweep points, skipping impossible combinations
+
+    Parameters:
+        - grid (dict): List of values for every name in GRID_PARAMETERS
+
+    Returns:
+        - points (list): Dicts with single value of every parameter
+    """
+    points = []
+    for values in itertools.product(*(grid[name] for name in GRID_PARAMETERS)):
+        point = dict(zip(GRID_PARAMETERS, values))
+        if point["correct_samples"] > point["bio_template_length"]:
+            continue
+        if point["verify_threshold"] > point["bio_template_length"]:
+            continue
+        points.append(point)
+    return points
+
+
+def point_key(point: dict) -> str:
+    return ",".join(f"{name}={point[name]}" for name in GRID_PARAMETERS)
+
+
+def run_trial(point: dict, trial: int, seed: int = 0) -> dict:
+    """
+    Run single unlock-only trial of sweep point, without RSA key generation and disk I/O
+
+    Parameters:
+        - point (dict): Sweep point parameters
+        - trial (int): Trial number of sweep point
+        - seed (int): Base seed of sweep, templates of trial depend only on seed, point and trial number
+
+    Returns:
+        - (dict): Trial result with 'success', 'reason', 'rounds_used' and timings
+    """
+    rng = random.Random(f"{seed}:{point_key(point)}:{trial}")
+    prime = point["prime"]
+    bio_template_length = point["bio_template_length"]
+    verify_threshold = point["verify_threshold"]
+    correct_samples = point["correct_samples"]
+
+    # Unique combinations of template indices are drawn, there cannot be more rounds than combinations
+    number_of_unlocking_rounds = min(
+        point["number_of_unlocking_rounds"], comb(bio_template_length, verify_threshold)
+    )
+
+    result = dict(
+        point,
+        trial=trial,
+        success=False,
+        reason=None,
+        rounds_used=None,
+        rounds=number_of_unlocking_rounds,
+    )
+
+    try:
+        enrol_template = [rng.randint(1, prime - 1) for i in range(bio_template_length)]
+        secret_polynomial = FuzzyVault.generate_secret_polynomial(
+            group_order=prime, sec_poly_deg=verify_threshold
+        )
+
+        s = pc()
+        fuzzy_vault = FuzzyVault(group_order=prime, bio_template=enrol_template)
+        fuzzy_vault.lock(secret_polynomial=secret_polynomial)
+        result["lock_time"] = pc() - s
+
+        verification_template = enrol_template[:correct_samples] + [
+            rng.randint(1, prime - 1) for i in range(bio_template_length - correct_samples)
+        ]
+        rng.shuffle(verification_template)
+        fuzzy_vault.bio_template = verification_template
+
+        # Unlocking draws index combinations from global generator
+        random.seed(rng.random())
+        s = pc()
+        recovered_secret_polynomial = fuzzy_vault.unlock(
+            verify_threshold=verify_threshold,
+            number_of_unlocking_rounds=number_of_unlocking_rounds,
+        )
+        result["unlock_time"] = pc() - s
+    except Exception as err:
+        result["reason"] = f"{type(err).__name__}: {err}"
+        return result
+
+    result["rounds_used"] = fuzzy_vault.unlock_stats["first_round"]
+    result["votes"] = fuzzy_vault.unlock_stats["votes"]
+    result["success"] = recovered_secret_polynomial == secret_polynomial
+    if not result["success"]:
+        result["reason"] = "wrong_polynomial"
+
+    return result
+
+
+def load_checkpoint(checkpoint_filepath: str) -> list:
+    """
+    Read results of already finished trials, truncating partially written last line of interrupted sweep
+
+    Parameters:
+        - checkpoint_filepath (str): Path of JSON Lines checkpoint
+
+    Returns:
+        - results (list): Trial results
+    """
+    results = []
+    if checkpoint_filepath is None or not os.path.exists(checkpoint_filepath):
+        return results
+
+    valid_length = 0
+    with open(checkpoint_filepath, "rb") as f:
+        for line in f:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                break
+            valid_length += len(line)
+
+    with open(checkpoint_filepath, "r+b") as f:
+        f.truncate(valid_length)
+
+    return results
+
+
+class Sweep:
+    def __init__(
+        self,
+        grid: dict,
+        trials: int = 25,
+        workers: int = None,
+        checkpoint_filepath: str = None,
+        seed: int = 0,
+        max_in_flight: int = None,
+    ):
+        """
+        Sweep class constructor, that returns parallel, resumable parameter sweep of unlocking accuracy and speed
+
+        Parameters:
+            - grid (dict): List of values for every name in GRID_PARAMETERS
+            - trials (int): Number of trials of every sweep point
+            - workers (int): Number of worker processes, defaults to number of CPU cores
+            - checkpoint_filepath (str): Path of JSON Lines file results are appended to, sweep resumes from it
+            - seed (int): Base seed of sweep
+            - max_in_flight (int): Maximal number of submitted unfinished trials
+
+        Returns:
+            - self (Sweep): Sweep class object
+        """
+        self.points = expand_grid(grid)
+        self.trials = trials
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpoint_filepath = checkpoint_filepath
+        self.seed = seed
+        self.max_in_flight = max_in_flight or 4 * self.workers
+
+    def pending_trials(self, finished_results: list) -> list:
+        finished = {
+            (point_key(result), result["trial"]) for result in finished_results
+        }
+        return [
+            (point, trial)
+            for point in self.points
+            for trial in range(self.trials)
+            if (point_key(point), trial) not in finished
+        ]
+
+    def run(self, progress: bool = False) -> list:
+        """
+        Run all trials not finished yet, appending every result to checkpoint as soon as it is ready
+
+        Parameters:
+            - progress (bool): Whether to print progress
+
+        Returns:
+            - results (list): Results of all trials, including ones loaded from checkpoint
+        """
+        results = load_checkpoint(self.checkpoint_filepath)
+        pending = iter(self.pending_trials(results))
+        total = len(self.points) * self.trials
+
+        checkpoint = (
+            open(self.checkpoint_filepath, "at")
+            if self.checkpoint_filepath is not None
+            else None
+        )
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = set()
+                while True:
+                    for point, trial in itertools.islice(
+                        pending, self.max_in_flight - len(futures)
+                    ):
+                        futures.add(executor.submit(run_trial, point, trial, self.seed))
+                    if not futures:
+                        break
+
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        results.append(result)
+                        if checkpoint is not None:
+                            checkpoint.write(json.dumps(result) + "\n")
+                            checkpoint.flush()
+                    if progress:
+                        print(f"{len(results)}/{total} trials finished", end="\r")
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+        if progress:
+            print()
+        return results
+
+
+def summarize(results: list) -> list:
+    """
+    Aggregate trial results per sweep point
+
+    Parameters:
+        - results (list): Trial results
+
+    Returns:
+        - summary (list): Dicts with point parameters, success and failure counts, mean timings, mean rounds used and failure reasons
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault(point_key(result), []).append(result)
+
+    summary = []
+    for group in groups.values():
+        successes = [result for result in group if result["success"]]
+        unlock_times = [result["unlock_time"] for result in group if "unlock_time" in result]
+        reasons = {}
+        for result in group:
+            if result["reason"] is not None:
+                reasons[result["reason"]] = reasons.get(result["reason"], 0) + 1
+
+        summary.append(
+            dict(
+                {name: group[0][name] for name in GRID_PARAMETERS},
+                success=len(successes),
+                failure=len(group) - len(successes),
+                total=len(group),
+                mean_unlock_time=sum(unlock_times) / len(unlock_times) if unlock_times else None,
+                mean_rounds_used=(
+                    sum(result["rounds_used"] for result in successes) / len(successes)
+                    if successes
+                    else None
+                ),
+                reasons=reasons,
+            )
+        )
+
+    return sorted(summary, key=lambda entry: [entry[name] for name in GRID_PARAMETERS])
+
+
+def parse_values(text: str) -> list:
+    """
+    Parse comma separated values and inclusive 'start:end' ranges of integers
+
+    Parameters:
+        - text (str): Values, e.g. '8:44' or '5,50,500'
+
+    Returns:
+        - (list): Integer values
+    """
+    values = []
+    for part in text.split(","):
+        if ":" in part:
+            start, end = part.split(":")
+            values += list(range(int(start), int(end) + 1))
+        else:
+            values.append(int(part))
+    return values
+
+
+def run_tests():
+    print("Running sweep.py tests...")
+
+    checkpoint_filepath = "./sweep_test.jsonl"
+    if os.path.exists(checkpoint_filepath):
+        os.remove(checkpoint_filepath)
+
+    grid = {
+        "prime": [12401],
+        "bio_template_length": [12],
+        "verify_threshold": [4],
+        "number_of_unlocking_rounds": [50],
+        "correct_samples": [2, 12, 13],
+    }
+    assert len(expand_grid(grid)) == 2
+
+    # Same seed gives same templates
+    point = expand_grid(grid)[1]
+    assert run_trial(point, 0)["success"] and run_trial(point, 0)["rounds_used"] == 1
+
+    sweep = Sweep(grid, trials=3, workers=2, checkpoint_filepath=checkpoint_filepath)
+    results = sweep.run()
+    assert len(results) == 6
+
+    # Interrupted sweep resumes from checkpoint
+    with open(checkpoint_filepath, "rt") as f:
+        lines = f.readlines()
+    with open(checkpoint_filepath, "wt") as f:
+        f.writelines(lines[:4])
+        f.write(lines[4][:10])
+    results = Sweep(grid, trials=3, workers=2, checkpoint_filepath=checkpoint_filepath).run()
+    assert len(results) == 6
+    assert len(load_checkpoint(checkpoint_filepath)) == 6
+
+    summary = {entry["correct_samples"]: entry for entry in summarize(results)}
+    assert summary[12]["success"] == 3
+    assert summary[2]["success"] == 0 and summary[2]["reasons"]["wrong_polynomial"] == 3
+
+    os.remove(checkpoint_filepath)
+
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    parser = argparse.ArgumentParser(description="Parallel, resumable parameter sweep of vault unlocking")
+    parser.add_argument("--primes", default="2147483647")
+    parser.add_argument("--template-lengths", default="44")
+    parser.add_argument("--thresholds", default="8")
+    parser.add_argument("--rounds", default="5000")
+    parser.add_argument("--correct-samples", default="8:44")
+    parser.add_argument("--trials", type=int, default=25)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint", default="sweep.jsonl", help="JSON Lines results, sweep resumes from it")
+    parser.add_argument("--summary", default=None, help="JSON file to store per-point summary in")
+    args = parser.parse_args()
+
+    grid = {
+        "prime": parse_values(args.primes),
+        "bio_template_length": parse_values(args.template_lengths),
+        "verify_threshold": parse_values(args.thresholds),
+        "number_of_unlocking_rounds": parse_values(args.rounds),
+        "correct_samples": parse_values(args.correct_samples),
+    }
+    sweep = Sweep(
+        grid,
+        trials=args.trials,
+        workers=args.workers,
+        checkpoint_filepath=args.checkpoint,
+        seed=args.seed,
+    )
+    summary = summarize(sweep.run(progress=True))
+
+    for entry in summary:
+        print(
+            f"{point_key(entry)}: {entry['success']}/{entry['total']} successful"
+            + (f", failures: {entry['reasons']}" if entry["reasons"] else "")
+        )
+    if args.summary is not None:
+        with open(args.summary, "wt") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import json
+import heapq
+import random
+import hashlib
+
+# Size in bytes of candidate digests, collisions among at most millions of candidates are negligible
+DIGEST_SIZE = 16
+
+
+def candidate_digest(coefs: list, group_order: int) -> bytes:
+    """
+    Compact binary key of secret polynomial candidate
+
+    Parameters:
+        - coefs (list): Coefficients of candidate reduced modulo group order
+        - group_order (int): Order of group coefficients belong to
+
+    Returns:
+        - (bytes): BLAKE2b digest of fixed-width little-endian coefficients
+    """
+    width = (group_order.bit_length() + 7) // 8
+    return hashlib.blake2b(
+        b"".join(int(coef).to_bytes(width, "little") for coef in coefs),
+        digest_size=DIGEST_SIZE,
+    ).digest()
+
+
+class ExactTally:
+    def __init__(self):
+        """
+        ExactTally class constructor, that returns vote count of every recovered candidate
+
+        Parameters:
+            - None
+
+        Returns:
+            - self (ExactTally): ExactTally class object
+        """
+        # Digest -> [votes, first round, coefficients]
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def distinct_candidates(self) -> int:
+        return len(self.entries)
+
+    def add(self, digest: bytes, coefs: tuple, round_number: int) -> int:
+        entry = self.entries.get(digest)
+        if entry is None:
+            self.entries[digest] = [1, round_number, coefs]
+            return 1
+        entry[0] += 1
+        if entry[2] is None:
+            entry[2] = coefs
+        return entry[0]
+
+    def winner(self) -> tuple:
+        """
+        Candidate with most votes, ties are won by candidate recovered first
+
+        Parameters:
+            - None
+
+        Returns:
+            - (tuple): Coefficients, votes and first round of winning candidate, None if nothing was added;
+              coefficients are None if tally was restored without them and candidate was not recovered since
+        """
+        if not self.entries:
+            return None
+        votes, first_round, coefs = max(
+            self.entries.values(), key=lambda entry: (entry[0], -entry[1])
+        )
+        return (coefs, votes, first_round)
+
+    def guaranteed_votes(self, digest: bytes = None) -> int:
+        """
+        Votes candidate is guaranteed to have, which are exact votes of ExactTally
+
+        Parameters:
+            - digest (bytes): Digest of candidate, winner if not given
+
+        Returns:
+            - (int): Guaranteed votes of candidate, 0 if it is not tracked
+        """
+        if digest is None:
+            winner = self.winner()
+            return 0 if winner is None else winner[1]
+        entry = self.entries.get(digest)
+        return 0 if entry is None else entry[0]
+
+    def to_dict(self, include_coefs: bool = True) -> dict:
+        return {
+            "type": "exact",
+            "entries": [
+                [digest.hex(), votes, first_round, list(coefs) if include_coefs and coefs is not None else None]
+                for digest, (votes, first_round, coefs) in self.entries.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, tally_dict: dict):
+        tally = cls()
+        for digest_hex, votes, first_round, coefs in tally_dict["entries"]:
+            tally.entries[bytes.fromhex(digest_hex)] = [
+                votes,
+                first_round,
+                None if coefs is None else tuple(coefs),
+            ]
+        return tally
+
+
+class SpaceSavingTally:
+    def __init__(self, capacity: int):
+        """
+        SpaceSavingTally class constructor, that returns Space-Saving heavy hitters sketch tracking at most 'capacity' candidates
+
+        Any candidate with more than n / capacity of n votes is guaranteed to be tracked, so clear majority winner
+        is the same as with ExactTally. Votes of candidates evicted and added again are overestimated by at most their 'error'.
+
+        Parameters:
+            - capacity (int): Maximal number of tracked candidates
+
+        Returns:
+            - self (SpaceSavingTally): SpaceSavingTally class object
+        """
+        if capacity < 1:
+            raise ValueError(f"Tally capacity must be positive, got {capacity}")
+        self.capacity = capacity
+
+        # Digest -> [votes, first round, coefficients, error]
+        self.entries = {}
+        # Min-heap of (votes, first round, digest), entries with outdated votes are skipped and periodically dropped
+        self.heap = []
+        self.evictions = 0
+        self.distinct_candidates = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, digest: bytes, entry: list) -> None:
+        heapq.heappush(self.heap, (entry[0], entry[1], digest))
+
+        # Rebuild heap from live entries, so that its size stays proportional to capacity
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [
+                (entry[0], entry[1], digest) for digest, entry in self.entries.items()
+            ]
+            heapq.heapify(self.heap)
+
+    def pop_min(self) -> tuple:
+        while True:
+            votes, first_round, digest = heapq.heappop(self.heap)
+            entry = self.entries.get(digest)
+            if entry is not None and entry[0] == votes and entry[1] == first_round:
+                del self.entries[digest]
+                return (digest, entry)
+
+    def add(self, digest: bytes, coefs: tuple, round_number: int) -> int:
+        entry = self.entries.get(digest)
+        if entry is not None:
+            entry[0] += 1
+            if entry[2] is None:
+                entry[2] = coefs
+            self.push(digest, entry)
+            return entry[0]
+
+        self.distinct_candidates += 1
+        if len(self.entries) < self.capacity:
+            entry = [1, round_number, coefs, 0]
+        else:
+            # Candidate replaces least voted one and inherits its votes as error bound
+            _, evicted_entry = self.pop_min()
+            self.evictions += 1
+            entry = [evicted_entry[0] + 1, round_number, coefs, evicted_entry[0]]
+        self.entries[digest] = entry
+        self.push(digest, entry)
+        return entry[0]
+
+    def winner(self) -> tuple:
+        """
+        Tracked candidate with most votes, ties are won by candidate tracked first
+
+        Parameters:
+            - None
+
+        Returns:
+            - (tuple): Coefficients, votes and first round of winning candidate, None if nothing was added;
+              coefficients are None if tally was restored without them and candidate was not recovered since
+        """
+        if not self.entries:
+            return None
+        votes, first_round, coefs, error = max(
+            self.entries.values(), key=lambda entry: (entry[0], -entry[1])
+        )
+        return (coefs, votes, first_round)
+
+    def guaranteed_votes(self, digest: bytes = None) -> int:
+        """
+        Votes candidate is guaranteed to have, its reported votes lowered by votes inherited on eviction
+
+        Reported votes of candidate that replaced evicted one are overestimated, so that even candidate recovered once
+        may report several votes; decisions about unlocking must be taken on guaranteed votes instead.
+
+        Parameters:
+            - digest (bytes): Digest of candidate, winner if not given
+
+        Returns:
+            - (int): Guaranteed votes of candidate, 0 if it is not tracked
+        """
+        if digest is None:
+            if not self.entries:
+                return 0
+            entry = max(self.entries.values(), key=lambda entry: (entry[0], -entry[1]))
+        else:
+            entry = self.entries.get(digest)
+            if entry is None:
+                return 0
+        return entry[0] - entry[3]
+
+    def to_dict(self, include_coefs: bool = True) -> dict:
+        return {
+            "type": "space_saving",
+            "capacity": self.capacity,
+            "evictions": self.evictions,
+            "distinct_candidates": self.distinct_candidates,
+            "entries": [
+                [
+                    digest.hex(),
+                    votes,
+                    first_round,
+                    list(coefs) if include_coefs and coefs is not None else None,
+                    error,
+                ]
+                for digest, (votes, first_round, coefs, error) in self.entries.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, tally_dict: dict):
+        tally = cls(tally_dict["capacity"])
+        tally.evictions = tally_dict["evictions"]
+        tally.distinct_candidates = tally_dict["distinct_candidates"]
+        for digest_hex, votes, first_round, coefs, error in tally_dict["entries"]:
+            tally.entries[bytes.fromhex(digest_hex)] = [
+                votes,
+                first_round,
+                None if coefs is None else tuple(coefs),
+                error,
+            ]
+        tally.heap = [
+            (entry[0], entry[1], digest) for digest, entry in tally.entries.items()
+        ]
+        heapq.heapify(tally.heap)
+        return tally
+
+
+def create_tally(capacity: int = None):
+    """
+    Create tally of unlocking candidates
+
+    Parameters:
+        - capacity (int): Maximal number of tracked candidates, exact unbounded tally is used if not given
+
+    Returns:
+        - (ExactTally | SpaceSavingTally): Empty tally
+    """
+    if capacity is None:
+        return ExactTally()
+    return SpaceSavingTally(capacity)
+
+
+def tally_from_dict(tally_dict: dict):
+    """
+    Restore tally saved with to_dict()
+
+    Parameters:
+        - tally_dict (dict): Tally as JSON-serializable dict
+
+    Returns:
+        - (ExactTally | SpaceSavingTally): Restored tally
+    """
+    if tally_dict["type"] == "exact":
+        return ExactTally.from_dict(tally_dict)
+    if tally_dict["type"] == "space_saving":
+        return SpaceSavingTally.from_dict(tally_dict)
+    raise ValueError(f"Unknown tally type: {tally_dict['type']}")
+
+
+def run_tests():
+    print("Running tally.py tests...")
+
+    prime = 2147483647
+    rng = random.Random(0)
+    assert candidate_digest([1, 2], prime) != candidate_digest([2, 1], prime)
+    assert candidate_digest([1, 2], prime) != candidate_digest([1, 2, 0], prime)
+
+    # Noisy stream, true winner holds a clear plurality among mostly distinct candidates
+    winner_coefs = (7, 7, 7)
+    stream = []
+    for round_number in range(1, 20001):
+        if rng.random() < 0.05:
+            coefs = winner_coefs
+        else:
+            coefs = tuple(rng.randrange(prime) for i in range(3))
+        stream.append((candidate_digest(coefs, prime), coefs, round_number))
+
+    exact_tally = ExactTally()
+    bounded_tally = SpaceSavingTally(capacity=64)
+    for digest, coefs, round_number in stream:
+        exact_tally.add(digest, coefs, round_number)
+        bounded_tally.add(digest, coefs, round_number)
+
+    assert exact_tally.winner()[0] == bounded_tally.winner()[0] == winner_coefs
+    assert len(bounded_tally) == 64 and len(bounded_tally.heap) <= 4 * 64
+    assert bounded_tally.winner()[1] >= exact_tally.winner()[1]
+
+    # Restored tallies continue counting where saved ones stopped
+    for tally in (exact_tally, bounded_tally):
+        restored_tally = tally_from_dict(json.loads(json.dumps(tally.to_dict())))
+        assert restored_tally.winner() == tally.winner()
+        assert restored_tally.distinct_candidates == tally.distinct_candidates
+        digest = candidate_digest(winner_coefs, prime)
+        assert restored_tally.add(digest, winner_coefs, 20001) == tally.winner()[1] + 1
+        assert restored_tally.winner()[1] == tally.winner()[1] + 1
+
+        # Tally restored without coefficients learns them again when candidate is recovered
+        restored_tally = tally_from_dict(json.loads(json.dumps(tally.to_dict(include_coefs=False))))
+        assert restored_tally.winner()[0] is None
+        assert restored_tally.winner()[1:] == tally.winner()[1:]
+        restored_tally.add(digest, winner_coefs, 20001)
+        assert restored_tally.winner()[0] == winner_coefs
+    print(
+        f"Exact tally tracked {len(exact_tally)} candidates, bounded tally {len(bounded_tally)} "
+        f"with {bounded_tally.evictions} evictions"
+    )
+
+    # Majority winner keeps exact votes and first round when it is never evicted
+    bounded_tally = SpaceSavingTally(capacity=2)
+    for round_number, coefs in enumerate([(1,), (1,), (2,), (3,), (1,), (4,), (1,)], start=1):
+        bounded_tally.add(candidate_digest(coefs, prime), coefs, round_number)
+    assert bounded_tally.winner() == ((1,), 4, 1)
+    assert bounded_tally.guaranteed_votes() == 4
+
+    # Candidate recovered once after eviction reports inherited votes, but is guaranteed single one
+    bounded_tally = SpaceSavingTally(capacity=2)
+    for round_number, coefs in enumerate([(1,), (2,), (2,), (3,)], start=1):
+        votes = bounded_tally.add(candidate_digest(coefs, prime), coefs, round_number)
+    assert votes == 2
+    assert bounded_tally.guaranteed_votes(candidate_digest((3,), prime)) == 1
+    assert bounded_tally.guaranteed_votes(candidate_digest((1,), prime)) == 0
+    assert exact_tally.guaranteed_votes() == exact_tally.winner()[1]
+
+    try:
+        SpaceSavingTally(0)
+        assert False
+    except ValueError:
+        pass
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
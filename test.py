@@ -1,79 +1,261 @@
 import os
-from main import execute_BRAKE
+import random
 from time import perf_counter as pc
 
 def test_time(test_result_directory):
-    test_correct_samples_filepath = f"test_time.csv"
+    from benchmark import Benchmark
+    from fuzzy_vault import FuzzyVault
 
+    test_time_filepath = f"test_time.csv"
+
+    PRIME = 2147483647
+    VERIFY_THRESHOLD = 8
+    BIO_TEMPLATE_LENGTH = 44
     CORRECT_SAMPLES = 44
-    TEST_CLIENT_PROFILE_FILEPATH = "./server_db/1.json"
     TESTS_FOR_NUMBER = 10
     NUMBERS_OF_UNLOCKING_ROUNDS = [5, 50, 500, 5000, 50000]
-    
-    with open(f"{test_result_directory}{test_correct_samples_filepath}", "w") as f:
-        f.write(f"time;unlocking_rounds\n")
 
-    time_array = []
+    with open(f"{test_result_directory}{test_time_filepath}", "w") as f:
+        f.write(f"time;p50;p99;unlocking_rounds\n")
+
+    def unlock_setup():
+        enrol_template = [random.randint(1, PRIME - 1) for i in range(BIO_TEMPLATE_LENGTH)]
+        secret_polynomial = FuzzyVault.generate_secret_polynomial(
+            group_order=PRIME, sec_poly_deg=VERIFY_THRESHOLD
+        )
+        fuzzy_vault = FuzzyVault(group_order=PRIME, bio_template=enrol_template)
+        fuzzy_vault.lock(secret_polynomial=secret_polynomial)
+
+        verification_template = enrol_template[:CORRECT_SAMPLES] + [
+            random.randint(1, PRIME - 1) for i in range(BIO_TEMPLATE_LENGTH - CORRECT_SAMPLES)
+        ]
+        fuzzy_vault.bio_template = verification_template
+        return (fuzzy_vault,)
+
     for NUMBER_OF_UNLOCKING_ROUNDS in NUMBERS_OF_UNLOCKING_ROUNDS:
-        for i in range(TESTS_FOR_NUMBER):
-            e = 0
-            s = pc()
-            try:
-                execute_BRAKE(
-                    correct_samples=CORRECT_SAMPLES,
-                    number_of_unlocking_rounds=NUMBER_OF_UNLOCKING_ROUNDS,
-                )
-                e = pc()
-            except:
-                e = pc()
-                if os.path.exists(TEST_CLIENT_PROFILE_FILEPATH):
-                    os.remove(TEST_CLIENT_PROFILE_FILEPATH)
-
-            time_array.append(e-s)
-
-        with open(f"{test_result_directory}{test_correct_samples_filepath}", "a") as f:
+        # Only unlocking is timed, without RSA key generation, disk I/O and debug prints
+        benchmark = Benchmark(
+            f"fuzzy_vault_unlock[rounds={NUMBER_OF_UNLOCKING_ROUNDS}]",
+            lambda fuzzy_vault: fuzzy_vault.unlock(
+                verify_threshold=VERIFY_THRESHOLD,
+                number_of_unlocking_rounds=NUMBER_OF_UNLOCKING_ROUNDS,
+            ),
+            setup=unlock_setup,
+            warmup=1,
+            repetitions=TESTS_FOR_NUMBER,
+        )
+        result = benchmark.measure()
+
+        with open(f"{test_result_directory}{test_time_filepath}", "a") as f:
             f.write(
-                f"{sum(time_array)/len(time_array)};{NUMBER_OF_UNLOCKING_ROUNDS}\n"
+                f"{result['mean']};{result['p50']};{result['p99']};{NUMBER_OF_UNLOCKING_ROUNDS}\n"
             )
 
-            print(f"####### Test for {NUMBER_OF_UNLOCKING_ROUNDS} completed... #######")
-    
+        print(f"####### Test for {NUMBER_OF_UNLOCKING_ROUNDS} completed... #######")
+
+
 def test_correct_samples(test_result_directory):
+    from sweep import Sweep, summarize
+
     NUMBER_OF_UNLOCKING_ROUNDS = 5
     test_correct_samples_filepath = f"test_correct_samples_{NUMBER_OF_UNLOCKING_ROUNDS}_32bit.csv"
+    test_correct_samples_checkpoint_filepath = f"test_correct_samples_{NUMBER_OF_UNLOCKING_ROUNDS}_32bit.jsonl"
 
     START_CORRECT_SAMPLES = 8
     END_CORRECT_SAMPLES = 44
     TESTS_FOR_SAMPLE = 25
-    TEST_CLIENT_PROFILE_FILEPATH = "./server_db/1.json"
 
     SAMPLES_RANGE = range(START_CORRECT_SAMPLES, END_CORRECT_SAMPLES + 1)
 
+    # Trials run in parallel without key generation and disk I/O, interrupted test resumes from checkpoint
+    sweep = Sweep(
+        {
+            "prime": [2147483647],
+            "bio_template_length": [44],
+            "verify_threshold": [8],
+            "number_of_unlocking_rounds": [NUMBER_OF_UNLOCKING_ROUNDS],
+            "correct_samples": list(SAMPLES_RANGE),
+        },
+        trials=TESTS_FOR_SAMPLE,
+        checkpoint_filepath=f"{test_result_directory}{test_correct_samples_checkpoint_filepath}",
+    )
+    summary = summarize(sweep.run(progress=True))
+
     with open(f"{test_result_directory}{test_correct_samples_filepath}", "w") as f:
-        f.write(f"success;failure;total;correct_samples\n")
-
-    for CORRECT_SAMPLES in SAMPLES_RANGE:
-        success_counter = 0
-        failure_counter = 0
-
-        for i in range(TESTS_FOR_SAMPLE):
-            try:
-                execute_BRAKE(
-                    correct_samples=CORRECT_SAMPLES,
-                    number_of_unlocking_rounds=NUMBER_OF_UNLOCKING_ROUNDS,
-                )
-                success_counter += 1
-            except:
-                if os.path.exists(TEST_CLIENT_PROFILE_FILEPATH):
-                    os.remove(TEST_CLIENT_PROFILE_FILEPATH)
-                failure_counter += 1
-
-        with open(f"{test_result_directory}{test_correct_samples_filepath}", "a") as f:
+        f.write(f"success;failure;total;correct_samples;mean_rounds_used;failure_reasons\n")
+        for entry in summary:
+            f.write(
+                f"{entry['success']};{entry['failure']};{entry['total']};{entry['correct_samples']};"
+                f"{entry['mean_rounds_used']};{entry['reasons']}\n"
+            )
+
+
+def test_batch_enrolment(test_result_directory):
+    from batch_enrol import BatchEnrolmentPipeline
+    from group_poly import Group
+
+    test_batch_enrolment_filepath = "test_batch_enrolment.csv"
+
+    PRIME = 2147483647
+    G = Group(prime=PRIME)
+    VERIFY_THRESHOLD = 8
+    BIO_TEMPLATE_LENGTH = 44
+    ENROLMENTS = 64
+    WORKERS_RANGE = range(1, (os.cpu_count() or 1) + 1)
+
+    with open(f"{test_result_directory}{test_batch_enrolment_filepath}", "w") as f:
+        f.write(f"enrolments_per_second;workers\n")
+
+    for WORKERS in WORKERS_RANGE:
+        templates = (
+            (client_id, [random.randint(1, PRIME - 1) for i in range(BIO_TEMPLATE_LENGTH)])
+            for client_id in range(ENROLMENTS)
+        )
+        pipeline = BatchEnrolmentPipeline(G, VERIFY_THRESHOLD, workers=WORKERS)
+
+        s = pc()
+        enroled = sum(1 for record in pipeline.enrol(templates))
+        e = pc()
+
+        with open(f"{test_result_directory}{test_batch_enrolment_filepath}", "a") as f:
+            f.write(f"{enroled/(e-s)};{WORKERS}\n")
+
+        print(f"####### Test for {WORKERS} workers completed... #######")
+
+
+def test_server_service_load(test_result_directory):
+    import shutil
+    import asyncio
+    from server import Server
+    from server_service import ServerService, run_load_test, create_test_profile
+
+    test_server_service_load_filepath = "test_server_service_load.csv"
+
+    TEST_DB_PATH = "./server_service_load_db/"
+    CLIENT_IDS = list(range(1, 11))
+    CONNECTIONS_RANGE = [100, 1000, 2000, 4000]
+    REQUESTS_PER_CONNECTION = 5
+
+    shutil.rmtree(TEST_DB_PATH, ignore_errors=True)
+    server = Server(TEST_DB_PATH)
+    for client_id in CLIENT_IDS:
+        server.enrol_client(create_test_profile(client_id))
+
+    with open(f"{test_result_directory}{test_server_service_load_filepath}", "w") as f:
+        f.write(f"connections;throughput;errors;overloaded;vault_p50;vault_p99;session_key_p50;session_key_p99\n")
+
+    async def run(connections):
+        service = ServerService(server, port=0)
+        await service.start()
+        report = await run_load_test(
+            "127.0.0.1",
+            service.port,
+            CLIENT_IDS,
+            connections=connections,
+            requests_per_connection=REQUESTS_PER_CONNECTION,
+        )
+        await service.close()
+        return report
+
+    for CONNECTIONS in CONNECTIONS_RANGE:
+        report = asyncio.run(run(CONNECTIONS))
+
+        with open(f"{test_result_directory}{test_server_service_load_filepath}", "a") as f:
+            f.write(
+                f"{CONNECTIONS};{report['throughput']};{report['errors']};{report['overloaded']};"
+                f"{report['vault']['p50']};{report['vault']['p99']};"
+                f"{report['session_key']['p50']};{report['session_key']['p99']}\n"
+            )
+
+        print(f"####### Test for {CONNECTIONS} connections completed... #######")
+
+    shutil.rmtree(TEST_DB_PATH)
+
+
+def test_evaluator_service_load(test_result_directory):
+    import hashlib
+    from concurrent.futures import ThreadPoolExecutor
+    from evaluator_service import EvaluatorService, EvaluatorClient, run_in_background
+    from server_service import latency_percentiles
+
+    test_evaluator_service_load_filepath = "test_evaluator_service_load.csv"
+
+    CONCURRENT_LOGINS_RANGE = [1, 10, 100, 500]
+    EVALUATIONS_PER_LOGIN = 20
+
+    service = EvaluatorService()
+    run_in_background(service)
+    evaluator_client = EvaluatorClient(port=service.port, pool_size=max(CONCURRENT_LOGINS_RANGE))
+    blinded_value = hashlib.sha256(b"blinded_data").hexdigest()
+
+    with open(f"{test_result_directory}{test_evaluator_service_load_filepath}", "w") as f:
+        f.write(f"p50;p99;mean_requests_per_batch;concurrent_logins\n")
+
+    def login(i):
+        latencies = []
+        for j in range(EVALUATIONS_PER_LOGIN):
+            s = pc()
+            evaluator_client.evaluate(blinded_value)
+            latencies.append(pc() - s)
+        return latencies
+
+    for CONCURRENT_LOGINS in CONCURRENT_LOGINS_RANGE:
+        with ThreadPoolExecutor(max_workers=CONCURRENT_LOGINS) as executor:
+            latencies = [
+                latency
+                for login_latencies in executor.map(login, range(CONCURRENT_LOGINS))
+                for latency in login_latencies
+            ]
+        percentiles = latency_percentiles(latencies)
+
+        with open(f"{test_result_directory}{test_evaluator_service_load_filepath}", "a") as f:
             f.write(
-                f"{success_counter};{failure_counter};{TESTS_FOR_SAMPLE};{CORRECT_SAMPLES}\n"
+                f"{percentiles['p50']};{percentiles['p99']};"
+                f"{service.stats()['mean_requests_per_batch']};{CONCURRENT_LOGINS}\n"
             )
 
-        print(f"####### Test for {CORRECT_SAMPLES} completed... #######")
+        print(f"####### Test for {CONCURRENT_LOGINS} concurrent logins completed... #######")
+
+    evaluator_client.close()
+
+
+def test_identification(test_result_directory):
+    from identification import IdentificationEngine, create_genuine_vault, create_random_vaults
+
+    test_identification_filepath = "test_identification.csv"
+
+    PRIME = 2147483647
+    VERIFY_THRESHOLD = 8
+    BIO_TEMPLATE_LENGTH = 44
+    CORRECT_SAMPLES = 22
+    NUMBER_OF_ROUNDS = 5000
+    NUMBERS_OF_VAULTS = [1000, 10000, 100000]
+
+    with open(f"{test_result_directory}{test_identification_filepath}", "w") as f:
+        f.write(f"time;identified;number_of_vaults\n")
+
+    enrol_template = [random.randint(1, PRIME - 1) for i in range(BIO_TEMPLATE_LENGTH)]
+    _, genuine_coefs = create_genuine_vault(PRIME, enrol_template, VERIFY_THRESHOLD)
+    verification_template = enrol_template[:CORRECT_SAMPLES] + [
+        random.randint(1, PRIME - 1) for i in range(BIO_TEMPLATE_LENGTH - CORRECT_SAMPLES)
+    ]
+    random.shuffle(verification_template)
+
+    for NUMBER_OF_VAULTS in NUMBERS_OF_VAULTS:
+        coefs = create_random_vaults(PRIME, BIO_TEMPLATE_LENGTH, NUMBER_OF_VAULTS)
+        coefs[-1] = genuine_coefs
+        engine = IdentificationEngine()
+        engine.add_vaults(PRIME, VERIFY_THRESHOLD, list(range(NUMBER_OF_VAULTS)), coefs)
+
+        s = pc()
+        matches = engine.identify(verification_template, number_of_rounds=NUMBER_OF_ROUNDS)
+        e = pc()
+        identified = [match["client_id"] for match in matches] == [NUMBER_OF_VAULTS - 1]
+
+        with open(f"{test_result_directory}{test_identification_filepath}", "a") as f:
+            f.write(f"{e - s};{identified};{NUMBER_OF_VAULTS}\n")
+
+        print(f"####### Test for {NUMBER_OF_VAULTS} vaults completed... #######")
 
 
 def main():
@@ -84,6 +266,10 @@ def main():
     # Uncomment for desired test
     # test_correct_samples(test_result_directory=test_result_directory)
     # test_time(test_result_directory)
+    # test_batch_enrolment(test_result_directory)
+    # test_server_service_load(test_result_directory)
+    # test_evaluator_service_load(test_result_directory)
+    # test_identification(test_result_directory)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,475 @@
+import os
+import sys
+import json
+import time
+import secrets
+import argparse
+import threading
+import contextvars
+from functools import wraps
+
+# Span that is parent of spans started in current thread or asyncio task
+_CURRENT_SPAN = contextvars.ContextVar("brake_current_span", default=None)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class RemoteSpanContext:
+    def __init__(self, trace_id: str, span_id: str):
+        """
+        RemoteSpanContext class constructor, that returns parent span started by another process
+
+        Parameters:
+            - trace_id (str): Trace id propagated with request
+            - span_id (str): Id of span the request was sent from
+
+        Returns:
+            - self (RemoteSpanContext): RemoteSpanContext class object
+        """
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class Span:
+    def __init__(self, tracer, name: str, attributes: dict):
+        """
+        Span class constructor, that returns timed operation nested in parent span of the current context
+
+        Parameters:
+            - tracer (Tracer): Tracer the finished span is exported by
+            - name (str): Operation name
+            - attributes (dict): Additional values describing operation
+
+        Returns:
+            - self (Span): Span class object
+        """
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = secrets.token_hex(8)
+
+        parent = _CURRENT_SPAN.get()
+        if parent is None:
+            self.trace_id = secrets.token_hex(16)
+            self.parent_id = None
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+
+        self.start = None
+        self.duration = None
+        self.error = None
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.token = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.token = _CURRENT_SPAN.set(self)
+        self.start = time.time()
+        self.start_counter = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self.start_counter
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc_value}"
+        _CURRENT_SPAN.reset(self.token)
+        self.tracer.export(self)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "pid": self.pid,
+            "tid": self.tid,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class InMemoryExporter:
+    def __init__(self):
+        """
+        InMemoryExporter class constructor, that returns exporter keeping finished spans as dicts
+
+        Parameters:
+            - None
+
+        Returns:
+            - self (InMemoryExporter): InMemoryExporter class object
+        """
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def export(self, span_dict: dict) -> None:
+        with self.lock:
+            self.spans.append(span_dict)
+
+    def close(self) -> None:
+        pass
+
+
+class JsonLinesExporter:
+    def __init__(self, filepath: str):
+        """
+        JsonLinesExporter class constructor, that returns exporter appending finished spans to JSON Lines file
+
+        Parameters:
+            - filepath (str): Path of JSON Lines file, processes of the same trace may share it
+
+        Returns:
+            - self (JsonLinesExporter): JsonLinesExporter class object
+        """
+        self.filepath = filepath
+        self.file = open(filepath, "at")
+        self.lock = threading.Lock()
+
+    def export(self, span_dict: dict) -> None:
+        line = json.dumps(span_dict, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+def to_chrome_trace(span_dicts: list) -> dict:
+    """
+    Convert spans into Chrome trace-event format, viewable as flame chart in chrome://tracing or Perfetto
+
+    Parameters:
+        - span_dicts (list): Finished spans as dicts
+
+    Returns:
+        - (dict): Trace with complete ('X') events, timestamps in microseconds
+    """
+    events = []
+    for span_dict in sorted(span_dicts, key=lambda span_dict: span_dict["start"]):
+        args = dict(
+            span_dict["attributes"],
+            trace_id=span_dict["trace_id"],
+            span_id=span_dict["span_id"],
+            parent_id=span_dict["parent_id"],
+        )
+        if span_dict["error"] is not None:
+            args["error"] = span_dict["error"]
+        events.append(
+            {
+                "name": span_dict["name"],
+                "ph": "X",
+                "ts": span_dict["start"] * 1e6,
+                "dur": span_dict["duration"] * 1e6,
+                "pid": span_dict["pid"],
+                "tid": span_dict["tid"],
+                "args": args,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+class ChromeTraceExporter(InMemoryExporter):
+    def __init__(self, filepath: str):
+        """
+        ChromeTraceExporter class constructor, that returns exporter writing spans in Chrome trace-event format when closed
+
+        Parameters:
+            - filepath (str): Path of JSON trace file
+
+        Returns:
+            - self (ChromeTraceExporter): ChromeTraceExporter class object
+        """
+        super().__init__()
+        self.filepath = filepath
+
+    def close(self) -> None:
+        with self.lock:
+            with open(self.filepath, "wt") as f:
+                json.dump(to_chrome_trace(self.spans), f)
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False):
+        """
+        Tracer class constructor, that returns source of spans exported to registered exporters
+
+        Parameters:
+            - enabled (bool): Whether spans are recorded, disabled tracer returns shared no-op span
+
+        Returns:
+            - self (Tracer): Tracer class object
+        """
+        self.enabled = enabled
+        self.exporters = []
+
+    def span(self, name: str, **attributes):
+        """
+        Start span nested in span of the current context, use as context manager
+
+        Parameters:
+            - name (str): Operation name
+            - attributes (dict): Additional values describing operation
+
+        Returns:
+            - (Span): Span, no-op span while tracing is disabled
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, attributes)
+
+    def export(self, span: Span) -> None:
+        span_dict = span.to_dict()
+        for exporter in self.exporters:
+            exporter.export(span_dict)
+
+
+# Tracer shared by all instrumented modules, enabled with BRAKE_TRACING=1 environment variable or enable()
+TRACER = Tracer(enabled=os.environ.get("BRAKE_TRACING") == "1")
+if TRACER.enabled and os.environ.get("BRAKE_TRACE_FILE"):
+    TRACER.exporters.append(JsonLinesExporter(os.environ["BRAKE_TRACE_FILE"]))
+
+
+def enable(exporter=None) -> None:
+    if exporter is not None:
+        TRACER.exporters.append(exporter)
+    TRACER.enabled = True
+
+
+def disable() -> None:
+    """
+    Stop recording spans, closing and removing all exporters
+
+    Parameters:
+        - None
+
+    Returns:
+        - None
+    """
+    TRACER.enabled = False
+    exporters, TRACER.exporters = TRACER.exporters, []
+    for exporter in exporters:
+        exporter.close()
+
+
+def is_enabled() -> bool:
+    return TRACER.enabled
+
+
+def span(name: str, **attributes):
+    return TRACER.span(name, **attributes)
+
+
+def traced(name: str):
+    """
+    Decorator recording every call of function as span, calling it directly while tracing is disabled
+
+    Parameters:
+        - name (str): Operation name of spans
+
+    Returns:
+        - Decorator
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with Span(TRACER, name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def inject() -> dict:
+    """
+    Context of current span to be sent along with request to another process
+
+    Parameters:
+        - None
+
+    Returns:
+        - (dict): 'trace_id' and 'span_id' of current span, None if there is none
+    """
+    current_span = _CURRENT_SPAN.get()
+    if current_span is None:
+        return None
+    return {"trace_id": current_span.trace_id, "span_id": current_span.span_id}
+
+
+class TraceContinuation:
+    def __init__(self, trace_context: dict):
+        """
+        TraceContinuation class constructor, that returns context manager making spans started in its block children of span of another process
+
+        Parameters:
+            - trace_context (dict): Context received with request, created by inject(), may be None
+
+        Returns:
+            - self (TraceContinuation): TraceContinuation class object
+        """
+        self.trace_context = trace_context
+        self.token = None
+
+    def __enter__(self):
+        if TRACER.enabled and self.trace_context:
+            self.token = _CURRENT_SPAN.set(
+                RemoteSpanContext(
+                    str(self.trace_context["trace_id"]), str(self.trace_context["span_id"])
+                )
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.token is not None:
+            _CURRENT_SPAN.reset(self.token)
+        return False
+
+
+def continue_trace(trace_context: dict) -> TraceContinuation:
+    return TraceContinuation(trace_context)
+
+
+def load_json_lines(filepath: str, trace_id: str = None) -> list:
+    """
+    Read spans exported by JsonLinesExporter, skipping partially written lines
+
+    Parameters:
+        - filepath (str): Path of JSON Lines file
+        - trace_id (str): Only spans of this trace are returned if given
+
+    Returns:
+        - span_dicts (list): Spans as dicts
+    """
+    span_dicts = []
+    with open(filepath, "rt") as f:
+        for line in f:
+            try:
+                span_dict = json.loads(line)
+            except ValueError:
+                continue
+            if trace_id is None or span_dict["trace_id"] == trace_id:
+                span_dicts.append(span_dict)
+    return span_dicts
+
+
+def slowest_trace(span_dicts: list) -> str:
+    """
+    Find trace whose root span took longest
+
+    Parameters:
+        - span_dicts (list): Spans as dicts
+
+    Returns:
+        - (str): Trace id, None if there are no root spans
+    """
+    roots = [span_dict for span_dict in span_dicts if span_dict["parent_id"] is None]
+    if not roots:
+        return None
+    return max(roots, key=lambda span_dict: span_dict["duration"])["trace_id"]
+
+
+def run_tests():
+    print("Running tracing.py tests...")
+
+    exporter = InMemoryExporter()
+    enable(exporter)
+
+    @traced("child")
+    def child():
+        return 1
+
+    with span("root", client_id=1) as root:
+        assert child() == 1
+        with span("sibling"):
+            outgoing_context = inject()
+
+    # Spans of another process continue the propagated trace
+    with continue_trace(outgoing_context):
+        with span("remote"):
+            pass
+
+    try:
+        with span("failing"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    disable()
+
+    spans = {span_dict["name"]: span_dict for span_dict in exporter.spans}
+    assert len(spans) == 5
+    assert spans["child"]["parent_id"] == root.span_id
+    assert spans["child"]["trace_id"] == spans["sibling"]["trace_id"] == root.trace_id
+    assert spans["remote"]["trace_id"] == root.trace_id
+    assert spans["remote"]["parent_id"] == spans["sibling"]["span_id"]
+    assert spans["failing"]["trace_id"] != root.trace_id
+    assert spans["failing"]["error"] == "ValueError: boom"
+    assert spans["root"]["attributes"] == {"client_id": 1}
+    assert slowest_trace(exporter.spans) in (root.trace_id, spans["failing"]["trace_id"])
+
+    chrome_trace = to_chrome_trace(exporter.spans)
+    assert [event["name"] for event in chrome_trace["traceEvents"]][:2] == ["root", "child"]
+    assert all(event["ph"] == "X" for event in chrome_trace["traceEvents"])
+
+    # Disabled tracing returns shared no-op span
+    assert span("disabled") is _NULL_SPAN and inject() is None
+    iterations = 100000
+    s = time.perf_counter()
+    for i in range(iterations):
+        child()
+    print(f"Disabled span overhead: {(time.perf_counter() - s) / iterations * 1e9:.0f} ns")
+
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    parser = argparse.ArgumentParser(description="Convert exported spans into Chrome trace-event format")
+    parser.add_argument("spans", nargs="+", help="JSON Lines files written by JsonLinesExporter")
+    parser.add_argument("--output", default="trace.json")
+    parser.add_argument("--trace-id", default=None, help="Trace to convert, 'slowest' picks slowest trace")
+    args = parser.parse_args()
+
+    span_dicts = []
+    for filepath in args.spans:
+        span_dicts += load_json_lines(filepath)
+
+    trace_id = args.trace_id
+    if trace_id == "slowest":
+        trace_id = slowest_trace(span_dicts)
+    if trace_id is not None:
+        span_dicts = [span_dict for span_dict in span_dicts if span_dict["trace_id"] == trace_id]
+
+    with open(args.output, "wt") as f:
+        json.dump(to_chrome_trace(span_dicts), f)
+    print(f"Wrote {len(span_dicts)} spans to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
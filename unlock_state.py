@@ -0,0 +1,459 @@
+import os
+import json
+import time
+import random
+import hashlib
+import secrets
+from math import comb
+from collections import OrderedDict
+
+from tally import create_tally, tally_from_dict
+
+# Number of rounds of Feistel network permuting combination ranks
+FEISTEL_ROUNDS = 4
+
+
+class CombinationSampler:
+    def __init__(self, number_of_indices: int, how_many_indices: int, key: bytes):
+        """
+        CombinationSampler class constructor, that returns keyed pseudo-random order of all index combinations
+
+        Combination drawn at cursor position is found by permuting cursor with keyed Feistel network over
+        combination ranks and unranking the result, so whole sampler state is its key and cursor.
+
+        Parameters:
+            - number_of_indices (int): Number of indices to choose from
+            - how_many_indices (int): Number of indices in single combination
+            - key (bytes): Key of permutation, the same key gives the same order
+
+        Returns:
+            - self (CombinationSampler): CombinationSampler class object
+        """
+        self.number_of_indices = number_of_indices
+        self.how_many_indices = how_many_indices
+        self.key = key
+        self.total = comb(number_of_indices, how_many_indices)
+
+        # Feistel network permutes [0, 2^(2 * half_bits)), ranks outside [0, total) are skipped by cycle walking
+        self.half_bits = max(1, ((self.total - 1).bit_length() + 1) // 2)
+        self.half_mask = (1 << self.half_bits) - 1
+        self.half_bytes = (self.half_bits + 7) // 8
+
+        # binomials[c][j] = comb(c, j) for unranking
+        self.binomials = [
+            [comb(c, j) for j in range(how_many_indices + 1)]
+            for c in range(number_of_indices + 1)
+        ]
+
+    def round_function(self, round_number: int, value: int) -> int:
+        digest = hashlib.blake2b(
+            value.to_bytes(self.half_bytes, "little"),
+            digest_size=self.half_bytes,
+            key=self.key,
+            person=round_number.to_bytes(4, "little"),
+        ).digest()
+        return int.from_bytes(digest, "little") & self.half_mask
+
+    def permute(self, position: int) -> int:
+        rank = position
+        while True:
+            left, right = rank >> self.half_bits, rank & self.half_mask
+            for round_number in range(FEISTEL_ROUNDS):
+                left, right = right, left ^ self.round_function(round_number, right)
+            rank = (left << self.half_bits) | right
+            if rank < self.total:
+                return rank
+
+    def unrank(self, rank: int) -> list:
+        """
+        Combination of given rank in combinatorial number system
+
+        Parameters:
+            - rank (int): Rank in [0, total)
+
+        Returns:
+            - combination (list): Sorted distinct indices
+        """
+        combination = []
+        c = self.number_of_indices
+        for j in range(self.how_many_indices, 0, -1):
+            c -= 1
+            while self.binomials[c][j] > rank:
+                c -= 1
+            rank -= self.binomials[c][j]
+            combination.append(c)
+        return combination[::-1]
+
+    def combination(self, position: int) -> list:
+        if not 0 <= position < self.total:
+            raise IndexError(f"Sampler position {position} outside [0, {self.total})")
+        return self.unrank(self.permute(position))
+
+
+def unlock_state_key(
+    vault_coefs: list, captures: list, group_order: int, verify_threshold: int
+) -> str:
+    """
+    Key of unlocking attempts of the same vault with the same verification captures
+
+    Parameters:
+        - vault_coefs (list): Coefficients of vault polynomial
+        - captures (list): Biometric verification templates
+        - group_order (int): Order of group the BRAKE protocol is executed in
+        - verify_threshold (int): Verification threshold of vault
+
+    Returns:
+        - (str): Hex digest of vault and templates
+    """
+    width = (group_order.bit_length() + 7) // 8
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{group_order}:{verify_threshold}:{len(vault_coefs)}:".encode("ascii"))
+    h.update(b"".join((int(coef) % group_order).to_bytes(width, "little") for coef in vault_coefs))
+    for bio_template in captures:
+        # Length prefix separates captures, so that moving values between them changes the key
+        h.update(len(bio_template).to_bytes(4, "little"))
+        h.update(b"".join((int(value) % group_order).to_bytes(width, "little") for value in bio_template))
+    return h.hexdigest()
+
+
+class UnlockState:
+    def __init__(
+        self,
+        key: str,
+        numbers_of_indices: list,
+        verify_threshold: int,
+        tally_capacity: int = None,
+        sampler_key: bytes = None,
+    ):
+        """
+        UnlockState class constructor, that returns progress of unlocking a vault with verification captures, resumed by retries
+
+        Combinations of all captures are interleaved, position 'i' of the cursor is combination 'i // n' of capture 'i % n'.
+
+        Parameters:
+            - key (str): Key of vault and verification templates, see unlock_state_key()
+            - numbers_of_indices (list): Number of distinct template values combinations are drawn from, for every capture
+            - verify_threshold (int): Number of indices in single combination
+            - tally_capacity (int): Maximal number of candidates counted at once, unbounded if not given
+            - sampler_key (bytes): Key of combination order, drawn from global random generator if not given
+
+        Returns:
+            - self (UnlockState): UnlockState class object
+        """
+        if sampler_key is None:
+            sampler_key = random.getrandbits(128).to_bytes(16, "little")
+
+        self.key = key
+        self.samplers = [
+            CombinationSampler(number_of_indices, verify_threshold, sampler_key)
+            for number_of_indices in numbers_of_indices
+        ]
+        self.cursor = 0
+        self.tally = create_tally(tally_capacity)
+        self.attempts = 0
+
+        # Expiry time is set whenever the state is saved
+        self.expires_at = None
+
+    @property
+    def tried_combinations(self) -> int:
+        n = len(self.samplers)
+        return sum(
+            min(sampler.total, (self.cursor - capture_index + n - 1) // n)
+            for capture_index, sampler in enumerate(self.samplers)
+        )
+
+    @property
+    def remaining_combinations(self) -> int:
+        return sum(sampler.total for sampler in self.samplers) - self.tried_combinations
+
+    def is_expired(self, now: float = None) -> bool:
+        if self.expires_at is None:
+            return False
+        return (time.time() if now is None else now) >= self.expires_at
+
+    def next_combinations(self, count: int) -> list:
+        """
+        Draw combinations not tried in any previous attempt, advancing cursor
+
+        Parameters:
+            - count (int): Number of combinations, capped at number of remaining combinations
+
+        Returns:
+            - combinations (list): Tuples of round number, capture index and combination of template indices
+        """
+        n = len(self.samplers)
+        end = n * max((sampler.total for sampler in self.samplers), default=0)
+        combinations = []
+        while len(combinations) < count and self.cursor < end:
+            capture_index, position = self.cursor % n, self.cursor // n
+            self.cursor += 1
+
+            # Captures with fewer combinations than others are skipped once exhausted
+            sampler = self.samplers[capture_index]
+            if position < sampler.total:
+                combinations.append((self.cursor, capture_index, sampler.combination(position)))
+        return combinations
+
+    def round_combination(self, round_number: int) -> tuple:
+        """
+        Combination drawn in given round, e.g. to recover candidate saved without its coefficients
+
+        Parameters:
+            - round_number (int): Round number returned by next_combinations()
+
+        Returns:
+            - (tuple): Capture index and combination of template indices
+        """
+        n = len(self.samplers)
+        capture_index, position = (round_number - 1) % n, (round_number - 1) // n
+        return (capture_index, self.samplers[capture_index].combination(position))
+
+    def to_dict(self, include_coefs: bool = True) -> dict:
+        return {
+            "key": self.key,
+            "numbers_of_indices": [sampler.number_of_indices for sampler in self.samplers],
+            "verify_threshold": self.samplers[0].how_many_indices,
+            "sampler_key": self.samplers[0].key.hex(),
+            "cursor": self.cursor,
+            "attempts": self.attempts,
+            "expires_at": self.expires_at,
+            "tally": self.tally.to_dict(include_coefs=include_coefs),
+        }
+
+    @classmethod
+    def from_dict(cls, state_dict: dict):
+        """
+        Restore state saved with to_dict()
+
+        Parameters:
+            - state_dict (dict): State as JSON-serializable dict
+
+        Returns:
+            - (UnlockState): Restored state
+        """
+        state = cls(
+            state_dict["key"],
+            state_dict["numbers_of_indices"],
+            state_dict["verify_threshold"],
+            sampler_key=bytes.fromhex(state_dict["sampler_key"]),
+        )
+        state.cursor = state_dict["cursor"]
+        state.attempts = state_dict["attempts"]
+        state.expires_at = state_dict["expires_at"]
+        state.tally = tally_from_dict(state_dict["tally"])
+        return state
+
+
+class UnlockStateStore:
+    def __init__(self, ttl: float = 300.0, capacity: int = 1024, directory: str = None):
+        """
+        UnlockStateStore class constructor, that returns store of unlocking progress of recent verification attempts
+
+        Parameters:
+            - ttl (float): Time in seconds for which unlocking progress is kept
+            - capacity (int): Maximal number of states kept in memory, least recently used are dropped
+            - directory (str): Directory states are saved to as JSON files, so that retries in new processes resume them;
+              files hold vote counts of candidate digests but not candidate coefficients, and expire with their states
+
+        Returns:
+            - self (UnlockStateStore): UnlockStateStore class object
+        """
+        self.ttl = ttl
+        self.capacity = capacity
+        self.directory = directory
+        self.states = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get_filepath(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str, now: float = None) -> UnlockState:
+        """
+        Find unexpired state of unlocking attempts
+
+        Parameters:
+            - key (str): Key of vault and verification template
+            - now (float): Current time, taken from clock if not given
+
+        Returns:
+            - (UnlockState): Saved state, None if there is none or it expired
+        """
+        state = self.states.get(key)
+        if state is None and self.directory is not None:
+            try:
+                with open(self.get_filepath(key), "rt") as f:
+                    state = UnlockState.from_dict(json.load(f))
+            except (FileNotFoundError, ValueError, KeyError):
+                state = None
+
+        if state is None:
+            return None
+        if state.is_expired(now):
+            self.discard(key)
+            return None
+
+        self.states[key] = state
+        self.states.move_to_end(key)
+        return state
+
+    def put(self, state: UnlockState, now: float = None) -> None:
+        """
+        Save state after unlocking attempt, it expires 'ttl' seconds after the last attempt
+
+        Parameters:
+            - state (UnlockState): State to save
+            - now (float): Current time, taken from clock if not given
+
+        Returns:
+            - None
+        """
+        state.expires_at = (time.time() if now is None else now) + self.ttl
+        self.states[state.key] = state
+        self.states.move_to_end(state.key)
+        while len(self.states) > self.capacity:
+            self.states.popitem(last=False)
+
+        if self.directory is not None:
+            # Write to temporary file and rename, so that concurrent readers never see partial state
+            filepath = self.get_filepath(state.key)
+            temporary_filepath = f"{filepath}.{os.getpid()}.tmp"
+            with open(temporary_filepath, "wt") as f:
+                json.dump(state.to_dict(include_coefs=False), f)
+
+            # Modification time of file is its expiry time, so that expired files are found without reading them
+            os.utime(temporary_filepath, (state.expires_at, state.expires_at))
+            os.replace(temporary_filepath, filepath)
+            self.delete_expired_files(time.time() if now is None else now)
+
+    def delete_expired_files(self, now: float) -> None:
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    if entry.stat().st_mtime <= now:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def discard(self, key: str) -> None:
+        self.states.pop(key, None)
+        if self.directory is not None:
+            try:
+                os.remove(self.get_filepath(key))
+            except FileNotFoundError:
+                pass
+
+
+def run_tests():
+    print("Running unlock_state.py tests...")
+
+    # Sampler visits every combination exactly once
+    sampler = CombinationSampler(10, 4, secrets.token_bytes(16))
+    combinations = {tuple(sampler.combination(position)) for position in range(sampler.total)}
+    assert len(combinations) == sampler.total == 210
+    assert all(len(set(combination)) == 4 for combination in combinations)
+    assert CombinationSampler(44, 8, b"key").combination(12345) == CombinationSampler(
+        44, 8, b"key"
+    ).combination(12345)
+
+    # State continues from its cursor after being restored
+    state = UnlockState("key", [10], 4)
+    first_attempt = state.next_combinations(100)
+    restored_state = UnlockState.from_dict(json.loads(json.dumps(state.to_dict())))
+    second_attempt = restored_state.next_combinations(200)
+    assert len(second_attempt) == 110 and second_attempt[0][0] == 101
+    assert not {tuple(c) for _, _, c in first_attempt} & {tuple(c) for _, _, c in second_attempt}
+
+    # Combinations of several captures are interleaved until each of them is exhausted
+    state = UnlockState("key", [5, 6, 3], 3)
+    combinations = state.next_combinations(25)
+    assert [capture_index for _, capture_index, _ in combinations[:6]] == [0, 1, 2, 0, 1, 0]
+    assert state.tried_combinations == 25 and state.remaining_combinations == 10 + 20 + 1 - 25
+    combinations += state.next_combinations(100)
+    assert len(combinations) == 31 and state.remaining_combinations == 0
+    assert len({(capture_index, tuple(c)) for _, capture_index, c in combinations}) == 31
+
+    # Expired states are dropped, expired files of states nobody retries are deleted by the next write
+    directory = "./unlock_state_test/"
+    store = UnlockStateStore(ttl=10, directory=directory)
+    store.put(restored_state, now=0)
+    assert UnlockStateStore(directory=directory).get("key", now=5).cursor == 210
+    assert store.get("key", now=11) is None
+    assert not os.path.exists(store.get_filepath("key"))
+    store.put(restored_state, now=0)
+    store.put(UnlockState("other_key", [10], 4), now=11)
+    assert not os.path.exists(store.get_filepath("key"))
+    assert os.path.exists(store.get_filepath("other_key"))
+    store.discard("other_key")
+
+    # Files hold no candidate coefficients, round of winning candidate tells combination to recover it from
+    state = UnlockState("key", [5, 6, 3], 3)
+    combinations = state.next_combinations(7)
+    for round_number, capture_index, combination in combinations:
+        state.tally.add(bytes([round_number % 2]), tuple(combination), round_number)
+        assert state.round_combination(round_number) == (capture_index, combination)
+    store.put(state, now=0)
+    with open(store.get_filepath("key"), "rt") as f:
+        saved_tally = json.load(f)["tally"]
+    assert all(coefs is None for _, _, _, coefs in saved_tally["entries"])
+    restored_state = UnlockStateStore(directory=directory).get("key", now=1)
+    coefs, votes, first_round = restored_state.tally.winner()
+    assert coefs is None and votes == 4
+    assert restored_state.round_combination(first_round) == (combinations[0][1], combinations[0][2])
+    store.discard("key")
+
+    # Retries with the same capture continue unlocking until enough genuine combinations are found
+    from fuzzy_vault import FuzzyVault
+
+    prime = 12401
+    rng = random.Random(0)
+    enrol_template = rng.sample(range(1, prime), 12)
+    secret_polynomial = FuzzyVault.generate_secret_polynomial(prime, 4)
+    fuzzy_vault = FuzzyVault(group_order=prime, bio_template=enrol_template)
+    fuzzy_vault.lock(secret_polynomial)
+    fuzzy_vault.bio_template = enrol_template[:6] + rng.sample(range(1, prime), 6)
+    store = UnlockStateStore()
+    for attempt in range(1, 50):
+        if fuzzy_vault.unlock(4, 10, state_store=store) == secret_polynomial:
+            break
+    assert fuzzy_vault.unlock_stats["total_rounds"] == 10 * attempt
+    assert len(store.states) == 1
+
+    # Retries in new processes resume from files without candidate coefficients
+    for attempt in range(1, 50):
+        store = UnlockStateStore(directory=directory)
+        if fuzzy_vault.unlock(4, 10, state_store=store) == secret_polynomial:
+            break
+    assert fuzzy_vault.unlock_stats["total_rounds"] == 10 * attempt
+    assert attempt > 1
+    store.discard(next(iter(store.states)))
+    os.rmdir(directory)
+
+    # Retry of capture whose combinations were all tried fails instead of returning the same candidate again
+    fuzzy_vault.bio_template = enrol_template[:5]
+    store = UnlockStateStore()
+    fuzzy_vault.unlock(4, 10, state_store=store)
+    try:
+        fuzzy_vault.unlock(4, 10, state_store=store)
+        assert False
+    except ValueError:
+        pass
+    assert not store.states
+
+    key = unlock_state_key([1, 2, 3], [[4, 5]], 12401, 2)
+    assert key == unlock_state_key([1, 2, 12404], [[4, 5]], 12401, 2)
+    assert key != unlock_state_key([1, 2, 3], [[5, 4]], 12401, 2)
+    assert key != unlock_state_key([1, 2, 3], [[4], [5]], 12401, 2)
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
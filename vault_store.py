@@ -0,0 +1,745 @@
+import os
+import shutil
+
+import numpy as np
+
+# Fixed size of slot storing Client's public key in DER format, fits RSA keys up to 4096 bits
+KEY_SLOT_SIZE = 600
+
+
+def fsync_directory(directory: str) -> None:
+    """
+    Flush directory entries to disk, so that files created, renamed or deleted in it survive crash
+
+    Parameters:
+        - directory (str): Path of directory
+
+    Returns:
+        - None
+    """
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def shard_file_generation(filename: str) -> int:
+    """
+    Parse generation of shard file name, 'vaults_<order>_<degree>.<column>' files belong to generation 0
+
+    Parameters:
+        - filename (str): Name of file in directory of columnar vault store
+
+    Returns:
+        - (int): Generation of shard file, None if file is not shard file
+    """
+    parts = filename.split(".")
+    if not parts[0].startswith("vaults_"):
+        return None
+    if len(parts) == 2:
+        return 0
+    if len(parts) == 3 and parts[1].startswith("g") and parts[1][1:].isdigit():
+        return int(parts[1][1:])
+    return None
+
+
+def coefficient_dtype(group_order: int) -> np.dtype:
+    """
+    Choose smallest unsigned integer dtype able to store coefficients of polynomial in group of given order
+
+    Parameters:
+        - group_order (int): Order of group the BRAKE protocol is executed in
+
+    Returns:
+        - (np.dtype): Little-endian unsigned integer dtype for vault coefficients
+    """
+    for dtype in ("<u2", "<u4", "<u8"):
+        if group_order - 1 <= np.iinfo(np.dtype(dtype)).max:
+            return np.dtype(dtype)
+    raise ValueError(
+        f"Group order {group_order} is too large for columnar vault store, use file storage instead"
+    )
+
+
+class VaultShard:
+    def __init__(
+        self,
+        directory: str,
+        group_order: int,
+        degree: int,
+        capacity: int = 1024,
+        generation: int = 0,
+    ):
+        """
+        VaultShard class constructor, that returns memory-mapped columns of all vaults of given group order and degree
+
+        Parameters:
+            - directory (str): Directory of columnar vault store
+            - group_order (int): Order of group of all vaults in shard
+            - degree (int): Degree of all vault polynomials in shard
+            - capacity (int): Initial number of rows allocated in shard files
+            - generation (int): Generation of shard files, every compaction writes shards of next generation
+
+        Returns:
+            - self (VaultShard): VaultShard class object
+        """
+        self.group_order = group_order
+        self.degree = degree
+        self.coef_dtype = coefficient_dtype(group_order)
+        self.name = f"vaults_{group_order}_{degree}"
+        self.generation = generation
+        self.filepath_prefix = os.path.join(
+            directory, self.name if generation == 0 else f"{self.name}.g{generation}"
+        )
+
+        # Row bookkeeping rebuilt from store's index log
+        self.rows = 0
+        self.row_ids = []
+        self.tombstones = set()
+
+        # Columns stored as separate memory-mapped files
+        self.columns = {
+            "coefs": (self.coef_dtype, (degree + 1,)),
+            "thresholds": (np.dtype("<u4"), ()),
+            "key_lengths": (np.dtype("<u2"), ()),
+            "keys": (np.dtype("u1"), (KEY_SLOT_SIZE,)),
+        }
+
+        existing_capacity = self.get_file_capacity()
+        self.capacity = max(existing_capacity, capacity)
+        self.open_columns()
+
+    def get_column_filepath(self, column: str) -> str:
+        return f"{self.filepath_prefix}.{column}"
+
+    def get_file_capacity(self) -> int:
+        """
+        Get number of rows allocated in shard files already present on disk
+
+        Parameters:
+            - None
+
+        Returns:
+            - (int): Number of allocated rows, 0 if shard files do not exist
+        """
+        dtype, shape = self.columns["thresholds"]
+        filepath = self.get_column_filepath("thresholds")
+        if not os.path.exists(filepath):
+            return 0
+        return os.path.getsize(filepath) // dtype.itemsize
+
+    def open_columns(self) -> None:
+        """
+        Allocate shard files for current capacity and memory-map them
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        self.arrays = {}
+        for column, (dtype, shape) in self.columns.items():
+            filepath = self.get_column_filepath(column)
+            row_size = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+            with open(filepath, "ab") as f:
+                if f.tell() < self.capacity * row_size:
+                    f.truncate(self.capacity * row_size)
+            self.arrays[column] = np.memmap(
+                filepath, dtype=dtype, mode="r+", shape=(self.capacity,) + shape
+            )
+
+    def grow(self, min_capacity: int) -> None:
+        """
+        Grow shard files so that at least 'min_capacity' rows fit, doubling capacity
+
+        Parameters:
+            - min_capacity (int): Required number of rows
+
+        Returns:
+            - None
+        """
+        if min_capacity <= self.capacity:
+            return
+
+        self.flush()
+        while self.capacity < min_capacity:
+            self.capacity *= 2
+        self.open_columns()
+
+    def write_row(
+        self, row: int, vault_coefs: list, verify_threshold: int, key_DER: bytes
+    ) -> None:
+        """
+        Write single vault into given row of shard
+
+        Parameters:
+            - row (int): Row index
+            - vault_coefs (list): Coefficients of vault polynomial
+            - verify_threshold (int): Verification threshold of vault
+            - key_DER (bytes): Client's public key in DER format
+
+        Returns:
+            - None
+        """
+        if len(key_DER) > KEY_SLOT_SIZE:
+            raise ValueError(
+                f"Public key of {len(key_DER)} bytes does not fit {KEY_SLOT_SIZE} bytes key slot"
+            )
+
+        coefs_row = self.arrays["coefs"][row]
+        coefs_row[:] = 0
+        coefs_row[: len(vault_coefs)] = [int(c) for c in vault_coefs]
+        self.arrays["thresholds"][row] = verify_threshold
+        self.arrays["key_lengths"][row] = len(key_DER)
+        self.arrays["keys"][row, : len(key_DER)] = np.frombuffer(key_DER, dtype="u1")
+
+    def get_key_DER(self, row: int) -> bytes:
+        return self.arrays["keys"][row, : int(self.arrays["key_lengths"][row])].tobytes()
+
+    def live_mask(self) -> np.ndarray:
+        """
+        Compute mask of rows that are not tombstoned
+
+        Parameters:
+            - None
+
+        Returns:
+            - (np.ndarray): Boolean mask over shard rows
+        """
+        mask = np.ones(self.rows, dtype=bool)
+        if self.tombstones:
+            mask[np.fromiter(self.tombstones, dtype=np.int64)] = False
+        return mask
+
+    def flush(self) -> None:
+        for array in self.arrays.values():
+            array.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.arrays = {}
+
+    def remove_files(self) -> None:
+        self.arrays = {}
+        for column in self.columns:
+            filepath = self.get_column_filepath(column)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+
+class ColumnarVaultStore:
+    def __init__(self, directory: str, initial_capacity: int = 1024):
+        """
+        ColumnarVaultStore class constructor, that returns store keeping vaults of the same group order and degree in shared memory-mapped arrays
+
+        Parameters:
+            - directory (str): Directory of columnar vault store
+            - initial_capacity (int): Number of rows allocated for newly created shards
+
+        Returns:
+            - self (ColumnarVaultStore): ColumnarVaultStore class object
+        """
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        self.index_filepath = os.path.join(directory, "index.log")
+
+        # Client's id -> (shard key, row index)
+        self.index = {}
+        self.shards = {}
+        # Generation of shard files referenced by index log, switched atomically by compaction
+        self.generation = 0
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        self.replay_index_log()
+        self.remove_stale_files()
+
+    def get_shard(self, group_order: int, degree: int) -> VaultShard:
+        """
+        Get shard for vaults of given group order and degree, creating it if nonexistent
+
+        Parameters:
+            - group_order (int): Order of group of vault
+            - degree (int): Degree of vault polynomial
+
+        Returns:
+            - (VaultShard): Shard storing vaults of given parameters
+        """
+        shard_key = (group_order, degree)
+        if shard_key not in self.shards:
+            self.shards[shard_key] = VaultShard(
+                self.directory,
+                group_order,
+                degree,
+                capacity=self.initial_capacity,
+                generation=self.generation,
+            )
+        return self.shards[shard_key]
+
+    def replay_index_log(self) -> None:
+        """
+        Rebuild id -> row index and tombstones from append-only index log, that starts with generation of shard files after compaction
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        if not os.path.exists(self.index_filepath):
+            return
+
+        with open(self.index_filepath, "rt") as f:
+            for line in f:
+                record = line.split()
+                if not record:
+                    continue
+
+                if record[0] == "G" and len(record) == 2:
+                    self.generation = int(record[1])
+                elif record[0] == "A" and len(record) == 5:
+                    client_id = int(record[1])
+                    group_order, degree, row = (int(value) for value in record[2:])
+                    shard = self.get_shard(group_order, degree)
+                    shard.grow(row + 1)
+                    shard.row_ids.extend([None] * (row + 1 - len(shard.row_ids)))
+                    shard.row_ids[row] = client_id
+                    shard.rows = max(shard.rows, row + 1)
+                    self.index[client_id] = ((group_order, degree), row)
+                elif record[0] == "D" and len(record) == 2:
+                    client_id = int(record[1])
+                    if client_id in self.index:
+                        shard_key, row = self.index.pop(client_id)
+                        self.shards[shard_key].tombstones.add(row)
+
+        # Rows never recorded in index log, e.g. interrupted appends, are dead
+        for shard in self.shards.values():
+            for row, client_id in enumerate(shard.row_ids):
+                if client_id is None:
+                    shard.tombstones.add(row)
+
+    def remove_stale_files(self) -> None:
+        """
+        Remove shard files of generations other than current one, left by compaction interrupted before or after switching index log
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".compact") or shard_file_generation(filename) not in (
+                None,
+                self.generation,
+            ):
+                os.remove(os.path.join(self.directory, filename))
+
+    def append_index_records(self, records: list) -> None:
+        """
+        Append records to index log and flush them to disk
+
+        Parameters:
+            - records (list): Lines of index log to append
+
+        Returns:
+            - None
+        """
+        with open(self.index_filepath, "at") as f:
+            f.write("".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def contains(self, client_id: int) -> bool:
+        return client_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def append(
+        self,
+        client_id: int,
+        vault_coefs: list,
+        group_order: int,
+        verify_threshold: int,
+        key_DER: bytes,
+    ) -> None:
+        """
+        Append vault of Client as new row of shard matching its group order and degree
+
+        Parameters:
+            - client_id (int): Client's identificator
+            - vault_coefs (list): Coefficients of vault polynomial
+            - group_order (int): Order of group the vault is defined in
+            - verify_threshold (int): Verification threshold of vault
+            - key_DER (bytes): Client's public key in DER format
+
+        Returns:
+            - None
+        """
+        if self.contains(client_id):
+            raise ValueError(f"Client ID {client_id} already exists in vault store")
+
+        degree = len(vault_coefs) - 1
+        shard = self.get_shard(group_order, degree)
+        row = shard.rows
+
+        # Write vault data before index record, so that interrupted append leaves unreferenced row
+        shard.grow(row + 1)
+        shard.write_row(row, vault_coefs, verify_threshold, key_DER)
+        shard.flush()
+        self.append_index_records([f"A {client_id} {group_order} {degree} {row}\n"])
+
+        shard.rows += 1
+        shard.row_ids.append(client_id)
+        self.index[client_id] = ((group_order, degree), row)
+
+    def append_batch(self, records: list) -> None:
+        """
+        Append vaults of many Clients committing them with single index log write
+
+        Parameters:
+            - records (list): Dicts with 'client_id', 'vault_coefs', 'group_order', 'verify_threshold' and 'key_DER' keys
+
+        Returns:
+            - None
+        """
+        batch_ids = set()
+        for record in records:
+            if self.contains(record["client_id"]) or record["client_id"] in batch_ids:
+                raise ValueError(
+                    f"Client ID {record['client_id']} already exists in vault store"
+                )
+            batch_ids.add(record["client_id"])
+
+        # Write vault data of whole batch before index records
+        index_records = []
+        new_rows = []
+        pending_rows = {}
+        for record in records:
+            group_order = record["group_order"]
+            degree = len(record["vault_coefs"]) - 1
+            shard_key = (group_order, degree)
+            shard = self.get_shard(group_order, degree)
+            row = shard.rows + pending_rows.get(shard_key, 0)
+            pending_rows[shard_key] = pending_rows.get(shard_key, 0) + 1
+
+            shard.grow(row + 1)
+            shard.write_row(
+                row, record["vault_coefs"], record["verify_threshold"], record["key_DER"]
+            )
+            new_rows.append((shard_key, row, record["client_id"]))
+            index_records.append(
+                f"A {record['client_id']} {group_order} {degree} {row}\n"
+            )
+
+        for shard_key in pending_rows:
+            self.shards[shard_key].flush()
+        self.append_index_records(index_records)
+
+        for shard_key, row, client_id in new_rows:
+            shard = self.shards[shard_key]
+            shard.rows += 1
+            shard.row_ids.append(client_id)
+            self.index[client_id] = (shard_key, row)
+
+    def delete(self, client_id: int) -> bool:
+        """
+        Tombstone vault of Client, the row is reclaimed by compaction
+
+        Parameters:
+            - client_id (int): Client's identificator
+
+        Returns:
+            - (bool): Logic value of Client's vault being found and deleted
+        """
+        if not self.contains(client_id):
+            return False
+
+        self.append_index_records([f"D {client_id}\n"])
+        shard_key, row = self.index.pop(client_id)
+        self.shards[shard_key].tombstones.add(row)
+        return True
+
+    def get_vault(self, client_id: int) -> dict:
+        """
+        Get public verification data of Client with vault coefficients as zero-copy view of memory-mapped shard
+
+        Parameters:
+            - client_id (int): Client's identificator
+
+        Returns:
+            - (dict): Client's public verification data
+        """
+        if not self.contains(client_id):
+            raise KeyError(f"Client ID {client_id} is not in vault store")
+
+        (group_order, degree), row = self.index[client_id]
+        shard = self.shards[(group_order, degree)]
+
+        return {
+            "client_id": client_id,
+            "vault_coefs": shard.arrays["coefs"][row],
+            "group_order": group_order,
+            "verify_threshold": int(shard.arrays["thresholds"][row]),
+        }
+
+    def get_public_key_DER(self, client_id: int) -> bytes:
+        """
+        Get Client's public key stored alongside their vault
+
+        Parameters:
+            - client_id (int): Client's identificator
+
+        Returns:
+            - (bytes): Client's public key in DER format
+        """
+        if not self.contains(client_id):
+            raise KeyError(f"Client ID {client_id} is not in vault store")
+
+        shard_key, row = self.index[client_id]
+        return self.shards[shard_key].get_key_DER(row)
+
+    def scan(
+        self, group_order: int = None, degree: int = None, with_thresholds: bool = False
+    ):
+        """
+        Iterate over all live vaults shard by shard without deserializing them
+
+        Parameters:
+            - group_order (int): Only scan shards of this group order if given
+            - degree (int): Only scan shards of this vault degree if given
+            - with_thresholds (bool): Whether to also yield verification thresholds of vaults
+
+        Returns:
+            - (generator): Yields tuples (group_order, client_ids, coefs) where 'coefs' is 2D array with one vault per row,
+              a zero-copy view if shard holds no tombstones, extended with 'thresholds' array if 'with_thresholds' is set
+        """
+        for (shard_order, shard_degree), shard in sorted(self.shards.items()):
+            if group_order is not None and shard_order != group_order:
+                continue
+            if degree is not None and shard_degree != degree:
+                continue
+            if shard.rows == len(shard.tombstones):
+                continue
+
+            coefs = shard.arrays["coefs"][: shard.rows]
+            thresholds = shard.arrays["thresholds"][: shard.rows]
+            client_ids = np.array(shard.row_ids[: shard.rows], dtype=object)
+            if shard.tombstones:
+                mask = shard.live_mask()
+                coefs = coefs[mask]
+                thresholds = thresholds[mask]
+                client_ids = client_ids[mask]
+
+            if with_thresholds:
+                yield (shard_order, client_ids, coefs, thresholds)
+            else:
+                yield (shard_order, client_ids, coefs)
+
+    def compact(self) -> dict:
+        """
+        Offline compaction rewriting shards without tombstoned rows and truncating index log
+
+        Live rows are written to shard files of next generation, which are switched to by single atomic replace of index log,
+        so that crash at any point leaves index log consistent with shard files it references.
+
+        Parameters:
+            - None
+
+        Returns:
+            - (dict): Number of reclaimed rows per shard name
+        """
+        reclaimed = {}
+        generation = self.generation + 1
+        index_records = [f"G {generation}\n"]
+        new_index = {}
+        new_shards = {}
+
+        # Shard files of next generation may be left by compaction interrupted earlier
+        self.remove_stale_files()
+        for shard_key, shard in sorted(self.shards.items()):
+            mask = shard.live_mask()
+            live_rows = np.flatnonzero(mask)
+            reclaimed[shard.name] = shard.rows - len(live_rows)
+
+            # Write live rows to shard files of next generation
+            group_order, degree = shard_key
+            capacity = max(self.initial_capacity, len(live_rows))
+            new_shard = VaultShard(
+                self.directory, group_order, degree, capacity=capacity, generation=generation
+            )
+            for column, array in shard.arrays.items():
+                new_shard.arrays[column][: len(live_rows)] = array[live_rows]
+            new_shard.flush()
+
+            new_shard.row_ids = [shard.row_ids[row] for row in live_rows]
+            new_shard.rows = len(new_shard.row_ids)
+            new_shards[shard_key] = new_shard
+            for row, client_id in enumerate(new_shard.row_ids):
+                new_index[client_id] = (shard_key, row)
+                index_records.append(f"A {client_id} {group_order} {degree} {row}\n")
+        fsync_directory(self.directory)
+
+        # Switch to next generation with single atomic replace of index log
+        self.write_index_log(index_records)
+        old_shards = self.shards
+        self.shards = new_shards
+        self.index = new_index
+        self.generation = generation
+
+        # Shard files of previous generation are referenced no more
+        self.remove_shards(old_shards)
+
+        return reclaimed
+
+    def write_index_log(self, records: list) -> None:
+        """
+        Atomically replace index log with given records
+
+        Parameters:
+            - records (list): Lines of new index log
+
+        Returns:
+            - None
+        """
+        tmp_index_filepath = f"{self.index_filepath}.compact"
+        with open(tmp_index_filepath, "wt") as f:
+            f.write("".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_index_filepath, self.index_filepath)
+        fsync_directory(self.directory)
+
+    def remove_shards(self, shards: dict) -> None:
+        """
+        Remove files of shards that are no longer referenced by index log
+
+        Parameters:
+            - shards (dict): Shards of previous generation
+
+        Returns:
+            - None
+        """
+        for shard in shards.values():
+            shard.remove_files()
+
+    def stats(self) -> dict:
+        """
+        Collect store statistics
+
+        Parameters:
+            - None
+
+        Returns:
+            - (dict): Number of live vaults, tombstones and allocated rows per shard
+        """
+        return {
+            shard.name: {
+                "live": shard.rows - len(shard.tombstones),
+                "tombstones": len(shard.tombstones),
+                "rows": shard.rows,
+                "capacity": shard.capacity,
+            }
+            for shard in self.shards.values()
+        }
+
+    def close(self) -> None:
+        for shard in self.shards.values():
+            shard.close()
+
+
+def run_tests():
+    print("Running vault_store.py tests...")
+
+    store_directory = "./vault_store_test/"
+    shutil.rmtree(store_directory, ignore_errors=True)
+
+    group_order = 2147483647
+    key_DER = bytes(range(200))
+    store = ColumnarVaultStore(store_directory, initial_capacity=2)
+    for client_id in range(5):
+        store.append(client_id, [client_id, 2, 3, 1], group_order, 3, key_DER)
+    store.append(5, [1, 2, 3, 4, 1], group_order, 3, key_DER)
+
+    # Zero-copy access to vault
+    vault = store.get_vault(3)
+    assert vault["vault_coefs"].tolist() == [3, 2, 3, 1]
+    assert np.shares_memory(
+        vault["vault_coefs"], store.shards[(group_order, 3)].arrays["coefs"]
+    )
+    assert store.get_public_key_DER(3) == key_DER
+
+    # Tombstones hide deleted vaults from scans
+    assert store.delete(1) and not store.delete(1)
+    scanned = {order: ids.tolist() for order, ids, coefs in store.scan(degree=3)}
+    assert scanned == {group_order: [0, 2, 3, 4]}
+
+    # Index log is replayed after reopening
+    store.close()
+    store = ColumnarVaultStore(store_directory, initial_capacity=2)
+    assert len(store) == 5 and not store.contains(1)
+    assert store.get_vault(4)["vault_coefs"].tolist() == [4, 2, 3, 1]
+
+    # Compaction reclaims tombstoned rows
+    assert store.compact()[f"vaults_{group_order}_3"] == 1
+    assert store.get_vault(4)["vault_coefs"].tolist() == [4, 2, 3, 1]
+    store.close()
+    store = ColumnarVaultStore(store_directory)
+    assert store.stats()[f"vaults_{group_order}_3"]["tombstones"] == 0
+    assert len(store) == 5
+    assert all(
+        shard_file_generation(filename) in (None, 1) for filename in os.listdir(store_directory)
+    )
+    store.close()
+
+    # Compaction interrupted before or after switching index log leaves every Client with their own vault and key
+    class CrashBeforeSwitch(ColumnarVaultStore):
+        def write_index_log(self, records: list) -> None:
+            raise RuntimeError("Crash before index log switch")
+
+    class CrashAfterSwitch(ColumnarVaultStore):
+        def remove_shards(self, shards: dict) -> None:
+            raise RuntimeError("Crash after index log switch")
+
+    for crashing_store_class, generation, deleted_ids, live_ids in (
+        (CrashBeforeSwitch, 1, (0, 2), (3, 4, 6)),
+        (CrashAfterSwitch, 2, (3,), (4, 6)),
+    ):
+        store = crashing_store_class(store_directory, initial_capacity=2)
+        store.append(6, [6, 2, 3, 1], group_order, 3, bytes([6]) * 100)
+        assert all(store.delete(client_id) for client_id in deleted_ids)
+        try:
+            store.compact()
+            assert False
+        except RuntimeError:
+            pass
+        store = ColumnarVaultStore(store_directory, initial_capacity=2)
+        assert store.generation == generation
+        assert all(
+            shard_file_generation(filename) in (None, generation)
+            for filename in os.listdir(store_directory)
+        )
+        for client_id in live_ids:
+            assert store.get_vault(client_id)["vault_coefs"].tolist()[0] == client_id
+            assert store.get_public_key_DER(client_id) == (
+                bytes([6]) * 100 if client_id == 6 else key_DER
+            )
+        assert not any(store.contains(client_id) for client_id in deleted_ids)
+        store.delete(6)
+        store.close()
+
+    shutil.rmtree(store_directory)
+
+    print("Tests completed!")
+
+
+def main():
+    run_tests()
+
+
+if __name__ == "__main__":
+    main()
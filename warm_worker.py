@@ -0,0 +1,328 @@
+import io
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+import tempfile
+import subprocess
+import stat
+import socketserver
+from contextlib import redirect_stdout
+
+# Name of worker's socket in private socket directory
+SOCKET_FILENAME = "brake_worker.sock"
+
+# Modules on CLI startup path, whose heavy dependencies are imported on first use
+STARTUP_MODULES = ("main", "client")
+# Modules that must not be imported until they are needed
+DEFERRED_MODULES = ("sympy", "Crypto", "cryptography", "rsa")
+
+
+def private_socket_directory() -> str:
+    """
+    Get directory of worker's socket accessible by current user only, created in $XDG_RUNTIME_DIR or in temporary directory if it is not set
+
+    Parameters:
+        - None
+
+    Returns:
+        - (str): Path of directory, raises PermissionError if it exists and is not private to current user
+    """
+    runtime_directory = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_directory:
+        directory = os.path.join(runtime_directory, "brake")
+    else:
+        directory = os.path.join(tempfile.gettempdir(), f"brake-{os.getuid()}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    # Directory of the same name may have been created beforehand by other user
+    directory_stat = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(directory_stat.st_mode)
+        or directory_stat.st_uid != os.getuid()
+        or directory_stat.st_mode & 0o077
+    ):
+        raise PermissionError(f"Socket directory {directory} is not private to current user")
+    return directory
+
+
+def default_socket_path() -> str:
+    return os.path.join(private_socket_directory(), SOCKET_FILENAME)
+
+
+def measure_import_time(module_name: str) -> tuple:
+    """
+    Measure import time of module in fresh interpreter
+
+    Parameters:
+        - module_name (str): Name of imported module
+
+    Returns:
+        - (tuple):
+            - import_time (float): Import time in seconds
+            - imported_deferred_modules (list): Names of DEFERRED_MODULES imported along with the module
+    """
+    code = (
+        "import sys, json, time\n"
+        "s = time.perf_counter()\n"
+        f"import {module_name}\n"
+        "import_time = time.perf_counter() - s\n"
+        f"deferred = [name for name in {DEFERRED_MODULES!r} if name in sys.modules]\n"
+        "print(json.dumps([import_time, deferred]))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    import_time, imported_deferred_modules = json.loads(output.splitlines()[-1])
+    return (import_time, imported_deferred_modules)
+
+
+def warm_up(prime: int = 2147483647) -> float:
+    """
+    Import heavy dependencies and run small lock and unlock in field used by the protocol
+
+    Parameters:
+        - prime (int): Order of field used by the protocol
+
+    Returns:
+        - (float): Warm-up time in seconds
+    """
+    s = time.perf_counter()
+
+    # Import dependencies that protocol modules defer to first use
+    import rsa
+    import server
+    import session_tickets
+    from fuzzy_vault import FuzzyVault
+    from group_poly import Group
+
+    Group(prime)
+    fuzzy_vault = FuzzyVault(group_order=prime, bio_template=list(range(1, 9)))
+    fuzzy_vault.lock(FuzzyVault.generate_secret_polynomial(prime, 4))
+    fuzzy_vault.unlock(verify_threshold=4, number_of_unlocking_rounds=2)
+
+    return time.perf_counter() - s
+
+
+def run_brake_job(job: dict) -> None:
+    import main
+
+    main.execute_BRAKE(
+        correct_samples=job.get("correct_samples"),
+        number_of_unlocking_rounds=job.get("number_of_unlocking_rounds"),
+    )
+
+
+# Jobs the worker runs, by name
+JOBS = {"brake": run_brake_job}
+
+
+class WarmWorkerHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.worker.handle_request(request)
+        except ValueError as err:
+            response = {"ok": False, "error": f"Malformed request: {err}"}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class WarmWorker:
+    def __init__(self, socket_path: str = None, prime: int = 2147483647):
+        """
+        WarmWorker class constructor, that returns persistent process running CLI jobs with dependencies already imported
+
+        Jobs run in working directory given by request, so socket is accessible by current user only.
+
+        Parameters:
+            - socket_path (str): Path of Unix domain socket to listen on, in private socket directory if not given
+            - prime (int): Order of field warmed up on start
+
+        Returns:
+            - self (WarmWorker): WarmWorker class object
+        """
+        self.socket_path = socket_path or default_socket_path()
+        self.prime = prime
+        self.socket_server = None
+        self.jobs_done = 0
+        self.warm_up_time = None
+
+    def start(self) -> None:
+        """
+        Warm up and start listening, jobs are run one at a time in order of arrival
+
+        Parameters:
+            - None
+
+        Returns:
+            - None
+        """
+        self.warm_up_time = warm_up(self.prime)
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.socket_server = socketserver.UnixStreamServer(self.socket_path, WarmWorkerHandler)
+        os.chmod(self.socket_path, 0o600)
+        self.socket_server.worker = self
+
+    def serve_forever(self) -> None:
+        if self.socket_server is None:
+            self.start()
+        try:
+            self.socket_server.serve_forever()
+        finally:
+            self.socket_server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def handle_request(self, request: dict) -> dict:
+        """
+        Run single job, capturing its printed and logged output
+
+        Parameters:
+            - request (dict): Request with 'op' field, 'run' requests carry 'job' name, job arguments and Client's working directory
+
+        Returns:
+            - (dict): Response with 'ok' field and either job's 'output' or 'error' fields
+        """
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "jobs_done": self.jobs_done, "warm_up_time": self.warm_up_time}
+        if op == "shutdown":
+            threading.Thread(target=self.socket_server.shutdown, daemon=True).start()
+            return {"ok": True}
+        if op != "run" or request.get("job") not in JOBS:
+            return {"ok": False, "error": f"Unknown request: {op} {request.get('job')}"}
+
+        # Relative paths of job refer to Client's working directory
+        cwd = os.getcwd()
+        output = io.StringIO()
+        log_handler = logging.StreamHandler(output)
+        logging.getLogger().addHandler(log_handler)
+        s = time.perf_counter()
+        try:
+            os.chdir(request.get("cwd", cwd))
+            with redirect_stdout(output):
+                JOBS[request["job"]](request)
+            response = {"ok": True}
+        except Exception as err:
+            response = {"ok": False, "error": f"{type(err).__name__}: {err}"}
+        finally:
+            os.chdir(cwd)
+            logging.getLogger().removeHandler(log_handler)
+
+        self.jobs_done += 1
+        response.update(output=output.getvalue(), duration=time.perf_counter() - s)
+        return response
+
+
+def submit(request: dict, socket_path: str = None, timeout: float = None) -> dict:
+    """
+    Send request to running WarmWorker and wait for its response
+
+    Parameters:
+        - request (dict): Request with 'op' field
+        - socket_path (str): Path of worker's Unix domain socket, in private socket directory if not given
+        - timeout (float): Socket timeout in seconds, jobs may run for long
+
+    Returns:
+        - (dict): Worker's response, raises OSError if no worker listens on socket
+    """
+    socket_path = socket_path or default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode("utf-8") + b"\n")
+            stream.flush()
+            line = stream.readline()
+    if not line:
+        raise ConnectionError("Warm worker closed connection")
+    return json.loads(line)
+
+
+def submit_job(job: str, socket_path: str = None, **arguments) -> dict:
+    return submit(dict(arguments, op="run", job=job, cwd=os.getcwd()), socket_path)
+
+
+def run_tests():
+    print("Running warm_worker.py tests...")
+
+    # Import times depend on machine and file cache, so they are reported only
+    for module_name in STARTUP_MODULES:
+        import_time, imported_deferred_modules = measure_import_time(module_name)
+        print(f"Import time of {module_name}: {import_time * 1000:.0f} ms")
+        assert not imported_deferred_modules, imported_deferred_modules
+
+    # Socket is accessible by current user only
+    socket_directory = private_socket_directory()
+    assert stat.S_IMODE(os.stat(socket_directory).st_mode) == 0o700
+    socket_path = os.path.join(socket_directory, f"brake_worker_test_{os.getpid()}.sock")
+    worker = WarmWorker(socket_path)
+    worker.start()
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+    thread = threading.Thread(target=worker.serve_forever, daemon=True)
+    thread.start()
+    print(f"Warm-up time: {worker.warm_up_time:.1f} s")
+
+    assert submit({"op": "ping"}, socket_path)["jobs_done"] == 0
+    assert not submit({"op": "run", "job": "unknown"}, socket_path)["ok"]
+
+    # Job runs in already warm process, in working directory of submitting process
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as job_directory:
+        os.chdir(job_directory)
+        try:
+            response = submit_job(
+                "brake", socket_path, correct_samples=44, number_of_unlocking_rounds=10
+            )
+        finally:
+            os.chdir(cwd)
+        assert os.path.isdir(os.path.join(job_directory, "server_db"))
+    assert response["ok"], response.get("error")
+    assert "SESSION KEY EXCHANGE SUCCESSFUL" in response["output"]
+    print(f"Warm job time: {response['duration']:.1f} s")
+
+    submit({"op": "shutdown"}, socket_path)
+    thread.join()
+    assert not os.path.exists(socket_path)
+
+    print("Tests completed!")
+
+
+def main():
+    if len(sys.argv) == 1:
+        run_tests()
+        return
+
+    parser = argparse.ArgumentParser(description="Persistent warm worker running CLI jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Warm up and serve jobs")
+    serve_parser.add_argument("--socket", default=None)
+    serve_parser.add_argument("--prime", type=int, default=2147483647)
+
+    for command in ("ping", "shutdown"):
+        command_parser = subparsers.add_parser(command)
+        command_parser.add_argument("--socket", default=None)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        worker = WarmWorker(args.socket, args.prime)
+        worker.start()
+        print(f"Warm worker ready on {worker.socket_path} after {worker.warm_up_time:.1f} s")
+        worker.serve_forever()
+    else:
+        print(json.dumps(submit({"op": args.command}, args.socket)))
+
+
+if __name__ == "__main__":
+    main()